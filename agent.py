@@ -0,0 +1,79 @@
+"""
+远程探测代理进程入口 (部署在中心服务器之外的主机上，不需要访问数据库)。
+
+代理通过 HTTP 从服务器拉取指派给自己的目标 (目标的“远程探测代理”填写本代理的 AGENT_ID)，
+在本地用与探测 worker 相同的探测引擎和调度器执行检查，再把结果按批次压缩上传，
+服务器把结果写入 check_log 并在每行记上代理ID。可以在不同的位置启动多个代理，分担检查负载或从多个地点观测。
+
+用法: AGENT_SERVER_URL=https://monitor.example.com AGENT_API_TOKEN=... AGENT_ID=sh-1 AGENT_LOCATION=上海 python agent.py
+"""
+import signal
+import threading
+
+from flask import Flask
+
+from config import Config
+from app import metrics, logger
+from app.alerts import AlertEngine
+from app.dispatcher import CheckDispatcher
+from app.probe_engine import ProbeEngine
+from app.probe_pool import ProcessProbePool
+from app.remote_agent import RemoteProbeAgent
+
+
+def main():
+    # 只加载配置供各组件的 init_app 读取，不初始化数据库和页面
+    settings = Flask(__name__)
+    settings.config.from_object(Config)
+    stop = threading.Event()
+
+    def _handle_signal(signum, frame):
+        logger.info(f"远程探测代理收到信号 {signum}，正在退出...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
+
+    # 检查流水线与探测 worker 相同，只是结果交给代理上传，而不是写入数据库；
+    # 代理目标的全部结果只经过本代理，因此告警也在这里评估 (按代理主机上的 ALERT_* 配置发送通知)
+    engine = ProcessProbePool() if settings.config.get('PROBE_PROCESSES') else ProbeEngine()
+    dispatcher = CheckDispatcher()
+    agent = RemoteProbeAgent()
+    agent.init_app(settings, dispatcher)
+    alerts = AlertEngine()
+    alerts.init_app(settings, result_handler=agent.submit)
+    if alerts.enabled:
+        alerts.start()
+        dispatcher.init_app(settings, engine, result_handler=alerts.handle_result, removal_handler=alerts.forget)
+    else:
+        dispatcher.init_app(settings, engine, result_handler=agent.submit)
+    engine.init_app(settings, result_handler=dispatcher.handle_result)
+    try:
+        agent.start()
+    except ValueError as e:
+        logger.error(f"远程探测代理无法启动: {e}")
+        return
+    engine.start()
+    dispatcher.start()
+
+    metrics_server = None
+    if settings.config.get('METRICS_PORT'):
+        metrics.register('probe_engine', engine.collect_metrics)
+        metrics.register('dispatcher', dispatcher.collect_metrics)
+        metrics.register('agent', agent.collect_metrics)
+        if alerts.enabled:
+            metrics.register('alerts', alerts.collect_metrics)
+        metrics_server = metrics.serve(settings.config['METRICS_PORT'], settings.config.get('METRICS_HOST', '0.0.0.0'))
+    logger.info(f"远程探测代理 {agent.agent_id} 正在运行，按 Ctrl+C 退出。")
+    stop.wait()
+    # 先停止调度和探测，再把已完成的检查结果上传
+    dispatcher.stop()
+    engine.stop()
+    alerts.stop()
+    agent.stop()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,12 @@
-from flask import Flask
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from apscheduler.schedulers.background import BackgroundScheduler
 from config import Config # 从项目根目录的 config.py 导入配置
 import os
 import logging
+import atexit
+import threading
 
 # 初始化核心扩展，但不立即绑定到应用实例
 # 这些实例将在应用工厂函数中绑定
@@ -20,6 +22,30 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__) # 获取当前模块的logger实例
 
+# 检查流水线组件
+# 结果写入器需要用到上面的 db 和 logger，因此这些导入放在它们定义之后
+from app.probe_engine import ProbeEngine
+from app.probe_pool import ProcessProbePool
+from app.dispatcher import CheckDispatcher
+from app.result_writer import ResultWriter
+from app.worker import CheckWorker
+from app.dashboard_cache import DashboardCache
+from app.status_stream import StatusHub
+from app.metrics import MetricsRegistry
+from app.alerts import AlertEngine
+from app.segment_store import SegmentStore
+
+probe_engine = ProbeEngine() # 异步探测引擎，负责执行所有HTTP检查
+probe_pool = ProcessProbePool() # 多进程探测池，PROBE_PROCESSES 大于 0 时代替 probe_engine
+dispatcher = CheckDispatcher() # 检查调度器，按到期时间把目标分批交给探测引擎
+result_writer = ResultWriter() # 检查结果写入器，批量写入 CheckLog
+worker = CheckWorker() # 探测 worker，通过数据库租约领取自己负责的目标并装入调度器
+dashboard_cache = DashboardCache() # 仪表盘页面的渲染缓存，按 results_version 失效
+status_hub = StatusHub() # 状态变化推送中心，把检查结果以 SSE 推送给打开的仪表盘页面
+metrics = MetricsRegistry() # Prometheus 指标注册表，由 /metrics 路由或 worker 的指标端口输出
+alerts = AlertEngine() # 告警引擎，根据检查结果的状态变化发送通知
+segment_store = SegmentStore() # 原始检查历史的段文件存储，RAW_HISTORY_BACKEND=segments 时代替 check_log 表
+
 def create_app(config_class=Config):
     """
     应用工厂函数，用于创建和配置Flask应用实例。
@@ -48,6 +74,10 @@ def create_app(config_class=Config):
     logger.info("数据库(SQLAlchemy)已初始化。")
     migrate.init_app(app, db)
     logger.info("数据库迁移(Migrate)已初始化。")
+    status_hub.init_app(app)
+    segment_store.init_app(app)
+    metrics.register('dashboard_cache', dashboard_cache.collect_metrics)
+    metrics.register('status_hub', status_hub.collect_metrics)
 
     # 导入并注册蓝本 (Blueprints)
     # 蓝本用于组织应用的路由，使代码更模块化
@@ -56,32 +86,104 @@ def create_app(config_class=Config):
     app.register_blueprint(routes.bp) # 注册在 routes.py 中定义的蓝本 bp
     logger.info("路由蓝本已注册。")
 
+    # 注册自定义命令行命令 (flask rebuild-status 等)
+    from app.cli import register_commands
+    register_commands(app)
+
     # 导入模型，确保它们在数据库创建/迁移时被识别
     # 尽管在 run.py 中也导入了，但在这里确保应用上下文内模型被知晓是好的做法
     from app import models 
 
-    # 启动后台调度器 (APScheduler)
-    # 确保只在主进程中启动调度器，防止在Flask重载时启动多个实例 (某些情况下)
-    # 对于生产环境，通常Gunicorn的worker模型能较好地处理这个问题
-    # 但在开发环境下，FLASK_ENV=development 且 DEBUG=True 时，Flask会使用两个进程 (reloader 和 worker)
+    # Web 进程默认不运行任何调度：检查由独立的探测 worker 进程 (python worker.py) 执行，
+    # 这样 Gunicorn 的多个 Web worker 不会各自重复检查全部目标。
+    # 单进程部署或开发环境可以设置 RUN_EMBEDDED_WORKER=1，在 Web 进程内同时运行一个探测 worker：
+    # worker 在处理第一个请求前启动 (python run.py 则在启动开发服务器前启动)，
+    # 因此 flask db upgrade、flask compact 等命令行命令和探测池子进程都不会启动 worker、领取租约。
+    if app.config.get('RUN_EMBEDDED_WORKER'):
+        app.before_request(_start_embedded_worker)
+    else:
+        logger.info("Web 进程未启动检查调度，请使用 python worker.py 单独运行探测 worker。")
+
+    logger.info("WebPulse Monitor 应用实例创建完成。")
+    return app
+
+_embedded_worker_lock = threading.Lock()
+
+def _start_embedded_worker():
+    if not worker.running:
+        with _embedded_worker_lock: # 并发的第一批请求只启动一次
+            start_worker(current_app._get_current_object())
+
+def start_worker(app):
+    """
+    在当前进程中启动检查流水线 (写入器 -> 探测引擎 -> 调度器) 和探测 worker，
+    并通过 APScheduler 安排周期性的维护任务。重复调用是安全的。
+    :param app: Flask应用实例。
+    """
+    if worker.running:
+        logger.info("探测 worker 已在运行中。")
+        return
+
+    # 探测引擎在自己的事件循环线程中执行检查，结果交给结果写入器批量写入数据库
+    # 结果写入器在每批提交后直接把状态变化交给同一进程的推送中心，页面无需等待下一次轮询
+    # RAW_HISTORY_BACKEND=segments 时原始检查结果追加到段文件，不再写入 check_log 表
+    result_writer.init_app(app, change_handler=status_hub.publish,
+                           raw_store=segment_store if segment_store.enabled else None)
+    result_writer.start()
+    if segment_store.enabled:
+        metrics.register('segment_store', segment_store.collect_metrics)
+    # 配置了 PROBE_PROCESSES 时改用多进程探测池，两者的 submit 接口相同
+    engine = probe_pool if app.config.get('PROBE_PROCESSES') else probe_engine
+    # 检查结果先回到调度器 (自适应模式据此调整检查间隔、重试确认失败)，
+    # 配置了告警通知渠道时再经过告警引擎，最后交给结果写入器
+    alerts.init_app(app, result_handler=result_writer.submit)
+    if alerts.enabled:
+        alerts.start()
+        dispatcher.init_app(app, engine, result_handler=alerts.handle_result, removal_handler=alerts.forget)
+        metrics.register('alerts', alerts.collect_metrics)
+    else:
+        dispatcher.init_app(app, engine, result_handler=result_writer.submit)
+    engine.init_app(app, result_handler=dispatcher.handle_result)
+    engine.start()
+    dispatcher.start()
+    # worker 通过心跳和租约领取自己负责的目标，并同步到检查调度器
+    worker.init_app(app, dispatcher)
+    worker.start()
+    # 检查流水线的指标只在抓取时读取各组件的计数器，不给检查和写库增加锁
+    metrics.register('probe_engine', engine.collect_metrics)
+    metrics.register('dispatcher', dispatcher.collect_metrics)
+    metrics.register('result_writer', result_writer.collect_metrics)
+    metrics.register('worker', worker.collect_metrics)
+    # 进程退出时按 worker -> 调度器 -> 探测引擎 -> 告警 -> 写入器 的顺序停止，
+    # 先释放租约让其他 worker 接手，并保证已完成的检查结果被写入数据库
+    atexit.register(stop_worker)
+
+    # APScheduler 只承担周期性的维护任务；多个 worker 时只有哈希环上的维护负责者实际执行
+    scheduler.add_job(
+        func=worker.run_maintenance,
+        trigger='interval',
+        minutes=app.config['COMPACTION_INTERVAL_MINUTES'],
+        id='compact_history',
+        name='按保留策略清理历史数据',
+        replace_existing=True,
+        max_instances=1, # 上一次清理未结束时不重复启动
+        coalesce=True
+    )
     if not scheduler.running:
-        from app.scheduler_jobs import schedule_all_checks # 导入调度任务的函数
-        
-        # 使用 with app.app_context() 来确保在调度任务函数内部可以访问数据库和应用配置
-        with app.app_context():
-            schedule_all_checks(app, scheduler) # 将应用实例和调度器实例传递给任务安排函数
-        
         try:
             scheduler.start()
-            logger.info("后台调度器(APScheduler)已启动，并已安排监控任务。")
-        except (KeyboardInterrupt, SystemExit):
-            # 在应用退出时优雅地关闭调度器 (虽然daemon=True会在主程序退出时自动退出)
-            scheduler.shutdown()
-            logger.info("后台调度器已关闭。")
+            logger.info("后台调度器(APScheduler)已启动，并已安排维护任务。")
         except Exception as e:
             logger.error(f"启动后台调度器失败: {e}")
-    else:
-        logger.info("后台调度器已在运行中。")
 
-    logger.info("WebPulse Monitor 应用实例创建完成。")
-    return app
+def stop_worker():
+    """
+    依次停止探测 worker 和检查流水线的各个组件，并排空结果写入队列。重复调用是安全的。
+    """
+    worker.stop()
+    dispatcher.stop()
+    probe_engine.stop()
+    probe_pool.stop()
+    alerts.stop()
+    result_writer.stop()
+    segment_store.close()
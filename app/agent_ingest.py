@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, delete, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db, logger # 从 app/__init__.py 中导入 db 实例和预配置的 logger
+from app.models import MonitoredTarget, ProbeAgent, AgentBatch
+from app.change_log import DEFAULT_HEARTBEAT_SECONDS
+from app.pipeline_state import current_version, TARGETS_VERSION
+from app.result_writer import write_results
+from app.rollups import to_utc_naive
+from app.scheduler_jobs import query_schedule_rows
+
+_ID_CHUNK = 500 # 每条 IN 语句最多包含的ID数 (SQLite 对绑定参数的个数有限制)
+
+
+def _utcnow():
+    return to_utc_naive(datetime.now(timezone.utc))
+
+
+def touch_agent(agent_id, location=None, address=None, **values):
+    """
+    在当前事务中记录远程代理的一次请求 (不存在时创建代理记录)。
+    :param values: 同时更新的其他列，例如 synced_version 和 target_count。
+    """
+    now = _utcnow()
+    table = ProbeAgent.__table__
+    values = dict(values, last_seen_at=now, address=address)
+    if location:
+        values['location'] = location
+    update = table.update().where(table.c.id == agent_id).values(**values)
+    if db.session.execute(update).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(id=agent_id, first_seen_at=now, **values))
+    except IntegrityError:
+        db.session.execute(update) # 同一代理的并发请求已经创建了记录
+
+
+def agent_targets(agent_id, since=None, location=None, address=None):
+    """
+    返回指派给代理的目标 (提交事务)。
+    :param since: 代理上一次同步到的 targets_version (来自 ETag)；为 None 时返回全部目标。
+    :return: 同步响应字典 {'version', 'full', 'targets', 'target_ids', 'run_now'}；
+             目标没有变化且没有立即检查请求时返回 None (对应 304)。
+             增量响应的 targets 只包含 config_version 大于 since 的目标，target_ids 为全部目标ID，
+             代理据此移除已删除、暂停或改派的目标；目标没有变化但有立即检查请求时不包含 target_ids。
+    """
+    version = current_version(TARGETS_VERSION) # 先于目标读取，之后的变化会在下一次同步中返回
+    if since is not None and since > version:
+        since = None # 版本号回退 (例如数据库被重建)，改为全量同步
+    table = MonitoredTarget.__table__
+    mine = (table.c.agent_id == agent_id, table.c.is_active.is_(True))
+    requested = db.session.execute(
+        select(table.c.id, table.c.check_requested_at).where(*mine, table.c.check_requested_at.is_not(None))).all()
+    if since == version and not requested:
+        touch_agent(agent_id, location, address)
+        db.session.commit()
+        return None
+
+    payload = {'version': version, 'full': since is None, 'targets': [], 'run_now': [row.id for row in requested]}
+    synced = {}
+    if since != version:
+        filters = () if since is None else (table.c.config_version > since,)
+        payload['targets'] = [dict(row._mapping) for row in query_schedule_rows(table.c.agent_id == agent_id, *filters)]
+        payload['target_ids'] = db.session.scalars(select(table.c.id).where(*mine)).all()
+        synced = {'synced_version': version, 'target_count': len(payload['target_ids'])}
+    if requested:
+        # 立即检查请求随本次响应下发，只清空本次读到的请求，之后新到的请求留到下一次同步
+        db.session.execute(
+            table.update()
+            .where(table.c.id == bindparam('b_id'), table.c.check_requested_at <= bindparam('b_requested'))
+            .values(check_requested_at=None),
+            [{'b_id': row.id, 'b_requested': row.check_requested_at} for row in requested])
+    touch_agent(agent_id, location, address, **synced)
+    db.session.commit()
+    return payload
+
+
+def ingest_batch(agent_id, batch_id, results, location=None, address=None, log_result=None,
+                 heartbeat_seconds=DEFAULT_HEARTBEAT_SECONDS):
+    """
+    写入远程代理上传的一批检查结果 (单个事务，提交事务)。
+    批次ID与结果在同一事务中写入，同一批次重复上传时 (例如代理没有收到上一次的响应) 不再写入，
+    直接返回第一次写入时的结果数。只接受当前指派给该代理的目标的结果，其余结果 (目标已删除或已改派) 被拒绝。
+    结果与本地 worker 的结果一样经过 write_results：插入 CheckLog (每行记上代理ID)、更新聚合表和当前状态。
+
+    :param results: ProbeResult 列表，按检查完成的先后顺序排列。
+    :return: (报告字典 {'batch_id', 'duplicate', 'accepted', 'rejected'}, StatusChange 列表)
+    """
+    touch_agent(agent_id, location, address)
+    agent_table = ProbeAgent.__table__
+    try:
+        with db.session.begin_nested():
+            db.session.execute(AgentBatch.__table__.insert().values(
+                agent_id=agent_id, batch_id=batch_id, received_at=_utcnow(), result_count=0))
+    except IntegrityError:
+        accepted = db.session.scalar(select(AgentBatch.result_count).where(
+            AgentBatch.agent_id == agent_id, AgentBatch.batch_id == batch_id))
+        db.session.execute(agent_table.update().where(agent_table.c.id == agent_id)
+                           .values(duplicate_batches=agent_table.c.duplicate_batches + 1))
+        db.session.commit()
+        logger.info(f"远程探测代理 {agent_id} 重复上传了批次 {batch_id}，已忽略。")
+        return {'batch_id': batch_id, 'duplicate': True, 'accepted': accepted or 0, 'rejected': 0}, []
+
+    target_ids = list({result.target_id for result in results})
+    assigned = set()
+    for start in range(0, len(target_ids), _ID_CHUNK):
+        assigned.update(db.session.scalars(select(MonitoredTarget.id).where(
+            MonitoredTarget.id.in_(target_ids[start:start + _ID_CHUNK]), MonitoredTarget.agent_id == agent_id)))
+    accepted = [result for result in results if result.target_id in assigned]
+    written, changes = 0, []
+    if accepted:
+        written, _, changes = write_results(accepted, log_result, heartbeat_seconds=heartbeat_seconds, agent_id=agent_id)
+
+    db.session.execute(AgentBatch.__table__.update().where(
+        AgentBatch.agent_id == agent_id, AgentBatch.batch_id == batch_id).values(result_count=written))
+    db.session.execute(agent_table.update().where(agent_table.c.id == agent_id).values(
+        batches_received=agent_table.c.batches_received + 1,
+        results_received=agent_table.c.results_received + written))
+    db.session.commit()
+    if written < len(results):
+        logger.warning(f"远程探测代理 {agent_id} 的批次 {batch_id} 中有 {len(results) - written} 条结果被拒绝 "
+                       f"(目标已删除或未指派给该代理)。")
+    return {'batch_id': batch_id, 'duplicate': False, 'accepted': written, 'rejected': len(results) - written}, changes
+
+
+def purge_agent_batches(hours, now=None):
+    """
+    删除超过 hours 小时的批次ID记录 (代理不会在这么久之后再重试同一批次)，不提交事务。
+    :return: 删除的行数。
+    """
+    cutoff = to_utc_naive(now or datetime.now(timezone.utc)) - timedelta(hours=hours)
+    return db.session.execute(delete(AgentBatch).where(AgentBatch.received_at < cutoff)).rowcount
@@ -0,0 +1,476 @@
+import collections
+import json
+import queue
+import smtplib
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from typing import NamedTuple, Optional
+
+from app import logger # 从 app/__init__.py 中导入预配置的 logger
+from app.metrics import LabeledCounter, counter, gauge
+
+# 告警事件的类型
+DOWN = 'down' # 目标连续失败达到阈值
+RECOVERED = 'recovered' # 已告警的目标恢复正常
+FLAPPING = 'flapping' # 目标在短时间内反复切换状态
+STABLE = 'stable' # 反复切换的目标恢复稳定
+LATENCY_HIGH = 'latency_high' # 响应时间连续超过阈值
+LATENCY_NORMAL = 'latency_normal' # 响应时间回到阈值以内
+RATE_LIMITED = 'rate_limited' # 限流期间省略的通知摘要
+
+_TITLES = {
+    DOWN: '故障',
+    RECOVERED: '恢复',
+    FLAPPING: '状态反复切换',
+    STABLE: '恢复稳定',
+    LATENCY_HIGH: '响应变慢',
+    LATENCY_NORMAL: '响应时间恢复',
+    RATE_LIMITED: '通知被限流',
+}
+
+
+class AlertEvent(NamedTuple):
+    """
+    一条待发送的告警通知。
+    """
+    kind: str
+    target_id: int
+    target_name: str
+    status_text: str
+    status_code: Optional[int]
+    response_time_ms: Optional[float]
+    details: str
+    timestamp: datetime
+
+    @property
+    def title(self):
+        return f"[WebPulse] {self.target_name or self.target_id} {_TITLES.get(self.kind, self.kind)}"
+
+    def message(self):
+        """
+        通知正文 (纯文本)。
+        """
+        parts = []
+        if self.target_id:
+            parts += [f"目标: {self.target_name} (ID: {self.target_id})", f"当前状态: {self.status_text}"]
+        if self.status_code is not None:
+            parts.append(f"状态码: {self.status_code}")
+        if self.response_time_ms is not None:
+            parts.append(f"响应时间: {self.response_time_ms}ms")
+        if self.details:
+            parts.append(f"详情: {self.details}")
+        parts.append(f"时间: {self.timestamp.strftime('%Y-%m-%d %H:%M:%S UTC')}")
+        return '\n'.join(parts)
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'title': self.title,
+            'target_id': self.target_id,
+            'target_name': self.target_name,
+            'status_text': self.status_text,
+            'status_code': self.status_code,
+            'response_time_ms': self.response_time_ms,
+            'details': self.details,
+            'timestamp': self.timestamp.isoformat(),
+        }
+
+
+class StdoutSink:
+    """
+    把通知输出到标准输出 (开发环境或交给日志收集系统)。
+    """
+    name = 'stdout'
+
+    def send(self, event):
+        print(f"{event.title}\n{event.message()}", flush=True)
+
+
+class WebhookSink:
+    """
+    以 JSON POST 请求把通知发送到 Webhook 地址。
+    """
+    name = 'webhook'
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, event):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(event.to_dict(), ensure_ascii=False).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'User-Agent': 'WebPulse-Monitor-Alerts'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SmtpSink:
+    """
+    通过 SMTP 发送通知邮件。
+    """
+    name = 'smtp'
+
+    def __init__(self, host, port=25, sender=None, recipients=(), username=None, password=None, starttls=False,
+                 timeout=10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, event):
+        message = EmailMessage()
+        message['Subject'] = event.title
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message.set_content(event.message())
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+def _stdout_from_config(config):
+    return StdoutSink()
+
+
+def _webhook_from_config(config):
+    if not config.get('ALERT_WEBHOOK_URL'):
+        raise ValueError("未配置 ALERT_WEBHOOK_URL")
+    return WebhookSink(config['ALERT_WEBHOOK_URL'], config.get('ALERT_SINK_TIMEOUT_SECONDS', 5))
+
+
+def _smtp_from_config(config):
+    recipients = [address.strip() for address in (config.get('ALERT_SMTP_RECIPIENTS') or '').split(',') if address.strip()]
+    if not config.get('ALERT_SMTP_HOST') or not recipients:
+        raise ValueError("未配置 ALERT_SMTP_HOST 或 ALERT_SMTP_RECIPIENTS")
+    return SmtpSink(config['ALERT_SMTP_HOST'], config.get('ALERT_SMTP_PORT', 25),
+                    config.get('ALERT_SMTP_SENDER') or f"webpulse@{config['ALERT_SMTP_HOST']}", recipients,
+                    config.get('ALERT_SMTP_USERNAME'), config.get('ALERT_SMTP_PASSWORD'),
+                    config.get('ALERT_SMTP_STARTTLS', False), config.get('ALERT_SINK_TIMEOUT_SECONDS', 10))
+
+
+# ALERT_SINKS 中可以使用的通知渠道：名称 -> 根据应用配置创建渠道的函数。
+# 新的渠道只需实现 send(event) 方法，并在这里注册工厂函数 (或直接调用 AlertEngine.add_sink)。
+SINK_FACTORIES = {
+    'stdout': _stdout_from_config,
+    'webhook': _webhook_from_config,
+    'smtp': _smtp_from_config,
+}
+
+
+class _TargetState:
+    """
+    单个目标的告警状态。只保存常数大小的计数，不读取历史日志。
+    """
+    __slots__ = ('up', 'failures', 'alerted', 'notified', 'transitions', 'flapping', 'slow_streak', 'fast_streak',
+                 'slow', 'slow_notified', 'last_sent')
+
+    def __init__(self, flap_transitions):
+        self.up = None # 最近一次检查是否正常；None 表示尚未检查过
+        self.failures = 0 # 连续失败次数
+        self.alerted = False # 连续失败是否已达到阈值 (处于故障中)
+        self.notified = False # 本次故障是否已发出故障通知，只有发出过才发送恢复通知
+        self.transitions = collections.deque(maxlen=flap_transitions) # 最近几次状态切换的时间 (time.monotonic())
+        self.flapping = False
+        self.slow_streak = 0 # 连续超过延迟阈值的次数
+        self.fast_streak = 0 # 延迟告警后连续回到阈值以内的次数
+        self.slow = False # 是否处于延迟告警中
+        self.slow_notified = False # 本次延迟告警是否已发出通知，只有发出过才发送响应时间恢复通知
+        self.last_sent = {} # 事件类型 -> 最近一次产生该类通知的时间，用于去重
+
+
+class AlertEngine:
+    """
+    告警引擎：按目标维护一个内存中的状态机，直接由检查结果驱动 (位于调度器和结果写入器之间)。
+
+    每条结果只更新该目标的几个计数器 (O(1))，不查询历史日志：
+    连续失败 failure_threshold 次时发出故障通知，已告警的目标恢复正常时发出恢复通知；
+    flap_window 秒内状态切换达到 flap_transitions 次时只发出一条“状态反复切换”通知，
+    在此期间不再逐次通知故障和恢复，直到 flap_window 秒内没有切换才发出“恢复稳定”通知；
+    开启 latency_threshold_ms 时，响应时间连续 latency_breaches 次超过阈值发出“响应变慢”通知，
+    再连续 latency_breaches 次回到阈值以内发出“响应时间恢复”通知。
+    同一目标的同类通知在 cooldown 秒内只发送一次；被去重的故障和响应变慢通知不会丢失，
+    冷却结束后目标仍处于故障 (或仍然变慢) 时补发。
+
+    通知放入有界队列，由独立的发送线程交给各个通知渠道 (sink)，不会阻塞检查流水线；
+    发送线程按令牌桶限制每分钟的通知数，被限流的通知合并为一条摘要。
+    worker 重启或目标迁移到其他 worker 后状态从头开始，仍在故障中的目标会再通知一次。
+    """
+
+    def __init__(self, result_handler=None, sinks=(), failure_threshold=2, latency_threshold_ms=0,
+                 latency_breaches=3, flap_window=600, flap_transitions=5, cooldown=300, rate_limit_per_minute=30,
+                 max_queue=1000):
+        self.result_handler = result_handler # 接收检查结果的下游回调 (通常是结果写入器的 submit)
+        self.sinks = list(sinks)
+        self.failure_threshold = failure_threshold # 连续失败多少次发出故障通知
+        self.latency_threshold_ms = latency_threshold_ms # 响应时间阈值(毫秒)，0 表示不检查延迟
+        self.latency_breaches = latency_breaches # 连续超过 (或回到) 阈值多少次才通知
+        self.flap_window = flap_window # 判断状态反复切换的时间窗口(秒)
+        self.flap_transitions = flap_transitions # 时间窗口内切换多少次视为反复切换
+        self.cooldown = cooldown # 同一目标同类通知的最短间隔(秒)
+        self.rate_limit_per_minute = rate_limit_per_minute # 每分钟最多发送的通知数，0 表示不限
+        self.max_queue = max_queue
+
+        self._states = {} # target_id -> _TargetState
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._tokens = float(rate_limit_per_minute)
+        self._refilled_at = time.monotonic()
+        self._suppressed = 0 # 因限流尚未报告的通知数
+
+        # 事件计数只在结果处理线程中更新，发送计数只在发送线程中更新
+        self.events = LabeledCounter() # 按类型统计产生的通知
+        self.deduplicated = 0 # 因冷却时间被去重的通知数
+        self.dropped = 0 # 发送队列已满而丢弃的通知数
+        self.rate_limited = 0 # 被限流合并的通知数
+        self.sent = 0 # 成功交给通知渠道的次数
+        self.sink_errors = 0 # 通知渠道发送失败的次数
+
+    def init_app(self, app, result_handler=None):
+        """
+        从Flask应用配置中读取告警规则，并按 ALERT_SINKS 创建通知渠道。
+        配置错误的渠道被跳过并记录错误，不影响检查流水线。
+        """
+        if result_handler is not None:
+            self.result_handler = result_handler
+        config = app.config
+        self.failure_threshold = config.get('ALERT_FAILURE_THRESHOLD', self.failure_threshold)
+        self.latency_threshold_ms = config.get('ALERT_LATENCY_MS', self.latency_threshold_ms)
+        self.latency_breaches = config.get('ALERT_LATENCY_BREACHES', self.latency_breaches)
+        self.flap_window = config.get('ALERT_FLAP_WINDOW_SECONDS', self.flap_window)
+        self.flap_transitions = config.get('ALERT_FLAP_TRANSITIONS', self.flap_transitions)
+        self.cooldown = config.get('ALERT_COOLDOWN_SECONDS', self.cooldown)
+        self.rate_limit_per_minute = config.get('ALERT_RATE_LIMIT_PER_MINUTE', self.rate_limit_per_minute)
+        self._tokens = float(self.rate_limit_per_minute)
+        self.max_queue = config.get('ALERT_QUEUE_SIZE', self.max_queue)
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self.sinks = []
+        for name in (config.get('ALERT_SINKS') or '').split(','):
+            name = name.strip().lower()
+            if not name:
+                continue
+            factory = SINK_FACTORIES.get(name)
+            if factory is None:
+                logger.error(f"未知的告警通知渠道: {name}")
+                continue
+            try:
+                self.sinks.append(factory(config))
+            except Exception as e:
+                logger.error(f"创建告警通知渠道 {name} 失败: {e}")
+
+    def add_sink(self, sink):
+        """
+        添加一个通知渠道 (任何带有 send(event) 方法的对象)。
+        """
+        self.sinks.append(sink)
+
+    @property
+    def enabled(self):
+        return bool(self.sinks)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name='alert-sender', daemon=True)
+        self._thread.start()
+        logger.info(f"告警引擎已启动: 通知渠道 {', '.join(getattr(sink, 'name', type(sink).__name__) for sink in self.sinks)}。")
+
+    def stop(self, timeout=10):
+        """
+        发送完队列中剩余的通知后停止发送线程。
+        """
+        if not self.running:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def handle_result(self, result):
+        """
+        调度器的 result_handler：先更新告警状态，再把结果交给下游的 result_handler。
+        :param result: ProbeResult 实例。
+        """
+        try:
+            self.observe(result)
+        except Exception as e:
+            logger.error(f"评估目标 (ID: {result.target_id}) 的告警规则时发生错误: {e}", exc_info=True)
+        if self.result_handler is not None:
+            return self.result_handler(result)
+
+    def observe(self, result, now=None):
+        """
+        用一条检查结果更新目标的告警状态 (只在结果处理线程中调用)。
+        :return: 本次产生的 AlertEvent 列表。
+        """
+        now = time.monotonic() if now is None else now
+        state = self._states.get(result.target_id)
+        if state is None:
+            state = self._states[result.target_id] = _TargetState(self.flap_transitions)
+        events = []
+        up = result.status_text == 'UP'
+
+        if state.up is not None and up != state.up:
+            state.transitions.append(now)
+        state.up = up
+        was_flapping = state.flapping
+        recent = len(state.transitions) >= self.flap_transitions and now - state.transitions[0] <= self.flap_window
+        if recent and not state.flapping:
+            state.flapping = True
+            events.append(FLAPPING)
+        elif state.flapping and state.transitions and now - state.transitions[-1] > self.flap_window:
+            state.flapping = False
+            state.transitions.clear()
+            events.append(STABLE)
+
+        if up:
+            state.failures = 0
+            if state.alerted:
+                state.alerted = False
+                if state.notified and not was_flapping:
+                    events.append(RECOVERED)
+        else:
+            state.failures += 1
+            if state.failures >= self.failure_threshold and not state.alerted:
+                state.alerted = True
+                if not state.flapping:
+                    events.append(DOWN)
+            elif state.alerted and not state.notified and not state.flapping and self._cooled_down(state, DOWN, now):
+                events.append(DOWN) # 故障通知曾因冷却时间被去重，冷却结束后仍在故障中则补发
+
+        if self.latency_threshold_ms and up and result.response_time_ms is not None:
+            if result.response_time_ms > self.latency_threshold_ms:
+                state.slow_streak += 1
+                state.fast_streak = 0
+                if state.slow_streak >= self.latency_breaches and not state.slow:
+                    state.slow = True
+                    events.append(LATENCY_HIGH)
+                elif state.slow and not state.slow_notified and self._cooled_down(state, LATENCY_HIGH, now):
+                    events.append(LATENCY_HIGH) # 同上，冷却结束后仍然变慢则补发
+            else:
+                state.slow_streak = 0
+                if state.slow:
+                    state.fast_streak += 1
+                    if state.fast_streak >= self.latency_breaches:
+                        state.slow = False
+                        state.fast_streak = 0
+                        if state.slow_notified:
+                            events.append(LATENCY_NORMAL)
+                        state.slow_notified = False
+
+        emitted = []
+        for kind in events:
+            if not self._cooled_down(state, kind, now):
+                self.deduplicated += 1
+                continue
+            state.last_sent[kind] = now
+            if kind == DOWN:
+                state.notified = True
+            elif kind == LATENCY_HIGH:
+                state.slow_notified = True
+            elif kind in (RECOVERED, STABLE):
+                state.notified = state.alerted # 恢复稳定的通知带有当前状态，之后按当前状态继续通知
+            event = AlertEvent(kind, result.target_id, result.target_name, result.status_text, result.status_code,
+                               result.response_time_ms, result.details, result.timestamp)
+            self.events.inc(kind)
+            emitted.append(event)
+            if self.sinks:
+                try:
+                    self._queue.put_nowait(event)
+                except queue.Full:
+                    self.dropped += 1
+                    logger.error(f"告警发送队列已满，丢弃目标 '{result.target_name}' 的{_TITLES[kind]}通知。")
+        return emitted
+
+    def _cooled_down(self, state, kind, now):
+        last = state.last_sent.get(kind)
+        return last is None or now - last >= self.cooldown
+
+    def forget(self, target_id):
+        """
+        丢弃目标的告警状态 (目标被删除或不再由本 worker 负责时)。
+        """
+        self._states.pop(target_id, None)
+
+    def _take_token(self):
+        if not self.rate_limit_per_minute:
+            return True
+        now = time.monotonic()
+        self._tokens = min(float(self.rate_limit_per_minute),
+                           self._tokens + (now - self._refilled_at) * self.rate_limit_per_minute / 60)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _run(self):
+        while True:
+            try:
+                event = self._queue.get(timeout=5 if self._suppressed else None)
+            except queue.Empty:
+                event = False # 没有新通知时也要把限流期间省略的通知数报告出去
+            if event is None:
+                return
+            if self._suppressed and self._take_token():
+                self._deliver_summary()
+            if event is False:
+                continue
+            if not self._take_token():
+                self._suppressed += 1
+                self.rate_limited += 1
+                continue
+            self._deliver(event)
+
+    def _deliver_summary(self):
+        suppressed, self._suppressed = self._suppressed, 0
+        self._deliver(AlertEvent(RATE_LIMITED, 0, '全部目标', '', None, None,
+                                 f"通知数超过每分钟 {self.rate_limit_per_minute} 条的上限，省略了 {suppressed} 条通知。",
+                                 datetime.now(timezone.utc)))
+
+    def _deliver(self, event):
+        for sink in self.sinks:
+            try:
+                sink.send(event)
+                self.sent += 1
+            except Exception as e:
+                self.sink_errors += 1
+                logger.error(f"通过 {getattr(sink, 'name', type(sink).__name__)} 发送告警 '{event.title}' 失败: {e}")
+
+    def stats(self):
+        return {
+            'targets': len(self._states),
+            'sinks': [getattr(sink, 'name', type(sink).__name__) for sink in self.sinks],
+            'queued': self._queue.qsize(),
+            'sent': self.sent,
+            'deduplicated': self.deduplicated,
+            'rate_limited': self.rate_limited,
+            'dropped': self.dropped,
+            'sink_errors': self.sink_errors,
+        }
+
+    def collect_metrics(self):
+        """
+        返回告警引擎的 Prometheus 指标文本行。
+        """
+        lines = []
+        lines += self.events.expose('webpulse_alert_events_total', '按类型统计产生的告警通知数', 'kind')
+        lines += gauge('webpulse_alert_queue_depth', '等待发送的告警通知数', self._queue.qsize())
+        lines += counter('webpulse_alert_notifications_sent_total', '成功交给通知渠道的次数', self.sent)
+        lines += counter('webpulse_alert_deduplicated_total', '因冷却时间被去重的通知数', self.deduplicated)
+        lines += counter('webpulse_alert_rate_limited_total', '因限流被合并为摘要的通知数', self.rate_limited)
+        lines += counter('webpulse_alert_dropped_total', '发送队列已满而丢弃的通知数', self.dropped)
+        lines += counter('webpulse_alert_sink_errors_total', '通知渠道发送失败的次数', self.sink_errors)
+        return lines
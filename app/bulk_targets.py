@@ -0,0 +1,287 @@
+import csv
+import io
+import json
+import time
+
+from sqlalchemy import bindparam, insert, select
+from werkzeug.datastructures import MultiDict
+
+from app import db, logger # 从 app/__init__.py 中导入 db 实例和预配置的 logger
+from app.forms import AddTargetForm
+from app.models import MonitoredTarget
+from app.pipeline_state import bump_version, RESULTS_VERSION, TARGETS_VERSION
+
+# 导入/导出文件中的列，顺序即CSV表头的顺序；导出的文件可以原样再导入
+TARGET_FIELDS = ('name', 'url', 'check_interval_seconds', 'is_active', 'check_method', 'max_body_bytes',
+                 'body_keyword', 'body_sha256', 'force_fresh_connection', 'probe_type', 'probe_params', 'log_mode',
+                 'agent_id')
+_BOOLEAN_DEFAULTS = {'is_active': True, 'force_fresh_connection': False} # 文件中未填写时的取值
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on', '是'}
+_FALSE_VALUES = {'0', 'false', 'no', 'n', 'off', '否'}
+_READ_SIZE = 64 * 1024
+_MAX_REPORTED_ERRORS = 100 # 报告中最多列出的错误条数
+
+
+class BulkImportError(ValueError):
+    """
+    导入文件无法解析 (格式错误)，整个导入被放弃。
+    """
+
+
+def detect_format(filename, content_type=None):
+    """
+    根据文件名或 Content-Type 判断文件格式，返回 'csv' 或 'json'，无法判断时返回 None。
+    """
+    name = (filename or '').lower()
+    if name.endswith('.csv') or (content_type or '').startswith('text/csv'):
+        return 'csv'
+    if name.endswith(('.json', '.jsonl', '.ndjson')) or 'json' in (content_type or ''):
+        return 'json'
+    return None
+
+
+def iter_records(stream, file_format):
+    """
+    以流式方式逐条读取导入文件，不把整个文件读入内存。
+    :param stream: 二进制文件对象 (上传的文件或请求体)。
+    :param file_format: 'csv' 或 'json' (JSON 数组或每行一个对象的 JSON Lines)。
+    :return: (位置描述, 记录字典) 的生成器。
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == 'csv':
+            reader = csv.DictReader(text)
+            missing = {'name', 'url'} - set(reader.fieldnames or ())
+            if missing:
+                raise BulkImportError(f"CSV 表头缺少必填列: {', '.join(sorted(missing))}")
+            for record in reader:
+                yield f"第 {reader.line_num} 行", record
+        elif file_format == 'json':
+            yield from _iter_json(text)
+        else:
+            raise BulkImportError(f"不支持的文件格式: {file_format}")
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise BulkImportError(f"无法解析导入文件: {e}") from e
+    finally:
+        text.detach() # 不随包装器一起关闭调用方的文件对象
+
+
+def _iter_json(text):
+    buffer = text.read(_READ_SIZE).lstrip()
+    if buffer.startswith('['):
+        yield from _iter_json_array(text, buffer[1:])
+        return
+    # JSON Lines：每行一个对象
+    line_no = 0
+    pending = buffer
+    while True:
+        chunk = text.read(_READ_SIZE)
+        pending += chunk
+        lines = pending.split('\n')
+        pending = lines.pop() if chunk else ''
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield f"第 {line_no} 行", _loads(line, line_no)
+        if not chunk:
+            return
+
+
+def _iter_json_array(text, buffer):
+    decoder = json.JSONDecoder()
+    index = 0
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            record, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise BulkImportError(f"JSON 数组第 {index + 1} 个元素格式错误: {e}") from e
+            chunk = text.read(_READ_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        index += 1
+        yield f"第 {index} 条", record
+        buffer = buffer[end:]
+
+
+def _loads(line, line_no):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        raise BulkImportError(f"第 {line_no} 行不是有效的 JSON: {e}") from e
+
+
+def _parse_bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    raise ValueError(f"无法识别的布尔值: {value}")
+
+
+def validate_record(record, form=None):
+    """
+    按添加目标表单 (AddTargetForm) 的规则校验一条导入记录。
+    :param form: 可复用的 AddTargetForm 实例 (csrf 已关闭)；批量校验时复用同一个实例，
+                 省去每条记录重新绑定全部字段的开销。
+    :return: (可直接写入 monitored_target 的列值字典, None) 或 (None, 错误信息)。
+    """
+    if not isinstance(record, dict):
+        return None, "记录必须是一个对象"
+    formdata = MultiDict()
+    try:
+        for field in TARGET_FIELDS:
+            value = record.get(field)
+            if field in _BOOLEAN_DEFAULTS:
+                if _parse_bool(value, _BOOLEAN_DEFAULTS[field]):
+                    formdata[field] = 'y'
+            elif isinstance(value, dict): # JSON 文件中的 probe_params 可以直接写成对象
+                formdata[field] = json.dumps(value, ensure_ascii=False)
+            elif value is not None and value != '':
+                formdata[field] = str(value).strip()
+    except ValueError as e:
+        return None, str(e)
+
+    if form is None:
+        form = AddTargetForm(formdata=formdata, meta={'csrf': False})
+    else:
+        form.process(formdata)
+    if not form.validate():
+        return None, '; '.join(f"{form[name].label.text}: {' '.join(errors)}" for name, errors in form.errors.items())
+    return {
+        'name': form.name.data,
+        'url': form.url.data,
+        'check_interval_seconds': form.check_interval_seconds.data,
+        'is_active': form.is_active.data,
+        'check_method': form.check_method.data,
+        'max_body_bytes': form.max_body_bytes.data or 65536,
+        'body_keyword': form.body_keyword.data or None,
+        'body_sha256': (form.body_sha256.data or '').lower() or None,
+        'force_fresh_connection': form.force_fresh_connection.data,
+        'probe_type': form.probe_type.data,
+        'probe_params': form.probe_params.data or None,
+        'log_mode': form.log_mode.data,
+        'agent_id': form.agent_id.data or None,
+    }, None
+
+
+def _insert_statement():
+    # 并发导入同一URL时，依靠 url 唯一索引忽略已被其他事务插入的行
+    table = MonitoredTarget.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=[table.c.url])
+
+
+def _write_chunk(chunk, update_existing, version, report):
+    # chunk: {url: 列值字典}；一次查询找出已存在的URL，然后分别用一条 executemany 插入和更新，
+    # 写入的目标都标记为 config_version=version，探测 worker 据此只同步这些目标
+    table = MonitoredTarget.__table__
+    for values in chunk.values():
+        values['config_version'] = version
+    existing = set(db.session.scalars(select(table.c.url).where(table.c.url.in_(list(chunk)))))
+    inserts = [values for url, values in chunk.items() if url not in existing]
+    if inserts:
+        db.session.execute(_insert_statement(), inserts)
+        report['inserted'] += len(inserts)
+    if not existing:
+        return
+    if not update_existing:
+        report['skipped_existing'] += len(existing)
+        return
+    update_columns = [field for field in TARGET_FIELDS if field != 'url'] + ['config_version']
+    db.session.execute(
+        table.update().where(table.c.url == bindparam('b_url'))
+        .values({column: bindparam(f'b_{column}') for column in update_columns}),
+        [{f'b_{key}': value for key, value in chunk[url].items()} for url in existing])
+    report['updated'] += len(existing)
+
+
+def import_targets(records, update_existing=True, chunk_size=500):
+    """
+    批量导入监控目标 (在当前会话中执行并提交一次事务)。
+    记录逐条校验，每 chunk_size 条有效记录按 url 去重后用集合操作写入：已存在的URL更新或跳过，新URL批量插入。
+    导入的目标不会请求立即检查，探测 worker 收到变化通知后一次性领取整批目标，
+    调度器按每个目标的相位把首次检查均匀错开在各自的检查间隔内，不会同时发起大量检查。
+
+    :param records: iter_records() 产生的 (位置描述, 记录字典) 可迭代对象。
+    :param update_existing: URL 已存在时是否用导入的值更新该目标。
+    :return: 导入报告字典。
+    """
+    started = time.monotonic()
+    report = {'total': 0, 'inserted': 0, 'updated': 0, 'skipped_existing': 0, 'duplicates': 0,
+              'invalid': 0, 'errors': []}
+    chunk = {}
+    version = None # 第一次写入前才递增 targets_version
+    form = AddTargetForm(formdata=None, meta={'csrf': False})
+    for position, record in records:
+        report['total'] += 1
+        values, error = validate_record(record, form)
+        if error:
+            report['invalid'] += 1
+            if len(report['errors']) < _MAX_REPORTED_ERRORS:
+                report['errors'].append(f"{position}: {error}")
+            continue
+        if values['url'] in chunk:
+            report['duplicates'] += 1 # 文件中重复的URL以最后一次出现为准
+        chunk[values['url']] = values
+        if len(chunk) >= chunk_size:
+            version = version or bump_version(TARGETS_VERSION, RESULTS_VERSION)
+            _write_chunk(chunk, update_existing, version, report)
+            chunk = {}
+    if chunk:
+        version = version or bump_version(TARGETS_VERSION, RESULTS_VERSION)
+        _write_chunk(chunk, update_existing, version, report)
+    db.session.commit()
+    report['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+    logger.info(f"批量导入监控目标完成: 共 {report['total']} 条，新增 {report['inserted']}，更新 {report['updated']}，"
+                f"跳过已存在 {report['skipped_existing']}，文件内重复 {report['duplicates']}，无效 {report['invalid']}，"
+                f"耗时 {report['elapsed_ms']}ms。")
+    return report
+
+
+def export_targets(file_format, batch_size=1000):
+    """
+    以流式方式导出全部监控目标，逐批从数据库读取，不把所有目标同时加载到内存。
+    :param file_format: 'csv' 或 'json' (JSON 数组)。
+    :return: 文本片段的生成器 (需要在应用上下文中迭代)。
+    """
+    columns = [MonitoredTarget.__table__.c[field] for field in TARGET_FIELDS]
+    result = db.session.execute(
+        select(*columns).order_by(MonitoredTarget.id).execution_options(yield_per=batch_size))
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(TARGET_FIELDS)
+        for rows in result.partitions():
+            writer.writerows(
+                [(*row[:3], int(row.is_active), *row[4:8], int(row.force_fresh_connection), *row[9:]) for row in rows])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        yield '['
+        separator = '\n'
+        for rows in result.partitions():
+            for row in rows:
+                yield separator + json.dumps(dict(row._mapping), ensure_ascii=False)
+                separator = ',\n'
+        yield '\n]\n'
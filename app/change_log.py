@@ -0,0 +1,152 @@
+from app.rollups import to_utc_naive
+
+# 原始检查日志的记录方式 (MonitoredTarget.log_mode)：
+# full    每次检查写一行 check_log (默认)；
+# changes 只在状态或状态码变化时写一行完整记录，状态不变的检查被汇总：
+#         距上一行超过心跳间隔 (CHANGE_LOG_HEARTBEAT_SECONDS) 时写一行汇总记录，
+#         sample_count 为它代表的检查次数，response_time_ms 为这些检查的平均响应时间。
+# 状态变化前尚未写出的汇总会先以旧状态写出，因此相邻两行之间的状态总是与较早的一行相同，
+# 日志页面据此还原完整的状态时间线。分钟/小时/天聚合表不受影响，仍然包含每一次检查。
+LOG_MODE_FULL = 'full'
+LOG_MODE_CHANGES = 'changes'
+LOG_MODE_CHOICES = [(LOG_MODE_FULL, '记录每次检查'), (LOG_MODE_CHANGES, '只记录状态变化 (其余检查定期汇总)')]
+DEFAULT_HEARTBEAT_SECONDS = 900
+
+
+def check_log_row(result, **overrides):
+    """
+    把 ProbeResult 转换为插入 check_log 表的列值字典。
+    :param overrides: 覆盖的列值，例如汇总记录的 sample_count 和平均 response_time_ms。
+    """
+    timings = result.timings
+    row = {
+        'target_id': result.target_id,
+        'timestamp': result.timestamp,
+        'status_code': result.status_code,
+        'status_text': result.status_text,
+        'response_time_ms': result.response_time_ms,
+        'details': result.details,
+        'dns_ms': timings.dns_ms if timings else None,
+        'connect_ms': timings.connect_ms if timings else None,
+        'tls_ms': timings.tls_ms if timings else None,
+        'ttfb_ms': timings.ttfb_ms if timings else None,
+        'transfer_ms': timings.transfer_ms if timings else None,
+        'connection_reused': timings.reused if timings else None,
+        'sample_count': None,
+    }
+    row.update(overrides)
+    return row
+
+
+class ChangeLogState:
+    """
+    一个目标在写入过程中的日志状态，初始值来自 TargetStatus，批次结束后随 TargetStatus 一起写回，
+    因此 worker 重启或目标换到其他 worker 之后仍能继续判断状态变化和心跳。
+    """
+    __slots__ = ('mode', 'status_text', 'status_code', 'checked_at', 'logged_at',
+                 'pending_checks', 'pending_latency_sum', 'pending_latency_count')
+
+    def __init__(self, mode=LOG_MODE_FULL, status_text=None, status_code=None, checked_at=None, logged_at=None,
+                 pending_checks=0, pending_latency_sum=0.0, pending_latency_count=0):
+        self.mode = mode
+        self.status_text = status_text # 上一次检查的状态，None 表示还没有检查过
+        self.status_code = status_code
+        self.checked_at = checked_at # 上一次检查的时间 (不带时区的UTC)
+        self.logged_at = logged_at # 上一次写入 check_log 的时间 (不带时区的UTC)
+        self.pending_checks = pending_checks or 0 # 自上一行之后被汇总、尚未写出的检查次数
+        self.pending_latency_sum = pending_latency_sum or 0.0
+        self.pending_latency_count = pending_latency_count or 0
+
+    def observe(self, result, heartbeat_seconds):
+        """
+        处理一条检查结果 (按时间顺序)。
+        :param heartbeat_seconds: changes 模式下状态不变时至少每隔多少秒写一行汇总记录。
+        :return: 需要插入 check_log 的列值字典列表 (0 到 2 行)。
+        """
+        timestamp = to_utc_naive(result.timestamp)
+        rows = []
+        if self.mode != LOG_MODE_CHANGES:
+            rows.append(check_log_row(result))
+        elif (self.status_text is None or result.status_text != self.status_text
+              or result.status_code != self.status_code):
+            if self.pending_checks:
+                # 先以旧状态写出变化之前被汇总的检查，时间为其中最后一次检查的时间
+                rows.append(check_log_row(
+                    result, timestamp=self.checked_at, status_text=self.status_text, status_code=self.status_code,
+                    response_time_ms=self._pending_mean(), details=None, dns_ms=None, connect_ms=None, tls_ms=None,
+                    ttfb_ms=None, transfer_ms=None, connection_reused=None, sample_count=self.pending_checks))
+            rows.append(check_log_row(result))
+        else:
+            self._fold(result.response_time_ms)
+            if self.logged_at is not None and (timestamp - self.logged_at).total_seconds() < heartbeat_seconds:
+                self.status_text, self.status_code, self.checked_at = result.status_text, result.status_code, timestamp
+                return rows
+            # 心跳：本次检查连同之前被汇总的检查写成一行汇总记录
+            rows.append(check_log_row(result, response_time_ms=self._pending_mean(), sample_count=self.pending_checks))
+
+        self.status_text, self.status_code, self.checked_at = result.status_text, result.status_code, timestamp
+        self.logged_at = timestamp
+        self.pending_checks = 0
+        self.pending_latency_sum = 0.0
+        self.pending_latency_count = 0
+        return rows
+
+    def _fold(self, response_time_ms):
+        self.pending_checks += 1
+        if response_time_ms is not None:
+            self.pending_latency_sum += response_time_ms
+            self.pending_latency_count += 1
+
+    def _pending_mean(self):
+        if not self.pending_latency_count:
+            return None
+        return round(self.pending_latency_sum / self.pending_latency_count, 2)
+
+
+class TimelinePeriod:
+    """
+    日志页面时间线中的一段：状态和状态码保持不变的一段时间。
+    """
+    __slots__ = ('status_text', 'status_code', 'start', 'end', 'checks', 'ongoing')
+
+    def __init__(self, status_text, status_code, start, end, checks, ongoing):
+        self.status_text = status_text
+        self.status_code = status_code
+        self.start = start
+        self.end = end # 下一段开始的时间；仍在持续时为最后一次检查的时间
+        self.checks = checks # 这段时间内的检查次数 (汇总记录按 sample_count 计)
+        self.ongoing = ongoing
+
+    @property
+    def duration_seconds(self):
+        return (self.end - self.start).total_seconds()
+
+
+def reconstruct_timeline(logs, last_checked_at=None, pending_checks=0):
+    """
+    从按时间倒序排列的一页日志 (完整记录和汇总记录均可) 还原状态时间线：
+    相邻且状态、状态码相同的记录合并为一段，每段持续到下一段 (更新的一段) 开始为止。
+    :param logs: 带有 timestamp、status_text、status_code、sample_count 属性的记录，最新的在前。
+    :param last_checked_at: 目标最近一次检查的时间，只在显示最新一页时提供，作为最新一段的结束时间
+                            (最后一行之后的检查可能尚在汇总中，没有写出)。
+    :param pending_checks: 最后一行之后被汇总、尚未写出的检查次数，计入最新一段。
+    :return: TimelinePeriod 列表，最新的在前。
+    """
+    periods = []
+    newer_start = None # 比当前记录更新的一段的开始时间
+    for log in logs:
+        checks = log.sample_count or 1
+        current = periods[-1] if periods else None
+        if current is not None and current.status_text == log.status_text and current.status_code == log.status_code:
+            current.start = log.timestamp
+            current.checks += checks
+            continue
+        if current is not None:
+            newer_start = current.start
+        if newer_start is None: # 本页最新的一段；只有最新一页才知道它仍在持续
+            end = max(log.timestamp, to_utc_naive(last_checked_at)) if last_checked_at else log.timestamp
+            periods.append(TimelinePeriod(log.status_text, log.status_code, log.timestamp, end,
+                                          checks + (pending_checks if last_checked_at else 0), last_checked_at is not None))
+        else:
+            periods.append(TimelinePeriod(log.status_text, log.status_code, log.timestamp, newer_start, checks, False))
+    return periods
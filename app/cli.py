@@ -0,0 +1,71 @@
+import click
+from datetime import datetime, timezone
+from app import logger
+
+
+def register_commands(app):
+    """
+    注册项目自定义的 flask 命令行命令。
+    :param app: Flask应用实例。
+    """
+
+    @app.cli.command('rebuild-status')
+    def rebuild_status_command():
+        """根据历史检查日志为缺少当前状态的目标补建 TargetStatus。"""
+        from app.result_writer import rebuild_target_status
+        created = rebuild_target_status()
+        logger.info(f"已为 {created} 个目标补建当前状态记录。")
+        click.echo(f"已为 {created} 个目标补建当前状态记录。")
+
+    @app.cli.command('backfill-rollups')
+    @click.option('--start', help='起始日期 (YYYY-MM-DD，UTC)，默认为最早原始记录之后的第一个整天。')
+    @click.option('--end', help='结束日期 (YYYY-MM-DD，UTC，不含)，默认为今天。')
+    def backfill_rollups_command(start, end):
+        """根据 check_log 历史记录重建分钟/小时/天聚合数据。"""
+        from app.rollups import backfill_rollups
+        scanned, written = backfill_rollups(
+            start=datetime.strptime(start, '%Y-%m-%d') if start else None,
+            end=datetime.strptime(end, '%Y-%m-%d') if end else None)
+        logger.info(f"聚合回填完成: 读取 {scanned} 条原始记录，写入 {written} 行聚合数据。")
+        click.echo(f"聚合回填完成: 读取 {scanned} 条原始记录，写入 {written} 行聚合数据。")
+
+    @app.cli.command('compact')
+    def compact_command():
+        """按保留策略立即清理一次过期的原始日志和聚合数据。"""
+        from app.retention import run_compaction
+        report = run_compaction(app)
+        click.echo(f"数据保留任务完成: {report}")
+
+    @app.cli.command('sla-report')
+    @click.option('--start', required=True, help='起始日期 (YYYY-MM-DD，UTC)。')
+    @click.option('--end', help='结束日期 (YYYY-MM-DD，UTC，不含)，默认为当前时间。')
+    @click.option('--target', 'target_ids', type=int, multiple=True, help='只统计指定ID的目标，可重复使用。')
+    @click.option('--bucket', type=click.Choice(['hour', 'day']), default='day', show_default=True, help='时间桶长度。')
+    @click.option('--min-failures', type=int, default=1, show_default=True, help='至少连续失败几次检查才算一次故障。')
+    @click.option('--format', 'output_format', type=click.Choice(['json', 'csv']), default='json', show_default=True,
+                  help='json 输出完整报表；csv 每个目标一行。')
+    @click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='输出文件，默认为标准输出。')
+    def sla_report_command(start, end, target_ids, bucket, min_failures, output_format, output):
+        """根据原始检查历史生成 SLA 报表 (可用率、故障、MTTR/MTBF、延迟分位数)。"""
+        import csv
+        import json
+        from app import segment_store
+        from app.reports import build_report, report_to_json, TARGET_COLUMNS
+        try:
+            end_date = datetime.strptime(end, '%Y-%m-%d') if end else datetime.now(timezone.utc)
+            report = build_report(datetime.strptime(start, '%Y-%m-%d'), end_date,
+                                  target_ids=list(target_ids) or None,
+                                  bucket_seconds=3600 if bucket == 'hour' else 86400, min_failures=min_failures,
+                                  store=segment_store if segment_store.enabled else None)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        report = report_to_json(report)
+        if output_format == 'csv':
+            writer = csv.writer(output)
+            writer.writerow(TARGET_COLUMNS)
+            for row in report['targets']:
+                writer.writerow(['' if row[column] is None else row[column] for column in TARGET_COLUMNS])
+        else:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+            output.write('\n')
+        logger.info(f"SLA 报表已生成: {report['overall']['targets']} 个目标, {report['rows']} 条检查记录。")
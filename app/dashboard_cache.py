@@ -0,0 +1,85 @@
+import threading
+import time
+
+from app.metrics import counter
+
+
+class DashboardCache:
+    """
+    仪表盘页面的渲染缓存，以 results_version 为键。
+    版本号没有变化时直接复用上一次渲染并编码好的页面；版本号变化后只由一个请求重新渲染，
+    同时到达的其他请求等待并复用它的结果。每个 Web 进程各自持有一份缓存。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self._version = None
+        self._html = None
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0 # 以 304 响应、无需读取缓存的请求数
+        self.render_seconds = 0.0 # 累计渲染耗时
+        self.last_render_ms = None # 最近一次渲染耗时
+
+    def get(self, version, render):
+        """
+        返回 version 对应的页面，缓存未命中时调用 render() 渲染。
+        :param version: 当前的 results_version。
+        :param render: 无参数的渲染函数，返回页面内容。
+        :return: (页面内容, 是否命中缓存)
+        """
+        with self._lock:
+            if self._version == version:
+                self.hits += 1
+                return self._html, True
+        with self._render_lock:
+            # 等待期间可能已有其他请求渲染了同一版本
+            with self._lock:
+                if self._version == version:
+                    self.hits += 1
+                    return self._html, True
+            started = time.perf_counter()
+            html = render()
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._version, self._html = version, html
+                self.misses += 1
+                self.render_seconds += elapsed
+                self.last_render_ms = round(elapsed * 1000, 2)
+            return html, False
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+            self._html = None
+
+    def stats(self):
+        """
+        返回缓存命中率和渲染耗时统计。
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'avg_render_ms': round(self.render_seconds * 1000 / self.misses, 2) if self.misses else None,
+                'last_render_ms': self.last_render_ms,
+            }
+
+    def collect_metrics(self):
+        """
+        返回仪表盘缓存的 Prometheus 指标文本行。
+        """
+        return (counter('webpulse_dashboard_cache_hits_total', '仪表盘渲染缓存命中次数', self.hits)
+                + counter('webpulse_dashboard_cache_misses_total', '仪表盘重新渲染次数', self.misses)
+                + counter('webpulse_dashboard_not_modified_total', '仪表盘返回 304 的次数', self.not_modified)
+                + counter('webpulse_dashboard_render_seconds_total', '仪表盘累计渲染耗时', self.render_seconds))
@@ -0,0 +1,421 @@
+import heapq
+import logging
+import threading
+import time
+
+from app.metrics import Histogram, LabeledCounter, LATENCY_BUCKETS, LAG_BUCKETS, counter, gauge
+from app.probe_engine import ProbeTarget
+
+logger = logging.getLogger(__name__)
+
+# Knuth 乘法散列常数，用于把目标ID均匀地映射到 [0, 1) 区间
+_PHASE_MULTIPLIER = 2654435761
+
+
+def phase_offset(target_id, interval):
+    """
+    计算目标在其检查周期内的固定相位 (秒)。
+    相同间隔的目标会被确定性地错开，而同一个目标每次重启后的相位保持不变。
+    """
+    return ((target_id * _PHASE_MULTIPLIER) % 2**32) / 2**32 * interval
+
+
+def seconds_until_phase(target_id, interval, now_wall=None):
+    """
+    距离目标下一次到达其相位点还有多少秒 (基于墙上时间对齐)。
+    """
+    now_wall = time.time() if now_wall is None else now_wall
+    return (phase_offset(target_id, interval) - now_wall) % interval
+
+
+class _ScheduleEntry:
+    __slots__ = ('probe', 'base_interval', 'interval', 'generation', 'streak', 'retries', 'recovery_left', 'failing')
+
+    def __init__(self, probe, interval, generation):
+        self.probe = probe # ProbeTarget 模板，分发时只替换 due 字段
+        self.base_interval = interval # 目标配置的检查间隔
+        self.interval = interval # 当前实际使用的检查间隔 (自适应模式下会在稳定时逐步放宽)
+        self.generation = generation
+        # 以下为自适应模式的状态
+        self.streak = 0 # 当前间隔下连续正常的检查次数
+        self.retries = 0 # 本次故障已进行的确认重试次数
+        self.recovery_left = 0 # 恢复后剩余的高频复查次数
+        self.failing = False # 最近一次记录的结果是否为故障
+
+
+class CheckDispatcher:
+    """
+    单线程检查调度器。
+
+    所有激活的目标保存在同一个按“下次到期时间”排序的最小堆中，
+    由一个后台线程批量取出到期的目标交给探测引擎，
+    不再为每个目标创建 APScheduler 任务和应用上下文。
+    更新或移除目标时采用惰性删除：旧的堆元素通过 generation 判定为过期后直接丢弃。
+
+    检查结果经过 handle_result 再交给 result_handler (结果写入器)。开启自适应模式 (adaptive) 后：
+    连续 backoff_after 次正常的目标把检查间隔乘以 backoff_factor，直到 max_interval；
+    正常的目标第一次失败时不立即记录，而是按 retry_delay、2×retry_delay…… 的间隔重试 confirm_retries 次，
+    仍然失败才记录故障，重试成功则只记录正常结果；故障恢复后以 recovery_interval 的间隔复查
+    recovery_checks 次，再回到配置的检查间隔。任何失败都会使间隔回到配置值。
+    """
+
+    def __init__(self, engine=None, max_batch=1000, max_sleep=1.0, result_handler=None, adaptive=False,
+                 max_interval=3600, backoff_after=3, backoff_factor=2.0, confirm_retries=2, retry_delay=5,
+                 recovery_checks=3, recovery_interval=30, removal_handler=None):
+        self.engine = engine
+        self.max_batch = max_batch # 单次交给探测引擎的最大目标数
+        self.max_sleep = max_sleep # 调度线程最长休眠时间(秒)
+        self.result_handler = result_handler # 接收 (确认后的) ProbeResult 的回调函数
+        self.removal_handler = removal_handler # 目标被移出调度时以目标ID调用 (例如丢弃告警状态)，需要快速返回
+        self.adaptive = adaptive # 是否开启自适应检查频率和失败重试确认
+        self.max_interval = max_interval # 稳定目标放宽后的最大检查间隔(秒)，不会低于目标配置的间隔
+        self.backoff_after = backoff_after # 连续正常多少次后放宽一次间隔
+        self.backoff_factor = backoff_factor # 每次放宽时间隔乘以的倍数
+        self.confirm_retries = confirm_retries # 记录故障前的确认重试次数
+        self.retry_delay = retry_delay # 第一次确认重试的延迟(秒)，之后每次加倍
+        self.recovery_checks = recovery_checks # 故障恢复后的高频复查次数
+        self.recovery_interval = recovery_interval # 高频复查的间隔(秒)，不会高于目标配置的间隔
+
+        self._heap = [] # 元素为 (due, target_id, generation)
+        self._entries = {} # target_id -> _ScheduleEntry
+        self._generation = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+        self.dispatched = 0 # 已分发的检查次数
+        self.backoffs = 0 # 放宽检查间隔的次数
+        self.retries_scheduled = 0 # 安排的确认重试次数
+        self.failures_confirmed = 0 # 重试后仍失败、被记录的故障次数
+        self.failures_cleared = 0 # 重试成功、未被记录为故障的瞬时失败次数
+
+        # 检查结果的指标，只在 handle_result 中 (探测引擎的单个结果处理线程) 更新，不需要加锁
+        self.check_latency = Histogram(LATENCY_BUCKETS) # 响应时间(秒)
+        self.schedule_lag = Histogram(LAG_BUCKETS) # 实际开始时间相对计划时间的延迟(秒)
+        self.results_by_status = LabeledCounter()
+        self.errors_by_class = LabeledCounter()
+
+    def init_app(self, app, engine, result_handler=None, removal_handler=None):
+        """
+        从Flask应用配置中读取调度参数，并绑定探测引擎。
+        :param result_handler: 接收检查结果的下游回调 (通常是结果写入器的 submit)；
+                               探测引擎应以本调度器的 handle_result 作为自己的 result_handler。
+        :param removal_handler: 目标被移出调度时以目标ID调用的回调。
+        """
+        self.engine = engine
+        if result_handler is not None:
+            self.result_handler = result_handler
+        if removal_handler is not None:
+            self.removal_handler = removal_handler
+        self.max_batch = app.config.get('DISPATCHER_MAX_BATCH', self.max_batch)
+        self.adaptive = app.config.get('ADAPTIVE_CHECKS', self.adaptive)
+        self.max_interval = app.config.get('ADAPTIVE_MAX_INTERVAL_SECONDS', self.max_interval)
+        self.backoff_after = app.config.get('ADAPTIVE_BACKOFF_AFTER', self.backoff_after)
+        self.backoff_factor = app.config.get('ADAPTIVE_BACKOFF_FACTOR', self.backoff_factor)
+        self.confirm_retries = app.config.get('ADAPTIVE_CONFIRM_RETRIES', self.confirm_retries)
+        self.retry_delay = app.config.get('ADAPTIVE_RETRY_DELAY_SECONDS', self.retry_delay)
+        self.recovery_checks = app.config.get('ADAPTIVE_RECOVERY_CHECKS', self.recovery_checks)
+        self.recovery_interval = app.config.get('ADAPTIVE_RECOVERY_INTERVAL_SECONDS', self.recovery_interval)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, target_id):
+        return target_id in self._entries
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='check-dispatcher', daemon=True)
+        self._thread.start()
+        logger.info(f"检查调度器已启动，当前共有 {len(self._entries)} 个目标。")
+
+    def stop(self, timeout=5):
+        if not self.running:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+        logger.info("检查调度器已停止。")
+
+    def _push(self, target_id, entry, delay):
+        heapq.heappush(self._heap, (time.monotonic() + delay, target_id, entry.generation))
+
+    def upsert(self, target):
+        """
+        添加或更新一个目标的调度。首次到期时间按其相位错开。
+        :param target: MonitoredTarget 对象或包含同名列的查询结果行。
+        """
+        self.load([target])
+
+    def load(self, targets):
+        """
+        批量添加或更新目标。
+        :param targets: MonitoredTarget 对象或查询结果行的可迭代对象，
+                        需要包含 id、check_interval_seconds 以及 ProbeTarget.from_row 读取的列。
+        """
+        now_wall = time.time()
+        now = time.monotonic()
+        with self._cond:
+            items = []
+            for row in targets:
+                target_id, interval = row.id, row.check_interval_seconds
+                self._generation += 1
+                entry = _ScheduleEntry(ProbeTarget.from_row(row), interval, self._generation)
+                self._entries[target_id] = entry
+                items.append((now + seconds_until_phase(target_id, interval, now_wall), target_id, entry.generation))
+            # 一次装入大量目标时 (例如启动时) 整体重建堆比逐个 heappush 更快
+            if len(items) > len(self._heap):
+                self._heap.extend(items)
+                heapq.heapify(self._heap)
+            else:
+                for item in items:
+                    heapq.heappush(self._heap, item)
+            self._cond.notify()
+
+    def sync(self, targets):
+        """
+        使调度内容与 targets 保持一致：新增或配置发生变化的目标重新装入，不在 targets 中的目标被移除，
+        未变化的目标保持原有的检查节奏。
+        :param targets: 与 load 相同的行对象的可迭代对象 (应包含全部需要调度的目标)。
+        :return: (装入或更新的目标数, 移除的目标数)
+        """
+        targets = list(targets)
+        wanted = {row.id for row in targets}
+        with self._cond:
+            stale = [target_id for target_id in self._entries if target_id not in wanted]
+            return self.apply(targets, stale)
+
+    def apply(self, targets=(), removed=()):
+        """
+        增量更新调度：targets 中新增或配置发生变化的目标重新装入，removed 中的目标被移除，
+        其他目标 (包括 targets 中配置未变化的目标) 保持原有的检查节奏。
+        :param targets: 与 load 相同的行对象的可迭代对象。
+        :param removed: 要移除的目标ID。
+        :return: (装入或更新的目标数, 移除的目标数)
+        """
+        changed = []
+        with self._cond:
+            for row in targets:
+                entry = self._entries.get(row.id)
+                if (entry is None or entry.base_interval != row.check_interval_seconds
+                        or entry.probe != ProbeTarget.from_row(row)):
+                    changed.append(row)
+            removed_count = 0
+            for target_id in removed:
+                removed_count += self._pop(target_id)
+            if changed:
+                self.load(changed)
+        return len(changed), removed_count
+
+    def target_ids(self):
+        """
+        返回当前调度中全部目标ID的列表 (快照)。
+        """
+        with self._cond:
+            return list(self._entries)
+
+    def clear(self):
+        """
+        移除全部目标的调度。
+        """
+        with self._cond:
+            for target_id in list(self._entries):
+                self._pop(target_id)
+            self._heap.clear()
+
+    def remove(self, target_id):
+        """
+        移除一个目标的调度。堆中残留的元素会在到期时被丢弃。
+        """
+        with self._cond:
+            return self._pop(target_id)
+
+    def _pop(self, target_id):
+        # 调用方需持有 self._cond
+        if self._entries.pop(target_id, None) is None:
+            return False
+        if self.removal_handler is not None:
+            self.removal_handler(target_id)
+        return True
+
+    def run_now(self, target_id):
+        """
+        立即检查一次指定目标，不改变其原有的检查节奏。
+        :return: 目标不在调度中时返回 False。
+        """
+        entry = self._entries.get(target_id)
+        if entry is None:
+            return False
+        self.engine.submit([entry.probe._replace(due=time.monotonic())])
+        return True
+
+    def handle_result(self, result):
+        """
+        探测引擎的 result_handler。自适应模式下先根据结果调整目标的检查间隔，
+        需要重试确认的失败结果被暂扣，其余结果交给下游的 result_handler。
+        :param result: ProbeResult 实例。
+        """
+        if result.response_time_ms is not None:
+            self.check_latency.observe(result.response_time_ms / 1000)
+        if result.lag_ms is not None:
+            self.schedule_lag.observe(max(result.lag_ms, 0) / 1000)
+        self.results_by_status.inc(result.status_text)
+        if result.error_class:
+            self.errors_by_class.inc(result.error_class)
+        if self.adaptive:
+            with self._cond:
+                result = self._adapt(result)
+        if result is not None and self.result_handler is not None:
+            self.result_handler(result)
+
+    def _adapt(self, result):
+        # 调用方需持有 self._cond；返回要记录的结果，暂扣时返回 None
+        target_id = result.target_id
+        entry = self._entries.get(target_id)
+        if entry is None:
+            return result
+        if result.status_text == 'UP':
+            retried = entry.retries
+            entry.retries = 0
+            if entry.failing:
+                # 刚从故障中恢复：先高频复查几次，确认恢复稳定后再回到配置的间隔
+                entry.failing = False
+                entry.streak = 0
+                entry.recovery_left = self.recovery_checks
+                entry.interval = entry.base_interval
+                if entry.recovery_left:
+                    self._reschedule(target_id, entry, min(self.recovery_interval, entry.base_interval))
+            elif entry.recovery_left:
+                entry.recovery_left -= 1
+                if entry.recovery_left:
+                    self._reschedule(target_id, entry, min(self.recovery_interval, entry.base_interval))
+                else:
+                    self._reschedule(target_id, entry, seconds_until_phase(target_id, entry.interval))
+            else:
+                entry.streak += 1
+                limit = max(self.max_interval, entry.base_interval)
+                if entry.streak >= self.backoff_after and entry.interval < limit:
+                    entry.interval = min(limit, int(entry.interval * self.backoff_factor))
+                    entry.streak = 0
+                    self.backoffs += 1
+                if retried:
+                    # 重试打乱了原来的节奏，重新对齐到相位点
+                    self.failures_cleared += 1
+                    self._reschedule(target_id, entry, seconds_until_phase(target_id, entry.interval))
+            return result
+
+        entry.streak = 0
+        entry.recovery_left = 0
+        entry.interval = entry.base_interval
+        if not entry.failing and entry.retries < self.confirm_retries:
+            delay = self.retry_delay * 2 ** entry.retries
+            entry.retries += 1
+            self.retries_scheduled += 1
+            self._reschedule(target_id, entry, delay)
+            logger.debug(f"目标 {result.target_name} (ID: {target_id}) 检查失败 ({result.status_text})，"
+                         f"{delay} 秒后进行第 {entry.retries} 次确认重试。")
+            return None
+        retried = entry.retries
+        entry.retries = 0
+        if not entry.failing:
+            entry.failing = True
+            self.failures_confirmed += 1
+            # 放宽间隔期间出现故障时，下一次检查回到配置的间隔
+            self._reschedule(target_id, entry, seconds_until_phase(target_id, entry.base_interval))
+        if retried:
+            result = result._replace(details=f"{result.details} (重试 {retried} 次后确认)")
+        return result
+
+    def _reschedule(self, target_id, entry, delay):
+        # 调用方需持有 self._cond；使堆中原有的元素失效，改为 delay 秒后到期
+        self._generation += 1
+        entry.generation = self._generation
+        self._push(target_id, entry, delay)
+        self._cond.notify()
+
+    def load_stats(self):
+        """
+        返回检查负载统计：按配置间隔计算的名义检查频率、自适应调整后的实际检查频率 (次/分钟)，
+        以及节省的比例和放宽、重试的计数。
+        """
+        with self._cond:
+            nominal = effective = 0.0
+            backed_off = 0
+            for entry in self._entries.values():
+                nominal += 60 / entry.base_interval
+                if entry.recovery_left:
+                    effective += 60 / min(self.recovery_interval, entry.base_interval)
+                else:
+                    effective += 60 / entry.interval
+                backed_off += entry.interval > entry.base_interval
+        return {
+            'targets': len(self._entries),
+            'nominal_checks_per_min': round(nominal, 2),
+            'effective_checks_per_min': round(effective, 2),
+            'saved_ratio': round(1 - effective / nominal, 4) if nominal else 0.0,
+            'backed_off_targets': backed_off,
+            'dispatched': self.dispatched,
+            'backoffs': self.backoffs,
+            'retries_scheduled': self.retries_scheduled,
+            'failures_confirmed': self.failures_confirmed,
+            'failures_cleared': self.failures_cleared,
+        }
+
+    def collect_metrics(self):
+        """
+        返回调度器和检查结果的 Prometheus 指标文本行 (包括确认重试前的每一次原始检查结果)。
+        """
+        lines = []
+        lines += self.check_latency.expose('webpulse_check_latency_seconds', '检查的响应时间')
+        lines += self.schedule_lag.expose('webpulse_schedule_lag_seconds', '检查实际开始时间相对计划时间的延迟')
+        lines += self.results_by_status.expose('webpulse_check_results_total', '按状态统计的检查结果数', 'status')
+        lines += self.errors_by_class.expose('webpulse_check_errors_total', '按类别统计的检查失败数', 'class')
+        lines += gauge('webpulse_scheduled_targets', '调度器中的目标数', len(self._entries))
+        lines += gauge('webpulse_schedule_heap_size', '调度堆的元素数 (包括等待惰性删除的过期元素)', len(self._heap))
+        lines += counter('webpulse_checks_dispatched_total', '交给探测引擎的检查次数', self.dispatched)
+        lines += counter('webpulse_check_retries_total', '自适应模式安排的确认重试次数', self.retries_scheduled)
+        return lines
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = self.max_sleep if not self._heap else min(self.max_sleep, self._heap[0][0] - now)
+                    self._cond.wait(timeout)
+                if self._stopping:
+                    return
+                batch = self._pop_due(time.monotonic())
+            if batch:
+                self.dispatched += len(batch)
+                try:
+                    self.engine.submit(batch)
+                except Exception as e:
+                    logger.error(f"向探测引擎提交 {len(batch)} 个检查时发生错误: {e}", exc_info=True)
+
+    def _pop_due(self, now):
+        # 调用方需持有 self._cond
+        batch = []
+        heap = self._heap
+        while heap and heap[0][0] <= now and len(batch) < self.max_batch:
+            due, target_id, generation = heapq.heappop(heap)
+            entry = self._entries.get(target_id)
+            if entry is None or entry.generation != generation:
+                continue # 目标已被移除或更新，丢弃过期的堆元素
+            batch.append(entry.probe._replace(due=due))
+            next_due = due + entry.interval
+            if next_due <= now:
+                # 落后超过一个周期 (例如进程被挂起)，不补跑，直接对齐到下一个相位点
+                next_due = now + seconds_until_phase(target_id, entry.interval)
+            heapq.heappush(heap, (next_due, target_id, generation))
+        return batch
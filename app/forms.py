@@ -1,8 +1,94 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, IntegerField, BooleanField, SubmitField, TextAreaField, PasswordField # 根据需要导入
-from wtforms.validators import DataRequired, URL, NumberRange, Length, Optional, Email # 根据需要导入验证器
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, IntegerField, BooleanField, SubmitField, TextAreaField, PasswordField, SelectField # 根据需要导入
+from wtforms.validators import DataRequired, URL, NumberRange, Length, Optional, Email, Regexp # 根据需要导入验证器
 
-class AddTargetForm(FlaskForm):
+from app.probe_types import probe_type_choices, validate_url, parse_probe_params, dump_probe_params
+from app.change_log import LOG_MODE_CHOICES
+
+class BodyCheckMixin:
+    """
+    探测方式和响应体校验字段，供添加/编辑目标表单共用。
+    未配置关键字或哈希时，探测在收到响应头后立即返回，不下载响应体。
+    默认复用到同一主机的 keep-alive 连接，勾选 force_fresh_connection 时每次都新建连接。
+    探测类型不是 HTTP 时，URL 的协议必须与类型相符 (tcp:// tls:// dns://)，响应体校验不适用。
+    """
+    probe_type = SelectField(
+        '探测类型',
+        choices=probe_type_choices(),
+        default='http'
+    )
+    probe_params = StringField(
+        '探测参数 (JSON)',
+        validators=[Optional(), Length(max=1000, message="参数长度不能超过1000个字符。")],
+        render_kw={"placeholder": "可选，例如 TLS：{\"min_days\": 14}；TCP：{\"banner\": \"220\"}；DNS：{\"expect\": [\"1.2.3.4\"]}"}
+    )
+    check_method = SelectField(
+        '请求方法',
+        choices=[('GET', 'GET'), ('HEAD', 'HEAD (只请求响应头)')],
+        default='GET'
+    )
+    max_body_bytes = IntegerField(
+        '响应体读取上限 (字节)',
+        default=65536,
+        validators=[
+            Optional(),
+            NumberRange(min=1, max=10 * 1024 * 1024, message="读取上限必须在1字节到10MB之间。")
+        ],
+        render_kw={"min": "1"}
+    )
+    body_keyword = StringField(
+        '响应体关键字',
+        validators=[Optional(), Length(max=256, message="关键字长度不能超过256个字符。")],
+        render_kw={"placeholder": "可选，例如：status\": \"ok"}
+    )
+    body_sha256 = StringField(
+        '响应体 SHA-256',
+        validators=[
+            Optional(),
+            Regexp(r'^[0-9a-fA-F]{64}$', message="请输入64位十六进制的 SHA-256 值。")
+        ],
+        render_kw={"placeholder": "可选，校验完整响应体的哈希"}
+    )
+
+    force_fresh_connection = BooleanField('每次检查都新建连接 (测量冷启动的DNS/连接/TLS耗时)', default=False)
+    log_mode = SelectField(
+        '日志记录方式',
+        choices=LOG_MODE_CHOICES,
+        default='full'
+    )
+    agent_id = StringField(
+        '远程探测代理',
+        validators=[
+            Optional(),
+            Regexp(r'^[A-Za-z0-9_.:-]{1,64}$', message="代理ID只能包含字母、数字和 _.:-，长度不超过64。")
+        ],
+        render_kw={"placeholder": "可选，填写代理的 AGENT_ID 后由该代理检查；留空由本地探测 worker 检查"}
+    )
+
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        if self.check_method.data == 'HEAD' and (self.body_keyword.data or self.body_sha256.data):
+            self.check_method.errors.append("HEAD 请求没有响应体，关键字或哈希校验需要使用 GET。")
+            return False
+        try:
+            validate_url(self.probe_type.data, self.url.data)
+        except ValueError as e:
+            self.url.errors.append(str(e))
+            return False
+        if self.probe_type.data != 'http' and (self.body_keyword.data or self.body_sha256.data):
+            self.probe_type.errors.append("只有 HTTP 探测支持响应体关键字或哈希校验。")
+            return False
+        try:
+            # 保存规范化后的参数，worker 加载目标时无需再次处理格式差异
+            self.probe_params.data = dump_probe_params(parse_probe_params(self.probe_type.data, self.probe_params.data))
+        except ValueError as e:
+            self.probe_params.errors.append(str(e))
+            return False
+        return True
+
+class AddTargetForm(BodyCheckMixin, FlaskForm):
     """
     用于添加新的监控目标的表单。
     """
@@ -34,7 +120,7 @@ class AddTargetForm(FlaskForm):
     is_active = BooleanField('立即激活监控', default=True)
     submit = SubmitField('添加监控目标')
 
-class EditTargetForm(FlaskForm):
+class EditTargetForm(BodyCheckMixin, FlaskForm):
     """
     用于编辑现有监控目标的表单。
     与AddTargetForm类似，但可能在验证或字段上略有不同，或者用于不同的路由。
@@ -64,6 +150,25 @@ class EditTargetForm(FlaskForm):
     is_active = BooleanField('激活监控')
     submit = SubmitField('更新监控目标')
 
+class ImportTargetsForm(FlaskForm):
+    """
+    批量导入监控目标的表单 (上传 CSV 或 JSON 文件)。
+    """
+    file = FileField(
+        '目标文件',
+        validators=[
+            FileRequired(message="请选择要导入的文件。"),
+            FileAllowed(['csv', 'json', 'jsonl', 'ndjson'], message="只支持 CSV、JSON 或 JSON Lines 文件。")
+        ]
+    )
+    file_format = SelectField(
+        '文件格式',
+        choices=[('auto', '按扩展名自动识别'), ('csv', 'CSV'), ('json', 'JSON / JSON Lines')],
+        default='auto'
+    )
+    update_existing = BooleanField('URL 已存在时用文件中的配置更新该目标', default=True)
+    submit = SubmitField('开始导入')
+
 # 如果将来需要用户登录，可以添加登录表单：
 # class LoginForm(FlaskForm):
 #     username = StringField('用户名', validators=[DataRequired()])
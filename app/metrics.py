@@ -0,0 +1,153 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 指标模块不依赖 Flask 应用实例，使用标准的模块级 logger
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8' # Prometheus 文本格式
+
+# 常用的直方图分桶 (单位：秒或条)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+FLUSH_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BATCH_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Histogram:
+    """
+    固定分桶的直方图。
+
+    observe 只做一次二分查找和两次加法，不加锁：每个直方图只由流水线中的一个线程更新
+    (例如结果处理线程或写入线程)，抓取时读到的快照最多相差正在进行的一次观测。
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1) # 最后一个桶为 +Inf
+        self._sum = 0.0
+
+    def observe(self, value):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+
+    @property
+    def count(self):
+        return sum(self._counts)
+
+    def expose(self, name, documentation):
+        """
+        以 Prometheus 文本格式输出 (分桶计数为累计值)。
+        :return: 文本行列表。
+        """
+        lines = [f"# HELP {name} {documentation}", f"# TYPE {name} histogram"]
+        cumulative = 0
+        counts = list(self._counts)
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum {self._sum}")
+        lines.append(f"{name}_count {cumulative}")
+        return lines
+
+
+class LabeledCounter:
+    """
+    按一个标签取值分别计数的计数器 (例如按错误类别)，同样只由一个线程更新、不加锁。
+    """
+
+    def __init__(self):
+        self._values = {}
+
+    def inc(self, label_value, amount=1):
+        self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def get(self, label_value):
+        return self._values.get(label_value, 0)
+
+    def expose(self, name, documentation, label):
+        lines = [f"# HELP {name} {documentation}", f"# TYPE {name} counter"]
+        for value, count in sorted(dict(self._values).items()):
+            lines.append(f'{name}{{{label}="{value}"}} {count}')
+        return lines
+
+
+def counter(name, documentation, value):
+    """
+    输出一个计数器 (单调递增的累计值) 的文本行。
+    """
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} counter", f"{name} {value}"]
+
+
+def gauge(name, documentation, value):
+    """
+    输出一个瞬时值的文本行。
+    """
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+class MetricsRegistry:
+    """
+    指标收集器的注册表。
+
+    收集器是返回文本行列表的函数 (通常是各组件的 collect_metrics 方法)，只在被抓取时调用，
+    因此队列深度、进行中的检查数等瞬时值不会给检查流水线增加任何开销。
+    """
+
+    def __init__(self):
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, collector):
+        """
+        注册 (或替换) 一个收集器。
+        :param name: 收集器名称，同名注册会替换旧的收集器，因此重复调用是安全的。
+        :param collector: 无参数、返回文本行列表的函数。
+        """
+        with self._lock:
+            self._collectors[name] = collector
+
+    def render(self):
+        """
+        调用全部收集器，返回 Prometheus 文本格式的指标。单个收集器出错时跳过它，不影响其他指标。
+        """
+        with self._lock:
+            collectors = list(self._collectors.items())
+        lines = []
+        for name, collector in collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.error(f"收集指标 {name} 时发生错误: {e}", exc_info=True)
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='0.0.0.0'):
+        """
+        在后台线程中启动一个只提供 /metrics 的 HTTP 服务 (供不运行 Web 应用的探测 worker 进程使用)。
+        :return: ThreadingHTTPServer 实例，调用其 shutdown() 停止。
+        """
+        registry = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # 不为每次抓取输出访问日志
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        logger.info(f"指标服务已启动: http://{host}:{server.server_address[1]}/metrics")
+        return server
@@ -15,12 +15,40 @@ class MonitoredTarget(db.Model):
     added_on = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc)) # 添加时间，使用带时区的UTC时间
     last_checked_on = db.Column(db.DateTime, nullable=True) # 上次检查的时间戳
 
+    # 探测方式：默认只等待响应头 (不下载响应体)；配置了关键字或哈希校验时才以流式方式读取响应体
+    check_method = db.Column(db.String(8), default='GET', server_default='GET', nullable=False) # HTTP方法，'GET' 或 'HEAD'
+    max_body_bytes = db.Column(db.Integer, default=65536, server_default='65536', nullable=False) # 响应体校验时最多读取的字节数
+    body_keyword = db.Column(db.String(256), nullable=True) # 响应体中必须包含的关键字 (可选)
+    body_sha256 = db.Column(db.String(64), nullable=True) # 响应体完整内容的 SHA-256 (小写十六进制，可选)
+    force_fresh_connection = db.Column(db.Boolean, default=False, server_default='0', nullable=False) # 每次检查都新建连接，用于测量冷启动的DNS/连接/TLS耗时
+
+    # 探测类型：http (默认)、tcp (只建立连接)、tls (TLS握手并读取证书到期时间)、dns (只解析域名)，见 app.probe_types
+    probe_type = db.Column(db.String(16), default='http', server_default='http', nullable=False) # 探测类型
+    probe_params = db.Column(db.Text, nullable=True) # 探测类型的参数 (JSON 对象)，例如 {"min_days": 14}
+
+    # 原始日志记录方式：full 每次检查一行；changes 只记录状态变化，其余检查定期汇总为一行 (见 app.change_log)
+    log_mode = db.Column(db.String(16), default='full', server_default='full', nullable=False)
+
+    # 负责检查该目标的远程探测代理 (见 app.remote_agent)；为空时由本地的探测 worker 通过租约检查
+    agent_id = db.Column(db.String(64), nullable=True, index=True)
+
+    # 探测 worker 的租约：只有持有未过期租约的 worker 才会调度该目标，保证每个目标只被一个 worker 检查
+    lease_owner = db.Column(db.String(64), nullable=True, index=True) # 持有租约的 worker ID
+    lease_expires_at = db.Column(db.DateTime, nullable=True) # 租约到期时间 (UTC)，由 worker 心跳时续期
+    check_requested_at = db.Column(db.DateTime, nullable=True, index=True) # 用户请求立即检查的时间，持有租约的 worker 执行后清空
+    config_version = db.Column(db.BigInteger, nullable=True, index=True) # 最近一次添加、修改或暂停/激活时的 targets_version，worker 据此只同步变化的目标
+
     # 定义与 CheckLog 模型的一对多关系
     # 'check_logs' 属性可以用来访问与此目标关联的所有日志记录
     # backref='target' 会在 CheckLog 模型中创建一个隐式的 'target' 属性，指向关联的 MonitoredTarget 对象
     # lazy='dynamic' 表示关联的日志不会立即加载，而是返回一个查询对象，可以进一步过滤或排序
     # cascade="all, delete-orphan" 表示当删除一个 MonitoredTarget 时，所有关联的 CheckLog 也会被删除
-    check_logs = db.relationship('CheckLog', backref='target', lazy='dynamic', cascade="all, delete-orphan")
+    # passive_deletes=True 表示删除目标时不把日志逐条加载为ORM对象再删除，
+    # 日志由 app.retention.delete_target_history 用一条批量 DELETE 清理
+    check_logs = db.relationship('CheckLog', backref='target', lazy='dynamic', cascade="all, delete-orphan", passive_deletes=True)
+
+    # 目标的当前状态 (一对一)，由检查结果写入器维护
+    current_status = db.relationship('TargetStatus', uselist=False, cascade="all, delete-orphan")
 
     def __repr__(self):
         # 定义对象的字符串表示形式，方便调试
@@ -31,12 +59,17 @@ class CheckLog(db.Model):
     记录每一次对监控目标的检查结果。
     """
     __tablename__ = 'check_log' # 明确指定表名
+    __table_args__ = (
+        # 复合索引：按目标查询最新日志、按时间倒序游标翻页都只需在这一个索引上定位后顺序扫描
+        # 它同时覆盖了只按 target_id 过滤的查询，因此 target_id 列不再单独建索引
+        db.Index('ix_check_log_target_id_timestamp', 'target_id', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True) # 主键ID
     
     # 外键，关联到 MonitoredTarget 表的 id 字段
-    # index=True 可以加快基于 target_id 的查询
-    target_id = db.Column(db.Integer, db.ForeignKey('monitored_target.id', name='fk_checklog_target_id'), nullable=False, index=True)
+    # 基于 target_id 的查询由上面的 (target_id, timestamp) 复合索引加速
+    target_id = db.Column(db.Integer, db.ForeignKey('monitored_target.id', name='fk_checklog_target_id'), nullable=False)
     
     timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True) # 检查发生的时间戳，使用带时区的UTC时间，加索引
     status_code = db.Column(db.Integer, nullable=True) # HTTP响应状态码，例如 200, 404, 500
@@ -44,6 +77,140 @@ class CheckLog(db.Model):
     response_time_ms = db.Column(db.Float, nullable=True) # 响应时间，单位毫秒
     details = db.Column(db.Text, nullable=True) # 额外详情，例如错误信息或特定的检查点
 
+    # 分阶段耗时，单位毫秒；未经历的阶段 (例如 HTTP 没有 TLS、连接失败后没有首字节) 为空
+    dns_ms = db.Column(db.Float, nullable=True) # DNS解析
+    connect_ms = db.Column(db.Float, nullable=True) # TCP连接
+    tls_ms = db.Column(db.Float, nullable=True) # TLS握手
+    ttfb_ms = db.Column(db.Float, nullable=True) # 发出请求到收到首字节
+    transfer_ms = db.Column(db.Float, nullable=True) # 读取响应头和响应体
+    connection_reused = db.Column(db.Boolean, nullable=True) # 是否复用了已有连接
+    # 汇总记录 (只记录状态变化的目标，见 app.change_log) 代表的检查次数，response_time_ms 为这些检查的平均值；
+    # 为空表示这一行就是一次检查
+    sample_count = db.Column(db.Integer, nullable=True)
+    agent_id = db.Column(db.String(64), nullable=True) # 执行这次检查的远程探测代理，为空表示本地的探测 worker
+
     def __repr__(self):
         # 定义对象的字符串表示形式
         return f'<CheckLog id={self.id} target_id={self.target_id} status="{self.status_text}" timestamp="{self.timestamp}">'
+
+class TargetStatus(db.Model):
+    """
+    每个监控目标的当前状态 (物化视图)。
+    由检查结果写入器在每批结果落库时同步更新，仪表盘只需一次关联查询即可渲染，
+    不再需要为每个目标去 check_log 表中查找最新一条日志。
+    """
+    __tablename__ = 'target_status' # 明确指定表名
+
+    # 主键同时也是外键，每个目标最多一行
+    target_id = db.Column(db.Integer, db.ForeignKey('monitored_target.id', name='fk_targetstatus_target_id', ondelete='CASCADE'), primary_key=True)
+    status_text = db.Column(db.String(50), nullable=False) # 最近一次检查的状态，例如 'UP', 'DOWN', 'ERROR'
+    status_code = db.Column(db.Integer, nullable=True) # 最近一次检查的HTTP状态码
+    response_time_ms = db.Column(db.Float, nullable=True) # 最近一次检查的响应时间，单位毫秒
+    checked_at = db.Column(db.DateTime, nullable=True) # 最近一次检查的时间戳 (UTC)
+    consecutive_failures = db.Column(db.Integer, default=0, nullable=False) # 连续非UP的检查次数
+    cert_expires_at = db.Column(db.DateTime, nullable=True) # 最近一次 HTTPS/TLS 检查读取到的证书到期时间 (UTC)
+    version = db.Column(db.BigInteger, nullable=True, index=True) # 最近一次更新时的 results_version，供状态推送增量读取
+    # 只记录状态变化的目标的日志状态 (见 app.change_log.ChangeLogState)
+    log_written_at = db.Column(db.DateTime, nullable=True) # 最近一次写入 check_log 的检查时间 (UTC)
+    log_pending_checks = db.Column(db.Integer, default=0, server_default='0', nullable=False) # 之后被汇总、尚未写出的检查次数
+    log_pending_latency_sum = db.Column(db.Float, default=0.0, server_default='0', nullable=False) # 这些检查的响应时间之和 (毫秒)
+    log_pending_latency_count = db.Column(db.Integer, default=0, server_default='0', nullable=False) # 其中有响应时间的检查次数
+
+    def __repr__(self):
+        return f'<TargetStatus target_id={self.target_id} status="{self.status_text}" failures={self.consecutive_failures}>'
+
+class CheckRollup(db.Model):
+    """
+    按时间桶聚合的检查统计 (分钟 / 小时 / 天 三种粒度)。
+    由检查结果写入器增量维护，也可以通过 flask backfill-rollups 从历史 check_log 回填。
+    可用率和延迟类查询只需读取有限数量的聚合行，与检查频率无关。
+    """
+    __tablename__ = 'check_rollup' # 明确指定表名
+    __table_args__ = (
+        # 供保留策略按粒度和时间批量清理过期聚合行
+        db.Index('ix_check_rollup_resolution_bucket_start', 'resolution', 'bucket_start'),
+    )
+
+    # 复合主键 (target_id, resolution, bucket_start) 同时就是按目标和时间范围查询所用的索引
+    target_id = db.Column(db.Integer, db.ForeignKey('monitored_target.id', name='fk_checkrollup_target_id', ondelete='CASCADE'), primary_key=True)
+    resolution = db.Column(db.Integer, primary_key=True) # 时间桶长度，单位秒：60, 3600, 86400
+    bucket_start = db.Column(db.DateTime, primary_key=True) # 时间桶起点 (UTC)
+
+    check_count = db.Column(db.Integer, default=0, nullable=False) # 桶内的检查次数
+    up_count = db.Column(db.Integer, default=0, nullable=False) # 其中状态为 UP 的次数
+    latency_count = db.Column(db.Integer, default=0, nullable=False) # 有响应时间的检查次数
+    latency_min_ms = db.Column(db.Float, nullable=True) # 最小响应时间
+    latency_max_ms = db.Column(db.Float, nullable=True) # 最大响应时间
+    latency_sum_ms = db.Column(db.Float, default=0.0, nullable=False) # 响应时间之和，用于计算平均值
+    latency_sketch = db.Column(db.LargeBinary, nullable=True) # 可合并的对数分桶直方图，用于估算 p50/p95/p99
+
+    def __repr__(self):
+        return f'<CheckRollup target_id={self.target_id} resolution={self.resolution} bucket_start="{self.bucket_start}" count={self.check_count}>'
+
+class ProbeWorker(db.Model):
+    """
+    正在运行的探测 worker (由 worker 定期心跳更新)。
+    心跳未超时的 worker 组成一致性哈希环，按目标ID划分各自负责的目标。
+    """
+    __tablename__ = 'probe_worker' # 明确指定表名
+
+    id = db.Column(db.String(64), primary_key=True) # worker ID，格式为 主机名-进程号-随机后缀
+    hostname = db.Column(db.String(255), nullable=False) # 所在主机
+    pid = db.Column(db.Integer, nullable=False) # 进程号
+    started_at = db.Column(db.DateTime, nullable=False) # 启动时间 (UTC)
+    heartbeat_at = db.Column(db.DateTime, nullable=False, index=True) # 最近一次心跳时间 (UTC)
+    target_count = db.Column(db.Integer, default=0, nullable=False) # 当前持有租约的目标数
+    nominal_checks_per_min = db.Column(db.Float, nullable=True) # 按目标配置的间隔计算的检查频率 (次/分钟)
+    effective_checks_per_min = db.Column(db.Float, nullable=True) # 自适应调整后的实际检查频率 (次/分钟)
+
+    def __repr__(self):
+        return f'<ProbeWorker id="{self.id}" targets={self.target_count} heartbeat="{self.heartbeat_at}">'
+
+class ProbeAgent(db.Model):
+    """
+    远程探测代理 (python agent.py)，每次拉取目标列表或上传检查结果时更新。
+    代理不连接数据库，只检查 MonitoredTarget.agent_id 指向自己的目标，通过 HTTP 接口同步目标并上传结果。
+    """
+    __tablename__ = 'probe_agent' # 明确指定表名
+
+    id = db.Column(db.String(64), primary_key=True) # 代理ID (AGENT_ID)，目标通过 agent_id 指派给代理
+    location = db.Column(db.String(64), nullable=True) # 代理所在的位置 (AGENT_LOCATION)，例如机房或地区
+    address = db.Column(db.String(64), nullable=True) # 最近一次请求的来源地址
+    first_seen_at = db.Column(db.DateTime, nullable=False) # 第一次请求的时间 (UTC)
+    last_seen_at = db.Column(db.DateTime, nullable=False, index=True) # 最近一次请求的时间 (UTC)
+    synced_version = db.Column(db.BigInteger, nullable=True) # 代理最近一次同步到的 targets_version
+    target_count = db.Column(db.Integer, default=0, nullable=False) # 最近一次同步时指派给代理的激活目标数
+    batches_received = db.Column(db.BigInteger, default=0, nullable=False) # 写入的结果批次数
+    duplicate_batches = db.Column(db.BigInteger, default=0, nullable=False) # 重试导致的重复批次数 (已忽略)
+    results_received = db.Column(db.BigInteger, default=0, nullable=False) # 写入的检查结果数
+
+    def __repr__(self):
+        return f'<ProbeAgent id="{self.id}" location="{self.location}" last_seen="{self.last_seen_at}">'
+
+class AgentBatch(db.Model):
+    """
+    已写入的远程代理结果批次，用于识别重试时重复上传的批次 (按 AGENT_BATCH_RETENTION_HOURS 清理)。
+    """
+    __tablename__ = 'agent_batch' # 明确指定表名
+
+    agent_id = db.Column(db.String(64), primary_key=True) # 上传批次的代理ID
+    batch_id = db.Column(db.String(64), primary_key=True) # 代理为每个批次生成的唯一ID，重试时保持不变
+    received_at = db.Column(db.DateTime, nullable=False, index=True) # 写入时间 (UTC)
+    result_count = db.Column(db.Integer, default=0, nullable=False) # 批次中写入的检查结果数
+
+    def __repr__(self):
+        return f'<AgentBatch agent_id="{self.agent_id}" batch_id="{self.batch_id}" results={self.result_count}>'
+
+class PipelineState(db.Model):
+    """
+    检查流水线的全局计数器 (键值对)。
+    results_version：每当检查结果落库或目标列表发生变化时加一，Web 进程据此判断仪表盘缓存是否过期，并生成 ETag；
+    targets_version：目标被添加、删除或暂停/激活时加一，状态推送据此通知页面重新加载。
+    """
+    __tablename__ = 'pipeline_state' # 明确指定表名
+
+    key = db.Column(db.String(64), primary_key=True) # 计数器名称
+    value = db.Column(db.BigInteger, default=0, nullable=False) # 单调递增的计数值
+
+    def __repr__(self):
+        return f'<PipelineState key="{self.key}" value={self.value}>'
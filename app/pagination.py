@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from sqlalchemy import or_
+
+
+def encode_cursor(timestamp, row_id):
+    """
+    将 (timestamp, id) 编码为URL中使用的游标字符串。
+    """
+    return f"{timestamp.isoformat()}_{row_id}"
+
+
+def decode_cursor(value):
+    """
+    解析游标字符串，格式非法时返回 None (调用方回退到第一页)。
+    """
+    if not value:
+        return None
+    try:
+        ts, row_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except ValueError:
+        return None
+
+
+class KeysetPage:
+    """
+    基于游标 (keyset) 的分页结果。
+
+    按 (时间戳, id) 倒序翻页，每一页都只需在 (target_id, timestamp) 复合索引上定位后顺序读取
+    per_page + 1 行，无论翻到多深，代价都与第一页相同，也不需要 OFFSET 和 COUNT(*)。
+    """
+
+    def __init__(self, items, has_older, has_newer):
+        self.items = items # 当前页的记录 (按时间倒序)
+        self.has_older = has_older # 是否还有更早的记录
+        self.has_newer = has_newer # 是否还有更新的记录
+
+    @property
+    def older_cursor(self):
+        last = self.items[-1]
+        return encode_cursor(last.timestamp, last.id) if self.has_older and self.items else None
+
+    @property
+    def newer_cursor(self):
+        first = self.items[0]
+        return encode_cursor(first.timestamp, first.id) if self.has_newer and self.items else None
+
+
+def keyset_paginate(query, ts_column, id_column, per_page=20, before=None, after=None):
+    """
+    对按时间倒序展示的查询做游标分页。
+
+    :param query: 已经过滤好的查询 (不要包含 order_by)。
+    :param ts_column: 时间戳列，例如 CheckLog.timestamp。
+    :param id_column: 用于打破时间戳并列的主键列。
+    :param before: 游标字符串，返回早于该位置的一页 (向更早翻页)。
+    :param after: 游标字符串，返回晚于该位置的一页 (向更新翻页)。
+    :return: KeysetPage 实例。
+    """
+    before_key = decode_cursor(before)
+    after_key = decode_cursor(after) if before_key is None else None
+
+    if after_key is not None:
+        ts, row_id = after_key
+        rows = query.filter(ts_column >= ts, or_(ts_column > ts, id_column > row_id)) \
+                    .order_by(ts_column.asc(), id_column.asc()).limit(per_page + 1).all()
+        has_newer = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items, has_older=True, has_newer=has_newer)
+
+    if before_key is not None:
+        ts, row_id = before_key
+        # 单独的 ts_column <= ts 条件让数据库可以直接在索引上做范围定位，
+        # 后面的 OR 只用于排除时间戳并列的记录
+        query = query.filter(ts_column <= ts, or_(ts_column < ts, id_column < row_id))
+    rows = query.order_by(ts_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    return KeysetPage(rows[:per_page], has_older=len(rows) > per_page, has_newer=before_key is not None)
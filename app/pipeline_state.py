@@ -0,0 +1,59 @@
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import PipelineState
+
+RESULTS_VERSION = 'results_version' # 检查结果或目标列表每次变化时加一
+TARGETS_VERSION = 'targets_version' # 目标被添加、修改、删除或暂停/激活时加一
+
+
+def bump_version(*keys):
+    """
+    在当前事务中把计数器加一 (随调用方的事务一起提交)，默认只递增 results_version。
+    计数器不存在时创建；多个进程同时创建时，后到的一方改为执行加一。
+    加一会锁住计数器所在的行直到事务提交，因此各事务拿到的新值互不相同，且与提交顺序一致。
+
+    :return: 第一个计数器加一后的值。
+    """
+    keys = keys or (RESULTS_VERSION,)
+    table = PipelineState.__table__
+    for key in sorted(keys): # 固定加锁顺序，避免多个计数器之间死锁
+        increment = table.update().where(table.c.key == key).values(value=table.c.value + 1)
+        if db.session.execute(increment).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(key=key, value=1))
+        except IntegrityError:
+            db.session.execute(increment)
+    return current_version(keys[0])
+
+
+def mark_targets_changed(*targets):
+    """
+    在当前事务中发出目标变化通知：递增 targets_version (同时递增 results_version 使仪表盘缓存失效)，
+    并把新版本号记到 targets 的 config_version 上，探测 worker 据此只读取变化的目标。
+    删除目标时不需要传入目标，worker 通过比对自己持有的目标发现删除。
+
+    :param targets: 新增、修改或暂停/激活的 MonitoredTarget 对象。
+    :return: 新的 targets_version。
+    """
+    version = bump_version(TARGETS_VERSION, RESULTS_VERSION)
+    for target in targets:
+        target.config_version = version
+    return version
+
+
+def current_version(key=RESULTS_VERSION):
+    """
+    返回计数器的当前值，尚未创建时返回 0。
+    """
+    return db.session.scalar(select(PipelineState.value).where(PipelineState.key == key)) or 0
+
+
+def current_versions():
+    """
+    用一条查询返回全部计数器 {名称: 值}。
+    """
+    return dict(db.session.execute(select(PipelineState.key, PipelineState.value)).all())
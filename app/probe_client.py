@@ -0,0 +1,586 @@
+import asyncio
+import functools
+import ipaddress
+import socket
+import ssl
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+# 这个模块只依赖标准库，不依赖 Flask 应用上下文，
+# 因此既可以被后台探测引擎使用，也可以被基准测试脚本直接导入。
+
+DEFAULT_USER_AGENT = 'WebPulseMonitor/1.0'
+
+# 所有 HTTPS 探测共享同一个 SSLContext，避免每次检查都重新加载系统CA证书
+_default_ssl_context = None
+
+
+def get_ssl_context():
+    """
+    返回进程内共享的默认 SSLContext (延迟创建)。
+    """
+    global _default_ssl_context
+    if _default_ssl_context is None:
+        _default_ssl_context = ssl.create_default_context()
+    return _default_ssl_context
+
+
+class ProbeError(Exception):
+    """
+    探测过程中出现的、非网络层面的错误的基类。
+    """
+
+
+class ProbeProtocolError(ProbeError):
+    """
+    服务器返回了无法解析的HTTP响应。
+    """
+
+
+class ProbeTimings:
+    """
+    一次探测各阶段的耗时 (毫秒)。探测过程中逐项填写，
+    因此即使探测超时或连接失败，已完成阶段的耗时仍然可用。
+    """
+    __slots__ = ('dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms', 'transfer_ms', 'reused')
+
+    def __init__(self):
+        self.dns_ms = None # DNS解析耗时
+        self.connect_ms = None # TCP连接耗时
+        self.tls_ms = None # TLS握手耗时 (仅 HTTPS)
+        self.ttfb_ms = None # 发出请求到收到状态行的耗时
+        self.transfer_ms = None # 读取响应头剩余部分和响应体的耗时
+        self.reused = False # 是否复用了已有连接 (复用时没有 DNS/连接/TLS 阶段)
+
+    def __repr__(self):
+        return (f'<ProbeTimings dns={self.dns_ms} connect={self.connect_ms} tls={self.tls_ms} '
+                f'ttfb={self.ttfb_ms} transfer={self.transfer_ms} reused={self.reused}>')
+
+
+def _ms_since(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+class HttpProbeResponse:
+    """
+    一次HTTP探测的结果 (只保留监控需要的字段)。
+    """
+    __slots__ = ('status_code', 'reason', 'headers', 'body', 'truncated', 'elapsed_ms', 'timings', 'cert_expires_at')
+
+    def __init__(self, status_code, reason, headers, body, truncated, elapsed_ms, timings=None, cert_expires_at=None):
+        self.status_code = status_code # HTTP状态码
+        self.reason = reason # 状态短语，例如 'Not Found'
+        self.headers = headers # 响应头 (键为小写)
+        self.body = body # 读取到的响应体 (不超过 body_limit 字节；只检查状态码时为空)
+        self.truncated = truncated # 响应体是否因超过 body_limit 而未读完
+        self.elapsed_ms = elapsed_ms # 从发起连接到读取完成的耗时，单位毫秒
+        self.timings = timings # 各阶段耗时 (ProbeTimings)
+        self.cert_expires_at = cert_expires_at # HTTPS 连接上服务器证书的到期时间 (UTC)，HTTP 时为 None
+
+
+def split_url(url):
+    """
+    将URL拆分为 (scheme, host, port, path)。
+    :raises ProbeError: URL 的协议不受支持或缺少主机名时抛出。
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ('http', 'https'):
+        raise ProbeError(f"不支持的URL协议: {parts.scheme or '(空)'}")
+    if not parts.hostname:
+        raise ProbeError("URL 缺少主机名")
+    port = parts.port or (443 if scheme == 'https' else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    return scheme, parts.hostname, port, path
+
+
+def _host_header(host, port, scheme):
+    # IPv6 地址需要加方括号；默认端口不写入 Host 头
+    if ':' in host:
+        host = f"[{host}]"
+    if (scheme == 'http' and port == 80) or (scheme == 'https' and port == 443):
+        return host
+    return f"{host}:{port}"
+
+
+async def _read_head(reader, on_status_line=None):
+    """
+    读取状态行和响应头，返回 (status_code, reason, headers)。
+    :param on_status_line: 可选回调，收到第一个状态行时调用一次 (用于统计首字节时间)。
+    """
+    while True:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ProbeProtocolError("服务器在返回状态行之前关闭了连接")
+        if on_status_line is not None:
+            on_status_line()
+            on_status_line = None
+        try:
+            version, code, *reason = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+            status_code = int(code)
+        except ValueError:
+            raise ProbeProtocolError(f"无法解析的状态行: {status_line[:80]!r}")
+        if not version.startswith('HTTP/'):
+            raise ProbeProtocolError(f"无法解析的状态行: {status_line[:80]!r}")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ProbeProtocolError("服务器在返回完整响应头之前关闭了连接")
+            if line in (b'\r\n', b'\n'):
+                break
+            name, sep, value = line.decode('latin-1').partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+
+        # 跳过 1xx 临时响应 (例如 100 Continue)，继续读取最终响应
+        if 100 <= status_code < 200:
+            continue
+        return status_code, (reason[0] if reason else ''), headers
+
+
+async def _read_body(reader, headers, limit, stop_at=None):
+    """
+    以流式方式读取响应体，最多缓存 limit 字节，超出部分不再读取。
+    支持 Content-Length、chunked 编码以及读到连接关闭为止三种响应体格式。
+    提供 stop_at 时，一旦缓冲区中出现该字节串就提前停止读取。
+
+    :return: (body, truncated)，truncated 表示在响应体结束之前停止了读取。
+    """
+    body = bytearray()
+
+    def _full(chunk):
+        # 追加数据，返回 True 表示应停止读取
+        room = limit - len(body)
+        body.extend(chunk[:room])
+        if stop_at is not None and stop_at in body[-(len(chunk) + len(stop_at)):]:
+            return True
+        return len(chunk) > room
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size_line = await reader.readline()
+            try:
+                size = int(size_line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise ProbeProtocolError(f"无法解析的 chunked 分块长度: {size_line[:40]!r}")
+            if size == 0:
+                # 跳过可能存在的 trailer，读到空行为止，使连接可以被复用
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return bytes(body), False
+            try:
+                chunk = await reader.readexactly(size + 2) # 分块数据后紧跟 CRLF
+            except asyncio.IncompleteReadError:
+                raise ProbeProtocolError("服务器在 chunked 分块传输完成之前关闭了连接")
+            if _full(chunk[:size]):
+                return bytes(body), True
+
+    length = headers.get('content-length', '')
+    remaining = int(length) if length.isdigit() else None # None 表示读到连接关闭为止
+    while remaining is None or remaining > 0:
+        chunk = await reader.read(65536 if remaining is None else min(65536, remaining))
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        if _full(chunk):
+            return bytes(body), remaining != 0
+    return bytes(body), False
+
+
+async def _resolve(host, port):
+    """
+    解析主机名，返回 [(family, ip), ...]。IP地址无需解析，也不占用默认线程池。
+    """
+    try:
+        ip = ipaddress.ip_address(host)
+        return [(socket.AF_INET6 if ip.version == 6 else socket.AF_INET, host)]
+    except ValueError:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return [(family, address[0]) for family, _, _, _, address in infos]
+
+
+def peer_cert_expiry(writer):
+    """
+    返回 TLS 连接上对端证书的到期时间 (UTC)。
+    证书在握手时已由 ssl 模块解析并缓存在传输对象上，复用的连接同样可以读取；
+    非 TLS 连接或未校验证书 (CERT_NONE) 时返回 None。
+    """
+    cert = writer.get_extra_info('peercert')
+    not_after = cert.get('notAfter') if cert else None
+    return _parse_cert_time(not_after) if not_after else None
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_cert_time(not_after):
+    # 同一证书的到期时间字符串在每次检查中重复出现，缓存解析结果以省去 strptime
+    return datetime.fromtimestamp(ssl.cert_time_to_seconds(not_after), timezone.utc)
+
+
+async def _open_connection(scheme, host, port, ssl_context, timings, resolve=_resolve, server_hostname=None):
+    """
+    分阶段建立连接：先解析域名，再建立TCP连接，HTTPS 时最后进行TLS握手，并记录各阶段耗时。
+    解析出多个地址时依次尝试，全部失败时抛出最后一个错误。
+    :param resolve: 解析函数，可以替换为带缓存的 DnsCache.resolve。
+    :param server_hostname: TLS 握手使用的 SNI 和证书校验主机名，默认与 host 相同。
+    """
+    start = time.perf_counter()
+    addresses = await resolve(host, port)
+    timings.dns_ms = _ms_since(start)
+
+    start = time.perf_counter()
+    last_error = None
+    for family, address in addresses:
+        try:
+            reader, writer = await asyncio.open_connection(address, port, family=family)
+            break
+        except OSError as e:
+            last_error = e
+    else:
+        raise last_error or OSError(f"无法解析主机: {host}")
+    timings.connect_ms = _ms_since(start)
+
+    if scheme == 'https':
+        start = time.perf_counter()
+        try:
+            await writer.start_tls(ssl_context or get_ssl_context(), server_hostname=server_hostname or host)
+        except BaseException:
+            writer.close()
+            raise
+        timings.tls_ms = _ms_since(start)
+    return reader, writer
+
+
+def _build_request(method, scheme, host, port, path, user_agent, keep_alive):
+    # 防止请求头注入
+    user_agent = user_agent.replace('\r', ' ').replace('\n', ' ')
+    return (
+        f"{method} {path} HTTP/1.1\r\n"
+        f"Host: {_host_header(host, port, scheme)}\r\n"
+        f"User-Agent: {user_agent}\r\n"
+        "Accept: */*\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    ).encode('latin-1', 'replace')
+
+
+async def _exchange(reader, writer, request, method, body_limit, stop_at, timings, drain_limit=0):
+    """
+    在已建立的连接上发送一个请求并读取响应。
+    drain_limit > 0 表示希望复用连接：不校验响应体时，长度已知且不超过 drain_limit 的响应体会被读出并丢弃，
+    使连接停在下一个响应的起点。
+
+    :return: (status_code, reason, headers, body, truncated, reusable)
+    """
+    writer.write(request)
+    await writer.drain()
+    sent = time.perf_counter()
+    marks = {}
+
+    def _first_byte():
+        marks['first_byte'] = time.perf_counter()
+        timings.ttfb_ms = round((marks['first_byte'] - sent) * 1000, 2)
+
+    status_code, reason, headers = await _read_head(reader, _first_byte)
+    body, truncated = b'', False
+    framed = 'content-length' in headers or headers.get('transfer-encoding', '').lower() == 'chunked'
+    reusable = drain_limit > 0 and framed and headers.get('connection', '').lower() != 'close'
+    if method == 'HEAD' or status_code in (204, 304):
+        pass # 没有响应体
+    elif body_limit > 0:
+        body, truncated = await _read_body(reader, headers, body_limit, stop_at)
+        reusable = reusable and not truncated
+    elif reusable:
+        length = headers.get('content-length', '')
+        if length.isdigit() and int(length) > drain_limit:
+            reusable = False # 响应体太大，关闭连接而不是下载它
+        else:
+            _, truncated = await _read_body(reader, headers, drain_limit)
+            reusable = not truncated
+    timings.transfer_ms = _ms_since(marks['first_byte'])
+    return status_code, reason, headers, body, truncated, reusable
+
+
+async def http_probe(url, method='GET', timeout=10, user_agent=DEFAULT_USER_AGENT, ssl_context=None,
+                     body_limit=0, stop_at=None, timings=None):
+    """
+    基于 asyncio 流的极简 HTTP/1.1 探测 (每次新建连接，不使用连接池和DNS缓存)。
+    不跟随重定向 (3xx 本身即视为服务可访问)，整个请求受 timeout 秒的总超时限制。
+    默认收到响应头后立即返回并关闭连接，不下载响应体；
+    body_limit > 0 时以流式方式最多读取 body_limit 字节，用于关键字或哈希校验。
+
+    :param url: 需要探测的URL (http 或 https)。
+    :param method: HTTP方法，默认 GET。
+    :param timeout: 总超时，单位秒。
+    :param user_agent: 请求使用的 User-Agent。
+    :param ssl_context: 可选的 SSLContext，默认使用共享的系统CA上下文。
+    :param body_limit: 最多读取的响应体字节数，0 表示不读取响应体。
+    :param stop_at: 可选的字节串，读取到它之后立即停止 (用于关键字匹配)。
+    :param timings: 可选的 ProbeTimings，用于在探测失败时也能拿到已完成阶段的耗时。
+    :return: HttpProbeResponse 实例。
+    :raises asyncio.TimeoutError: 超时。
+    :raises OSError: DNS解析、连接或TLS握手失败。
+    :raises ProbeError: URL非法或响应无法解析。
+    """
+    scheme, host, port, path = split_url(url)
+    request = _build_request(method, scheme, host, port, path, user_agent, keep_alive=False)
+    if timings is None:
+        timings = ProbeTimings()
+
+    async def _run():
+        start = time.perf_counter()
+        reader, writer = await _open_connection(scheme, host, port, ssl_context, timings)
+        try:
+            status_code, reason, headers, body, truncated, _ = await _exchange(
+                reader, writer, request, method, body_limit, stop_at, timings)
+            return HttpProbeResponse(status_code, reason, headers, body, truncated, _ms_since(start), timings,
+                                     peer_cert_expiry(writer) if scheme == 'https' else None)
+        finally:
+            writer.close()
+
+    return await asyncio.wait_for(_run(), timeout)
+
+
+class DnsCache:
+    """
+    进程内的DNS解析缓存。
+    标准库的 getaddrinfo 不返回记录的 TTL，因此统一使用配置的 ttl 秒作为缓存有效期；
+    同一主机的并发解析会合并为一次 getaddrinfo 调用。只缓存成功的解析结果。
+    """
+
+    def __init__(self, ttl=300, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {} # (host, port) -> (过期时间, 地址列表)
+        self._pending = {} # (host, port) -> 进行中的解析 Future
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def resolve(self, host, port):
+        key = (host, port)
+        cached = self._entries.get(key)
+        now = time.monotonic()
+        if cached is not None and cached[0] > now:
+            self.hits += 1
+            return cached[1]
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.hits += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise # 被取消的是本任务
+                return await self.resolve(host, port) # 负责解析的任务被取消了，由本任务重新解析
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            addresses = await _resolve(host, port)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # 标记异常已被获取，避免没有等待者时产生警告
+            raise
+        except BaseException:
+            # 本任务被取消 (或进程退出)：取消只在本任务中生效，等待同一解析的其他任务各自重新解析
+            future.cancel()
+            raise
+        else:
+            future.set_result(addresses)
+            if len(self._entries) >= self.max_entries:
+                self.purge(now)
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = (now + self.ttl, addresses)
+            return addresses
+        finally:
+            del self._pending[key]
+
+    def purge(self, now=None):
+        """
+        清除已过期的缓存项。
+        """
+        now = time.monotonic() if now is None else now
+        for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+
+
+class ConnectionPool:
+    """
+    按 (scheme, host, port) 划分的 keep-alive 空闲连接池。
+    每个主机最多保留 max_per_host 条空闲连接，全部主机合计最多 max_total 条，
+    空闲超过 idle_timeout 秒或已被对端关闭的连接在取用或清扫时被丢弃。
+    """
+
+    def __init__(self, max_per_host=6, max_total=1000, idle_timeout=60):
+        self.max_per_host = max_per_host
+        self.max_total = max_total
+        self.idle_timeout = idle_timeout
+        self._idle = {} # key -> [(放回时间, reader, writer), ...]，末尾为最近放回的连接
+        self.idle_count = 0
+        self.created = 0 # 新建的连接数
+        self.reused = 0 # 从池中取出并复用的次数
+        self.discarded = 0 # 因过期、对端关闭或池已满而关闭的空闲连接数
+
+    def acquire(self, key):
+        """
+        取出一条可用的空闲连接，没有时返回 None。
+        """
+        idle = self._idle.get(key)
+        deadline = time.monotonic() - self.idle_timeout
+        while idle:
+            released_at, reader, writer = idle.pop()
+            self.idle_count -= 1
+            if released_at < deadline or reader.at_eof() or writer.is_closing():
+                self._discard(writer)
+                continue
+            self.reused += 1
+            return reader, writer
+        return None
+
+    def release(self, key, reader, writer):
+        """
+        放回一条已读完响应的连接；池已满时直接关闭。
+        """
+        idle = self._idle.setdefault(key, [])
+        if len(idle) >= self.max_per_host or self.idle_count >= self.max_total:
+            self._discard(writer)
+            return
+        idle.append((time.monotonic(), reader, writer))
+        self.idle_count += 1
+
+    def sweep(self):
+        """
+        关闭所有空闲超时或已被对端关闭的连接。
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        for key in list(self._idle):
+            alive = []
+            for item in self._idle[key]:
+                released_at, reader, writer = item
+                if released_at < deadline or reader.at_eof() or writer.is_closing():
+                    self._discard(writer)
+                    self.idle_count -= 1
+                else:
+                    alive.append(item)
+            if alive:
+                self._idle[key] = alive
+            else:
+                del self._idle[key]
+
+    def close(self):
+        for idle in self._idle.values():
+            for _, _, writer in idle:
+                writer.close()
+        self._idle.clear()
+        self.idle_count = 0
+
+    def _discard(self, writer):
+        self.discarded += 1
+        writer.close()
+
+
+class ProbeClient:
+    """
+    长期存在的探测客户端：在多次检查之间共享DNS缓存和按主机划分的 keep-alive 连接池。
+    必须在同一个事件循环中使用。
+    复用的连接如果在收到任何响应之前就失败 (通常是服务器已关闭了空闲连接)，会自动改用新连接重试一次。
+    """
+
+    def __init__(self, ssl_context=None, dns_ttl=300, pool_max_per_host=6, pool_max_total=1000,
+                 pool_idle_timeout=60, drain_limit=65536):
+        self.ssl_context = ssl_context
+        self.drain_limit = drain_limit # 为复用连接最多读出并丢弃的响应体字节数
+        self.dns = DnsCache(ttl=dns_ttl)
+        self.pool = ConnectionPool(max_per_host=pool_max_per_host, max_total=pool_max_total,
+                                   idle_timeout=pool_idle_timeout)
+        self.stale_retries = 0 # 复用连接失效后改用新连接重试的次数
+
+    async def probe(self, url, method='GET', timeout=10, user_agent=DEFAULT_USER_AGENT,
+                    body_limit=0, stop_at=None, timings=None, fresh=False):
+        """
+        与 http_probe 参数相同，但优先复用连接池中的连接并使用DNS缓存。
+        :param fresh: 为 True 时绕过DNS缓存和连接池，新建连接并在结束后关闭，用于测量冷启动连接耗时。
+        """
+        scheme, host, port, path = split_url(url)
+        request = _build_request(method, scheme, host, port, path, user_agent, keep_alive=not fresh)
+        if timings is None:
+            timings = ProbeTimings()
+        key = (scheme, host, port)
+
+        async def _run():
+            start = time.perf_counter()
+            if not fresh:
+                connection = self.pool.acquire(key)
+                if connection is not None:
+                    timings.reused = True
+                    try:
+                        return await self._send(key, connection, request, method, body_limit, stop_at,
+                                                timings, start, keep_alive=True)
+                    except (ProbeProtocolError, ConnectionError, asyncio.IncompleteReadError):
+                        if timings.ttfb_ms is not None:
+                            raise
+                        # 服务器已关闭了这条空闲连接，改用新连接重试
+                        self.stale_retries += 1
+                        timings.reused = False
+                        start = time.perf_counter()
+            connection = await _open_connection(scheme, host, port, self.ssl_context, timings,
+                                                resolve=_resolve if fresh else self.dns.resolve)
+            self.pool.created += 1
+            return await self._send(key, connection, request, method, body_limit, stop_at,
+                                    timings, start, keep_alive=not fresh)
+
+        return await asyncio.wait_for(_run(), timeout)
+
+    async def _send(self, key, connection, request, method, body_limit, stop_at, timings, start, keep_alive):
+        reader, writer = connection
+        try:
+            status_code, reason, headers, body, truncated, reusable = await _exchange(
+                reader, writer, request, method, body_limit, stop_at, timings,
+                self.drain_limit if keep_alive else 0)
+        except BaseException:
+            writer.close()
+            raise
+        # 证书到期时间随每次 HTTPS 检查一并取得 (复用的连接也能读取)，不需要单独的请求
+        cert_expires_at = peer_cert_expiry(writer) if key[0] == 'https' else None
+        if reusable:
+            self.pool.release(key, reader, writer)
+        else:
+            writer.close()
+        return HttpProbeResponse(status_code, reason, headers, body, truncated, _ms_since(start), timings,
+                                 cert_expires_at)
+
+    def stats(self):
+        """
+        返回DNS缓存命中率和连接池复用情况的统计字典。
+        """
+        lookups = self.dns.hits + self.dns.misses
+        connections = self.pool.created + self.pool.reused
+        return {
+            'dns_hits': self.dns.hits,
+            'dns_misses': self.dns.misses,
+            'dns_hit_rate': round(self.dns.hits / lookups, 3) if lookups else None,
+            'dns_cached_hosts': len(self.dns),
+            'pool_created': self.pool.created,
+            'pool_reused': self.pool.reused,
+            'pool_reuse_rate': round(self.pool.reused / connections, 3) if connections else None,
+            'pool_idle': self.pool.idle_count,
+            'pool_discarded': self.pool.discarded,
+            'stale_retries': self.stale_retries,
+        }
+
+    def sweep(self):
+        self.dns.purge()
+        self.pool.sweep()
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,380 @@
+import asyncio
+import hashlib
+import logging
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+from app.metrics import counter, gauge
+from app.probe_client import ProbeClient, ProbeError, ProbeTimings, DEFAULT_USER_AGENT
+from app.probe_types import PROBE_TYPES, parse_probe_params, target_endpoint
+
+# 探测引擎不依赖 Flask 应用实例，使用标准的模块级 logger
+logger = logging.getLogger(__name__)
+
+
+class ProbeTarget(NamedTuple):
+    """
+    交给探测引擎的精简目标描述，避免在事件循环中访问 ORM 对象。
+    """
+    id: int
+    name: str
+    url: str
+    due: Optional[float] = None # 计划执行的时间点 (time.monotonic())，用于统计调度延迟
+    method: str = 'GET' # HTTP方法，'GET' 或 'HEAD'
+    max_body_bytes: int = 65536 # 响应体校验时最多读取的字节数
+    body_keyword: Optional[str] = None # 响应体中必须包含的关键字
+    body_sha256: Optional[str] = None # 响应体完整内容的 SHA-256
+    fresh_connection: bool = False # 为 True 时每次都新建连接 (不复用连接、不使用DNS缓存)
+    probe_type: str = 'http' # 探测类型 (见 app.probe_types.PROBE_TYPES)
+    params: Optional[dict] = None # 探测类型的参数 (已校验的字典)
+
+    @classmethod
+    def from_row(cls, row, due=None):
+        """
+        从 MonitoredTarget 对象或包含同名列的查询结果行构造 ProbeTarget。
+        探测参数在这里解析一次，之后每次检查直接使用字典；参数无效时按无参数处理，并记录警告。
+        """
+        probe_type = row.probe_type or 'http'
+        params = None
+        if row.probe_params:
+            try:
+                params = parse_probe_params(probe_type, row.probe_params) or None
+            except ValueError as e:
+                logger.warning(f"目标 (ID: {row.id}) 的探测参数无效，已忽略: {e}")
+        return cls(row.id, row.name, row.url, due, row.check_method or 'GET',
+                   row.max_body_bytes or cls._field_defaults['max_body_bytes'], row.body_keyword or None, row.body_sha256 or None,
+                   bool(row.force_fresh_connection), probe_type, params)
+
+    @property
+    def reads_body(self):
+        # 只有配置了响应体校验时才需要读取响应体
+        return self.method != 'HEAD' and bool(self.body_keyword or self.body_sha256)
+
+
+class ProbeResult(NamedTuple):
+    """
+    一次检查的结果，字段与 CheckLog 表一一对应。
+    """
+    target_id: int
+    timestamp: datetime
+    status_code: Optional[int]
+    status_text: str
+    response_time_ms: Optional[float]
+    details: str
+    lag_ms: Optional[float] = None # 实际开始时间相对计划时间的延迟，单位毫秒
+    target_name: str = '' # 仅用于日志输出
+    timings: Optional[ProbeTimings] = None # 各阶段耗时 (DNS/连接/TLS/首字节/传输)
+    error_class: str = '' # 失败原因的类别 (见 ERROR_CLASSES)，成功时为空，用于按类别统计错误数
+    cert_expires_at: Optional[datetime] = None # HTTPS/TLS 检查读取到的证书到期时间 (UTC)
+
+
+# 检查失败的类别：超时、DNS解析失败、TLS握手失败、其他连接错误、4xx/5xx 状态码、响应体校验不通过、
+# 协议错误 (无法解析的响应等)、引擎内部错误以及证书剩余有效期不足 (TLS 探测的 min_days)。
+# 只能在末尾追加：探测子进程按序号回传类别
+ERROR_CLASSES = ('timeout', 'dns', 'tls', 'connect', 'http_4xx', 'http_5xx', 'body', 'protocol', 'internal', 'cert')
+
+
+class ProbeEngine:
+    """
+    基于 asyncio 的探测引擎。
+
+    所有检查都运行在同一个后台线程的事件循环中：
+    全局信号量限制同时进行中的请求数，按主机划分的信号量限制对单个主机的并发，
+    因此少数响应缓慢或超时的目标不会再拖住其他目标的检查。
+    HTTP 请求通过长期存在的 ProbeClient 发出，同一主机的多次检查共享DNS缓存和 keep-alive 连接池。
+    检查结果通过 result_handler 回调交出，回调在独立的单线程执行器中运行，
+    以免阻塞事件循环；检查任务会等待回调返回后才释放全局并发名额，
+    因此下游 (例如结果写入队列) 满载时会自然地减缓新检查的启动，形成背压。
+    """
+
+    def __init__(self, result_handler=None, max_in_flight=500, per_host_limit=6, timeout=10, ssl_context=None,
+                 dns_cache_ttl=300, pool_max_per_host=None, pool_max_total=1000, pool_idle_timeout=60,
+                 stats_log_interval=300):
+        self.result_handler = result_handler
+        self.ssl_context = ssl_context # HTTPS 探测使用的 SSLContext，None 表示使用系统CA
+        self.dns_cache_ttl = dns_cache_ttl # DNS缓存有效期(秒)
+        self.pool_max_per_host = pool_max_per_host # 每个主机保留的空闲连接数，None 表示与单主机并发上限相同
+        self.pool_max_total = pool_max_total # 全部主机合计保留的空闲连接数
+        self.pool_idle_timeout = pool_idle_timeout # 空闲连接的保留时间(秒)
+        self.stats_log_interval = stats_log_interval # 输出DNS缓存和连接池统计的间隔(秒)，0 表示不输出
+        self.max_in_flight = max_in_flight
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._global_slots = None
+        self._host_slots = {}
+        self._tasks = set() # 持有任务的强引用，防止被垃圾回收
+        self._handler_executor = None
+        self._client = None
+
+        self.submitted = 0 # 已提交的检查数
+        self.completed = 0 # 已完成的检查数
+        self.in_flight = 0 # 正在进行网络请求的检查数
+
+    def init_app(self, app, result_handler=None):
+        """
+        从Flask应用配置中读取引擎参数。
+        :param app: Flask应用实例。
+        :param result_handler: 处理 ProbeResult 的回调函数。
+        """
+        self.max_in_flight = app.config.get('PROBE_MAX_IN_FLIGHT', self.max_in_flight)
+        self.per_host_limit = app.config.get('PROBE_PER_HOST_LIMIT', self.per_host_limit)
+        self.timeout = app.config.get('PROBE_TIMEOUT_SECONDS', self.timeout)
+        self.dns_cache_ttl = app.config.get('PROBE_DNS_CACHE_TTL', self.dns_cache_ttl)
+        self.pool_max_per_host = app.config.get('PROBE_POOL_MAX_PER_HOST', self.pool_max_per_host)
+        self.pool_max_total = app.config.get('PROBE_POOL_MAX_TOTAL', self.pool_max_total)
+        self.pool_idle_timeout = app.config.get('PROBE_POOL_IDLE_SECONDS', self.pool_idle_timeout)
+        self.stats_log_interval = app.config.get('PROBE_STATS_LOG_INTERVAL', self.stats_log_interval)
+        if result_handler is not None:
+            self.result_handler = result_handler
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def client(self):
+        """
+        共享的 ProbeClient (在事件循环线程中首次使用时创建)。
+        """
+        if self._client is None:
+            self._client = ProbeClient(
+                ssl_context=self.ssl_context, dns_ttl=self.dns_cache_ttl,
+                pool_max_per_host=self.pool_max_per_host or self.per_host_limit,
+                pool_max_total=self.pool_max_total, pool_idle_timeout=self.pool_idle_timeout)
+        return self._client
+
+    def stats(self):
+        """
+        返回引擎计数器以及DNS缓存、连接池的统计。
+        """
+        stats = {'submitted': self.submitted, 'completed': self.completed, 'in_flight': self.in_flight}
+        if self._client is not None:
+            stats.update(self._client.stats())
+        return stats
+
+    def collect_metrics(self):
+        """
+        返回探测引擎的 Prometheus 指标文本行。
+        """
+        return (gauge('webpulse_probes_in_flight', '正在进行中的检查数', self.in_flight)
+                + counter('webpulse_probes_submitted_total', '提交给探测引擎的检查数', self.submitted)
+                + counter('webpulse_probes_completed_total', '已完成的检查数', self.completed))
+
+    def start(self):
+        """
+        在后台守护线程中启动事件循环。重复调用是安全的。
+        """
+        if self.running:
+            return
+        self._ready.clear()
+        self._handler_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='probe-results')
+        self._thread = threading.Thread(target=self._run_loop, name='probe-engine', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        logger.info(f"探测引擎已启动: 全局并发上限 {self.max_in_flight}, 单主机并发上限 {self.per_host_limit}, 超时 {self.timeout} 秒。")
+
+    def _run_loop(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._global_slots = asyncio.Semaphore(self.max_in_flight)
+        self._host_slots = {}
+        self._client = None
+        self._track(loop.create_task(self._sweep_idle()))
+        if self.stats_log_interval:
+            self._track(loop.create_task(self._report_stats()))
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def _sweep_idle(self):
+        # 每隔空闲连接的保留时间清理一次过期的DNS缓存和空闲连接 (与是否输出统计无关)
+        while True:
+            await asyncio.sleep(max(1, self.pool_idle_timeout))
+            if self._client is not None:
+                self._client.sweep()
+
+    async def _report_stats(self):
+        # 定期输出DNS缓存命中率和连接池统计
+        while True:
+            await asyncio.sleep(self.stats_log_interval)
+            if self._client is not None:
+                logger.info(f"探测引擎统计: {self.stats()}")
+
+    def _track(self, task):
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stop(self, timeout=5):
+        """
+        停止事件循环并等待尚未写出的结果处理完毕。
+        """
+        if not self.running:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_pending(), self._loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"停止探测引擎时取消未完成的检查失败: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._handler_executor.shutdown(wait=True)
+        self._thread = None
+        logger.info(f"探测引擎已停止: {self.stats()}")
+
+    async def _cancel_pending(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._client is not None:
+            self._client.close() # 关闭连接池中的空闲连接
+
+    def submit(self, targets):
+        """
+        线程安全地提交一批待检查的目标。
+        :param targets: ProbeTarget 的可迭代对象。
+        """
+        batch = list(targets)
+        if not batch:
+            return
+        if not self.running:
+            self.start()
+        self._loop.call_soon_threadsafe(self._schedule, batch)
+
+    def _schedule(self, batch):
+        self.submitted += len(batch)
+        for target in batch:
+            self._track(self._loop.create_task(self._run_probe(target)))
+
+    def _host_semaphore(self, url):
+        key = target_endpoint(url)
+        slots = self._host_slots.get(key)
+        if slots is None:
+            slots = self._host_slots[key] = asyncio.Semaphore(self.per_host_limit)
+        return slots
+
+    async def _run_probe(self, target):
+        async with self._global_slots:
+            async with self._host_semaphore(target.url):
+                self.in_flight += 1
+                try:
+                    result = await self.check(target)
+                finally:
+                    self.in_flight -= 1
+            self.completed += 1
+            if self.result_handler is not None:
+                try:
+                    await self._loop.run_in_executor(self._handler_executor, self._handle_result, result)
+                except RuntimeError:
+                    # 解释器退出时线程池已被关闭，直接在当前线程中交出结果，避免丢失
+                    self._handle_result(result)
+
+    def _handle_result(self, result):
+        try:
+            self.result_handler(result)
+        except Exception as e:
+            logger.error(f"处理目标 (ID: {result.target_id}) 的检查结果时发生错误: {e}", exc_info=True)
+
+    async def check(self, target):
+        """
+        对单个目标执行一次检查，并按照原有规则归类为 UP / DOWN / ERROR。
+        HTTP 目标发出HTTP请求；其他探测类型调用注册表中的检查函数，超时和网络错误使用相同的归类规则。
+        :param target: ProbeTarget 实例。
+        :return: ProbeResult 实例。
+        """
+        started = time.monotonic()
+        lag_ms = round((started - target.due) * 1000, 2) if target.due is not None else None
+        check_timestamp = datetime.now(timezone.utc) # 记录检查开始的时间戳 (UTC)
+        status_code = None
+        response_time_ms = None
+        details = ''
+        error_class = ''
+        cert_expires_at = None
+
+        reads_body = target.reads_body
+        keyword = target.body_keyword.encode('utf-8') if reads_body and target.body_keyword else None
+        timings = ProbeTimings() # 失败时保留已完成阶段的耗时，便于判断慢在哪一步
+        try:
+            probe_type = PROBE_TYPES.get(target.probe_type)
+            if probe_type is None:
+                raise ProbeError(f"不支持的探测类型: {target.probe_type}")
+            if probe_type.check is not None:
+                outcome = await asyncio.wait_for(probe_type.check(self.client, target, timings), self.timeout)
+                return ProbeResult(target.id, check_timestamp, None, outcome.status_text, outcome.response_time_ms,
+                                   outcome.details, lag_ms, target.name, timings, outcome.error_class,
+                                   outcome.cert_expires_at)
+            response = await self.client.probe(target.url, method=target.method, timeout=self.timeout,
+                                               user_agent=f'{DEFAULT_USER_AGENT} ({target.name})',
+                                               body_limit=target.max_body_bytes if reads_body else 0,
+                                               # 只有关键字校验时找到关键字即可停止；还要校验哈希则必须读完
+                                               stop_at=keyword if not target.body_sha256 else None,
+                                               timings=timings, fresh=target.fresh_connection)
+            response_time_ms = response.elapsed_ms
+            status_code = response.status_code
+            cert_expires_at = response.cert_expires_at
+            # 通常认为 2xx 和 3xx 系列的状态码表示服务是可访问的 (UP)
+            if 200 <= status_code < 400:
+                status_text = 'UP'
+                if reads_body:
+                    details = self._check_body(target, keyword, response)
+                    if details:
+                        status_text = 'DOWN'
+                        error_class = 'body'
+            else: # 4xx 和 5xx 系列的状态码通常表示服务有问题 (DOWN)
+                status_text = 'DOWN'
+                details = f"HTTP 错误状态码: {status_code} - {response.reason}"
+                error_class = 'http_5xx' if status_code >= 500 else 'http_4xx'
+        except asyncio.TimeoutError:
+            status_text = 'DOWN'
+            details = f"请求超时 (超过{self.timeout}秒)。"
+            error_class = 'timeout'
+        except OSError as e: # DNS解析失败、连接被拒绝、TLS握手失败等
+            status_text = 'DOWN'
+            details = f"连接错误 (无法解析主机或连接到服务器): {e.__class__.__name__}"
+            if isinstance(e, socket.gaierror):
+                error_class = 'dns'
+            elif isinstance(e, ssl.SSLError):
+                error_class = 'tls'
+            else:
+                error_class = 'connect'
+        except ProbeError as e:
+            status_text = 'ERROR'
+            details = f"请求发生未知错误: {str(e)} (类型: {e.__class__.__name__})"
+            error_class = 'protocol'
+        except Exception as e: # 捕获其他所有预料之外的异常
+            status_text = 'ERROR'
+            error_class = 'internal'
+            details = f"执行检查时发生未知系统错误: {str(e)} (类型: {e.__class__.__name__})"
+            logger.critical(f"检查目标 '{target.name}' (URL: {target.url}) 时发生严重未知错误: {e}", exc_info=True)
+
+        return ProbeResult(target.id, check_timestamp, status_code, status_text,
+                           response_time_ms, details, lag_ms, target.name, timings, error_class, cert_expires_at)
+
+    @staticmethod
+    def _check_body(target, keyword, response):
+        """
+        校验已读取的响应体。
+        :return: 校验失败时返回失败原因，通过时返回空字符串。
+        """
+        if keyword is not None and keyword not in response.body:
+            if response.truncated:
+                return f"响应体前 {len(response.body)} 字节中未找到关键字: {target.body_keyword}"
+            return f"响应体中未找到关键字: {target.body_keyword}"
+        if target.body_sha256:
+            if response.truncated:
+                return f"响应体超过 {target.max_body_bytes} 字节的读取上限，无法校验 SHA-256。"
+            digest = hashlib.sha256(response.body).hexdigest()
+            if digest != target.body_sha256.lower():
+                return f"响应体 SHA-256 不匹配: 期望 {target.body_sha256.lower()}，实际 {digest}"
+        return ''
@@ -0,0 +1,360 @@
+import logging
+import math
+import multiprocessing
+import struct
+import threading
+import zlib
+from datetime import datetime, timezone
+from multiprocessing.connection import wait
+from urllib.parse import urlsplit
+
+from app.metrics import counter, gauge
+from app.probe_client import ProbeTimings
+from app.probe_engine import ProbeEngine, ProbeResult, ERROR_CLASSES
+
+logger = logging.getLogger(__name__)
+
+# 子进程回传的二进制检查结果记录 (小端)：
+# target_id, 时间戳(UTC epoch 秒), 状态码(-1 表示无), 状态序号, 响应时间, 调度延迟,
+# DNS/连接/TLS/首字节/传输耗时 (NaN 表示无), 是否复用连接 (2 表示未知), 错误类别序号 (0 表示无),
+# 证书到期时间 (UTC epoch 秒，NaN 表示无), 详情的 UTF-8 字节数
+_RECORD = struct.Struct('<qdhBfffffffBBdH')
+_STATUSES = ('UP', 'DOWN', 'ERROR')
+_STATUS_INDEX = {status: index for index, status in enumerate(_STATUSES)}
+_ERROR_CLASSES = ('',) + ERROR_CLASSES
+_ERROR_CLASS_INDEX = {error_class: index for index, error_class in enumerate(_ERROR_CLASSES)}
+_MAX_DETAILS = 0xFFFF
+_NAN = float('nan')
+
+
+def _f(value):
+    return _NAN if value is None else value
+
+
+def _unf(value):
+    return None if math.isnan(value) else round(value, 2)
+
+
+def pack_result(result):
+    """
+    把 ProbeResult 编码为紧凑的二进制记录 (不包含仅用于日志的 target_name)。
+    """
+    timings = result.timings
+    details = result.details.encode('utf-8')[:_MAX_DETAILS]
+    return _RECORD.pack(
+        result.target_id,
+        result.timestamp.timestamp(),
+        -1 if result.status_code is None else result.status_code,
+        _STATUS_INDEX.get(result.status_text, _STATUS_INDEX['ERROR']),
+        _f(result.response_time_ms),
+        _f(result.lag_ms),
+        _f(timings.dns_ms if timings else None),
+        _f(timings.connect_ms if timings else None),
+        _f(timings.tls_ms if timings else None),
+        _f(timings.ttfb_ms if timings else None),
+        _f(timings.transfer_ms if timings else None),
+        2 if timings is None else int(timings.reused),
+        _ERROR_CLASS_INDEX.get(result.error_class, _ERROR_CLASS_INDEX['internal']),
+        _NAN if result.cert_expires_at is None else result.cert_expires_at.timestamp(),
+        len(details),
+    ) + details
+
+
+def unpack_results(buffer, names=None):
+    """
+    解码一段由多条二进制记录拼接而成的数据。
+    :param names: 可选的 {target_id: 名称} 字典，用于还原 target_name。
+    :return: ProbeResult 的生成器。
+    """
+    view = memoryview(buffer)
+    offset = 0
+    while offset < len(view):
+        (target_id, timestamp, status_code, status, response_time_ms, lag_ms,
+         dns_ms, connect_ms, tls_ms, ttfb_ms, transfer_ms, reused, error_class, cert_expires_at, details_len) = _RECORD.unpack_from(view, offset)
+        offset += _RECORD.size
+        details = bytes(view[offset:offset + details_len]).decode('utf-8', 'replace')
+        offset += details_len
+        timings = None
+        if reused != 2:
+            timings = ProbeTimings()
+            timings.dns_ms, timings.connect_ms, timings.tls_ms, timings.ttfb_ms, timings.transfer_ms = (
+                _unf(dns_ms), _unf(connect_ms), _unf(tls_ms), _unf(ttfb_ms), _unf(transfer_ms))
+            timings.reused = bool(reused)
+        yield ProbeResult(
+            target_id,
+            datetime.fromtimestamp(timestamp, timezone.utc),
+            None if status_code < 0 else status_code,
+            _STATUSES[status],
+            _unf(response_time_ms),
+            details,
+            _unf(lag_ms),
+            names.get(target_id, '') if names is not None else '',
+            timings,
+            _ERROR_CLASSES[error_class],
+            None if math.isnan(cert_expires_at) else datetime.fromtimestamp(cert_expires_at, timezone.utc),
+        )
+
+
+def _child_main(targets_conn, results_conn, engine_options, flush_interval, flush_bytes):
+    """
+    探测子进程：在自己的事件循环中运行一个 ProbeEngine，
+    把检查结果编码为二进制记录，攒批后通过管道发回协调进程。
+    """
+    buffer = bytearray()
+    lock = threading.Lock()
+    stopping = threading.Event()
+
+    def _send_locked():
+        # 调用方需持有 lock；管道满时在这里阻塞，从而向本进程的探测引擎施加背压
+        if buffer:
+            results_conn.send_bytes(buffer)
+            buffer.clear()
+
+    def _collect(result):
+        record = pack_result(result)
+        with lock:
+            buffer.extend(record)
+            if len(buffer) >= flush_bytes:
+                _send_locked()
+
+    def _flusher():
+        while not stopping.wait(flush_interval):
+            with lock:
+                _send_locked()
+
+    engine = ProbeEngine(result_handler=_collect, **engine_options)
+    engine.start()
+    flusher = threading.Thread(target=_flusher, name='probe-pool-flusher', daemon=True)
+    flusher.start()
+    try:
+        while True:
+            batch = targets_conn.recv()
+            if batch is None:
+                break
+            engine.submit(batch)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        engine.stop()
+        stopping.set()
+        flusher.join()
+        with lock:
+            _send_locked()
+        results_conn.send_bytes(b'') # 空消息表示子进程已结束
+        results_conn.close()
+
+
+class ProcessProbePool:
+    """
+    多进程探测池，与 ProbeEngine 提供相同的 submit / start / stop 接口。
+
+    协调进程 (检查调度器所在进程) 把精简的 ProbeTarget 元组按 主机:端口 的哈希分给各个子进程，
+    同一主机始终由同一个子进程检查，因此单主机并发上限和 keep-alive 连接池仍然有效。
+    每个子进程运行自己的异步探测引擎，结果以二进制记录批量发回，
+    由协调进程的接收线程解码为 ProbeResult 后交给 result_handler (通常是结果写入器)。
+    result_handler 阻塞时接收线程停止读取管道，背压会一直传递到子进程的探测引擎。
+    子进程异常退出 (结果管道在没有收到结束消息时断开) 时，它正在检查的目标各产生一条 ERROR 结果，
+    接收线程随即在同一位置启动新的子进程，之后分给该位置的主机由新进程检查。
+    """
+
+    def __init__(self, result_handler=None, processes=2, flush_interval=0.05, flush_bytes=65536, **engine_options):
+        self.result_handler = result_handler
+        self.processes = processes
+        self.flush_interval = flush_interval # 子进程攒批发送结果的最长间隔(秒)
+        self.flush_bytes = flush_bytes # 子进程攒批发送结果的字节数上限
+        self.engine_options = engine_options # 传给子进程 ProbeEngine 的参数
+
+        self._context = None
+        self._children = [] # [(进程, 目标管道发送端, 结果管道接收端)]
+        self._pending = [] # 与 _children 对应：{target_id: 目标名称}，已交给子进程、尚未收到结果的检查
+        self._receiver = None
+        self._send_lock = threading.Lock() # 保护目标管道的发送以及 _children、_pending 的替换
+        self._stopping = False
+        self._names = {} # target_id -> 名称，用于还原日志中的目标名称
+
+        self.submitted = 0
+        self.completed = 0
+        self.bytes_received = 0
+        self.respawns = 0 # 异常退出后重新启动的子进程数
+
+    def init_app(self, app, result_handler=None):
+        """
+        从Flask应用配置中读取进程数和子进程探测引擎的参数。
+        """
+        self.processes = app.config.get('PROBE_PROCESSES', self.processes)
+        config_keys = {
+            'max_in_flight': 'PROBE_MAX_IN_FLIGHT',
+            'per_host_limit': 'PROBE_PER_HOST_LIMIT',
+            'timeout': 'PROBE_TIMEOUT_SECONDS',
+            'dns_cache_ttl': 'PROBE_DNS_CACHE_TTL',
+            'pool_max_per_host': 'PROBE_POOL_MAX_PER_HOST',
+            'pool_max_total': 'PROBE_POOL_MAX_TOTAL',
+            'pool_idle_timeout': 'PROBE_POOL_IDLE_SECONDS',
+            'stats_log_interval': 'PROBE_STATS_LOG_INTERVAL',
+        }
+        for option, key in config_keys.items():
+            if key in app.config:
+                self.engine_options[option] = app.config[key]
+        if result_handler is not None:
+            self.result_handler = result_handler
+
+    @property
+    def running(self):
+        return self._receiver is not None and self._receiver.is_alive()
+
+    @property
+    def in_flight(self):
+        return self.submitted - self.completed
+
+    def start(self):
+        if self.running:
+            return
+        # 使用 spawn 启动子进程，避免在已有多个线程的进程中 fork
+        self._context = multiprocessing.get_context('spawn')
+        self._stopping = False
+        self._children = [self._spawn(index) for index in range(self.processes)]
+        self._pending = [{} for _ in self._children]
+        self._receiver = threading.Thread(target=self._receive, name='probe-pool-receiver', daemon=True)
+        self._receiver.start()
+        logger.info(f"多进程探测池已启动: {self.processes} 个探测进程。")
+
+    def stop(self, timeout=10):
+        """
+        通知所有子进程停止，接收完它们发回的剩余结果后返回。
+        """
+        if not self.running:
+            return
+        with self._send_lock:
+            self._stopping = True
+            for _, targets_send, _ in self._children:
+                try:
+                    targets_send.send(None)
+                except OSError:
+                    pass
+        self._receiver.join(timeout)
+        for process, targets_send, _ in self._children:
+            process.join(timeout)
+            targets_send.close()
+        self._receiver = None
+        logger.info(f"多进程探测池已停止: {self.stats()}")
+
+    def _spawn(self, index):
+        targets_recv, targets_send = self._context.Pipe(duplex=False)
+        results_recv, results_send = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_child_main, name=f'probe-process-{index}', daemon=True,
+            args=(targets_recv, results_send, self.engine_options, self.flush_interval, self.flush_bytes))
+        process.start()
+        targets_recv.close()
+        results_send.close()
+        return process, targets_send, results_recv
+
+    def _child_for(self, url):
+        return zlib.crc32(urlsplit(url).netloc.encode('utf-8', 'replace')) % len(self._children)
+
+    def submit(self, targets):
+        """
+        线程安全地提交一批待检查的目标，按主机分配给各个子进程。
+        :param targets: ProbeTarget 的可迭代对象。
+        """
+        batch = list(targets)
+        if not batch:
+            return
+        if not self.running:
+            self.start()
+        shards = [[] for _ in self._children]
+        for target in batch:
+            self._names[target.id] = target.name
+            shards[self._child_for(target.url)].append(target)
+        with self._send_lock:
+            self.submitted += len(batch)
+            for index, shard in enumerate(shards):
+                if not shard:
+                    continue
+                pending = self._pending[index]
+                for target in shard:
+                    pending[target.id] = target.name
+                try:
+                    self._children[index][1].send(shard)
+                except OSError:
+                    # 子进程已经退出：这些检查留在 _pending 中，由接收线程发现子进程退出时记为 ERROR
+                    pass
+
+    def _receive(self):
+        connections = {results_recv: index for index, (_, _, results_recv) in enumerate(self._children)}
+        while connections:
+            for connection in wait(list(connections)):
+                index = connections[connection]
+                try:
+                    payload = connection.recv_bytes()
+                except (EOFError, OSError):
+                    payload = None # 结果管道在没有收到结束消息时断开：子进程异常退出
+                if not payload:
+                    del connections[connection]
+                    connection.close()
+                    if payload is None:
+                        replacement = self._replace_child(index)
+                        if replacement is not None:
+                            connections[replacement] = index
+                    continue
+                self.bytes_received += len(payload)
+                results = list(unpack_results(payload, self._names))
+                with self._send_lock:
+                    pending = self._pending[index]
+                    for result in results:
+                        pending.pop(result.target_id, None)
+                self._deliver(results)
+
+    def _replace_child(self, index):
+        """
+        处理异常退出的子进程：把它正在检查的目标记为 ERROR，并 (池未在停止时) 在同一位置启动新的子进程。
+        :return: 新子进程的结果管道接收端；池正在停止时返回 None。
+        """
+        with self._send_lock:
+            process, targets_send, _ = self._children[index]
+            lost, self._pending[index] = self._pending[index], {}
+            targets_send.close()
+            replacement = None
+            if not self._stopping:
+                self._children[index] = self._spawn(index)
+                replacement = self._children[index][2]
+                self.respawns += 1
+        process.join(1)
+        logger.error(f"探测子进程 {process.name} 异常退出 (退出码 {process.exitcode})，"
+                     f"{len(lost)} 个进行中的检查记为 ERROR" + ("，已重新启动。" if replacement is not None else "。"))
+        now = datetime.now(timezone.utc)
+        self._deliver([ProbeResult(target_id, now, None, 'ERROR', None, f"探测子进程异常退出 (退出码 {process.exitcode})",
+                                   target_name=name, error_class='internal') for target_id, name in lost.items()])
+        return replacement
+
+    def _deliver(self, results):
+        for result in results:
+            self.completed += 1
+            if self.result_handler is not None:
+                try:
+                    self.result_handler(result)
+                except Exception as e:
+                    logger.error(f"处理目标 (ID: {result.target_id}) 的检查结果时发生错误: {e}", exc_info=True)
+
+    def collect_metrics(self):
+        """
+        返回协调进程侧的 Prometheus 指标文本行 (进行中的检查数包括在子进程中排队等待并发名额的检查)。
+        """
+        return (gauge('webpulse_probes_in_flight', '正在进行中的检查数', self.in_flight)
+                + counter('webpulse_probes_submitted_total', '提交给探测引擎的检查数', self.submitted)
+                + counter('webpulse_probes_completed_total', '已完成的检查数', self.completed)
+                + counter('webpulse_probe_pool_received_bytes_total', '从探测子进程接收的结果字节数', self.bytes_received)
+                + counter('webpulse_probe_pool_respawns_total', '异常退出后重新启动的探测子进程数', self.respawns))
+
+    def stats(self):
+        """
+        返回协调进程侧的计数器。
+        """
+        return {
+            'processes': self.processes,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'in_flight': self.in_flight,
+            'bytes_received': self.bytes_received,
+            'respawns': self.respawns,
+        }
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import socket
+import time
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from app.probe_client import _open_connection, _resolve, _ms_since, peer_cert_expiry
+
+# 探测类型注册表。与 probe_client 一样只依赖标准库，可以在探测子进程和基准测试脚本中直接导入。
+#
+# 除了 HTTP(S) 检查之外，数据库、消息队列、邮件服务器等不提供 HTTP 接口的服务可以用更轻量的探测：
+# tcp://host:port 只建立TCP连接，tls://host[:port] 完成TLS握手并读取证书到期时间，
+# dns://hostname 只做一次域名解析。它们与 HTTP 检查运行在同一个事件循环中，
+# 共用全局和单主机并发限制、DNS缓存以及 ProbeEngine 的超时和错误归类规则。
+
+
+class ProbeOutcome(NamedTuple):
+    """
+    轻量探测的结果，由 ProbeEngine.check 转换为 ProbeResult。
+    """
+    status_text: str # 'UP' 或 'DOWN'
+    response_time_ms: float # 整个探测的耗时，单位毫秒
+    details: str = ''
+    error_class: str = '' # 失败原因的类别 (见 probe_engine.ERROR_CLASSES)
+    cert_expires_at: Optional[datetime] = None # TLS 探测读取到的证书到期时间 (UTC)
+
+
+class ProbeType(NamedTuple):
+    """
+    一种探测类型。
+    check 为 None 表示由 ProbeEngine 内置的 HTTP 检查处理 (只有 http 类型如此)。
+    """
+    name: str
+    label: str # 表单中显示的名称
+    schemes: tuple # 允许的URL协议
+    default_port: Optional[int] # URL 未写端口时使用的端口
+    port_required: bool # URL 是否必须写明端口
+    check: Optional[Callable] # async check(client, target, timings) -> ProbeOutcome
+    parse_params: Callable # 校验并规范化参数字典，参数不合法时抛出 ValueError
+
+
+PROBE_TYPES = {}
+
+
+def register_probe_type(name, label, schemes, check=None, parse_params=None, default_port=None, port_required=False):
+    """
+    注册 (或替换) 一种探测类型。
+    :param check: 异步检查函数，接收 (ProbeClient, ProbeTarget, ProbeTimings)，返回 ProbeOutcome；
+                  网络错误和超时直接抛出，由 ProbeEngine 按统一规则归类。
+    :param parse_params: 参数校验函数，接收参数字典并返回规范化后的字典；None 表示该类型不接受参数。
+    """
+    PROBE_TYPES[name] = ProbeType(name, label, tuple(schemes), default_port, port_required, check,
+                                  parse_params or _no_params)
+
+
+def _no_params(params):
+    if params:
+        raise ValueError(f"不支持的参数: {', '.join(sorted(params))}")
+    return {}
+
+
+def probe_type_choices():
+    """
+    返回供表单下拉框使用的 (名称, 显示名称) 列表。
+    """
+    return [(probe_type.name, probe_type.label) for probe_type in PROBE_TYPES.values()]
+
+
+def target_endpoint(url):
+    """
+    返回URL指向的 (主机, 端口)，用于按主机划分并发限制；无法解析时返回 None。
+    """
+    try:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port
+    except ValueError:
+        return None
+    if not parts.hostname:
+        return None
+    if port is None:
+        port = next((t.default_port for t in PROBE_TYPES.values() if scheme in t.schemes and t.default_port), None)
+        if port is None and scheme in ('http', 'https'):
+            port = 443 if scheme == 'https' else 80
+    return parts.hostname, port
+
+
+def validate_url(probe_type, url):
+    """
+    检查URL的协议和端口是否与探测类型相符。
+    :raises ValueError: 不相符时抛出，异常信息可直接显示给用户。
+    """
+    definition = PROBE_TYPES.get(probe_type)
+    if definition is None:
+        raise ValueError(f"不支持的探测类型: {probe_type}")
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        raise ValueError("URL 中的端口无效。")
+    if parts.scheme.lower() not in definition.schemes:
+        schemes = ' 或 '.join(f'{scheme}://' for scheme in definition.schemes)
+        raise ValueError(f"{definition.label} 的URL必须以 {schemes} 开头。")
+    if port is None and definition.port_required:
+        raise ValueError(f"{definition.label} 的URL必须写明端口，例如 {definition.schemes[0]}://db.example.com:5432")
+
+
+def parse_probe_params(probe_type, text):
+    """
+    解析并校验以 JSON 对象保存的探测参数。
+    :param text: JSON 文本，空值表示没有参数。
+    :return: 规范化后的参数字典 (没有参数时为空字典)。
+    :raises ValueError: JSON 无效或参数不被该探测类型接受。
+    """
+    definition = PROBE_TYPES.get(probe_type)
+    if definition is None:
+        raise ValueError(f"不支持的探测类型: {probe_type}")
+    params = {}
+    if text and text.strip():
+        try:
+            params = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"参数不是有效的 JSON: {e}")
+        if not isinstance(params, dict):
+            raise ValueError("参数必须是 JSON 对象，例如 {\"min_days\": 14}")
+    return definition.parse_params(dict(params))
+
+
+def dump_probe_params(params):
+    """
+    把参数字典序列化为保存到 probe_params 列的文本，没有参数时返回 None。
+    """
+    return json.dumps(params, ensure_ascii=False, sort_keys=True) if params else None
+
+
+def _endpoint(target):
+    parts = urlsplit(target.url)
+    return parts.hostname, parts.port or PROBE_TYPES[target.probe_type].default_port
+
+
+async def _connect(client, target, timings, scheme='tcp', server_hostname=None):
+    host, port = _endpoint(target)
+    return await _open_connection(scheme, host, port, client.ssl_context, timings,
+                                  resolve=_resolve if target.fresh_connection else client.dns.resolve,
+                                  server_hostname=server_hostname)
+
+
+def _parse_tcp_params(params):
+    banner = params.pop('banner', None)
+    _no_params(params)
+    if banner is None:
+        return {}
+    if not isinstance(banner, str) or not banner or len(banner) > 256:
+        raise ValueError("banner 必须是长度不超过256的字符串。")
+    return {'banner': banner}
+
+
+async def check_tcp(client, target, timings):
+    """
+    建立TCP连接即判定为 UP；配置了 banner 时还要求服务器主动发送的欢迎信息中包含该文本
+    (例如 SMTP 的 "220"、SSH 的 "SSH-")。
+    """
+    start = time.perf_counter()
+    reader, writer = await _connect(client, target, timings)
+    try:
+        banner = (target.params or {}).get('banner')
+        if banner:
+            expected = banner.encode('utf-8')
+            received = b''
+            # 欢迎信息以行为单位：收到完整的一行后就判定，不等服务器关闭连接 (SMTP/SSH 服务器会一直等待客户端)
+            while expected not in received and not received.endswith(b'\n') and len(received) < 1024:
+                chunk = await reader.read(1024 - len(received))
+                if not chunk:
+                    break
+                received += chunk
+            if expected not in received:
+                return ProbeOutcome('DOWN', _ms_since(start), f"欢迎信息中未找到: {banner}", 'body')
+    finally:
+        writer.close()
+    return ProbeOutcome('UP', _ms_since(start))
+
+
+def _parse_tls_params(params):
+    min_days = params.pop('min_days', 0)
+    server_name = params.pop('server_name', None)
+    _no_params(params)
+    if isinstance(min_days, bool) or not isinstance(min_days, (int, float)) or not 0 <= min_days <= 3650:
+        raise ValueError("min_days 必须是0到3650之间的数字。")
+    if server_name is not None and (not isinstance(server_name, str) or not server_name or len(server_name) > 253):
+        raise ValueError("server_name 必须是有效的主机名。")
+    parsed = {}
+    if min_days:
+        parsed['min_days'] = min_days
+    if server_name:
+        parsed['server_name'] = server_name
+    return parsed
+
+
+async def check_tls(client, target, timings):
+    """
+    完成一次TLS握手 (校验证书链和主机名) 并读取证书到期时间；
+    配置了 min_days 时，证书剩余有效期不足该天数即判定为 DOWN。
+    """
+    start = time.perf_counter()
+    params = target.params or {}
+    _, writer = await _connect(client, target, timings, scheme='https', server_hostname=params.get('server_name'))
+    try:
+        cert_expires_at = peer_cert_expiry(writer)
+    finally:
+        writer.close()
+    elapsed_ms = _ms_since(start)
+    min_days = params.get('min_days')
+    if min_days and cert_expires_at is not None:
+        days_left = (cert_expires_at - datetime.now(timezone.utc)).total_seconds() / 86400
+        if days_left < min_days:
+            return ProbeOutcome('DOWN', elapsed_ms, f"证书将在 {days_left:.1f} 天后过期 (要求至少 {min_days} 天)。",
+                                'cert', cert_expires_at)
+    return ProbeOutcome('UP', elapsed_ms, '', '', cert_expires_at)
+
+
+_DNS_FAMILIES = {'any': socket.AF_UNSPEC, 'ipv4': socket.AF_INET, 'ipv6': socket.AF_INET6}
+
+
+def _parse_dns_params(params):
+    expect = params.pop('expect', None)
+    family = params.pop('family', 'any')
+    _no_params(params)
+    if family not in _DNS_FAMILIES:
+        raise ValueError("family 必须是 any、ipv4 或 ipv6。")
+    parsed = {}
+    if family != 'any':
+        parsed['family'] = family
+    if expect is not None:
+        if isinstance(expect, str):
+            expect = [expect]
+        if not isinstance(expect, list) or not expect or not all(isinstance(item, str) and item for item in expect):
+            raise ValueError("expect 必须是IP地址字符串或其列表。")
+        parsed['expect'] = expect
+    return parsed
+
+
+async def check_dns(client, target, timings):
+    """
+    解析URL中的主机名 (每次都真正查询，不使用DNS缓存)；
+    配置了 expect 时要求解析结果中至少包含其中一个地址。
+    """
+    params = target.params or {}
+    start = time.perf_counter()
+    infos = await asyncio.get_running_loop().getaddrinfo(
+        urlsplit(target.url).hostname, None, family=_DNS_FAMILIES[params.get('family', 'any')], type=socket.SOCK_STREAM)
+    timings.dns_ms = elapsed_ms = _ms_since(start)
+    addresses = list(dict.fromkeys(address[0] for _, _, _, _, address in infos))
+    expect = params.get('expect')
+    if expect and not set(expect).intersection(addresses):
+        return ProbeOutcome('DOWN', elapsed_ms,
+                            f"解析结果 {', '.join(addresses[:5])} 中没有期望的地址 {', '.join(expect)}", 'body')
+    return ProbeOutcome('UP', elapsed_ms)
+
+
+register_probe_type('http', 'HTTP(S)', ('http', 'https'))
+register_probe_type('tcp', 'TCP 连接', ('tcp',), check_tcp, _parse_tcp_params, port_required=True)
+register_probe_type('tls', 'TLS 握手/证书', ('tls',), check_tls, _parse_tls_params, default_port=443)
+register_probe_type('dns', 'DNS 解析', ('dns',), check_dns, _parse_dns_params)
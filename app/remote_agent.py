@@ -0,0 +1,446 @@
+import gzip
+import json
+import logging
+import math
+import queue
+import random
+import re
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import zlib
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+
+from app.metrics import Histogram, FLUSH_BUCKETS, counter, gauge
+from app.probe_client import ProbeTimings
+from app.probe_engine import ProbeResult
+from app.scheduler_jobs import SCHEDULE_COLUMNS
+
+# 远程代理在独立的主机上运行，不创建 Flask 应用上下文，使用标准的模块级 logger
+logger = logging.getLogger(__name__)
+
+TARGETS_PATH = '/api/agent/targets' # 拉取指派给代理的目标 (支持 If-None-Match)
+RESULTS_PATH = '/api/agent/results' # 上传一批检查结果 (gzip 压缩的 JSON)
+AGENT_ID_HEADER = 'X-Agent-Id'
+AGENT_LOCATION_HEADER = 'X-Agent-Location' # 经过 URL 编码，位置名称可以包含中文
+BATCH_ID_HEADER = 'X-Batch-Id'
+AGENT_ID_PATTERN = re.compile(r'[A-Za-z0-9_.:-]{1,64}')
+BATCH_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+# 目标列表中每个目标的字段，与探测 worker 调度目标时读取的列相同 (ProbeTarget.from_row 可以直接使用)
+AGENT_TARGET_FIELDS = tuple(column.key for column in SCHEDULE_COLUMNS)
+AgentTargetRow = namedtuple('AgentTargetRow', AGENT_TARGET_FIELDS)
+
+# 上传批次中每条结果是一个数组，元素按以下顺序排列；时间为 UTC epoch 秒。只能在末尾追加
+RESULT_FIELDS = ('target_id', 'timestamp', 'status_code', 'status_text', 'response_time_ms', 'details', 'error_class',
+                 'cert_expires_at', 'dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms', 'transfer_ms', 'connection_reused')
+_TIMING_FIELDS = ('dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms', 'transfer_ms')
+_PERMANENT_ERRORS = (400, 413, 422) # 服务器拒绝批次内容，重试也不会成功，丢弃该批次
+_STOP = object() # 通知上传线程发送剩余批次后退出的哨兵
+
+
+def _epoch(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return round(value.timestamp(), 3)
+
+
+def _datetime(value, field):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{field} 必须是 epoch 秒数")
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+def _number(value, field):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{field} 必须是数字")
+    return float(value)
+
+
+def encode_results(results):
+    """
+    把一批 ProbeResult 编码为上传的请求体 (gzip 压缩的 JSON)。
+    :return: (压缩后的字节串, 压缩前的字节数)
+    """
+    rows = []
+    for result in results:
+        timings = result.timings
+        rows.append([
+            result.target_id, _epoch(result.timestamp), result.status_code, result.status_text,
+            result.response_time_ms, result.details or '', result.error_class or '', _epoch(result.cert_expires_at),
+            *(getattr(timings, field) if timings else None for field in _TIMING_FIELDS),
+            timings.reused if timings else None,
+        ])
+    raw = json.dumps({'results': rows}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return gzip.compress(raw, compresslevel=6), len(raw)
+
+
+def decode_results(body, content_encoding=None, max_bytes=16 * 1024 * 1024):
+    """
+    解码并校验代理上传的请求体。
+    :param content_encoding: 请求的 Content-Encoding，支持 gzip 和不压缩。
+    :param max_bytes: 解压后的最大字节数，防止压缩炸弹。
+    :return: ProbeResult 列表 (保持上传时的顺序)。
+    :raises ValueError: 请求体无法解压、不是合法的批次或超过大小限制。
+    """
+    if content_encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            data = decompressor.decompress(body, max_bytes + 1)
+        except zlib.error as e:
+            raise ValueError(f"无法解压请求体: {e}") from e
+        if len(data) > max_bytes or decompressor.unconsumed_tail:
+            raise ValueError(f"解压后的请求体超过 {max_bytes} 字节")
+    elif content_encoding in (None, '', 'identity'):
+        data = body
+    else:
+        raise ValueError(f"不支持的 Content-Encoding: {content_encoding}")
+    try:
+        rows = json.loads(data)['results']
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"请求体不是合法的结果批次: {e}") from e
+    if not isinstance(rows, list):
+        raise ValueError("results 必须是数组")
+
+    results = []
+    for index, row in enumerate(rows):
+        if not isinstance(row, list) or len(row) != len(RESULT_FIELDS):
+            raise ValueError(f"第 {index + 1} 条结果必须是包含 {len(RESULT_FIELDS)} 个元素的数组")
+        (target_id, timestamp, status_code, status_text, response_time_ms, details, error_class, cert_expires_at,
+         *timing_values, reused) = row
+        try:
+            if isinstance(target_id, bool) or not isinstance(target_id, int):
+                raise ValueError("target_id 必须是整数")
+            if status_code is not None and (isinstance(status_code, bool) or not isinstance(status_code, int)):
+                raise ValueError("status_code 必须是整数")
+            if not isinstance(status_text, str) or not 0 < len(status_text) <= 50:
+                raise ValueError("status_text 必须是 1 到 50 个字符的字符串")
+            if not isinstance(details, str) or not isinstance(error_class, str):
+                raise ValueError("details 和 error_class 必须是字符串")
+            timings = None
+            if any(value is not None for value in timing_values) or reused is not None:
+                timings = ProbeTimings()
+                for field, value in zip(_TIMING_FIELDS, timing_values):
+                    setattr(timings, field, _number(value, field))
+                timings.reused = bool(reused)
+            results.append(ProbeResult(
+                target_id, _datetime(timestamp, 'timestamp'), status_code, status_text,
+                _number(response_time_ms, 'response_time_ms'), details, timings=timings, error_class=error_class,
+                cert_expires_at=_datetime(cert_expires_at, 'cert_expires_at')))
+        except ValueError as e:
+            raise ValueError(f"第 {index + 1} 条结果无效: {e}") from e
+    return results
+
+
+class RemoteProbeAgent:
+    """
+    远程探测代理：在中心服务器之外的主机上运行探测引擎和检查调度器，只通过 HTTP 与服务器通信，不连接数据库。
+
+    同步线程每隔 sync_interval 秒拉取指派给本代理的目标：请求带上次响应的 ETag，目标没有变化时服务器返回 304；
+    有变化时只返回 config_version 更新的目标以及全部目标ID，代理据此增量更新调度器 (与探测 worker 的 reconcile 相同)，
+    每隔 full_sync_interval 秒不带 ETag 全量同步一次。用户在页面上请求的立即检查随目标列表一起下发。
+    检查结果由上传线程按批次 (batch_size 条或 flush_interval 秒) 编码为 gzip 压缩的 JSON，每批生成一个批次ID；
+    上传失败时以相同的批次ID按指数退避重试，服务器据此忽略已经写入的批次，响应丢失导致的重试不会写入重复的日志。
+    批次按产生的顺序逐个上传；服务器长时间不可用时最多在内存中保留 max_pending 条结果，超出时丢弃最旧的批次。
+    """
+
+    def __init__(self, server_url=None, token=None, agent_id=None, location=None, dispatcher=None,
+                 sync_interval=10, full_sync_interval=300, batch_size=500, flush_interval=2.0, max_pending=100000,
+                 retry_max_seconds=60, timeout=30, max_queue=10000, put_timeout=30):
+        self.server_url = (server_url or '').rstrip('/') # 中心服务器的地址，例如 https://monitor.example.com
+        self.token = token # 与服务器 AGENT_API_TOKEN 相同的共享令牌
+        self.agent_id = agent_id
+        self.location = location # 代理所在的位置，记在代理信息中，便于区分检查来自哪里
+        self.dispatcher = dispatcher
+        self.sync_interval = sync_interval # 拉取目标变化的间隔(秒)
+        self.full_sync_interval = full_sync_interval # 全量同步的间隔(秒)
+        self.batch_size = batch_size # 每批最多包含的检查结果数
+        self.flush_interval = flush_interval # 批次中第一条结果最多等待多少秒就上传
+        self.max_pending = max_pending # 尚未上传成功的结果最多保留多少条
+        self.retry_max_seconds = retry_max_seconds # 重试间隔的上限(秒)
+        self.timeout = timeout # 每个 HTTP 请求的超时(秒)
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+
+        self._queue = None
+        self._sync_thread = None
+        self._upload_thread = None
+        self._stop_event = threading.Event()
+        self._pending = deque() # 等待上传的批次 (批次ID, 请求体, 结果数)，只由上传线程访问
+        self._pending_results = 0
+        self._next_attempt = 0.0 # 下一次上传的最早时间 (time.monotonic())
+        self._retry_delay = 1.0
+        self._etag = None # 上一次同步响应的 ETag
+        self._full_synced_at = None # 最近一次全量同步的时间；None 表示下一次同步需要全量同步
+
+        self.results_submitted = 0 # 交给上传队列的检查结果数
+        self.results_sent = 0 # 服务器已写入的检查结果数
+        self.results_rejected = 0 # 服务器拒绝的结果数 (例如目标已改派给其他代理或已删除)
+        self.dropped = 0 # 因队列满载、积压过多或被服务器拒绝而丢弃的结果数
+        self.batches_sent = 0 # 已被服务器确认的批次数
+        self.duplicate_batches = 0 # 服务器报告为重复 (之前的上传已经写入) 的批次数
+        self.upload_retries = 0 # 上传失败后安排的重试次数
+        self.bytes_raw = 0 # 上传批次压缩前的字节数
+        self.bytes_sent = 0 # 上传批次压缩后的字节数
+        self.syncs = 0 # 收到目标列表的同步次数
+        self.syncs_not_modified = 0 # 服务器返回 304 (目标没有变化) 的同步次数
+        self.upload_time = Histogram(FLUSH_BUCKETS) # 每批上传 (含服务器写库) 的耗时(秒)，只由上传线程更新
+
+    def init_app(self, app, dispatcher):
+        """
+        绑定检查调度器并从配置中读取代理参数 (代理进程只加载配置，不初始化数据库)。
+        :param dispatcher: 检查调度器，其 result_handler 应为本代理的 submit。
+        """
+        self.dispatcher = dispatcher
+        self.server_url = (app.config.get('AGENT_SERVER_URL') or self.server_url or '').rstrip('/')
+        self.token = app.config.get('AGENT_API_TOKEN', self.token)
+        self.agent_id = self.agent_id or app.config.get('AGENT_ID') or socket.gethostname()
+        self.location = app.config.get('AGENT_LOCATION', self.location)
+        self.sync_interval = app.config.get('AGENT_SYNC_SECONDS', self.sync_interval)
+        self.full_sync_interval = app.config.get('AGENT_FULL_SYNC_SECONDS', self.full_sync_interval)
+        self.batch_size = app.config.get('AGENT_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('AGENT_FLUSH_SECONDS', self.flush_interval)
+        self.max_pending = app.config.get('AGENT_MAX_PENDING_RESULTS', self.max_pending)
+        self.timeout = app.config.get('AGENT_TIMEOUT_SECONDS', self.timeout)
+
+    @property
+    def running(self):
+        return self._upload_thread is not None and self._upload_thread.is_alive()
+
+    @property
+    def pending_results(self):
+        """
+        尚未被服务器确认的结果数 (包括队列中还未组成批次的结果)。
+        """
+        return self._pending_results + (self._queue.qsize() if self._queue is not None else 0)
+
+    def start(self):
+        if self.running:
+            return
+        if not self.server_url or not self.token:
+            raise ValueError("远程探测代理需要配置 AGENT_SERVER_URL 和 AGENT_API_TOKEN。")
+        if not AGENT_ID_PATTERN.fullmatch(self.agent_id or ''):
+            raise ValueError(f"代理ID只能包含字母、数字和 _.:-，长度不超过64: {self.agent_id}")
+        self._stop_event.clear()
+        self._etag = self._full_synced_at = None
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._upload_thread = threading.Thread(target=self._run_uploader, name='agent-uploader', daemon=True)
+        self._upload_thread.start()
+        self._sync_thread = threading.Thread(target=self._run_sync, name='agent-sync', daemon=True)
+        self._sync_thread.start()
+        logger.info(f"远程探测代理 {self.agent_id} ({self.location or '未设置位置'}) 已启动: 服务器 {self.server_url}, "
+                    f"同步间隔 {self.sync_interval} 秒, 批大小 {self.batch_size}。")
+
+    def stop(self, timeout=30):
+        """
+        停止同步，并把剩余的结果组成批次尽量上传一次 (应在调度器和探测引擎停止之后调用)。
+        仍未上传成功的结果随进程退出而丢失。
+        """
+        if not self.running:
+            return
+        self._stop_event.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join(timeout)
+            self._sync_thread = None
+        self._queue.put(_STOP)
+        self._upload_thread.join(timeout)
+        self._upload_thread = None
+        logger.info(f"远程探测代理 {self.agent_id} 已停止: 上传 {self.results_sent} 条结果 ({self.batches_sent} 批)，"
+                    f"丢弃 {self.dropped} 条，未上传 {self._pending_results} 条。")
+
+    def submit(self, result):
+        """
+        提交一条检查结果 (检查调度器的 result_handler)。队列满时阻塞等待，形成背压。
+        :return: 成功放入队列返回 True，超时被丢弃返回 False。
+        """
+        try:
+            self._queue.put(result, timeout=self.put_timeout)
+            self.results_submitted += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.error(f"远程代理上传队列持续满载超过 {self.put_timeout} 秒，丢弃目标 (ID: {result.target_id}) 的检查结果。")
+            return False
+
+    def collect_metrics(self):
+        """
+        返回代理同步和上传的 Prometheus 指标文本行。
+        """
+        lines = []
+        lines += gauge('webpulse_agent_pending_results', '尚未被服务器确认的检查结果数', self.pending_results)
+        lines += counter('webpulse_agent_results_sent_total', '服务器已写入的检查结果数', self.results_sent)
+        lines += counter('webpulse_agent_results_dropped_total', '丢弃的检查结果数', self.dropped)
+        lines += counter('webpulse_agent_batches_sent_total', '已被服务器确认的批次数', self.batches_sent)
+        lines += counter('webpulse_agent_duplicate_batches_total', '服务器报告为重复的批次数', self.duplicate_batches)
+        lines += counter('webpulse_agent_upload_retries_total', '上传失败后的重试次数', self.upload_retries)
+        lines += counter('webpulse_agent_upload_bytes_total', '上传批次压缩后的字节数', self.bytes_sent)
+        lines += counter('webpulse_agent_syncs_total', '收到目标列表的同步次数', self.syncs)
+        lines += counter('webpulse_agent_syncs_not_modified_total', '目标没有变化 (304) 的同步次数', self.syncs_not_modified)
+        lines += self.upload_time.expose('webpulse_agent_upload_seconds', '每批检查结果上传 (含服务器写库) 的耗时')
+        return lines
+
+    def _open(self, method, path, body=None, headers=None):
+        request = urllib.request.Request(self.server_url + path, data=body, method=method, headers={
+            'Authorization': f'Bearer {self.token}',
+            AGENT_ID_HEADER: self.agent_id,
+            AGENT_LOCATION_HEADER: urllib.parse.quote(self.location or ''),
+            'User-Agent': 'WebPulse-Monitor-Agent',
+            **(headers or {}),
+        })
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _run_sync(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                self._full_synced_at = None # 同步失败后下一次改为全量同步；在此之前继续检查已知的目标
+                logger.warning(f"远程探测代理 {self.agent_id} 同步目标失败: {e}")
+            self._stop_event.wait(self.sync_interval)
+
+    def sync(self):
+        """
+        向服务器同步一次指派给本代理的目标，并执行随目标列表下发的立即检查请求。
+        :return: (装入或更新的目标数, 移除的目标数)；目标没有变化 (304) 时返回 None。
+        """
+        full = self._etag is None or self._full_synced_at is None or \
+            time.monotonic() - self._full_synced_at >= self.full_sync_interval
+        try:
+            with self._open('GET', TARGETS_PATH, headers={} if full else {'If-None-Match': self._etag}) as response:
+                payload = json.loads(response.read().decode('utf-8'))
+                etag = response.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                self.syncs_not_modified += 1
+                return None
+            raise
+        self.syncs += 1
+
+        rows = [AgentTargetRow(**{field: item.get(field) for field in AGENT_TARGET_FIELDS})
+                for item in payload.get('targets', ())]
+        if payload.get('full'):
+            added, removed = self.dispatcher.sync(rows)
+            self._full_synced_at = time.monotonic()
+        elif payload.get('target_ids') is not None:
+            # 增量响应只包含变化的目标；不在全部目标ID中的目标已被删除、暂停或改派给其他代理
+            wanted = set(payload['target_ids'])
+            added, removed = self.dispatcher.apply(
+                rows, [target_id for target_id in self.dispatcher.target_ids() if target_id not in wanted])
+        else:
+            added, removed = 0, 0 # 目标没有变化，响应只携带立即检查请求
+        for target_id in payload.get('run_now', ()):
+            self.dispatcher.run_now(target_id)
+        self._etag = etag
+        if added or removed:
+            logger.info(f"远程探测代理 {self.agent_id} 同步目标 (版本 {payload.get('version')}, "
+                        f"{'全量' if payload.get('full') else '增量'}): 调度新增/更新 {added} 个，移除 {removed} 个，"
+                        f"当前共 {len(self.dispatcher)} 个目标。")
+        return added, removed
+
+    def _run_uploader(self):
+        batch = []
+        deadline = None
+        while True:
+            now = time.monotonic()
+            waits = []
+            if batch:
+                waits.append(deadline - now)
+            if self._pending:
+                waits.append(self._next_attempt - now)
+            try:
+                item = self._queue.get(timeout=max(0.0, min(waits)) if waits else None)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                if batch:
+                    self._seal(batch)
+                self._next_attempt = 0.0 # 退出前不再等待退避，每个剩余批次尝试一次
+                while self._pending and self._send_next():
+                    pass
+                if self._pending:
+                    logger.warning(f"远程探测代理 {self.agent_id} 退出时仍有 {self._pending_results} 条结果未能上传。")
+                return
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._seal(batch)
+                batch = []
+            while self._pending and time.monotonic() >= self._next_attempt:
+                if not self._send_next():
+                    break
+
+    def _seal(self, batch):
+        # 批次一旦生成，批次ID和请求体在重试时都保持不变
+        body, raw_size = encode_results(batch)
+        self._pending.append((uuid.uuid4().hex, body, len(batch)))
+        self._pending_results += len(batch)
+        self.bytes_raw += raw_size
+        while self._pending_results > self.max_pending and len(self._pending) > 1:
+            batch_id, _, count = self._pending.popleft()
+            self._pending_results -= count
+            self.dropped += count
+            logger.error(f"远程探测代理 {self.agent_id} 积压的结果超过 {self.max_pending} 条，丢弃最旧的批次 {batch_id} ({count} 条)。")
+
+    def _send_next(self):
+        """
+        上传队首的批次。
+        :return: 批次已处理完 (被确认或被永久拒绝) 返回 True；需要稍后重试返回 False。
+        """
+        batch_id, body, count = self._pending[0]
+        started = time.perf_counter()
+        try:
+            with self._open('POST', RESULTS_PATH, body=body, headers={
+                    'Content-Type': 'application/json', 'Content-Encoding': 'gzip', BATCH_ID_HEADER: batch_id}) as response:
+                report = json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            if e.code not in _PERMANENT_ERRORS:
+                return self._retry_later(batch_id, f"HTTP {e.code}")
+            self._pending.popleft()
+            self._pending_results -= count
+            self.dropped += count
+            logger.error(f"服务器拒绝了远程探测代理 {self.agent_id} 的批次 {batch_id} ({count} 条)，已丢弃: "
+                         f"HTTP {e.code} {e.read()[:200].decode('utf-8', 'replace')}")
+            return True
+        except (OSError, ValueError) as e:
+            return self._retry_later(batch_id, e)
+
+        elapsed = time.perf_counter() - started
+        self._pending.popleft()
+        self._pending_results -= count
+        self._retry_delay = 1.0
+        self.upload_time.observe(elapsed)
+        self.batches_sent += 1
+        self.bytes_sent += len(body)
+        accepted = report.get('accepted', count) # 重复批次报告的是第一次上传时写入的结果数
+        self.results_sent += accepted
+        self.results_rejected += count - accepted
+        if report.get('duplicate'):
+            self.duplicate_batches += 1
+            logger.info(f"批次 {batch_id} 在之前的上传中已写入，服务器忽略了这次重试。")
+        elif report.get('rejected'):
+            logger.warning(f"服务器拒绝了批次 {batch_id} 中的 {report['rejected']} 条结果 (目标已删除或已改派给其他代理)。")
+        return True
+
+    def _retry_later(self, batch_id, error):
+        # 指数退避并加入随机抖动，避免服务器恢复时所有代理同时重试
+        delay = self._retry_delay * random.uniform(0.8, 1.2)
+        self._next_attempt = time.monotonic() + delay
+        self._retry_delay = min(self._retry_delay * 2, self.retry_max_seconds)
+        self.upload_retries += 1
+        logger.warning(f"远程探测代理 {self.agent_id} 上传批次 {batch_id} 失败: {error}，{delay:.1f} 秒后重试 "
+                       f"(积压 {self._pending_results} 条结果)。")
+        return False
@@ -0,0 +1,441 @@
+import math
+import time
+from itertools import chain
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import case, func, select
+
+from app import db, logger # 从 app/__init__.py 中导入 db 实例和预配置的 logger
+from app.models import CheckLog, MonitoredTarget
+from app.rollups import LatencySketch, to_utc_naive
+from app.segment_store import RECORD_SIZE
+
+# SLA 报表按目标逐块读取原始检查历史 (check_log 或段文件)，每块转换为 NumPy 数组后向量化计算：
+# 可用率、故障 (连续非 UP 检查) 的次数和时长、MTTR / MTBF，以及每个目标和每个时间桶的延迟分位数。
+# 延迟分位数使用与 rollups.LatencySketch 相同的对数分桶，因此与聚合表的分位数可以直接对比；
+# 内存占用只与单块大小、时间桶数量和目标数量有关，与读取的行数无关。
+
+DEFAULT_CHUNK_SIZE = 100000 # 每块读取的检查记录条数
+MAX_BUCKETS = 2000 # 时间桶数量上限，防止过细的粒度生成过大的报表
+MAX_RECENT_INCIDENTS = 20 # 每个目标在报表中列出的最近故障条数
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 分桶范围：MIN_VALUE_MS (0.01ms) 到 MAX_LATENCY_MS，超出范围的响应时间计入两端的桶
+MAX_LATENCY_MS = 600000.0
+_BIN_MIN = math.ceil(math.log(LatencySketch.MIN_VALUE_MS) / LatencySketch.LOG_GAMMA)
+_BIN_MAX = math.ceil(math.log(MAX_LATENCY_MS) / LatencySketch.LOG_GAMMA)
+SKETCH_BINS = _BIN_MAX - _BIN_MIN + 1
+
+# 与 segment_store.RECORD ('<dIBBhfI') 对应的结构化 dtype，用于直接按列读取映射的段文件
+SEGMENT_DTYPE = np.dtype([('ts', '<f8'), ('target_id', '<u4'), ('status', 'u1'), ('error_class', 'u1'),
+                          ('status_code', '<i2'), ('latency', '<f4'), ('details_ref', '<u4')])
+assert SEGMENT_DTYPE.itemsize == RECORD_SIZE
+
+
+class CheckChunk(NamedTuple):
+    """
+    同一个目标按时间顺序排列的一段检查记录 (列式存储)。
+    """
+    target_id: int
+    ts: np.ndarray # UTC epoch 秒 (float64)
+    up: np.ndarray # 是否为 UP (bool)
+    latency: np.ndarray # 响应时间，单位毫秒 (float64，NaN 表示没有)
+    weight: Optional[np.ndarray] = None # 每行代表的检查次数 (int64)，None 表示每行都是一次检查
+
+
+def latency_bins(latency):
+    """
+    把响应时间数组转换为分桶序号 (0 .. SKETCH_BINS-1)，NaN 被丢弃。
+    """
+    latency = latency[~np.isnan(latency)]
+    index = np.ceil(np.log(np.maximum(latency, LatencySketch.MIN_VALUE_MS)) / LatencySketch.LOG_GAMMA)
+    return np.clip(index - _BIN_MIN, 0, SKETCH_BINS - 1).astype(np.intp)
+
+
+def weighted_bincount(index, weight, minlength):
+    """
+    np.bincount 的计数版本：weight 为 None 时每个元素计 1，否则按 weight (整数) 计数。
+    """
+    if weight is None:
+        return np.bincount(index, minlength=minlength)
+    return np.bincount(index, weights=weight, minlength=minlength).astype(np.int64)
+
+
+def sketch_quantiles(counts, quantiles=QUANTILES):
+    """
+    从分桶计数估算分位数，算法与 LatencySketch.quantile 相同。
+    :param counts: 形状为 (..., SKETCH_BINS) 的计数数组，可以一次计算多行。
+    :return: 形状为 (..., len(quantiles)) 的数组，没有数据的行为 NaN。
+    """
+    cumulative = np.cumsum(counts, axis=-1)
+    total = cumulative[..., -1:]
+    ranks = np.asarray(quantiles) * (total - 1)
+    # 每个分位数对应第一个累计计数大于秩的桶
+    index = (cumulative[..., None, :] <= ranks[..., None]).sum(axis=-1)
+    index = np.minimum(index, SKETCH_BINS - 1)
+    values = np.round(2 * LatencySketch.GAMMA ** (index + _BIN_MIN) / (LatencySketch.GAMMA + 1), 2)
+    return np.where(total > 0, values, np.nan)
+
+
+class _TargetState:
+    """
+    一个目标的累计统计。记录按 (目标, 时间) 顺序到达，跨块的故障通过 open_since / open_checks 延续。
+    """
+    __slots__ = ('target_id', 'checks', 'up', 'first_ts', 'last_ts', 'latency_sum', 'sketch', 'last_down',
+                 'open_since', 'open_checks', 'resolved', 'resolved_seconds', 'longest_seconds',
+                 'max_failed_checks', 'recent')
+
+    def __init__(self, target_id):
+        self.target_id = target_id
+        self.checks = self.up = 0
+        self.first_ts = self.last_ts = None
+        self.latency_sum = 0.0
+        self.sketch = np.zeros(SKETCH_BINS, dtype=np.int64)
+        self.last_down = False
+        self.open_since = None # 尚未恢复的故障的开始时间
+        self.open_checks = 0 # 尚未恢复的故障已连续失败的检查次数
+        self.resolved = self.max_failed_checks = 0
+        self.resolved_seconds = self.longest_seconds = 0.0
+        self.recent = [] # 最近的已恢复故障 (开始, 结束, 失败检查次数)
+
+    def add(self, ts, up, latency, bins, weight, min_failures):
+        n = len(ts)
+        if self.first_ts is None:
+            self.first_ts = float(ts[0])
+        self.last_ts = float(ts[-1])
+        has_latency = ~np.isnan(latency)
+        if weight is None:
+            total = n
+            self.up += int(np.count_nonzero(up))
+            self.latency_sum += float(latency[has_latency].sum())
+            position = None # 每行的检查序号就是行号
+        else:
+            # 汇总记录代表多次检查：按权重累计，检查序号为权重的前缀和
+            total = int(weight.sum())
+            self.up += int(weight[up].sum())
+            self.latency_sum += float((latency[has_latency] * weight[has_latency]).sum())
+            position = np.cumsum(weight) - weight
+        self.checks += total
+        self.sketch += weighted_bincount(bins, None if weight is None else weight[has_latency], SKETCH_BINS)
+
+        # 故障 = 连续的非 UP 检查：开始于 UP -> 非UP，结束于 非UP -> UP (以恢复后的第一次 UP 为结束时间)
+        down = ~up
+        previous = np.empty(n, dtype=bool)
+        previous[0] = self.last_down
+        previous[1:] = down[:-1]
+        starts = np.flatnonzero(down & ~previous)
+        ends = np.flatnonzero(up & previous)
+        start_ts = ts[starts]
+        start_pos = starts if position is None else position[starts]
+        end_pos = ends if position is None else position[ends]
+        if self.open_since is not None: # 上一块结束时仍在故障中，它的开始位置相对本块为负数
+            start_ts = np.concatenate(([self.open_since], start_ts))
+            start_pos = np.concatenate(([-self.open_checks], start_pos))
+        closed = len(ends)
+        if closed:
+            durations = ts[ends] - start_ts[:closed]
+            failed = end_pos - start_pos[:closed]
+            keep = failed >= min_failures
+            self._record_resolved(start_ts[:closed][keep], ts[ends][keep], durations[keep], failed[keep])
+        if len(start_ts) > closed:
+            self.open_since = float(start_ts[closed])
+            self.open_checks = int(total - start_pos[closed])
+        else:
+            self.open_since = None
+            self.open_checks = 0
+        self.last_down = bool(down[-1])
+
+    def _record_resolved(self, start_ts, end_ts, durations, failed):
+        if not len(durations):
+            return
+        self.resolved += len(durations)
+        self.resolved_seconds += float(durations.sum())
+        self.longest_seconds = max(self.longest_seconds, float(durations.max()))
+        self.max_failed_checks = max(self.max_failed_checks, int(failed.max()))
+        recent = zip(start_ts[-MAX_RECENT_INCIDENTS:].tolist(), end_ts[-MAX_RECENT_INCIDENTS:].tolist(),
+                     failed[-MAX_RECENT_INCIDENTS:].tolist())
+        self.recent = (self.recent + list(recent))[-MAX_RECENT_INCIDENTS:]
+
+    def finish(self, period_end, min_failures, name=None):
+        """
+        结束该目标的统计并返回报表行。尚未恢复的故障计算到 period_end 为止，不计入 MTTR。
+        """
+        open_seconds = 0.0
+        ongoing = self.open_since is not None and self.open_checks >= min_failures
+        if ongoing:
+            open_seconds = max(0.0, period_end - self.open_since)
+            self.longest_seconds = max(self.longest_seconds, open_seconds)
+            self.max_failed_checks = max(self.max_failed_checks, self.open_checks)
+        incidents = self.resolved + (1 if ongoing else 0)
+        downtime = self.resolved_seconds + open_seconds
+        observed = max(0.0, period_end - self.first_ts)
+        latency_count = int(self.sketch.sum())
+        p50, p95, p99 = sketch_quantiles(self.sketch).tolist()
+        return {
+            'target_id': self.target_id,
+            'name': name,
+            'checks': self.checks,
+            'up': self.up,
+            'uptime_pct': round(self.up / self.checks * 100, 3),
+            'availability_pct': round((1 - downtime / observed) * 100, 3) if observed else None,
+            'first_check': _from_epoch(self.first_ts),
+            'last_check': _from_epoch(self.last_ts),
+            'incidents': incidents,
+            'ongoing_since': _from_epoch(self.open_since) if ongoing else None,
+            'downtime_seconds': round(downtime, 1),
+            'longest_incident_seconds': round(self.longest_seconds, 1),
+            'max_failed_checks': self.max_failed_checks,
+            'mttr_seconds': round(self.resolved_seconds / self.resolved, 1) if self.resolved else None,
+            'mtbf_seconds': round((observed - downtime) / incidents, 1) if incidents else None,
+            'avg_ms': round(self.latency_sum / latency_count, 2) if latency_count else None,
+            'p50_ms': _optional(p50),
+            'p95_ms': _optional(p95),
+            'p99_ms': _optional(p99),
+            'recent_incidents': [{'start': _from_epoch(start), 'end': _from_epoch(end), 'failed_checks': failed,
+                                  'duration_seconds': round(end - start, 1)}
+                                 for start, end, failed in reversed(self.recent)],
+        }
+
+
+class ReportBuilder:
+    """
+    逐块累计 SLA 报表。add 接收按 (目标, 时间) 顺序到达的 CheckChunk，同一目标可以跨越多块。
+    """
+
+    def __init__(self, start, end, bucket_seconds=3600, min_failures=1, names=None):
+        """
+        :param start: 报表起始时间 (UTC)。
+        :param end: 报表结束时间 (UTC，不含)。
+        :param bucket_seconds: 时间桶长度 (秒)。
+        :param min_failures: 至少连续失败多少次检查才算一次故障。
+        :param names: 目标ID -> 名称，用于报表显示。
+        :raises ValueError: 时间范围或时间桶参数无效。
+        """
+        self.start = to_utc_naive(start)
+        self.end = to_utc_naive(end)
+        self.start_ts = _to_epoch(self.start)
+        self.end_ts = _to_epoch(self.end)
+        if self.end_ts <= self.start_ts:
+            raise ValueError("结束时间必须晚于起始时间。")
+        if bucket_seconds <= 0:
+            raise ValueError("时间桶长度必须大于0。")
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = math.ceil((self.end_ts - self.start_ts) / bucket_seconds)
+        if self.bucket_count > MAX_BUCKETS:
+            raise ValueError(f"时间桶数量 ({self.bucket_count}) 超过上限 {MAX_BUCKETS}，请增大时间桶或缩小时间范围。")
+        self.min_failures = max(1, min_failures)
+        self.names = names or {}
+        self.rows = 0
+        self.targets = []
+        self._state = None
+        self._bucket_checks = np.zeros(self.bucket_count, dtype=np.int64)
+        self._bucket_up = np.zeros(self.bucket_count, dtype=np.int64)
+        self._bucket_sketch = np.zeros(self.bucket_count * SKETCH_BINS, dtype=np.int64)
+        # 尚未恢复的故障最多计算到当前时间
+        self._period_end = min(self.end_ts, time.time())
+
+    def add(self, chunk):
+        if not len(chunk.ts):
+            return
+        if self._state is None or self._state.target_id != chunk.target_id:
+            self._finish_target()
+            self._state = _TargetState(chunk.target_id)
+        has_latency = ~np.isnan(chunk.latency)
+        bins = latency_bins(chunk.latency)
+        weight = chunk.weight
+        self._state.add(chunk.ts, chunk.up, chunk.latency, bins, weight, self.min_failures)
+        self.rows += len(chunk.ts)
+
+        # 所有目标合计的时间桶统计：检查次数、UP 次数和 (时间桶, 延迟分桶) 二维计数
+        bucket = np.clip(((chunk.ts - self.start_ts) // self.bucket_seconds).astype(np.intp), 0, self.bucket_count - 1)
+        self._bucket_checks += weighted_bincount(bucket, weight, self.bucket_count)
+        self._bucket_up += weighted_bincount(bucket[chunk.up], None if weight is None else weight[chunk.up],
+                                             self.bucket_count)
+        # 块通常只覆盖少数几个时间桶，只对覆盖到的范围计数，避免每块都分配整个二维数组
+        first, last = int(bucket.min()), int(bucket.max()) # 不假设块内的时间戳有序
+        self._bucket_sketch[first * SKETCH_BINS:(last + 1) * SKETCH_BINS] += weighted_bincount(
+            (bucket[has_latency] - first) * SKETCH_BINS + bins, None if weight is None else weight[has_latency],
+            (last - first + 1) * SKETCH_BINS)
+
+    def _finish_target(self):
+        if self._state is not None:
+            self.targets.append(self._state.finish(self._period_end, self.min_failures,
+                                                   self.names.get(self._state.target_id)))
+            self._state = None
+
+    def result(self):
+        """
+        返回报表字典：整体统计、每个目标一行 (targets) 和每个时间桶一行 (buckets)。
+        """
+        self._finish_target()
+        sketch = self._bucket_sketch.reshape(self.bucket_count, SKETCH_BINS)
+        quantiles = sketch_quantiles(sketch)
+        buckets = []
+        for index in np.flatnonzero(self._bucket_checks).tolist():
+            checks = int(self._bucket_checks[index])
+            p50, p95, p99 = quantiles[index].tolist()
+            buckets.append({
+                'start': _from_epoch(self.start_ts + index * self.bucket_seconds),
+                'checks': checks,
+                'uptime_pct': round(int(self._bucket_up[index]) / checks * 100, 3),
+                'p50_ms': _optional(p50),
+                'p95_ms': _optional(p95),
+                'p99_ms': _optional(p99),
+            })
+        checks = sum(row['checks'] for row in self.targets)
+        up = sum(row['up'] for row in self.targets)
+        p50, p95, p99 = sketch_quantiles(sketch.sum(axis=0)).tolist()
+        return {
+            'start': self.start,
+            'end': self.end,
+            'bucket_seconds': self.bucket_seconds,
+            'min_failures': self.min_failures,
+            'rows': self.rows,
+            'overall': {
+                'targets': len(self.targets),
+                'checks': checks,
+                'uptime_pct': round(up / checks * 100, 3) if checks else None,
+                'incidents': sum(row['incidents'] for row in self.targets),
+                'downtime_seconds': round(sum(row['downtime_seconds'] for row in self.targets), 1),
+                'p50_ms': _optional(p50),
+                'p95_ms': _optional(p95),
+                'p99_ms': _optional(p99),
+            },
+            'targets': self.targets,
+            'buckets': buckets,
+        }
+
+
+def _epoch_column(dialect_name):
+    # 在数据库中把时间戳转换为 epoch 秒，避免为每行构造 datetime 对象
+    if dialect_name == 'sqlite':
+        return (func.julianday(CheckLog.timestamp) - 2440587.5) * 86400.0
+    if dialect_name == 'postgresql':
+        return func.extract('epoch', CheckLog.timestamp)
+    if dialect_name in ('mysql', 'mariadb'):
+        return func.unix_timestamp(CheckLog.timestamp)
+    return None
+
+
+def iter_check_log_chunks(target_ids, start, end, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    按目标逐个读取 [start, end) 范围内的 check_log 记录，每次返回最多 chunk_size 条组成的 CheckChunk。
+    每个目标一条查询 (走 (target_id, timestamp) 复合索引)，结果以 yield_per 流式读取。
+    """
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    epoch = _epoch_column(db.engine.dialect.name)
+    columns = [
+        epoch if epoch is not None else CheckLog.timestamp,
+        case((CheckLog.status_text == 'UP', 1), else_=0),
+        func.coalesce(CheckLog.response_time_ms, -1.0), # 没有响应时间的记录用 -1 表示，转换为数组后再替换为 NaN
+        func.coalesce(CheckLog.sample_count, 1), # 汇总记录代表的检查次数 (见 app.change_log)
+    ]
+    for target_id in target_ids:
+        query = (select(*columns)
+                 .where(CheckLog.target_id == target_id, CheckLog.timestamp >= start, CheckLog.timestamp < end)
+                 .order_by(CheckLog.timestamp)
+                 .execution_options(yield_per=chunk_size))
+        for rows in db.session.execute(query).partitions():
+            if epoch is None: # 其他数据库：在 Python 中转换时间戳
+                rows = [(_to_epoch(ts), up, latency, weight) for ts, up, latency, weight in rows]
+            # 逐个值展开后由 np.fromiter 直接填充数组，比 np.array(rows) 逐行探测 Row 对象快得多
+            data = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * 4).reshape(-1, 4)
+            latency = data[:, 2]
+            latency[latency < 0] = np.nan
+            weight = data[:, 3].astype(np.int64)
+            # julianday 换算有微秒级误差，时间戳统一保留到毫秒
+            yield CheckChunk(target_id, np.round(data[:, 0], 3), data[:, 1] > 0, latency,
+                             weight if (weight != 1).any() else None)
+
+
+def iter_segment_chunks(store, target_ids, start, end, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    按目标逐个读取段存储中 [start, end) 范围内的记录，合并为最多约 chunk_size 条的 CheckChunk。
+    映射切片通过 np.frombuffer 按列读取，取出所需的列 (复制) 后即释放，不持有映射区的引用。
+    """
+    for target_id in target_ids:
+        pending, size = [], 0
+        for view in store.scan(target_id, start, end):
+            records = np.frombuffer(view, dtype=SEGMENT_DTYPE)
+            pending.append((records['ts'].copy(), records['status'] == 0, records['latency'].astype(np.float64)))
+            size += len(records)
+            del records
+            if size >= chunk_size: # 每天一个段文件，单个切片往往很小，攒够一块再交给 ReportBuilder
+                yield _merge_chunk(target_id, pending)
+                pending, size = [], 0
+        if pending:
+            yield _merge_chunk(target_id, pending)
+
+
+def _merge_chunk(target_id, parts):
+    if len(parts) == 1:
+        return CheckChunk(target_id, *parts[0])
+    return CheckChunk(target_id, *(np.concatenate(column) for column in zip(*parts)))
+
+
+def build_report(start, end, target_ids=None, bucket_seconds=3600, min_failures=1,
+                 chunk_size=DEFAULT_CHUNK_SIZE, store=None):
+    """
+    生成 [start, end) 时间范围内的 SLA 报表。
+    :param target_ids: 只统计这些目标，None 表示全部目标。
+    :param store: 启用的段存储 (SegmentStore)；为 None 时从 check_log 表读取。
+    :return: ReportBuilder.result() 返回的字典，另含耗时 elapsed_ms；时间范围内没有检查记录的目标不出现在报表中。
+    :raises ValueError: 时间范围或时间桶参数无效。
+    """
+    started = time.perf_counter()
+    query = select(MonitoredTarget.id, MonitoredTarget.name, MonitoredTarget.agent_id).order_by(MonitoredTarget.id)
+    if target_ids is not None:
+        query = query.where(MonitoredTarget.id.in_(target_ids))
+    rows = db.session.execute(query).all()
+    names = {row.id: row.name for row in rows}
+    builder = ReportBuilder(start, end, bucket_seconds, min_failures, names)
+    if store is not None:
+        # 远程代理上传的结果始终写入 check_log (见 app.agent_ingest)，这些目标仍从 check_log 表读取
+        local_ids = [row.id for row in rows if not row.agent_id]
+        agent_ids = [row.id for row in rows if row.agent_id]
+        chunks = chain(iter_segment_chunks(store, local_ids, builder.start, builder.end, chunk_size),
+                       iter_check_log_chunks(agent_ids, builder.start, builder.end, chunk_size))
+    else:
+        chunks = iter_check_log_chunks(list(names), builder.start, builder.end, chunk_size)
+    for chunk in chunks:
+        builder.add(chunk)
+    report = builder.result()
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"SLA 报表生成完成: {len(names)} 个目标, {builder.rows} 条检查记录, "
+                f"耗时 {report['elapsed_ms']}ms。")
+    return report
+
+
+# 导出为 CSV 时每个目标一行包含的列
+TARGET_COLUMNS = ('target_id', 'name', 'checks', 'uptime_pct', 'availability_pct', 'incidents', 'downtime_seconds',
+                  'longest_incident_seconds', 'max_failed_checks', 'mttr_seconds', 'mtbf_seconds',
+                  'avg_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'ongoing_since')
+
+
+def report_to_json(value):
+    """
+    把报表中的时间转换为 ISO 8601 字符串 (UTC)，返回可直接序列化为 JSON 的副本。
+    """
+    if isinstance(value, dict):
+        return {key: report_to_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [report_to_json(item) for item in value]
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    return value
+
+
+def _to_epoch(ts):
+    if ts.tzinfo is None: # 数据库中的时间为不带时区的 UTC
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def _from_epoch(value):
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+
+def _optional(value):
+    return None if math.isnan(value) else value
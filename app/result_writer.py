@@ -0,0 +1,431 @@
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import bindparam, func, select
+
+from app import db, logger # 从 app/__init__.py 中导入 db 实例和预配置的 logger
+from app.metrics import Histogram, FLUSH_BUCKETS, BATCH_BUCKETS, counter, gauge
+from app.models import MonitoredTarget, CheckLog, TargetStatus
+from app.change_log import ChangeLogState, DEFAULT_HEARTBEAT_SECONDS
+from app.pipeline_state import bump_version
+from app.rollups import update_rollups
+from app.status_stream import StatusChange
+
+_STOP = object() # 通知写入线程排空队列后退出的哨兵
+
+
+class ResultWriter:
+    """
+    检查结果的异步批量写入器 (write-behind)。
+
+    探测引擎把 ProbeResult 放入有界的内存队列，由唯一的写入线程按批次写库：
+    一条多行 executemany 的 INSERT 写入 CheckLog，再用 executemany 的 UPDATE
+    批量更新 last_checked_on 和 TargetStatus，整批只提交一次事务。
+    当批次达到 batch_size 或距离批次中第一条结果超过 flush_interval 秒时触发写入。
+    队列满时 submit 会阻塞 (向探测引擎施加背压)，超过 put_timeout 秒仍无法放入才丢弃该结果。
+    每条结果的日志按 check_log_mode 输出 (见 make_result_logger)。
+    配置了 raw_store (段存储) 时原始结果不再写入 CheckLog，而是在事务提交后追加到段文件，
+    聚合表、当前状态等仍在同一事务中写入数据库。
+    只记录状态变化的目标 (log_mode='changes') 每 change_log_heartbeat 秒最多写一行汇总记录 (见 app.change_log)。
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_queue=10000, put_timeout=30, change_handler=None,
+                 check_log_mode='all', check_log_sample_rate=100, raw_store=None,
+                 change_log_heartbeat=DEFAULT_HEARTBEAT_SECONDS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.change_handler = change_handler # 每批提交成功后以 StatusChange 列表调用，用于推送状态变化
+        self.check_log_mode = check_log_mode # 逐条检查结果的日志方式: all / sampled / debug
+        self.check_log_sample_rate = check_log_sample_rate # sampled 模式下每多少条正常结果输出一条
+        self._log_result = make_result_logger(check_log_mode, check_log_sample_rate)
+        self.raw_store = raw_store # 保存原始检查结果的 SegmentStore，None 表示写入 CheckLog 表
+        self.change_log_heartbeat = change_log_heartbeat # 只记录状态变化的目标写汇总记录的间隔 (秒)
+
+        self.app = None
+        self._queue = None
+        self._thread = None
+
+        self.rows_written = 0 # 已落库的检查结果数
+        self.log_rows_written = 0 # 实际插入 CheckLog 的行数 (只记录状态变化的目标少于检查结果数)
+        self._hour_started = time.monotonic() # 每小时在日志中报告一次写入的行数
+        self._hour_results = 0
+        self._hour_log_rows = 0
+        self.batches_written = 0 # 已提交的批次数
+        self.dropped = 0 # 因队列持续满载或写库失败而丢弃的结果数
+        self.flush_seconds = 0.0 # 累计写库耗时
+        # 只由写入线程更新的指标
+        self.flush_time = Histogram(FLUSH_BUCKETS) # 每批写库耗时(秒)
+        self.batch_sizes = Histogram(BATCH_BUCKETS) # 每批的结果条数
+
+    def init_app(self, app, change_handler=None, raw_store=None):
+        """
+        绑定Flask应用并从配置中读取批量写入参数。
+        :param change_handler: 每批提交成功后接收 StatusChange 列表的回调函数。
+        :param raw_store: 代替 CheckLog 表保存原始检查结果的 SegmentStore。
+        """
+        self.app = app
+        if change_handler is not None:
+            self.change_handler = change_handler
+        if raw_store is not None:
+            self.raw_store = raw_store
+        self.batch_size = app.config.get('RESULT_WRITER_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('RESULT_WRITER_FLUSH_INTERVAL', self.flush_interval)
+        self.max_queue = app.config.get('RESULT_WRITER_QUEUE_SIZE', self.max_queue)
+        self.put_timeout = app.config.get('RESULT_WRITER_PUT_TIMEOUT', self.put_timeout)
+        self.check_log_mode = app.config.get('CHECK_LOG_MODE', self.check_log_mode)
+        self.check_log_sample_rate = app.config.get('CHECK_LOG_SAMPLE_RATE', self.check_log_sample_rate)
+        self._log_result = make_result_logger(self.check_log_mode, self.check_log_sample_rate)
+        self.change_log_heartbeat = app.config.get('CHANGE_LOG_HEARTBEAT_SECONDS', self.change_log_heartbeat)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+        self._thread.start()
+        logger.info(f"检查结果写入器已启动: 批大小 {self.batch_size}, 刷新间隔 {self.flush_interval} 秒, 队列上限 {self.max_queue}。")
+
+    def stop(self, timeout=30):
+        """
+        排空队列中剩余的结果并停止写入线程。
+        """
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        logger.info(f"检查结果写入器已停止，累计写入 {self.rows_written} 条日志，丢弃 {self.dropped} 条。")
+
+    def submit(self, result):
+        """
+        提交一条检查结果。队列满时阻塞等待，形成背压。
+        :param result: ProbeResult 实例。
+        :return: 成功放入队列返回 True，超时被丢弃返回 False。
+        """
+        try:
+            self._queue.put(result, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.error(f"检查结果队列持续满载超过 {self.put_timeout} 秒，丢弃目标 (ID: {result.target_id}) 的检查结果。")
+            return False
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                if batch:
+                    self.flush(batch)
+                return
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self.flush(batch)
+                batch = []
+
+    def flush(self, batch):
+        """
+        将一批检查结果写入数据库 (单个事务)。
+        :param batch: ProbeResult 列表。
+        """
+        started = time.perf_counter()
+        raw = [] if self.raw_store is not None else None
+        with self.app.app_context():
+            try:
+                written, log_rows, changes = write_results(batch, self._log_result,
+                                                           raw_sink=raw.append if raw is not None else None,
+                                                           heartbeat_seconds=self.change_log_heartbeat)
+                db.session.commit()
+                self.rows_written += written
+                self.log_rows_written += log_rows
+                self._hour_results += written
+                self._hour_log_rows += log_rows
+                self.batches_written += 1
+                self.dropped += len(batch) - written
+                elapsed = time.perf_counter() - started
+                self.flush_seconds += elapsed
+                self.flush_time.observe(elapsed)
+                self.batch_sizes.observe(len(batch))
+                logger.debug(f"批量写入 {written} 条检查结果 ({log_rows} 行日志)，涉及 {len(changes)} 个目标，耗时 {elapsed * 1000:.1f}ms。")
+            except Exception as e:
+                db.session.rollback() # 如果提交失败，回滚事务
+                self.dropped += len(batch)
+                logger.error(f"批量写入 {len(batch)} 条检查日志时数据库提交失败: {e}", exc_info=True)
+                return
+        if time.monotonic() - self._hour_started >= 3600:
+            self._report_hourly()
+        if raw:
+            try:
+                self.raw_store.append(raw)
+            except OSError as e:
+                self.dropped += len(raw)
+                logger.error(f"追加 {len(raw)} 条原始检查记录到段文件时失败: {e}", exc_info=True)
+        if changes and self.change_handler is not None:
+            try:
+                self.change_handler(changes)
+            except Exception as e:
+                logger.error(f"推送 {len(changes)} 个目标的状态变化时发生错误: {e}", exc_info=True)
+
+    def _report_hourly(self):
+        # 对比实际写入 check_log 的行数与每次检查都记录时需要写入的行数
+        hours = (time.monotonic() - self._hour_started) / 3600
+        if self.raw_store is None and self._hour_results:
+            logger.info(f"过去 {hours:.1f} 小时写入 {self._hour_results} 条检查结果，check_log 新增 {self._hour_log_rows} 行 "
+                        f"(每小时 {self._hour_log_rows / hours:.0f} 行，每次检查都记录时为 {self._hour_results / hours:.0f} 行，"
+                        f"节省 {1 - self._hour_log_rows / self._hour_results:.1%})。")
+        self._hour_started = time.monotonic()
+        self._hour_results = 0
+        self._hour_log_rows = 0
+
+    def collect_metrics(self):
+        """
+        返回写入队列和批量写库的 Prometheus 指标文本行。
+        """
+        lines = []
+        lines += gauge('webpulse_result_queue_depth', '等待写入数据库的检查结果数', self.queue_depth)
+        lines += self.flush_time.expose('webpulse_db_flush_seconds', '每批检查结果写库 (含提交) 的耗时')
+        lines += self.batch_sizes.expose('webpulse_db_flush_batch_size', '每批写库的检查结果条数')
+        lines += counter('webpulse_check_logs_written_total', '已落库的检查结果数 (包括被汇总的检查)', self.rows_written)
+        lines += counter('webpulse_check_log_rows_total', '实际插入 check_log 表的行数', self.log_rows_written)
+        lines += counter('webpulse_results_dropped_total', '因队列满载或写库失败而丢弃的检查结果数', self.dropped)
+        return lines
+
+
+def write_results(batch, log_result=None, raw_sink=None, heartbeat_seconds=DEFAULT_HEARTBEAT_SECONDS, agent_id=None):
+    """
+    在当前会话中写入一批检查结果 (不提交事务)：
+    插入 CheckLog 并增量更新聚合表，批量更新 last_checked_on，并更新或创建每个目标的 TargetStatus。
+    在检查期间已被删除的目标的结果会被丢弃，避免外键冲突导致整批失败。
+    只记录状态变化的目标按 app.change_log.ChangeLogState 的规则决定写入哪些行，其日志状态随 TargetStatus 一起更新。
+
+    :param batch: ProbeResult 列表，按检查完成的先后顺序排列。
+    :param log_result: 为每条写入的结果输出日志的函数，默认每条都输出 (见 make_result_logger)。
+    :param raw_sink: 可选的回调，提供时不插入 CheckLog，而是把每条有效的 ProbeResult 交给它 (例如收集后写入段存储)。
+    :param heartbeat_seconds: 只记录状态变化的目标在状态不变时写一行汇总记录的间隔 (秒)。
+    :param agent_id: 结果来自远程探测代理时为代理ID，记在插入的每一行 CheckLog 上。
+    :return: (写入的检查结果数, 插入的 CheckLog 行数, StatusChange 列表 (每个涉及的目标一条))
+    """
+    log_result = log_result or _log_result
+    # 一次查询同时确认目标仍然存在，并取得其当前的连续失败次数和日志状态
+    target_ids = {result.target_id for result in batch}
+    known = {
+        row.id: row for row in db.session.execute(
+            select(MonitoredTarget.id, MonitoredTarget.log_mode, TargetStatus.target_id.label('status_target_id'),
+                   TargetStatus.consecutive_failures, TargetStatus.status_text, TargetStatus.status_code,
+                   TargetStatus.checked_at, TargetStatus.log_written_at, TargetStatus.log_pending_checks,
+                   TargetStatus.log_pending_latency_sum, TargetStatus.log_pending_latency_count)
+            .outerjoin(TargetStatus, TargetStatus.target_id == MonitoredTarget.id)
+            .where(MonitoredTarget.id.in_(target_ids)))
+    }
+
+    rows = []
+    entries = [] # 聚合表的输入 (target_id, timestamp, status_text, response_time_ms)
+    latest = {} # target_id -> (最新的 ProbeResult, 连续失败次数)
+    log_states = {} # target_id -> ChangeLogState
+    for result in batch:
+        current = known.get(result.target_id)
+        if current is None:
+            continue
+        log_result(result)
+        entries.append((result.target_id, result.timestamp, result.status_text, result.response_time_ms))
+        state = log_states.get(result.target_id)
+        if state is None:
+            state = log_states[result.target_id] = ChangeLogState(
+                current.log_mode, current.status_text, current.status_code, current.checked_at,
+                current.log_written_at, current.log_pending_checks, current.log_pending_latency_sum,
+                current.log_pending_latency_count)
+        if raw_sink is not None:
+            raw_sink(result) # 段存储每条检查只占 24 字节，不区分日志记录方式
+        else:
+            rows.extend(state.observe(result, heartbeat_seconds))
+        previous = latest.get(result.target_id)
+        failures = previous[1] if previous else (current.consecutive_failures or 0)
+        failures = 0 if result.status_text == 'UP' else failures + 1
+        latest[result.target_id] = (result, failures)
+
+    if not entries:
+        return 0, 0, []
+
+    if rows:
+        if agent_id is not None:
+            for row in rows:
+                row['agent_id'] = agent_id
+        db.session.execute(CheckLog.__table__.insert(), rows)
+
+    target_table = MonitoredTarget.__table__
+    db.session.execute(
+        target_table.update()
+        .where(target_table.c.id == bindparam('b_id'))
+        .values(last_checked_on=bindparam('b_checked_on')),
+        [{'b_id': target_id, 'b_checked_on': result.timestamp} for target_id, (result, _) in latest.items()]
+    )
+    # 在同一事务中增量更新分钟/小时/天三种粒度的聚合数据 (放在上面的写操作之后：SQLite 此时已持有写锁)
+    update_rollups(entries)
+
+    # 通知 Web 进程仪表盘数据已变化；新版本号同时记在本批更新的 TargetStatus 上，供状态推送增量读取
+    version = bump_version()
+    status_updates = []
+    status_inserts = []
+    changes = []
+    for target_id, (result, failures) in latest.items():
+        values = {
+            'b_target_id': target_id,
+            'b_status_text': result.status_text,
+            'b_status_code': result.status_code,
+            'b_response_time_ms': result.response_time_ms,
+            'b_checked_at': result.timestamp,
+            'b_failures': failures,
+            'b_version': version,
+            'b_cert_expires_at': result.cert_expires_at,
+            'b_log_written_at': log_states[target_id].logged_at,
+            'b_log_pending_checks': log_states[target_id].pending_checks,
+            'b_log_pending_latency_sum': log_states[target_id].pending_latency_sum,
+            'b_log_pending_latency_count': log_states[target_id].pending_latency_count,
+        }
+        changes.append(StatusChange(target_id, result.status_text, result.status_code, result.response_time_ms,
+                                    result.timestamp, failures, version))
+        if known[target_id].status_target_id is None:
+            status_inserts.append(values)
+        else:
+            status_updates.append(values)
+
+    status_table = TargetStatus.__table__
+    status_values = {
+        'status_text': bindparam('b_status_text'),
+        'status_code': bindparam('b_status_code'),
+        'response_time_ms': bindparam('b_response_time_ms'),
+        'checked_at': bindparam('b_checked_at'),
+        'consecutive_failures': bindparam('b_failures'),
+        'version': bindparam('b_version'),
+        'log_written_at': bindparam('b_log_written_at'),
+        'log_pending_checks': bindparam('b_log_pending_checks'),
+        'log_pending_latency_sum': bindparam('b_log_pending_latency_sum'),
+        'log_pending_latency_count': bindparam('b_log_pending_latency_count'),
+    }
+    if status_updates:
+        # 只有 HTTPS/TLS 检查成功握手时才带有证书到期时间，其他结果 (例如连接失败) 保留上次读取到的值
+        db.session.execute(
+            status_table.update().where(status_table.c.target_id == bindparam('b_target_id')).values(
+                cert_expires_at=func.coalesce(bindparam('b_cert_expires_at'), status_table.c.cert_expires_at),
+                **status_values),
+            status_updates)
+    if status_inserts:
+        db.session.execute(
+            status_table.insert().values(target_id=bindparam('b_target_id'),
+                                         cert_expires_at=bindparam('b_cert_expires_at'), **status_values),
+            status_inserts)
+    return len(entries), len(rows), changes
+
+
+def _log_result(result):
+    if result.status_text == 'UP':
+        logger.info(f"目标 '{result.target_name}' 状态: UP, 状态码: {result.status_code}, 响应时间: {result.response_time_ms}ms")
+    elif result.status_code is not None:
+        logger.warning(f"目标 '{result.target_name}' 状态: DOWN, 状态码: {result.status_code}, 响应时间: {result.response_time_ms}ms. 详情: {result.details}")
+    else:
+        logger.warning(f"目标 '{result.target_name}' (ID: {result.target_id}) 检查失败 ({result.status_text}): {result.details}")
+
+
+def _log_result_debug(result):
+    if result.status_text == 'UP':
+        logger.debug(f"目标 '{result.target_name}' 状态: UP, 状态码: {result.status_code}, 响应时间: {result.response_time_ms}ms")
+    else:
+        logger.debug(f"目标 '{result.target_name}' (ID: {result.target_id}) 检查失败 ({result.status_text}, "
+                     f"状态码: {result.status_code}): {result.details}")
+
+
+def make_result_logger(mode='all', sample_rate=100):
+    """
+    按 CHECK_LOG_MODE 构造逐条检查结果的日志函数。检查量大时逐条格式化和写出日志本身会占用可观的 CPU 和磁盘I/O，
+    此时可以改用 /metrics 指标观察整体情况。
+    :param mode: 'all' 每条结果输出一行 (默认)；'sampled' 失败结果照常输出，正常结果每 sample_rate 条只输出一条；
+                 'debug' 全部降为 DEBUG 级别，未开启 DEBUG 日志时不构造日志字符串。
+    :return: 接收 ProbeResult 的函数。
+    """
+    if mode == 'debug':
+        def log_debug(result):
+            if logger.isEnabledFor(logging.DEBUG):
+                _log_result_debug(result)
+        return log_debug
+    if mode == 'sampled':
+        sample_rate = max(int(sample_rate), 1)
+        seen = [0] # 只在写入线程中调用，不需要加锁
+
+        def log_sampled(result):
+            if result.status_text != 'UP':
+                _log_result(result)
+                return
+            seen[0] += 1
+            if seen[0] >= sample_rate:
+                seen[0] = 0
+                _log_result(result)
+        return log_sampled
+    if mode != 'all':
+        logger.warning(f"未知的 CHECK_LOG_MODE: {mode}，按 all 输出每条检查结果。")
+    return _log_result
+
+
+def rebuild_target_status():
+    """
+    根据 check_log 中已有的历史记录，为尚无 TargetStatus 的目标补建当前状态。
+    用于升级到物化状态表之后的一次性回填，每个目标只走 (target_id, timestamp) 索引查询。
+
+    :return: 补建的 TargetStatus 行数。
+    """
+    missing_ids = db.session.scalars(
+        select(MonitoredTarget.id)
+        .outerjoin(TargetStatus, TargetStatus.target_id == MonitoredTarget.id)
+        .where(TargetStatus.target_id.is_(None))
+    ).all()
+
+    created = 0
+    for target_id in missing_ids:
+        latest = db.session.scalars(
+            select(CheckLog).where(CheckLog.target_id == target_id)
+            .order_by(CheckLog.timestamp.desc()).limit(1)
+        ).first()
+        if latest is None:
+            continue
+        # 连续失败次数 = 最近一次 UP 之后的检查次数 (汇总记录按 sample_count 计)
+        last_up = db.session.scalar(
+            select(db.func.max(CheckLog.timestamp))
+            .where(CheckLog.target_id == target_id, CheckLog.status_text == 'UP'))
+        failures_query = select(db.func.coalesce(db.func.sum(db.func.coalesce(CheckLog.sample_count, 1)), 0)) \
+            .where(CheckLog.target_id == target_id)
+        if last_up is not None:
+            failures_query = failures_query.where(CheckLog.timestamp > last_up)
+        db.session.add(TargetStatus(
+            target_id=target_id,
+            status_text=latest.status_text,
+            status_code=latest.status_code,
+            response_time_ms=latest.response_time_ms,
+            checked_at=latest.timestamp,
+            consecutive_failures=db.session.scalar(failures_query),
+        ))
+        created += 1
+    if created:
+        bump_version()
+    db.session.commit()
+    return created
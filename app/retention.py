@@ -0,0 +1,123 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+from app import db, logger, segment_store # 从 app/__init__.py 中导入 db 实例、预配置的 logger 和段存储
+from app.models import MonitoredTarget, CheckLog, CheckRollup, TargetStatus
+from app.agent_ingest import purge_agent_batches
+from app.pipeline_state import bump_version, RESULTS_VERSION, TARGETS_VERSION
+from app.rollups import RESOLUTION_MINUTE, RESOLUTION_HOUR, RESOLUTION_DAY, to_utc_naive
+
+
+def _purge_in_chunks(model, column, filters, cutoff, chunk_size, deadline, pause):
+    """
+    按块删除 column < cutoff 的过期数据，每块单独提交。
+
+    每一块先沿 column 所在的索引向后数 chunk_size 条，得到本块的上界，
+    再用一条范围 DELETE 删除上界及之前的记录。这样每块只在索引上做一次有限的范围扫描，
+    事务很短，块与块之间还会短暂停顿，让检查结果写入器有机会获得数据库写锁。
+
+    :return: 删除的行数
+    """
+    removed = 0
+    while time.monotonic() < deadline:
+        bound = db.session.scalar(
+            select(column).where(*filters, column < cutoff)
+            .order_by(column).offset(chunk_size - 1).limit(1))
+        if bound is None:
+            # 剩余的过期记录不足一块，直接删完
+            removed += db.session.execute(delete(model).where(*filters, column < cutoff)).rowcount
+            db.session.commit()
+            break
+        removed += db.session.execute(delete(model).where(*filters, column <= bound)).rowcount
+        db.session.commit()
+        time.sleep(pause)
+    return removed
+
+
+def compact(raw_days=0, minute_days=2, hour_days=90, day_days=0, chunk_size=5000, max_seconds=30, pause=0.05, now=None,
+            agent_batch_hours=24):
+    """
+    执行一次保留策略：删除超出保留期的原始检查日志和各粒度聚合数据。
+    原始日志被删除后，其统计信息仍保留在聚合表中 (聚合由写入器实时维护)。
+    保留天数为 0 表示永久保留。单次运行最多耗时约 max_seconds 秒，未删完的部分留给下一次。
+    远程代理批次ID (用于识别重复上传) 保留 agent_batch_hours 小时。
+
+    :return: 报告字典 {表/粒度: 删除行数, ..., 'elapsed_ms': 耗时}
+    """
+    started = time.monotonic()
+    deadline = started + max_seconds
+    now = to_utc_naive(now or datetime.now(timezone.utc))
+    report = {}
+
+    if raw_days:
+        # 沿 timestamp 索引从最旧的记录开始删除
+        report['check_log'] = _purge_in_chunks(
+            CheckLog, CheckLog.timestamp, (), now - timedelta(days=raw_days), chunk_size, deadline, pause)
+        if segment_store.enabled:
+            # 段文件按天切分，整天都已过期的文件直接删除
+            report['segments'] = segment_store.purge(now - timedelta(days=raw_days))
+
+    for label, resolution, days in (('rollup_1m', RESOLUTION_MINUTE, minute_days),
+                                    ('rollup_1h', RESOLUTION_HOUR, hour_days),
+                                    ('rollup_1d', RESOLUTION_DAY, day_days)):
+        if days:
+            # 沿 (resolution, bucket_start) 索引删除过期时间桶
+            report[label] = _purge_in_chunks(
+                CheckRollup, CheckRollup.bucket_start, (CheckRollup.resolution == resolution,),
+                now - timedelta(days=days), chunk_size, deadline, pause)
+
+    if agent_batch_hours:
+        report['agent_batch'] = purge_agent_batches(agent_batch_hours, now)
+        db.session.commit()
+
+    report['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+    return report
+
+
+def run_compaction(app):
+    """
+    由 APScheduler 定期调用的保留策略任务。
+    """
+    with app.app_context():
+        config = app.config
+        try:
+            report = compact(
+                raw_days=config.get('CHECK_LOG_RETENTION_DAYS', 0),
+                minute_days=config.get('ROLLUP_MINUTE_RETENTION_DAYS', 2),
+                hour_days=config.get('ROLLUP_HOUR_RETENTION_DAYS', 90),
+                day_days=config.get('ROLLUP_DAY_RETENTION_DAYS', 0),
+                chunk_size=config.get('COMPACTION_CHUNK_SIZE', 5000),
+                max_seconds=config.get('COMPACTION_MAX_SECONDS', 30),
+                agent_batch_hours=config.get('AGENT_BATCH_RETENTION_HOURS', 24),
+            )
+            logger.info(f"数据保留任务完成: {report}")
+            return report
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"执行数据保留任务时发生错误: {e}", exc_info=True)
+
+
+def delete_target_history(target_id):
+    """
+    删除一个监控目标及其全部历史数据 (在当前会话中执行，不提交事务)。
+    每张表各用一条批量 DELETE，不会把日志逐条加载为ORM对象。
+    段文件不参与数据库事务，这里不删除：调用方应在提交成功后调用 segment_store.delete_target()，
+    避免提交失败回滚后目标还在而它的原始历史已经没了。
+
+    :return: 报告字典 {'check_log': 删除的日志行数, 'check_rollup': 删除的聚合行数, 'elapsed_ms': 耗时}
+             (使用段存储时还包括 'segments': 待删除的段文件记录数)
+    """
+    started = time.monotonic()
+    report = {
+        'check_log': db.session.execute(delete(CheckLog).where(CheckLog.target_id == target_id)).rowcount,
+        'check_rollup': db.session.execute(delete(CheckRollup).where(CheckRollup.target_id == target_id)).rowcount,
+    }
+    if segment_store.enabled:
+        report['segments'] = segment_store.count(target_id)
+    db.session.execute(delete(TargetStatus).where(TargetStatus.target_id == target_id))
+    db.session.execute(delete(MonitoredTarget).where(MonitoredTarget.id == target_id))
+    bump_version(RESULTS_VERSION, TARGETS_VERSION)
+    report['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+    return report
@@ -0,0 +1,338 @@
+import math
+import struct
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db, logger # 从 app/__init__.py 中导入 db 实例和预配置的 logger
+from app.models import CheckLog, CheckRollup
+
+# 三种聚合粒度 (秒)
+RESOLUTION_MINUTE = 60
+RESOLUTION_HOUR = 3600
+RESOLUTION_DAY = 86400
+RESOLUTIONS = (RESOLUTION_MINUTE, RESOLUTION_HOUR, RESOLUTION_DAY)
+
+# 插入聚合行时因并发插入冲突而重新合并的最多次数
+_INSERT_ATTEMPTS = 3
+
+# 查询窗口 -> (窗口长度, 使用的聚合粒度)。每种组合最多读取约 1500 行聚合数据
+WINDOWS = {
+    '24h': (timedelta(hours=24), RESOLUTION_MINUTE),
+    '30d': (timedelta(days=30), RESOLUTION_HOUR),
+    '1y': (timedelta(days=365), RESOLUTION_DAY),
+}
+
+
+class LatencySketch:
+    """
+    可合并的对数分桶直方图 (思路与 DDSketch 相同)。
+
+    每个响应时间落入 ceil(log_gamma(x)) 号桶，分位数估算的相对误差不超过 RELATIVE_ACCURACY。
+    两个直方图相加即可合并，因此分钟级聚合可以无损地合并为小时级、天级聚合。
+    """
+    __slots__ = ('bins', 'count')
+
+    RELATIVE_ACCURACY = 0.01
+    GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    LOG_GAMMA = math.log(GAMMA)
+    MIN_VALUE_MS = 0.01 # 小于该值的响应时间都计入同一个桶
+
+    def __init__(self, bins=None):
+        self.bins = bins or {} # 桶编号 -> 计数
+        self.count = sum(self.bins.values())
+
+    def add(self, value_ms, n=1):
+        index = math.ceil(math.log(max(value_ms, self.MIN_VALUE_MS)) / self.LOG_GAMMA)
+        self.bins[index] = self.bins.get(index, 0) + n
+        self.count += n
+
+    def merge(self, other):
+        for index, n in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + n
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """
+        估算第 q 分位数 (0 <= q <= 1)，直方图为空时返回 None。
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # 返回桶的“中点”，使相对误差在桶的两侧对称
+                return round(2 * self.GAMMA ** index / (self.GAMMA + 1), 2)
+        return None
+
+    def to_bytes(self):
+        # 紧凑编码：桶数 (uint16) + 若干 (int16 桶编号, uint32 计数)
+        items = sorted(self.bins.items())
+        flat = [value for item in items for value in item]
+        return struct.pack(f'<H{"hI" * len(items)}', len(items), *flat)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        (size,) = struct.unpack_from('<H', data)
+        flat = struct.unpack_from(f'<{"hI" * size}', data, 2)
+        return cls(dict(zip(flat[0::2], flat[1::2])))
+
+
+def to_utc_naive(ts):
+    """
+    统一转换为不带时区信息的UTC时间 (数据库中存储的形式)。
+    """
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def bucket_start(ts, resolution):
+    """
+    计算时间戳所在时间桶的起点 (不带时区的UTC时间)。
+    """
+    ts = to_utc_naive(ts)
+    epoch = int((ts - datetime(1970, 1, 1)).total_seconds())
+    return datetime(1970, 1, 1) + timedelta(seconds=epoch - epoch % resolution)
+
+
+class _Aggregate:
+    __slots__ = ('check_count', 'up_count', 'latency_count', 'latency_min_ms', 'latency_max_ms',
+                 'latency_sum_ms', 'sketch')
+
+    def __init__(self):
+        self.check_count = 0
+        self.up_count = 0
+        self.latency_count = 0
+        self.latency_min_ms = None
+        self.latency_max_ms = None
+        self.latency_sum_ms = 0.0
+        self.sketch = LatencySketch()
+
+    def add(self, status_text, response_time_ms, n=1):
+        # n > 1 表示一条汇总记录 (response_time_ms 为 n 次检查的平均值)
+        self.check_count += n
+        if status_text == 'UP':
+            self.up_count += n
+        if response_time_ms is not None:
+            self.latency_count += n
+            self.latency_sum_ms += response_time_ms * n
+            self.latency_min_ms = response_time_ms if self.latency_min_ms is None else min(self.latency_min_ms, response_time_ms)
+            self.latency_max_ms = response_time_ms if self.latency_max_ms is None else max(self.latency_max_ms, response_time_ms)
+            self.sketch.add(response_time_ms, n)
+
+    def merge_row(self, row):
+        # 把数据库中已有的聚合行合并进来
+        self.check_count += row.check_count
+        self.up_count += row.up_count
+        self.latency_count += row.latency_count
+        self.latency_sum_ms += row.latency_sum_ms or 0.0
+        for attr, pick in (('latency_min_ms', min), ('latency_max_ms', max)):
+            ours, theirs = getattr(self, attr), getattr(row, attr)
+            if theirs is not None:
+                setattr(self, attr, theirs if ours is None else pick(ours, theirs))
+        self.sketch.merge(LatencySketch.from_bytes(row.latency_sketch))
+
+    def as_params(self, target_id, resolution, start):
+        return {
+            'b_target_id': target_id,
+            'b_resolution': resolution,
+            'b_bucket_start': start,
+            'b_check_count': self.check_count,
+            'b_up_count': self.up_count,
+            'b_latency_count': self.latency_count,
+            'b_latency_min_ms': self.latency_min_ms,
+            'b_latency_max_ms': self.latency_max_ms,
+            'b_latency_sum_ms': self.latency_sum_ms,
+            'b_latency_sketch': self.sketch.to_bytes(),
+        }
+
+
+def update_rollups(entries):
+    """
+    将一批检查记录增量合并进三种粒度的聚合表 (在当前会话中执行，不提交事务)。
+    每种粒度只需一次查询读取 (并锁定) 已有的聚合行，然后用 executemany 批量更新或插入；
+    插入时与并发的写入者冲突则回滚到保存点，重新读取后合并，不影响同一事务中的其他写入。
+    使用 SQLite 时调用方应先在当前事务中执行过写操作 (见 _merge_existing)。
+
+    :param entries: (target_id, timestamp, status_text, response_time_ms) 元组的可迭代对象；
+                    回填汇总记录时可以附加第五个元素，表示这条记录代表的检查次数。
+    :return: 更新或插入的聚合行数。
+    """
+    partials = {resolution: {} for resolution in RESOLUTIONS}
+    for entry in entries:
+        target_id, ts, status_text, response_time_ms = entry[:4]
+        n = entry[4] if len(entry) > 4 else 1
+        for resolution in RESOLUTIONS:
+            key = (target_id, bucket_start(ts, resolution))
+            aggregate = partials[resolution].get(key)
+            if aggregate is None:
+                aggregate = partials[resolution][key] = _Aggregate()
+            aggregate.add(status_text, response_time_ms, n)
+
+    table = CheckRollup.__table__
+    key_filter = (table.c.target_id == bindparam('b_target_id')) & \
+                 (table.c.resolution == bindparam('b_resolution')) & \
+                 (table.c.bucket_start == bindparam('b_bucket_start'))
+    values = {
+        'check_count': bindparam('b_check_count'),
+        'up_count': bindparam('b_up_count'),
+        'latency_count': bindparam('b_latency_count'),
+        'latency_min_ms': bindparam('b_latency_min_ms'),
+        'latency_max_ms': bindparam('b_latency_max_ms'),
+        'latency_sum_ms': bindparam('b_latency_sum_ms'),
+        'latency_sketch': bindparam('b_latency_sketch'),
+    }
+
+    insert = table.insert().values(target_id=bindparam('b_target_id'), resolution=bindparam('b_resolution'),
+                                   bucket_start=bindparam('b_bucket_start'), **values)
+    touched = 0
+    for resolution, buckets in partials.items():
+        for attempt in range(_INSERT_ATTEMPTS):
+            touched += _merge_existing(table, resolution, buckets, key_filter, values)
+            if not buckets:
+                break
+            inserts = [aggregate.as_params(target_id, resolution, start)
+                       for (target_id, start), aggregate in buckets.items()]
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert, inserts)
+            except IntegrityError:
+                # 并发的写入者 (例如代理上传与探测 worker) 刚插入了同一个时间桶：回滚保存点，重新读取后合并
+                if attempt == _INSERT_ATTEMPTS - 1:
+                    raise
+                logger.info(f"聚合行 (粒度 {resolution} 秒) 已被并发插入，重新合并 {len(inserts)} 个时间桶。")
+                continue
+            touched += len(inserts)
+            break
+    return touched
+
+
+def _merge_existing(table, resolution, buckets, key_filter, values):
+    """
+    读取并锁定 buckets 中已存在的聚合行，与本批的部分聚合合并后写回；合并过的时间桶从 buckets 中移除。
+    按主键顺序加行锁 (SELECT ... FOR UPDATE)，避免并发的读-改-写丢失更新。SQLite 不支持行锁，
+    由调用方保证此前已在当前事务中执行过写操作 (持有数据库写锁，其他写入者此时无法提交)。
+    :return: 更新的聚合行数。
+    """
+    target_ids = {target_id for target_id, _ in buckets}
+    starts = {start for _, start in buckets}
+    existing = db.session.execute(
+        select(table).where(table.c.resolution == resolution,
+                            table.c.target_id.in_(target_ids),
+                            table.c.bucket_start.in_(starts))
+        .order_by(table.c.target_id, table.c.bucket_start)
+        .with_for_update())
+    updates = []
+    for row in existing:
+        aggregate = buckets.pop((row.target_id, row.bucket_start), None)
+        if aggregate is not None:
+            aggregate.merge_row(row)
+            updates.append(aggregate.as_params(row.target_id, resolution, row.bucket_start))
+    if updates:
+        db.session.execute(table.update().where(key_filter).values(**values), updates)
+    return len(updates)
+
+
+def backfill_rollups(start=None, end=None, chunk_size=50000):
+    """
+    根据 check_log 中的原始记录重建 [start, end) 范围内的聚合数据 (按天对齐)。
+    范围内在 check_log 中有原始记录的目标，其原始记录覆盖的那些天已有的聚合行会先被删除，因此重复执行是安全的；
+    其他目标 (例如原始历史保存在段文件中的目标) 的聚合无法从 check_log 重建，保持不变。
+
+    默认 start 为最早一条原始记录之后的第一个整天 (避免用已被部分清理的当天数据覆盖聚合)，
+    默认 end 为今天零点 (今天的数据由写入器实时维护)。
+    汇总记录 (只记录状态变化的目标) 按 sample_count 计入检查次数，但其中的检查都按平均响应时间计入延迟分布，
+    因此回填的分位数不如写入器实时维护的精确。
+
+    :return: (读取的原始记录数, 写入的聚合行数)
+    """
+    if start is None:
+        earliest = db.session.scalar(select(db.func.min(CheckLog.timestamp)))
+        if earliest is None:
+            return 0, 0
+        start = bucket_start(earliest, RESOLUTION_DAY)
+        if start != to_utc_naive(earliest):
+            start += timedelta(days=1)
+    if end is None:
+        end = bucket_start(datetime.now(timezone.utc), RESOLUTION_DAY)
+    start = bucket_start(start, RESOLUTION_DAY)
+    end = bucket_start(end, RESOLUTION_DAY)
+    if start >= end:
+        return 0, 0
+
+    spans = db.session.execute(
+        select(CheckLog.target_id, db.func.min(CheckLog.timestamp), db.func.max(CheckLog.timestamp))
+        .where(CheckLog.timestamp >= start, CheckLog.timestamp < end)
+        .group_by(CheckLog.target_id)
+    ).all()
+    if not spans:
+        return 0, 0
+    table = CheckRollup.__table__
+    db.session.execute(
+        table.delete().where(table.c.target_id == bindparam('b_target'),
+                             table.c.bucket_start >= bindparam('b_start'), table.c.bucket_start < bindparam('b_end')),
+        [{'b_target': target_id, 'b_start': bucket_start(first, RESOLUTION_DAY),
+          'b_end': bucket_start(last, RESOLUTION_DAY) + timedelta(days=1)} for target_id, first, last in spans])
+
+    scanned = 0
+    written = 0
+    last_id = 0
+    while True:
+        # 按主键游标分块读取，每块只取聚合需要的列
+        rows = db.session.execute(
+            select(CheckLog.id, CheckLog.target_id, CheckLog.timestamp, CheckLog.status_text, CheckLog.response_time_ms,
+                   CheckLog.sample_count)
+            .where(CheckLog.id > last_id, CheckLog.timestamp >= start, CheckLog.timestamp < end)
+            .order_by(CheckLog.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        scanned += len(rows)
+        written += update_rollups((row.target_id, row.timestamp, row.status_text, row.response_time_ms,
+                                   row.sample_count or 1) for row in rows)
+        db.session.commit()
+        logger.info(f"聚合回填进度: 已处理 {scanned} 条原始记录。")
+    db.session.commit()
+    return scanned, written
+
+
+def window_summary(target_id, window='24h', now=None):
+    """
+    汇总目标在指定窗口内的可用率和延迟统计。
+    只读取对应粒度的聚合行 (24h -> 分钟, 30d -> 小时, 1y -> 天)，读取行数有上限。
+
+    :param window: '24h', '30d' 或 '1y'。
+    :return: 包含 checks, up, uptime_pct, avg/min/max 以及 p50/p95/p99 (毫秒) 的字典。
+    """
+    span, resolution = WINDOWS[window]
+    now = to_utc_naive(now or datetime.now(timezone.utc))
+    since = bucket_start(now - span, resolution)
+    rows = db.session.execute(
+        select(CheckRollup).where(CheckRollup.target_id == target_id,
+                                  CheckRollup.resolution == resolution,
+                                  CheckRollup.bucket_start >= since)
+    ).scalars()
+    total = _Aggregate()
+    for row in rows:
+        total.merge_row(row)
+    return {
+        'window': window,
+        'checks': total.check_count,
+        'up': total.up_count,
+        'uptime_pct': round(total.up_count * 100.0 / total.check_count, 3) if total.check_count else None,
+        'avg_ms': round(total.latency_sum_ms / total.latency_count, 2) if total.latency_count else None,
+        'min_ms': total.latency_min_ms,
+        'max_ms': total.latency_max_ms,
+        'p50_ms': total.sketch.quantile(0.50),
+        'p95_ms': total.sketch.quantile(0.95),
+        'p99_ms': total.sketch.quantile(0.99),
+    }
+
@@ -1,10 +1,25 @@
-from flask import render_template, redirect, url_for, flash, request, current_app
-from app import db, scheduler, logger # 从 app/__init__.py 导入实例
-from app.models import MonitoredTarget, CheckLog
-from app.forms import AddTargetForm, EditTargetForm # 导入表单类
-from app.scheduler_jobs import perform_check # 导入手动检查函数
+from flask import render_template, redirect, url_for, flash, request, current_app, session, make_response, jsonify, Response, stream_with_context
+from app import db, logger, dashboard_cache, status_hub, metrics, segment_store # 从 app/__init__.py 导入实例
+from app.models import MonitoredTarget, CheckLog, TargetStatus, ProbeWorker, ProbeAgent
+from app.pipeline_state import current_version, mark_targets_changed, TARGETS_VERSION
+from app.forms import AddTargetForm, EditTargetForm, ImportTargetsForm # 导入表单类
+from app.bulk_targets import BulkImportError, detect_format, export_targets, import_targets, iter_records
+from app.pagination import keyset_paginate
+from app.rollups import window_summary, to_utc_naive
+from app.retention import delete_target_history
+from app.reports import build_report, report_to_json
+from app.change_log import LOG_MODE_CHANGES, reconstruct_timeline
+from app.agent_ingest import agent_targets, ingest_batch
+from app.remote_agent import AGENT_ID_HEADER, AGENT_LOCATION_HEADER, AGENT_ID_PATTERN, BATCH_ID_HEADER, BATCH_ID_PATTERN, decode_results
+from app.result_writer import make_result_logger
+from app.status_stream import RESET_EVENT
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
 from flask import Blueprint
-import time # 用于手动触发检查时生成唯一ID
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote
+import hmac
+import re
+import time
 
 # 创建一个蓝本(Blueprint)实例，用于组织一组相关的路由
 # 'main' 是蓝本的名称，__name__ 是蓝本所在的模块或包的名称
@@ -16,35 +31,175 @@ def index():
     """
     主页/仪表盘路由。
     显示所有监控目标及其最新的状态。
+    渲染好的页面按 results_version (检查结果或目标列表每次变化时加一) 缓存，
+    版本未变时不再查询和渲染；浏览器已持有当前版本时直接返回 304。
     """
-    logger.info(f"用户访问了主页 (IP: {request.remote_addr})")
+    logger.debug(f"用户访问了主页 (IP: {request.remote_addr})")
+    started = time.perf_counter()
     try:
-        targets = MonitoredTarget.query.order_by(MonitoredTarget.name.asc()).all()
-        latest_statuses = {}
-        for target in targets:
-            # 为每个目标获取最新的日志条目以显示其当前状态
-            latest_log = target.check_logs.order_by(CheckLog.timestamp.desc()).first()
-            if latest_log:
-                latest_statuses[target.id] = {
-                    "status_text": latest_log.status_text,
-                    "timestamp": latest_log.timestamp.strftime('%Y-%m-%d %H:%M:%S UTC') if latest_log.timestamp else "N/A",
-                    "response_time_ms": latest_log.response_time_ms,
-                    "status_code": latest_log.status_code
-                }
-            else:
-                latest_statuses[target.id] = {
-                    "status_text": "PENDING", # 如果没有日志，则状态为待定
-                    "timestamp": "N/A",
-                    "response_time_ms": "N/A",
-                    "status_code": "N/A"
-                }
+        version = current_version()
     except Exception as e:
+        db.session.rollback()
+        logger.error(f"读取仪表盘数据版本时发生错误: {e}", exc_info=True)
+        version = None
+
+    # 有待显示的一次性提示消息时不使用缓存和 ETag，避免把这些消息缓存下来重复显示
+    cacheable = version is not None and '_flashes' not in session
+    etag = f"dashboard-{version}"
+    if cacheable and request.if_none_match.contains(etag):
+        dashboard_cache.count_not_modified()
+        response = make_response('', 304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Server-Timing'] = f'cache;desc="not-modified", total;dur={(time.perf_counter() - started) * 1000:.2f}'
+        return response
+
+    try:
+        if cacheable:
+            body, hit = dashboard_cache.get(version, lambda: _render_dashboard(version))
+            cache_status = 'hit' if hit else 'miss'
+        else:
+            body, cache_status = _render_dashboard(version), 'bypass'
+    except Exception as e:
+        db.session.rollback()
         logger.error(f"获取监控目标列表时发生错误: {e}", exc_info=True)
         flash('加载监控目标失败，请稍后重试。', 'danger')
-        targets = []
-        latest_statuses = {}
-        
-    return render_template('index.html', title='监控仪表盘', targets=targets, latest_statuses=latest_statuses)
+        body = render_template('index.html', title='监控仪表盘', rows=[], version=None)
+        cacheable, cache_status = False, 'error'
+
+    response = make_response(body)
+    if cacheable:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache' # 允许浏览器缓存，但每次使用前都要向服务器确认
+    else:
+        response.headers['Cache-Control'] = 'no-store'
+    response.headers['Server-Timing'] = f'cache;desc="{cache_status}", total;dur={(time.perf_counter() - started) * 1000:.2f}'
+    return response
+
+def _render_dashboard(version):
+    """
+    查询所有目标及其当前状态并渲染仪表盘，返回编码后的页面 (bytes)。
+    只选取表格用到的列，以元组形式返回，不为每个目标构造ORM对象。
+    :param version: 渲染时的 results_version，页面据此订阅之后的状态变化。
+    """
+    # 一次关联查询取出所有目标及其当前状态 (TargetStatus 以 target_id 为主键)，
+    # 查询开销与 check_log 表的大小无关
+    rows = db.session.execute(
+        db.select(MonitoredTarget.id, MonitoredTarget.name, MonitoredTarget.url, MonitoredTarget.is_active,
+                  MonitoredTarget.probe_type,
+                  TargetStatus.status_text, TargetStatus.status_code, TargetStatus.response_time_ms,
+                  TargetStatus.checked_at, TargetStatus.consecutive_failures, TargetStatus.cert_expires_at)
+        .outerjoin(TargetStatus, TargetStatus.target_id == MonitoredTarget.id)
+        .order_by(MonitoredTarget.name.asc())
+    ).all()
+    return render_template('index.html', title='监控仪表盘', rows=rows, version=version).encode('utf-8')
+
+@bp.route('/stream/status')
+def status_stream():
+    """
+    以 Server-Sent Events 推送目标状态变化 (status 事件)，以及需要重新加载页面的通知 (refresh / reset 事件)。
+    查询参数 since (或断线重连时浏览器自动带上的 Last-Event-ID) 为客户端已看到的 results_version，
+    服务器会补发此后的变化。推送过程不访问数据库。
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    subscriber = status_hub.subscribe(since)
+    keepalive = status_hub.keepalive
+
+    def generate():
+        try:
+            yield b'retry: 3000\n\n' # 断线后3秒重连
+            while True:
+                frames = subscriber.take(keepalive)
+                if frames is None: # 消费过慢已被移出，通知客户端重新加载
+                    yield RESET_EVENT
+                    return
+                yield b''.join(frames) if frames else b': keepalive\n\n'
+        finally:
+            status_hub.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}) # 禁止 Nginx 缓冲
+
+@bp.route('/stats/status_stream')
+def status_stream_stats():
+    """
+    以JSON返回本进程状态推送的订阅者数和消息统计。
+    """
+    return jsonify(status_hub.stats())
+
+@bp.route('/stats/dashboard_cache')
+def dashboard_cache_stats():
+    """
+    以JSON返回本进程仪表盘缓存的命中率和渲染耗时。
+    """
+    return jsonify(dashboard_cache.stats())
+
+@bp.route('/stats/probe_load')
+def probe_load_stats():
+    """
+    以JSON返回各个存活探测 worker 上报的检查频率：按目标配置间隔计算的名义频率与自适应调整后的实际频率 (次/分钟)，
+    以及自适应模式节省的比例。
+    """
+    dead_after = current_app.config.get('WORKER_DEAD_AFTER_SECONDS', 30)
+    since = to_utc_naive(datetime.now(timezone.utc)) - timedelta(seconds=dead_after)
+    workers = db.session.execute(
+        db.select(ProbeWorker.id, ProbeWorker.target_count, ProbeWorker.nominal_checks_per_min,
+                  ProbeWorker.effective_checks_per_min)
+        .where(ProbeWorker.heartbeat_at >= since).order_by(ProbeWorker.id)).all()
+    nominal = sum(row.nominal_checks_per_min or 0 for row in workers)
+    effective = sum(row.effective_checks_per_min or 0 for row in workers)
+    return jsonify({
+        'adaptive': current_app.config.get('ADAPTIVE_CHECKS', False),
+        'workers': [dict(row._mapping) for row in workers],
+        'targets': sum(row.target_count for row in workers),
+        'nominal_checks_per_min': round(nominal, 2),
+        'effective_checks_per_min': round(effective, 2),
+        'saved_ratio': round(1 - effective / nominal, 4) if nominal else 0.0,
+    })
+
+@bp.route('/stats/agents')
+def agent_stats():
+    """
+    以JSON返回远程探测代理的列表：位置、最近一次请求的时间、同步到的 targets_version、指派的目标数和上传统计。
+    超过 AGENT_DEAD_AFTER_SECONDS 秒没有请求的代理标记为离线。
+    """
+    dead_after = current_app.config.get('AGENT_DEAD_AFTER_SECONDS', 120)
+    since = to_utc_naive(datetime.now(timezone.utc)) - timedelta(seconds=dead_after)
+    agents = db.session.scalars(db.select(ProbeAgent).order_by(ProbeAgent.id)).all()
+    return jsonify({
+        'targets_version': current_version(TARGETS_VERSION),
+        'agents': [{
+            'id': agent.id,
+            'location': agent.location,
+            'address': agent.address,
+            'online': agent.last_seen_at >= since,
+            'last_seen_at': agent.last_seen_at.isoformat() + 'Z',
+            'synced_version': agent.synced_version,
+            'target_count': agent.target_count,
+            'batches_received': agent.batches_received,
+            'duplicate_batches': agent.duplicate_batches,
+            'results_received': agent.results_received,
+        } for agent in agents],
+    })
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """
+    以 Prometheus 文本格式返回本进程的指标。Web 进程内运行探测 worker (RUN_EMBEDDED_WORKER) 时包括检查流水线的指标；
+    独立的 worker 进程通过 METRICS_PORT 端口提供同样的输出。
+    """
+    return Response(metrics.render(), headers={'Content-Type': METRICS_CONTENT_TYPE, 'Cache-Control': 'no-cache'})
+
+@bp.app_template_filter('datetimeformat')
+def datetimeformat(value, fmt='%Y-%m-%d %H:%M:%S'):
+    """
+    模板过滤器：格式化时间。传入字符串 "now" 时使用当前UTC时间。
+    """
+    if value == 'now':
+        value = datetime.now(timezone.utc)
+    return value.strftime(fmt) if value else 'N/A'
 
 @bp.route('/add_target', methods=['GET', 'POST'])
 def add_target():
@@ -67,30 +222,25 @@ def add_target():
                 name=form.name.data,
                 url=form.url.data,
                 check_interval_seconds=form.check_interval_seconds.data,
-                is_active=form.is_active.data
+                is_active=form.is_active.data,
+                check_method=form.check_method.data,
+                max_body_bytes=form.max_body_bytes.data or 65536,
+                body_keyword=form.body_keyword.data or None,
+                body_sha256=(form.body_sha256.data or '').lower() or None,
+                force_fresh_connection=form.force_fresh_connection.data,
+                probe_type=form.probe_type.data,
+                probe_params=form.probe_params.data or None,
+                log_mode=form.log_mode.data,
+                agent_id=form.agent_id.data or None
             )
+            # 激活的目标在探测 worker 收到变化通知后 (几秒内) 被领取并加入调度，
+            # 同时请求一次立即检查，worker 领取后马上执行
+            if target.is_active:
+                target.check_requested_at = datetime.now(timezone.utc)
             db.session.add(target)
-            db.session.commit() # 先提交以获取target.id
+            mark_targets_changed(target)
+            db.session.commit()
             logger.info(f"新监控目标 '{target.name}' (ID: {target.id}) 已成功添加到数据库。")
-            
-            # 如果目标是激活的，则安排调度任务并立即执行一次检查
-            if target.is_active:
-                job_id = f'check_target_{target.id}'
-                scheduler.add_job(
-                    perform_check,
-                    trigger='interval',
-                    seconds=target.check_interval_seconds,
-                    args=[current_app.app_context(), target.id], # 传递应用上下文和目标ID
-                    id=job_id,
-                    name=f"Check {target.name}",
-                    replace_existing=True
-                )
-                logger.info(f"已为新目标 '{target.name}' (ID: {target.id}) 安排了定时检查任务。")
-                
-                # 安排一次立即执行的检查
-                immediate_job_id = f'immediate_check_{target.id}_{int(time.time())}'
-                scheduler.add_job(perform_check, args=[current_app.app_context(), target.id], id=immediate_job_id, name=f"Immediate check for {target.name}")
-                logger.info(f"已为新目标 '{target.name}' (ID: {target.id}) 安排了一次立即检查。")
 
             flash(f'监控目标 "{target.name}" 添加成功!', 'success')
             return redirect(url_for('main.index')) # 重定向到主页
@@ -102,6 +252,222 @@ def add_target():
             
     return render_template('add_target.html', title='添加监控目标', form=form)
 
+@bp.route('/target/<int:target_id>/edit', methods=['GET', 'POST'])
+def edit_target(target_id):
+    """
+    编辑监控目标的配置。GET请求显示预填的表单，POST请求保存修改。
+    保存后探测 worker 收到变化通知，只重新调度这一个目标。
+    """
+    target = db.session.get(MonitoredTarget, target_id)
+    if not target:
+        flash('错误：未找到要编辑的监控目标。', 'warning')
+        logger.warning(f"用户尝试编辑不存在的目标 (ID: {target_id})。")
+        return redirect(url_for('main.index'))
+
+    form = EditTargetForm(obj=target)
+    page = dict(title='编辑监控目标', heading=f'编辑监控目标 “{target.name}”', form=form,
+                form_action=url_for('main.edit_target', target_id=target.id))
+    if form.validate_on_submit():
+        logger.info(f"用户尝试修改监控目标 '{target.name}' (ID: {target_id})")
+        try:
+            duplicate = MonitoredTarget.query.filter(
+                MonitoredTarget.url == form.url.data, MonitoredTarget.id != target.id).first()
+            if duplicate:
+                flash(f'错误：URL "{form.url.data}" 已经被监控 (名称: {duplicate.name})。', 'danger')
+                logger.warning(f"修改失败，URL '{form.url.data}' 已被目标 (ID: {duplicate.id}) 使用。")
+                return render_template('add_target.html', **page)
+
+            target.name = form.name.data
+            target.url = form.url.data
+            target.check_interval_seconds = form.check_interval_seconds.data
+            target.is_active = form.is_active.data
+            target.check_method = form.check_method.data
+            target.max_body_bytes = form.max_body_bytes.data or 65536
+            target.body_keyword = form.body_keyword.data or None
+            target.body_sha256 = (form.body_sha256.data or '').lower() or None
+            target.force_fresh_connection = form.force_fresh_connection.data
+            target.probe_type = form.probe_type.data
+            target.probe_params = form.probe_params.data or None
+            target.log_mode = form.log_mode.data
+            target.agent_id = form.agent_id.data or None
+            if not db.session.is_modified(target):
+                flash(f'监控目标 "{target.name}" 没有任何修改。', 'info')
+                return redirect(url_for('main.index'))
+            mark_targets_changed(target)
+            db.session.commit()
+            logger.info(f"监控目标 '{target.name}' (ID: {target_id}) 已更新。")
+            flash(f'监控目标 "{target.name}" 已更新。', 'success')
+            return redirect(url_for('main.index'))
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"修改监控目标 (ID: {target_id}) 时发生数据库错误: {e}", exc_info=True)
+            flash(f'保存修改时发生内部错误，请稍后重试。错误详情: {str(e)}', 'danger')
+
+    return render_template('add_target.html', **page)
+
+@bp.route('/targets/import', methods=['GET', 'POST'])
+def import_targets_page():
+    """
+    批量导入监控目标：上传 CSV 或 JSON 文件，逐条按添加目标表单的规则校验后批量写入。
+    """
+    form = ImportTargetsForm()
+    report = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        file_format = form.file_format.data
+        if file_format == 'auto':
+            file_format = detect_format(upload.filename, upload.mimetype)
+        logger.info(f"用户开始批量导入监控目标: 文件 '{upload.filename}', 格式 {file_format}")
+        try:
+            report = import_targets(iter_records(upload.stream, file_format),
+                                    update_existing=form.update_existing.data,
+                                    chunk_size=current_app.config.get('IMPORT_CHUNK_SIZE', 500))
+            flash(f"导入完成：新增 {report['inserted']} 个目标，更新 {report['updated']} 个，"
+                  f"跳过 {report['skipped_existing'] + report['invalid']} 条。", 'success' if not report['invalid'] else 'warning')
+        except BulkImportError as e:
+            db.session.rollback()
+            logger.warning(f"批量导入失败，文件格式错误: {e}")
+            flash(f'导入失败：{e}', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"批量导入监控目标时发生数据库错误: {e}", exc_info=True)
+            flash('导入时发生内部错误，已全部回滚，请稍后重试。', 'danger')
+    return render_template('import_targets.html', title='批量导入/导出', form=form, report=report)
+
+@bp.route('/api/targets/import', methods=['POST'])
+def api_import_targets():
+    """
+    供脚本调用的批量导入接口：请求体为 CSV 或 JSON (JSON 数组或 JSON Lines)，以流式方式读取。
+    格式由查询参数 format 或 Content-Type 决定；update_existing=0 时跳过已存在的URL。
+    请求必须在 Authorization 请求头中带上 IMPORT_API_TOKEN (浏览器的跨站表单无法设置该请求头，因此也不会被 CSRF 利用)。
+    返回JSON格式的导入报告。
+    """
+    token = current_app.config.get('IMPORT_API_TOKEN')
+    if not token:
+        return jsonify({'error': '服务器未配置 IMPORT_API_TOKEN，批量导入接口未开启。'}), 404
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+        logger.warning(f"拒绝了令牌无效的批量导入请求 (IP: {request.remote_addr})。")
+        return jsonify({'error': '令牌无效。'}), 401
+    file_format = request.args.get('format') or detect_format(None, request.content_type)
+    if file_format not in ('csv', 'json'):
+        return jsonify({'error': '无法识别的格式，请使用 format=csv 或 format=json。'}), 400
+    try:
+        report = import_targets(iter_records(request.stream, file_format),
+                                update_existing=request.args.get('update_existing', '1') != '0',
+                                chunk_size=current_app.config.get('IMPORT_CHUNK_SIZE', 500))
+    except BulkImportError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"API 批量导入监控目标时发生数据库错误: {e}", exc_info=True)
+        return jsonify({'error': '导入时发生内部错误，已全部回滚。'}), 500
+    return jsonify(report)
+
+# 远程探测代理同步目标时使用的 ETag，其中的版本号即代理已同步到的 targets_version
+_AGENT_ETAG = re.compile(r'agent-targets-(\d+)')
+
+def _authenticate_agent():
+    """
+    校验远程探测代理请求的共享令牌和代理ID。
+    :return: (代理ID, 位置, None)；校验失败时返回 (None, None, 错误响应)。
+    """
+    token = current_app.config.get('AGENT_API_TOKEN')
+    if not token:
+        return None, None, (jsonify({'error': '服务器未配置 AGENT_API_TOKEN，远程探测代理接口未开启。'}), 404)
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+        return None, None, (jsonify({'error': '令牌无效。'}), 401)
+    agent_id = request.headers.get(AGENT_ID_HEADER, '')
+    if not AGENT_ID_PATTERN.fullmatch(agent_id):
+        return None, None, (jsonify({'error': f'缺少或无效的 {AGENT_ID_HEADER} 请求头。'}), 400)
+    location = unquote(request.headers.get(AGENT_LOCATION_HEADER, ''))[:64] or None
+    return agent_id, location, None
+
+@bp.route('/api/agent/targets')
+def api_agent_targets():
+    """
+    远程探测代理拉取指派给自己 (MonitoredTarget.agent_id) 的激活目标。
+    ETag 中带有 targets_version：代理带上次的 ETag (If-None-Match) 请求时，目标没有变化则返回 304，
+    有变化时只返回之后变化的目标和全部目标ID；不带 ETag 时返回全部目标。立即检查请求随响应一起下发。
+    """
+    agent_id, location, error = _authenticate_agent()
+    if error:
+        return error
+    since = None
+    for tag in request.if_none_match.as_set():
+        match = _AGENT_ETAG.fullmatch(tag)
+        if match:
+            since = int(match.group(1))
+    try:
+        payload = agent_targets(agent_id, since, location=location, address=request.remote_addr)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"远程探测代理 {agent_id} 同步目标时发生数据库错误: {e}", exc_info=True)
+        return jsonify({'error': '同步目标时发生内部错误。'}), 500
+    if payload is None:
+        response = make_response('', 304)
+        response.set_etag(f"agent-targets-{since}")
+    else:
+        response = jsonify(payload)
+        response.set_etag(f"agent-targets-{payload['version']}")
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add(AGENT_ID_HEADER)
+    return response
+
+@bp.route('/api/agent/results', methods=['POST'])
+def api_agent_results():
+    """
+    远程探测代理上传一批检查结果：请求体为 gzip 压缩的 JSON (见 app.remote_agent.encode_results)，
+    X-Batch-Id 为批次ID。整批在一个事务中写入 CheckLog (记上代理ID)、聚合表和当前状态；
+    同一批次重复上传时不再写入，返回第一次写入的结果数。返回JSON格式的报告。
+    """
+    agent_id, location, error = _authenticate_agent()
+    if error:
+        return error
+    batch_id = request.headers.get(BATCH_ID_HEADER, '')
+    if not BATCH_ID_PATTERN.fullmatch(batch_id):
+        return jsonify({'error': f'缺少或无效的 {BATCH_ID_HEADER} 请求头。'}), 400
+    max_bytes = current_app.config.get('AGENT_MAX_BATCH_BYTES', 16 * 1024 * 1024)
+    if request.content_length is None or request.content_length > max_bytes:
+        return jsonify({'error': f'请求体必须提供 Content-Length 且不超过 {max_bytes} 字节。'}), 413
+    try:
+        results = decode_results(request.get_data(cache=False), request.headers.get('Content-Encoding'), max_bytes)
+    except ValueError as e:
+        logger.warning(f"远程探测代理 {agent_id} 上传的批次 {batch_id} 无效: {e}")
+        return jsonify({'error': str(e)}), 400
+    try:
+        report, changes = ingest_batch(
+            agent_id, batch_id, results, location=location, address=request.remote_addr,
+            log_result=make_result_logger(current_app.config.get('CHECK_LOG_MODE', 'all'),
+                                          current_app.config.get('CHECK_LOG_SAMPLE_RATE', 100)),
+            heartbeat_seconds=current_app.config.get('CHANGE_LOG_HEARTBEAT_SECONDS', 900))
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"写入远程探测代理 {agent_id} 的批次 {batch_id} ({len(results)} 条) 时发生数据库错误: {e}", exc_info=True)
+        return jsonify({'error': '写入检查结果时发生内部错误，请稍后重试。'}), 500
+    if changes:
+        # 直接推送给连接到本进程的仪表盘，其他 Web 进程通过轮询 TargetStatus.version 获得变化
+        status_hub.publish(changes)
+    return jsonify(report)
+
+@bp.route('/targets/export')
+def export_targets_file():
+    """
+    以流式方式导出全部监控目标 (format=csv 或 json)，导出的文件可以直接再导入。
+    """
+    file_format = request.args.get('format', 'csv')
+    if file_format not in ('csv', 'json'):
+        flash('不支持的导出格式。', 'warning')
+        return redirect(url_for('main.import_targets_page'))
+    mimetype = 'text/csv' if file_format == 'csv' else 'application/json'
+    filename = f"webpulse-targets-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{file_format}"
+    logger.info(f"用户导出了全部监控目标 ({file_format})。")
+    return Response(stream_with_context(export_targets(file_format)), mimetype=f'{mimetype}; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @bp.route('/target/<int:target_id>/delete', methods=['POST']) # 只允许POST请求删除
 def delete_target(target_id):
     """
@@ -111,16 +477,15 @@ def delete_target(target_id):
     if target_to_delete:
         logger.info(f"用户尝试删除监控目标: '{target_to_delete.name}' (ID: {target_id})")
         try:
-            job_id = f'check_target_{target_to_delete.id}'
-            if scheduler.get_job(job_id):
-                scheduler.remove_job(job_id)
-                logger.info(f"已从调度器中移除目标 '{target_to_delete.name}' (ID: {target_id}) 的任务。")
-
-            # CheckLog 会因为在MonitoredTarget模型中设置的 cascade="all, delete-orphan" 而被一同删除
-            db.session.delete(target_to_delete)
+            # 目标被删除后，持有其租约的探测 worker 收到变化通知后将它移出调度
+            # 目标的日志、聚合和当前状态各用一条批量 DELETE 清理，不再逐条加载 CheckLog
+            target_name = target_to_delete.name
+            report = delete_target_history(target_id)
             db.session.commit()
-            flash(f'监控目标 "{target_to_delete.name}" 已成功删除。', 'success')
-            logger.info(f"监控目标 '{target_to_delete.name}' (ID: {target_id}) 已从数据库中删除。")
+            if segment_store.enabled:
+                segment_store.delete_target(target_id) # 段文件不随事务回滚，提交成功后再删除
+            flash(f'监控目标 "{target_name}" 已成功删除 (清理了 {report["check_log"]} 条日志，耗时 {report["elapsed_ms"]}ms)。', 'success')
+            logger.info(f"监控目标 '{target_name}' (ID: {target_id}) 已从数据库中删除: {report}")
         except Exception as e:
             db.session.rollback()
             logger.error(f"删除目标 '{target_to_delete.name}' (ID: {target_id}) 时发生错误: {e}", exc_info=True)
@@ -141,28 +506,16 @@ def toggle_active(target_id):
         logger.info(f"用户尝试切换目标 '{target_to_toggle.name}' (ID: {target_id}) 的激活状态，当前为: {'激活' if target_to_toggle.is_active else '暂停'}")
         try:
             target_to_toggle.is_active = not target_to_toggle.is_active
+            mark_targets_changed(target_to_toggle)
             db.session.commit()
             
-            job_id = f'check_target_{target_to_toggle.id}'
+            # 探测 worker 收到变化通知后领取新激活的目标，或释放已暂停目标的租约并将其移出调度
             if target_to_toggle.is_active:
-                # 如果任务不存在或已被移除，则重新添加
-                if not scheduler.get_job(job_id): # 避免重复添加
-                    scheduler.add_job(
-                        perform_check,
-                        trigger='interval',
-                        seconds=target_to_toggle.check_interval_seconds,
-                        args=[current_app.app_context(), target_to_toggle.id],
-                        id=job_id,
-                        name=f"Check {target_to_toggle.name}",
-                        replace_existing=True # 如果之前因为某些原因没删掉，这里会替换
-                    )
                 flash(f'目标 "{target_to_toggle.name}" 已激活监控。', 'success')
-                logger.info(f"目标 '{target_to_toggle.name}' (ID: {target_id}) 已被设置为激活状态，并已安排/确认调度任务。")
-            else: # 如果设置为不激活，则移除调度任务
-                if scheduler.get_job(job_id):
-                    scheduler.remove_job(job_id)
+                logger.info(f"目标 '{target_to_toggle.name}' (ID: {target_id}) 已被设置为激活状态，将由探测 worker 领取调度。")
+            else:
                 flash(f'目标 "{target_to_toggle.name}" 已暂停监控。', 'info')
-                logger.info(f"目标 '{target_to_toggle.name}' (ID: {target_id}) 已被设置为暂停状态，并已移除调度任务。")
+                logger.info(f"目标 '{target_to_toggle.name}' (ID: {target_id}) 已被设置为暂停状态，探测 worker 将停止检查。")
         except Exception as e:
             db.session.rollback()
             logger.error(f"切换目标 '{target_to_toggle.name}' (ID: {target_id}) 激活状态时发生错误: {e}", exc_info=True)
@@ -174,10 +527,10 @@ def toggle_active(target_id):
     return redirect(url_for('main.index'))
 
 @bp.route('/target/<int:target_id>/logs')
-@bp.route('/target/<int:target_id>/logs/page/<int:page>')
-def target_logs(target_id, page=1):
+def target_logs(target_id):
     """
-    显示指定监控目标的历史检查日志，支持分页。
+    显示指定监控目标的历史检查日志，使用游标 (keyset) 分页。
+    查询参数 before / after 为翻页游标，count=1 时额外统计日志总数。
     """
     target = db.session.get(MonitoredTarget, target_id)
     if not target:
@@ -185,24 +538,61 @@ def target_logs(target_id, page=1):
         logger.warning(f"用户尝试查看不存在的目标 (ID: {target_id}) 的日志。")
         return redirect(url_for('main.index'))
     
-    logger.info(f"用户正在查看目标 '{target.name}' (ID: {target_id}) 的日志, 第 {page} 页。")
+    before = request.args.get('before')
+    after = request.args.get('after')
+    logger.info(f"用户正在查看目标 '{target.name}' (ID: {target_id}) 的日志, 游标: {before or after or '最新'}。")
+    total = None
+    summaries = []
+    timeline = None
     try:
-        # 日志按时间倒序分页显示，每页显示20条 (可配置)
-        logs_pagination = CheckLog.query.filter_by(target_id=target.id)\
-                                    .order_by(CheckLog.timestamp.desc())\
-                                    .paginate(page=page, per_page=20, error_out=False) # error_out=False 防止页码超出时抛出404
+        # 日志按时间倒序分页显示，每页显示20条 (可配置)；使用段存储时直接从映射的段文件中读取。
+        # 远程探测代理的结果由 Web 进程写入 check_log (段文件只由探测 worker 写入)，这些目标始终读取 check_log
+        per_page = current_app.config.get('LOGS_PER_PAGE', 20)
+        use_segments = segment_store.enabled and not target.agent_id
+        if use_segments:
+            logs_page = segment_store.page(target.id, per_page=per_page, before=before, after=after)
+        else:
+            logs_page = keyset_paginate(CheckLog.query.filter_by(target_id=target.id),
+                                        CheckLog.timestamp, CheckLog.id,
+                                        per_page=per_page, before=before, after=after)
         
-        if not logs_pagination.items and page > 1: # 如果当前页没有项目且不是第一页，可能用户手动输入了过大的页码
-            logger.warning(f"用户尝试访问目标 '{target.name}' 日志的无效页码: {page}。实际总页数: {logs_pagination.pages}")
-            return redirect(url_for('main.target_logs', target_id=target.id, page=logs_pagination.pages or 1))
+        if not logs_page.items and (before or after): # 游标已失效 (例如日志已被清理)，回到最新一页
+            logger.warning(f"用户访问目标 '{target.name}' 日志时使用了无效游标，已重定向到最新一页。")
+            return redirect(url_for('main.target_logs', target_id=target.id))
+
+        # 只记录状态变化的目标：由本页的完整记录和汇总记录还原状态时间线，
+        # 最新一页的最新一段持续到最近一次检查 (之后被汇总的检查尚未写出)
+        if target.log_mode == LOG_MODE_CHANGES and not use_segments:
+            status = target.current_status
+            newest = not logs_page.has_newer and status is not None
+            timeline = reconstruct_timeline(logs_page.items,
+                                            last_checked_at=status.checked_at if newest else None,
+                                            pending_checks=status.log_pending_checks if newest else 0)
+
+        # 可用率和延迟统计只读取聚合表，读取的行数与检查频率无关
+        summaries = [window_summary(target.id, window) for window in ('24h', '30d', '1y')]
+
+        # 总数需要扫描该目标的全部日志，只在用户明确要求时才统计
+        if request.args.get('count') == '1' and use_segments:
+            total = segment_store.count(target.id) # 段文件的记录数由文件大小直接算出
+        elif request.args.get('count') == '1':
+            total = db.session.scalar(
+                db.select(db.func.count()).select_from(CheckLog).where(CheckLog.target_id == target.id))
 
     except Exception as e:
         logger.error(f"获取目标 '{target.name}' (ID: {target_id}) 日志时发生错误: {e}", exc_info=True)
         flash(f'加载日志失败，请稍后重试。', 'danger')
-        logs_pagination = None # 或者一个空的Pagination对象
+        logs_page = None
 
     return render_template('target_logs.html', title=f'"{target.name}" 的监控日志', 
-                           target=target, logs_pagination=logs_pagination)
+                           target=target, logs_page=logs_page, total=total, summaries=summaries, timeline=timeline)
+
+@bp.route('/target/<int:target_id>/logs/page/<int:page>')
+def target_logs_page(target_id, page):
+    """
+    兼容旧版基于页码的日志链接，统一重定向到最新一页。
+    """
+    return redirect(url_for('main.target_logs', target_id=target_id))
 
 @bp.route('/target/<int:target_id>/run_check_now', methods=['POST']) # 只允许POST请求
 def run_check_now(target_id):
@@ -214,19 +604,12 @@ def run_check_now(target_id):
         if target.is_active:
             logger.info(f"用户为目标 '{target.name}' (ID: {target_id}) 手动触发了一次立即检查。")
             try:
-                # 使用 add_job 并设置一个唯一的、基于时间的ID来立即执行一次任务
-                # 这样可以利用调度器的执行环境和上下文管理
-                immediate_job_id = f'manual_check_{target.id}_{int(time.time())}'
-                scheduler.add_job(
-                    func=perform_check, 
-                    args=[current_app.app_context(), target.id], 
-                    id=immediate_job_id, 
-                    name=f"Manual check for {target.name}",
-                    # trigger='date', run_date=datetime.now(timezone.utc) + timedelta(seconds=1) # 另一种立即执行的方式
-                    # 或者不指定trigger，APScheduler默认会立即执行一次性任务
-                )
-                flash(f'已为 "{target.name}" 手动触发了一次检查。请稍后刷新页面查看结果。', 'info')
+                # 记录请求时间，由持有该目标租约的探测 worker 在几秒内执行，不影响原有的检查节奏
+                target.check_requested_at = datetime.now(timezone.utc)
+                db.session.commit()
+                flash(f'已为 "{target.name}" 手动触发了一次检查，结果出来后仪表盘会自动更新。', 'info')
             except Exception as e:
+                db.session.rollback()
                 logger.error(f"手动为目标 '{target.name}' (ID: {target_id}) 触发检查时发生错误: {e}", exc_info=True)
                 flash(f'手动触发检查失败: {str(e)}', 'danger')
         else:
@@ -238,3 +621,47 @@ def run_check_now(target_id):
         
     # 重定向回之前的页面，如果获取不到则回到首页
     return redirect(request.referrer or url_for('main.index'))
+
+# SLA 报表的时间窗口 -> (窗口长度, 默认时间桶)
+REPORT_WINDOWS = {'24h': (timedelta(hours=24), 'hour'), '7d': (timedelta(days=7), 'hour'),
+                  '30d': (timedelta(days=30), 'day')}
+REPORT_BUCKETS = {'hour': 3600, 'day': 86400}
+
+@bp.route('/reports/sla')
+def sla_report():
+    """
+    根据原始检查历史生成 SLA 报表：每个目标的可用率、故障次数、MTTR/MTBF 和延迟分位数，以及按时间桶的趋势。
+    查询参数: window (24h/7d/30d) 或 start/end (YYYY-MM-DD，UTC)，bucket (hour/day)，
+    target (只统计一个目标)，min_failures (至少连续失败几次才算故障)，format=json 时返回JSON。
+    """
+    window = request.args.get('window', '7d')
+    if window not in REPORT_WINDOWS:
+        window = '7d'
+    length, default_bucket = REPORT_WINDOWS[window]
+    bucket = request.args.get('bucket', default_bucket)
+    target_id = request.args.get('target', type=int)
+    min_failures = request.args.get('min_failures', 1, type=int)
+    wants_json = request.args.get('format') == 'json'
+    try:
+        if request.args.get('start'):
+            start = datetime.strptime(request.args['start'], '%Y-%m-%d')
+            end = datetime.strptime(request.args['end'], '%Y-%m-%d') if request.args.get('end') else start + length
+        else:
+            end = to_utc_naive(datetime.now(timezone.utc))
+            start = end - length
+        if bucket not in REPORT_BUCKETS:
+            raise ValueError(f"不支持的时间桶: {bucket}")
+        report = build_report(start, end, target_ids=[target_id] if target_id else None,
+                              bucket_seconds=REPORT_BUCKETS[bucket], min_failures=min_failures,
+                              store=segment_store if segment_store.enabled else None)
+    except ValueError as e:
+        if wants_json:
+            return jsonify({'error': str(e)}), 400
+        flash(f'报表参数无效: {e}', 'warning')
+        return redirect(url_for('main.sla_report'))
+
+    logger.info(f"用户生成了 SLA 报表: {report['start']} ~ {report['end']}, 目标: {target_id or '全部'}。")
+    if wants_json:
+        return jsonify(report_to_json(report))
+    return render_template('sla_report.html', title='SLA 报表', report=report, window=window,
+                           bucket=bucket, target_id=target_id, windows=REPORT_WINDOWS)
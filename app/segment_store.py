@@ -0,0 +1,518 @@
+import bisect
+import logging
+import math
+import mmap
+import os
+import shutil
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError: # Windows 没有 flock：只能由单个进程写入段文件
+    fcntl = None
+
+from app.metrics import counter, gauge
+from app.pagination import KeysetPage, decode_cursor
+from app.probe_engine import ERROR_CLASSES
+
+# 段存储模块不依赖 Flask 应用上下文 (init_app 只读取配置)，使用标准的模块级 logger
+logger = logging.getLogger(__name__)
+
+# 原始检查记录的定长二进制格式 (小端，24 字节，各字段按自身大小对齐)：
+# 时间戳 (UTC epoch 秒), target_id, 状态序号, 错误类别序号 (0 表示无), 状态码 (-1 表示无),
+# 响应时间 (毫秒，NaN 表示无), 详情引用 (详情文件中的偏移 + 1，0 表示没有详情)
+RECORD = struct.Struct('<dIBBhfI')
+RECORD_SIZE = RECORD.size
+STATUSES = ('UP', 'DOWN', 'ERROR')
+_STATUS_INDEX = {status: index for index, status in enumerate(STATUSES)}
+_ERROR_CLASSES = ('',) + ERROR_CLASSES
+_ERROR_CLASS_INDEX = {error_class: index for index, error_class in enumerate(_ERROR_CLASSES)}
+_DETAILS_HEADER = struct.Struct('<H') # 详情文件中每个字符串前的 UTF-8 字节数
+_MAX_DETAILS = 0xFFFF
+_NAN = float('nan')
+
+
+class SegmentRecord(NamedTuple):
+    """
+    从段文件中读出的一条检查记录，属性与 CheckLog 同名，日志页面可以直接渲染。
+    id 是记录在当天段文件中的序号，与时间戳一起构成分页游标。
+    段文件不保存分阶段耗时，这些属性始终为 None。
+    """
+    id: int
+    timestamp: datetime # UTC (不带时区，与数据库中读出的时间一致)
+    status_text: str
+    status_code: Optional[int]
+    response_time_ms: Optional[float]
+    details: str
+    error_class: str = ''
+    dns_ms: Optional[float] = None
+    connect_ms: Optional[float] = None
+    tls_ms: Optional[float] = None
+    ttfb_ms: Optional[float] = None
+    transfer_ms: Optional[float] = None
+    connection_reused: Optional[bool] = None
+
+
+class _Timestamps:
+    """
+    把映射区中的记录时间戳包装成只读序列，供 bisect 二分查找 (不复制数据)。
+    """
+    __slots__ = ('_buffer', '_count')
+
+    def __init__(self, buffer, count):
+        self._buffer = buffer
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return RECORD.unpack_from(self._buffer, index * RECORD_SIZE)[0]
+
+
+class _Segment:
+    """
+    一个只读映射的段文件。长度向下取整到完整记录，忽略写入器正在追加的半条记录。
+    """
+
+    def __init__(self, path):
+        self.count = 0
+        self._map = None
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size // RECORD_SIZE * RECORD_SIZE
+            if size:
+                self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+                self.count = size // RECORD_SIZE
+        self.view = memoryview(self._map) if self._map is not None else memoryview(b'')
+
+    def bounds(self, start_ts=None, end_ts=None):
+        """
+        二分查找时间范围 [start_ts, end_ts) 对应的记录序号范围。
+        同一目标的记录按检查完成的先后追加，时间戳基本有序。
+        """
+        timestamps = _Timestamps(self.view, self.count)
+        lo = bisect.bisect_left(timestamps, start_ts) if start_ts is not None else 0
+        hi = bisect.bisect_left(timestamps, end_ts, lo) if end_ts is not None else self.count
+        return lo, hi
+
+    def close(self):
+        self.view.release()
+        if self._map is not None:
+            self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SegmentStore:
+    """
+    原始检查历史的只追加段存储，可以代替 check_log 表保存原始检查结果 (RAW_HISTORY_BACKEND=segments)。
+
+    每个目标一个目录，目录下按 UTC 日期切分段文件 (YYYYMMDD.seg)，每条结果是 24 字节的定长记录；
+    详情文本单独存放在同名的 .det 文件中，同一天内相同的详情只写一次，记录中只保存引用。
+    写入器只做顺序追加，不需要索引维护和事务；读取时用 mmap 映射段文件，
+    按时间戳二分定位后直接在映射区上扫描，图表和可用率查询不需要为每条记录构造ORM对象。
+    保留策略按天删除整个段文件，删除目标时删除整个目录。
+
+    每个目标同一时间只由持有其租约的探测 worker 写入；Web 进程只读。租约交接时新旧持有者可能短暂地
+    同时追加同一个文件，因此每次追加都对段文件加排他锁 (flock)，并按详情文件的实际长度计算新详情的引用。
+    段文件目录是本机目录：所有探测 worker 必须运行在同一台主机上 (或共享支持 flock 的同一个目录)，
+    否则每台主机只保存自己检查过的那部分原始历史。
+    """
+
+    def __init__(self, directory=None, max_open_files=256):
+        self.directory = directory
+        self.max_open_files = max_open_files # 写入器保持打开的段文件数上限
+        self.enabled = False
+        self._handles = OrderedDict() # path -> 以追加方式打开的文件，按最近使用排序
+        self._interned = {} # (target_id, day) -> _InternTable
+        self._lock = threading.Lock() # 保护写入器的文件句柄和详情缓存
+        self.records_written = 0
+        self.bytes_written = 0
+        self.details_written = 0 # 写入详情文件的不同详情数 (重复的详情只写一次)
+
+    def init_app(self, app):
+        """
+        从Flask应用配置中读取原始历史的存储方式和段文件目录。
+        """
+        self.enabled = app.config.get('RAW_HISTORY_BACKEND', 'sql') == 'segments'
+        self.directory = app.config.get('SEGMENT_STORE_DIR') or os.path.join(app.instance_path, 'segments')
+        self.max_open_files = app.config.get('SEGMENT_MAX_OPEN_FILES', self.max_open_files)
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            logger.info(f"原始检查历史写入段文件目录: {self.directory}")
+
+    # ---- 写入 ----
+
+    def append(self, results):
+        """
+        追加一批检查结果 (由结果写入线程在数据库事务提交后调用)。
+        :param results: ProbeResult 的列表。
+        :return: 写入的记录数。
+        """
+        groups = {} # (target_id, day) -> [ProbeResult, ...]
+        for result in results:
+            day = result.timestamp.astimezone(timezone.utc).date() if result.timestamp.tzinfo else result.timestamp.date()
+            groups.setdefault((result.target_id, day), []).append(result)
+
+        with self._lock:
+            for (target_id, day), items in groups.items():
+                base = self._path(target_id, day)
+                segment = self._handle(base + '.seg')
+                if fcntl is not None:
+                    fcntl.flock(segment.fileno(), fcntl.LOCK_EX) # 与同时写这一天的其他进程 (租约交接) 互斥
+                try:
+                    interned = self._interned_details(target_id, day, base)
+                    pending_details = []
+                    records = bytearray()
+                    for result in items:
+                        records += RECORD.pack(
+                            _epoch(result.timestamp),
+                            target_id,
+                            _STATUS_INDEX.get(result.status_text, _STATUS_INDEX['ERROR']),
+                            _ERROR_CLASS_INDEX.get(result.error_class, _ERROR_CLASS_INDEX['internal']),
+                            -1 if result.status_code is None else result.status_code,
+                            _NAN if result.response_time_ms is None else result.response_time_ms,
+                            self._details_ref(interned, result.details, pending_details) if result.details else 0,
+                        )
+                    if pending_details:
+                        # 先写详情再写记录，读取方看到的记录引用的详情一定已经落盘
+                        details = self._handle(base + '.det')
+                        details.write(b''.join(pending_details))
+                        details.flush()
+                        self.details_written += len(pending_details)
+                    segment.write(records)
+                    segment.flush()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(segment.fileno(), fcntl.LOCK_UN)
+                self.records_written += len(items)
+                self.bytes_written += len(records)
+            self._forget_old_days(max(day for _, day in groups) if groups else None)
+        return len(results)
+
+    def _details_ref(self, interned, text, pending):
+        ref = interned.refs.get(text)
+        if ref is None:
+            data = text.encode('utf-8')[:_MAX_DETAILS]
+            # 引用 = 条目在详情文件中的偏移 + 1
+            ref = interned.size + 1
+            interned.refs[text] = ref
+            interned.size += _DETAILS_HEADER.size + len(data)
+            pending.append(_DETAILS_HEADER.pack(len(data)) + data)
+        return ref
+
+    def _interned_details(self, target_id, day, base):
+        # 调用方持有段文件的排他锁，此时详情文件的长度不会再变化
+        key = (target_id, day)
+        try:
+            size = os.path.getsize(base + '.det')
+        except FileNotFoundError:
+            size = 0
+        interned = self._interned.get(key)
+        if interned is None or size < interned.size: # 首次写这一天，或详情文件已被删除重建
+            interned = self._interned[key] = _InternTable()
+        if size > interned.size:
+            # 写入器 (重新) 启动后第一次写这一天的详情，或租约交接期间其他进程追加过详情：
+            # 读入缓存之后新增的部分，之后相同文本直接复用引用
+            with open(base + '.det', 'rb') as f:
+                f.seek(interned.size)
+                data = f.read(size - interned.size)
+            offset = 0
+            while offset + _DETAILS_HEADER.size <= len(data):
+                (length,) = _DETAILS_HEADER.unpack_from(data, offset)
+                end = offset + _DETAILS_HEADER.size + length
+                if end > len(data):
+                    break
+                interned.refs.setdefault(data[offset + _DETAILS_HEADER.size:end].decode('utf-8', 'replace'),
+                                         interned.size + offset + 1)
+                offset = end
+            interned.size = size # 新详情总是追加在文件末尾 (末尾不完整的条目不会被引用)
+        return interned
+
+    def _forget_old_days(self, newest_day):
+        # 只保留最近两天的详情缓存 (跨零点的批次仍可能写入前一天)
+        if newest_day is None:
+            return
+        for key in [key for key in self._interned if key[1] < newest_day - timedelta(days=1)]:
+            del self._interned[key]
+
+    def _handle(self, path):
+        handle = self._handles.get(path)
+        if handle is not None:
+            if os.fstat(handle.fileno()).st_nlink:
+                self._handles.move_to_end(path)
+                return handle
+            # 文件已被保留策略或删除目标操作删除，重新创建
+            handle.close()
+            del self._handles[path]
+            self._interned = {key: value for key, value in self._interned.items()
+                              if self._path(*key) != path[:-4]}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path, 'ab')
+        self._handles[path] = handle
+        while len(self._handles) > self.max_open_files:
+            _, oldest = self._handles.popitem(last=False)
+            oldest.close()
+        return handle
+
+    def close(self):
+        """
+        关闭写入器打开的全部段文件。
+        """
+        with self._lock:
+            for handle in self._handles.values():
+                handle.close()
+            self._handles.clear()
+            self._interned.clear()
+
+    # ---- 读取 ----
+
+    def scan(self, target_id, start=None, end=None):
+        """
+        按时间顺序逐个返回 [start, end) 范围内的记录所在的映射区切片 (memoryview，不复制数据)，
+        每个切片是若干条连续的 RECORD 记录，可以用 RECORD.iter_unpack 或按列解析。
+        切片只在生成器前进到下一个段文件之前有效。
+        """
+        start_ts = _epoch(start) if start is not None else None
+        end_ts = _epoch(end) if end is not None else None
+        for day in self._days(target_id, start, end):
+            try:
+                segment = _Segment(self._path(target_id, day) + '.seg')
+            except FileNotFoundError:
+                continue # 已被保留策略删除
+            with segment:
+                lo, hi = segment.bounds(start_ts, end_ts)
+                if hi > lo:
+                    chunk = segment.view[lo * RECORD_SIZE:hi * RECORD_SIZE]
+                    try:
+                        yield chunk
+                    finally:
+                        chunk.release()
+
+    def summary(self, target_id, start=None, end=None):
+        """
+        直接在映射区上统计时间范围内的检查次数、可用率和响应时间 (用于图表和可用率查询)。
+        :return: {'checks', 'up', 'uptime_pct', 'avg_ms', 'max_ms'}
+        """
+        checks = up = latency_count = 0
+        latency_sum = 0.0
+        latency_max = None
+        up_index = _STATUS_INDEX['UP']
+        for chunk in self.scan(target_id, start, end):
+            for _, _, status, _, _, latency, _ in RECORD.iter_unpack(chunk):
+                checks += 1
+                if status == up_index:
+                    up += 1
+                if latency == latency: # 不是 NaN
+                    latency_count += 1
+                    latency_sum += latency
+                    if latency_max is None or latency > latency_max:
+                        latency_max = latency
+        return {
+            'checks': checks,
+            'up': up,
+            'uptime_pct': round(up * 100 / checks, 3) if checks else None,
+            'avg_ms': round(latency_sum / latency_count, 2) if latency_count else None,
+            'max_ms': round(latency_max, 2) if latency_max is not None else None,
+        }
+
+    def count(self, target_id):
+        """
+        目标现有的记录总数 (只读取文件大小，不扫描记录)。
+        """
+        directory = self._target_dir(target_id)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return 0
+        return sum(os.path.getsize(os.path.join(directory, name)) // RECORD_SIZE
+                   for name in names if name.endswith('.seg'))
+
+    def page(self, target_id, per_page=20, before=None, after=None):
+        """
+        与 pagination.keyset_paginate 相同的游标分页 (按写入顺序倒序)，供日志页面使用。
+        游标中的时间戳确定所在的段文件，记录序号确定在段文件中的位置。
+        """
+        before_key = decode_cursor(before)
+        after_key = decode_cursor(after) if before_key is None else None
+        days = self._days(target_id)
+        if after_key is not None:
+            ts, index = after_key
+            items = self._collect(target_id, [day for day in days if day >= ts.date()], per_page + 1,
+                                  newest_first=False, skip=(ts.date(), index))
+            return KeysetPage(list(reversed(items[:per_page])), has_older=True, has_newer=len(items) > per_page)
+        skip = None
+        if before_key is not None:
+            ts, index = before_key
+            days = [day for day in days if day <= ts.date()]
+            skip = (ts.date(), index)
+        items = self._collect(target_id, list(reversed(days)), per_page + 1, newest_first=True, skip=skip)
+        return KeysetPage(items[:per_page], has_older=len(items) > per_page, has_newer=before_key is not None)
+
+    def _collect(self, target_id, days, limit, newest_first, skip=None):
+        # 从游标位置 skip = (日期, 序号) 之后 (不含) 开始，按方向读取最多 limit 条记录
+        items = []
+        for day in days:
+            base = self._path(target_id, day)
+            try:
+                segment = _Segment(base + '.seg')
+            except FileNotFoundError:
+                continue
+            with segment:
+                if newest_first:
+                    hi = min(skip[1], segment.count) if skip and skip[0] == day else segment.count
+                    indexes = range(hi - 1, max(-1, hi - 1 - (limit - len(items))), -1)
+                else:
+                    lo = skip[1] + 1 if skip and skip[0] == day else 0
+                    indexes = range(lo, min(segment.count, lo + limit - len(items)))
+                if not indexes:
+                    continue
+                details = _DetailsReader(base + '.det')
+                for index in indexes:
+                    items.append(_to_record(index, RECORD.unpack_from(segment.view, index * RECORD_SIZE), details))
+            if len(items) >= limit:
+                break
+        return items
+
+    def _days(self, target_id, start=None, end=None):
+        """
+        目标现有段文件的日期列表 (升序)，可以按时间范围过滤。
+        """
+        try:
+            names = os.listdir(self._target_dir(target_id))
+        except FileNotFoundError:
+            return []
+        days = []
+        for name in names:
+            if name.endswith('.seg'):
+                try:
+                    days.append(datetime.strptime(name[:-4], '%Y%m%d').date())
+                except ValueError:
+                    continue
+        first = start.date() if start is not None else None
+        last = end.date() if end is not None else None
+        return sorted(day for day in days if (first is None or day >= first) and (last is None or day <= last))
+
+    # ---- 清理 ----
+
+    def purge(self, cutoff):
+        """
+        删除整天都早于 cutoff 的段文件和详情文件。
+        :return: 删除的记录数。
+        """
+        cutoff_day = (cutoff.astimezone(timezone.utc) if cutoff.tzinfo else cutoff).date()
+        removed = 0
+        try:
+            target_dirs = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        for target_dir in target_dirs:
+            directory = os.path.join(self.directory, target_dir)
+            try:
+                names = os.listdir(directory)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for name in names:
+                try:
+                    day = datetime.strptime(name[:8], '%Y%m%d').date()
+                except ValueError:
+                    continue
+                if day < cutoff_day:
+                    path = os.path.join(directory, name)
+                    try:
+                        if name.endswith('.seg'):
+                            removed += os.path.getsize(path) // RECORD_SIZE
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+    def delete_target(self, target_id):
+        """
+        删除一个目标的全部段文件。
+        :return: 删除的记录数。
+        """
+        removed = self.count(target_id)
+        shutil.rmtree(self._target_dir(target_id), ignore_errors=True)
+        return removed
+
+    def stats(self):
+        return {'records_written': self.records_written, 'bytes_written': self.bytes_written,
+                'details_written': self.details_written, 'open_files': len(self._handles)}
+
+    def collect_metrics(self):
+        """
+        返回段存储写入情况的 Prometheus 指标文本行。
+        """
+        return (counter('webpulse_segment_records_written_total', '写入段文件的原始检查记录数', self.records_written)
+                + counter('webpulse_segment_bytes_written_total', '写入段文件的字节数 (不含详情)', self.bytes_written)
+                + counter('webpulse_segment_details_written_total', '写入详情文件的不同详情数', self.details_written)
+                + gauge('webpulse_segment_open_files', '写入器打开的段文件数', len(self._handles)))
+
+    def _target_dir(self, target_id):
+        return os.path.join(self.directory, str(target_id))
+
+    def _path(self, target_id, day):
+        # 不含扩展名的段文件路径，.seg 为记录，.det 为详情
+        return os.path.join(self.directory, str(target_id), day.strftime('%Y%m%d'))
+
+
+class _InternTable:
+    """
+    写入器对一个详情文件的缓存：已写入的详情文本及其引用，以及文件的当前长度。
+    """
+    __slots__ = ('refs', 'size')
+
+    def __init__(self):
+        self.refs = {}
+        self.size = 0
+
+
+class _DetailsReader:
+    """
+    按引用读取详情文本 (整个详情文件一次读入，文件通常只有几KB)。
+    """
+
+    def __init__(self, path):
+        try:
+            with open(path, 'rb') as f:
+                self._data = f.read()
+        except FileNotFoundError:
+            self._data = b''
+
+    def get(self, ref):
+        if not ref:
+            return ''
+        offset = ref - 1
+        if offset + _DETAILS_HEADER.size > len(self._data):
+            return ''
+        (length,) = _DETAILS_HEADER.unpack_from(self._data, offset)
+        start = offset + _DETAILS_HEADER.size
+        return self._data[start:start + length].decode('utf-8', 'replace')
+
+
+def _epoch(ts):
+    if ts.tzinfo is None: # 数据库中读出的时间为不带时区的 UTC
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def _to_record(index, fields, details):
+    timestamp, _, status, error_class, status_code, latency, details_ref = fields
+    return SegmentRecord(
+        index,
+        datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None),
+        STATUSES[status],
+        None if status_code < 0 else status_code,
+        None if math.isnan(latency) else round(latency, 2),
+        details.get(details_ref),
+        _ERROR_CLASSES[error_class],
+    )
@@ -0,0 +1,38 @@
+import bisect
+import hashlib
+
+
+def _hash(value):
+    # 取 blake2b 的前 8 字节作为环上的位置，分布均匀且与进程无关 (不受 PYTHONHASHSEED 影响)
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    一致性哈希环，用于把监控目标分配给各个探测 worker。
+    每个成员在环上放置 replicas 个虚拟节点；成员加入或离开时，
+    只有大约 1/N 的目标会换到别的 worker，其余目标的归属保持不变。
+    """
+
+    def __init__(self, members=(), replicas=256):
+        self.replicas = replicas
+        self._members = frozenset(members)
+        points = sorted((_hash(f'{member}#{i}'), member) for member in self._members for i in range(replicas))
+        self._keys = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    @property
+    def members(self):
+        return self._members
+
+    def __len__(self):
+        return len(self._members)
+
+    def owner(self, key):
+        """
+        返回负责 key 的成员，环为空时返回 None。
+        """
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[index]
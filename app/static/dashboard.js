@@ -0,0 +1,66 @@
+// 仪表盘实时更新：订阅 /stream/status，收到状态变化时原地更新对应的表格行。
+(function () {
+    'use strict';
+
+    var script = document.currentScript;
+    if (!script || !window.EventSource) {
+        return; // 不支持 SSE 的浏览器仍可手动刷新页面
+    }
+
+    var BADGE_CLASSES = {
+        UP: 'bg-success',
+        DOWN: 'bg-danger',
+        ERROR: 'bg-warning text-dark'
+    };
+    var reloading = false;
+
+    function reload() {
+        if (!reloading) {
+            reloading = true;
+            window.location.reload();
+        }
+    }
+
+    function setText(row, field, text) {
+        var cell = row.querySelector('[data-field="' + field + '"]');
+        if (cell) {
+            cell.textContent = text;
+        }
+    }
+
+    function renderStatus(cell, data) {
+        var badge = document.createElement('span');
+        badge.className = 'badge rounded-pill ' + (BADGE_CLASSES[data.s] || 'bg-secondary');
+        badge.textContent = data.s;
+        cell.replaceChildren(badge);
+        if (data.f > 1) {
+            var failures = document.createElement('small');
+            failures.className = 'text-muted d-block';
+            failures.title = '连续失败次数';
+            failures.textContent = '×' + data.f;
+            cell.appendChild(failures);
+        }
+    }
+
+    var source = new EventSource(script.dataset.streamUrl);
+
+    source.addEventListener('status', function (event) {
+        var data = JSON.parse(event.data);
+        var row = document.getElementById('target-' + data.id);
+        if (!row) {
+            reload(); // 页面上还没有这个目标 (例如刚添加)
+            return;
+        }
+        var statusCell = row.querySelector('[data-field="status"]');
+        if (statusCell) {
+            renderStatus(statusCell, data);
+        }
+        setText(row, 'code', data.c === null ? 'N/A' : String(data.c));
+        setText(row, 'ms', data.ms === null ? 'N/A' : Math.round(data.ms).toString());
+        setText(row, 'checked', data.t ? data.t + ' UTC' : 'N/A');
+    });
+
+    // 目标被添加、删除或暂停/激活，或者错过了部分事件：重新加载整个页面
+    source.addEventListener('refresh', reload);
+    source.addEventListener('reset', reload);
+})();
@@ -0,0 +1,301 @@
+import collections
+import json
+import threading
+from typing import NamedTuple, Optional
+from datetime import datetime
+
+from app import logger # 从 app/__init__.py 中导入预配置的 logger
+from app.metrics import counter, gauge
+
+
+class StatusChange(NamedTuple):
+    """
+    一个目标当前状态的变化，由结果写入器在每批提交后产生，或由轮询线程从 target_status 表读出。
+    """
+    target_id: int
+    status_text: str
+    status_code: Optional[int]
+    response_time_ms: Optional[float]
+    checked_at: Optional[datetime]
+    consecutive_failures: int
+    version: int # 写入该状态时的 results_version
+
+
+def encode_event(event, data, event_id=None):
+    """
+    编码一条 Server-Sent Events 消息。
+    """
+    head = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{head}event: {event}\ndata: {data}\n\n".encode('utf-8')
+
+
+def encode_change(change):
+    """
+    把 StatusChange 编码为紧凑的 status 事件 (JSON 字段名尽量短，每个订阅者共享同一份字节串)。
+    """
+    data = json.dumps({
+        'id': change.target_id,
+        's': change.status_text,
+        'c': change.status_code,
+        'ms': change.response_time_ms,
+        'f': change.consecutive_failures,
+        't': change.checked_at.strftime('%Y-%m-%d %H:%M:%S') if change.checked_at else None,
+    }, separators=(',', ':'))
+    return encode_event('status', data, change.version)
+
+
+RESET_EVENT = encode_event('reset', '{}') # 客户端错过了事件 (消费过慢或重连间隔过长)，需要重新加载页面
+REFRESH_EVENT = 'refresh' # 目标列表发生变化，需要重新加载页面
+
+
+class StatusSubscriber:
+    """
+    一个 SSE 客户端的待发送缓冲区。缓冲区有上限：
+    客户端消费太慢导致积压超过 max_pending 条时，丢弃积压并把它标记为已掉队，由 StatusHub 移除。
+    """
+
+    def __init__(self, max_pending=256):
+        self.max_pending = max_pending
+        self.dropped = False
+        self._pending = collections.deque()
+        self._condition = threading.Condition()
+
+    def offer(self, frame):
+        """
+        放入一条已编码的消息，不会阻塞发布方。
+        :return: 缓冲区已满 (客户端掉队) 时返回 False。
+        """
+        with self._condition:
+            if self.dropped:
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.dropped = True
+                self._pending.clear()
+                self._condition.notify()
+                return False
+            self._pending.append(frame)
+            self._condition.notify()
+            return True
+
+    def take(self, timeout):
+        """
+        等待并取出全部待发送的消息，超时返回空列表；客户端已掉队时返回 None。
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending or self.dropped, timeout)
+            if self.dropped:
+                return None
+            frames = list(self._pending)
+            self._pending.clear()
+            return frames
+
+
+class StatusHub:
+    """
+    进程内的状态变化分发中心 (一对多)。
+
+    状态变化有两个来源：同一进程内的结果写入器 (RUN_EMBEDDED_WORKER) 在每批提交后直接发布，
+    不需要任何数据库查询；探测 worker 在其他进程时，由一个轮询线程每隔 poll_interval 秒读取一次
+    pipeline_state 中的版本号，版本变化时才从 target_status 读取 version 更大的行。
+    轮询开销只与 Web 进程数有关，与打开的页面数无关。
+
+    每条变化只编码一次，再放入各订阅者有上限的缓冲区；最近的 replay_size 条消息保留在内存中，
+    供刚加载页面或短暂断线重连的客户端补发。
+    """
+
+    def __init__(self, buffer_size=256, replay_size=1000, poll_interval=2, keepalive=15):
+        self.buffer_size = buffer_size # 每个订阅者最多积压的消息数
+        self.replay_size = replay_size # 保留用于补发的最近消息数
+        self.poll_interval = poll_interval # 轮询数据库版本号的间隔(秒)
+        self.keepalive = keepalive # 没有消息时发送心跳注释的间隔(秒)
+
+        self.app = None
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._replay = collections.deque() # [(version, frame)]
+        self._floor = None # 版本号不大于它的消息已不在补发缓冲区中；None 表示尚未开始
+        self._last_version = 0 # 已发布的最大 results_version
+        self._targets_version = None
+        self._poller = None
+        self._stop_event = threading.Event()
+
+        self.published = 0 # 已发布的状态变化条数
+        self.delivered = 0 # 放入订阅者缓冲区的消息条数
+        self.dropped_subscribers = 0 # 因消费过慢被移除的订阅者数
+        self.polls = 0 # 轮询线程读取版本号的次数
+
+    def init_app(self, app):
+        """
+        绑定Flask应用并从配置中读取缓冲区和轮询参数。
+        """
+        self.app = app
+        self.buffer_size = app.config.get('STATUS_STREAM_BUFFER', self.buffer_size)
+        self.replay_size = app.config.get('STATUS_STREAM_REPLAY', self.replay_size)
+        self.poll_interval = app.config.get('STATUS_STREAM_POLL_SECONDS', self.poll_interval)
+        self.keepalive = app.config.get('STATUS_STREAM_KEEPALIVE_SECONDS', self.keepalive)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def _activate(self):
+        # 第一个订阅者到来时才读取起始版本号并启动轮询线程，避免 flask 命令行等场景访问数据库
+        from app.pipeline_state import current_versions, RESULTS_VERSION, TARGETS_VERSION
+        versions = current_versions()
+        self._floor = self._last_version = max(self._last_version, versions.get(RESULTS_VERSION, 0))
+        self._targets_version = versions.get(TARGETS_VERSION, 0)
+        if self.poll_interval and self.app is not None:
+            self._stop_event.clear()
+            self._poller = threading.Thread(target=self._poll_loop, name='status-stream-poller', daemon=True)
+            self._poller.start()
+        logger.info(f"状态推送已启动: 起始版本 {self._floor}, 轮询间隔 {self.poll_interval} 秒。")
+
+    def subscribe(self, since=None):
+        """
+        注册一个订阅者 (需要在应用上下文中调用)。
+        :param since: 客户端已看到的 results_version；补发缓冲区覆盖该版本之后的全部消息时立即补发，
+                      否则让客户端重新加载页面。为 None 时只接收之后的新消息。
+        :return: StatusSubscriber 实例。
+        """
+        subscriber = StatusSubscriber(self.buffer_size)
+        with self._lock:
+            if self._floor is None:
+                self._activate()
+            if since is not None and since < self._last_version:
+                if since >= self._floor:
+                    for version, frame in self._replay:
+                        if version > since:
+                            subscriber.offer(frame)
+                else:
+                    subscriber.offer(RESET_EVENT)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, changes):
+        """
+        发布一批状态变化 (结果写入器的 change_handler)，不访问数据库，不会因为慢客户端而阻塞。
+        版本号不大于已发布版本的变化会被忽略，因此直接发布和轮询线程读到同一批变化时不会重复推送。
+        """
+        with self._lock:
+            if self._floor is None:
+                return # 还没有订阅者
+            frames = []
+            for change in changes:
+                if change.version <= self._last_version:
+                    continue
+                frame = encode_change(change)
+                frames.append(frame)
+                self._remember(change.version, frame)
+            if not frames:
+                return
+            self._last_version = max(self._last_version, max(change.version for change in changes))
+            self._fan_out(frames)
+            self.published += len(frames)
+
+    def publish_refresh(self, version):
+        """
+        通知所有订阅者目标列表已变化，需要重新加载页面。
+        """
+        frame = encode_event(REFRESH_EVENT, '{}', version)
+        with self._lock:
+            self._remember(version, frame)
+            self._fan_out([frame])
+
+    def _remember(self, version, frame):
+        # 调用方需持有 self._lock；补发缓冲区满时淘汰最旧的消息并抬高可补发的起点
+        if len(self._replay) >= self.replay_size:
+            self._floor = max(self._floor, self._replay.popleft()[0])
+        self._replay.append((version, frame))
+
+    def _fan_out(self, frames):
+        # 调用方需持有 self._lock
+        slow = []
+        for subscriber in self._subscribers:
+            for frame in frames:
+                if not subscriber.offer(frame):
+                    slow.append(subscriber)
+                    break
+                self.delivered += 1
+        for subscriber in slow:
+            self._subscribers.discard(subscriber)
+        if slow:
+            self.dropped_subscribers += len(slow)
+            logger.warning(f"{len(slow)} 个状态推送客户端消费过慢，已断开 (缓冲上限 {self.buffer_size} 条)。")
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self._poller is not None:
+            self._poller.join(timeout)
+            self._poller = None
+
+    def _poll_loop(self):
+        while not self._stop_event.wait(self.poll_interval):
+            with self.app.app_context():
+                try:
+                    self.poll()
+                except Exception as e:
+                    from app import db
+                    db.session.rollback()
+                    logger.error(f"状态推送轮询数据库时发生错误: {e}", exc_info=True)
+
+    def poll(self):
+        """
+        读取一次数据库中的版本号 (需要在应用上下文中调用)，有变化时读取并发布新的状态。
+        没有订阅者时跳过。
+        :return: 发布的状态变化条数。
+        """
+        if not self._subscribers:
+            return 0
+        from app import db
+        from app.models import TargetStatus
+        from app.pipeline_state import current_versions, RESULTS_VERSION, TARGETS_VERSION
+        self.polls += 1
+        versions = current_versions()
+        published = 0
+        if versions.get(RESULTS_VERSION, 0) > self._last_version:
+            rows = db.session.execute(
+                db.select(TargetStatus.target_id, TargetStatus.status_text, TargetStatus.status_code,
+                          TargetStatus.response_time_ms, TargetStatus.checked_at,
+                          TargetStatus.consecutive_failures, TargetStatus.version)
+                .where(TargetStatus.version > self._last_version)
+                .order_by(TargetStatus.version)
+            ).all()
+            changes = [StatusChange(*row) for row in rows]
+            published = len(changes)
+            if changes:
+                self.publish(changes)
+            with self._lock:
+                self._last_version = max(self._last_version, versions.get(RESULTS_VERSION, 0))
+        db.session.rollback() # 结束只读事务，下一次轮询能看到其他进程新提交的数据
+        targets_version = versions.get(TARGETS_VERSION, 0)
+        if targets_version != self._targets_version:
+            self._targets_version = targets_version
+            self.publish_refresh(versions.get(RESULTS_VERSION, 0))
+        return published
+
+    def stats(self):
+        """
+        返回订阅者数、发布和投递的消息数等统计。
+        """
+        return {
+            'subscribers': len(self._subscribers),
+            'last_version': self._last_version,
+            'published': self.published,
+            'delivered': self.delivered,
+            'dropped_subscribers': self.dropped_subscribers,
+            'polls': self.polls,
+        }
+
+    def collect_metrics(self):
+        """
+        返回状态推送的 Prometheus 指标文本行。
+        """
+        return (gauge('webpulse_status_stream_subscribers', '当前的状态推送订阅者数', len(self._subscribers))
+                + counter('webpulse_status_stream_published_total', '已发布的状态变化条数', self.published)
+                + counter('webpulse_status_stream_delivered_total', '放入订阅者缓冲区的消息条数', self.delivered)
+                + counter('webpulse_status_stream_dropped_subscribers_total', '因消费过慢被断开的订阅者数',
+                          self.dropped_subscribers))
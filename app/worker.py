@@ -0,0 +1,383 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, delete, or_, select
+
+from app import db, logger # 从 app/__init__.py 中导入 db 实例和预配置的 logger
+from app.metrics import counter, gauge
+from app.models import MonitoredTarget, ProbeWorker
+from app.pipeline_state import current_version, TARGETS_VERSION
+from app.rollups import to_utc_naive
+from app.scheduler_jobs import query_schedule_rows
+from app.sharding import HashRing
+
+_ID_CHUNK = 500 # 每条 IN 语句最多包含的ID数 (SQLite 对绑定参数的个数有限制)
+_MAINTENANCE_KEY = 'maintenance' # 哈希环上负责此键的 worker 执行数据保留等维护任务
+
+
+def _utcnow():
+    return to_utc_naive(datetime.now(timezone.utc))
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), _ID_CHUNK):
+        yield ids[start:start + _ID_CHUNK]
+
+
+class CheckWorker:
+    """
+    可水平扩展的探测 worker。
+
+    每个 worker 定期在 probe_worker 表中心跳，心跳未超时的 worker 组成一致性哈希环，
+    按目标ID划分各自负责的目标。worker 只调度自己持有有效租约的目标：
+    租约通过带条件的 UPDATE 获取 (仅当目标无人持有、已归自己或租约过期时才能拿到)，
+    因此同一时刻每个目标最多被一个 worker 检查。
+    有 worker 加入时，原持有者在下一次心跳释放划出的目标，新 worker 随后接手；
+    worker 异常退出时，它的租约在 lease_seconds 秒后过期，由其他 worker 接手。
+
+    调度内容按“期望状态 (数据库中的目标) 与调度器中的实际状态对账”的方式维护：
+    启动、成员变化时全量对账；平时的心跳只续租，目标的增删改通过 targets_version 变化通知，
+    由 reconcile 只读取变化的目标并增量更新调度器。
+    指派给远程探测代理 (agent_id 不为空) 的目标不参与划分，由代理自己检查。
+    """
+
+    def __init__(self, dispatcher=None, heartbeat_interval=10, lease_seconds=30, poll_interval=2,
+                 dead_after=30, full_reconcile_interval=300, worker_id=None):
+        self.dispatcher = dispatcher
+        self.heartbeat_interval = heartbeat_interval # 心跳和重新划分目标的间隔(秒)
+        self.lease_seconds = lease_seconds # 租约有效期(秒)，应明显大于心跳间隔
+        self.poll_interval = poll_interval # 检查“立即检查”请求的间隔(秒)
+        self.dead_after = dead_after # 超过这么多秒没有心跳的 worker 视为已退出
+        self.full_reconcile_interval = full_reconcile_interval # 即使没有变化通知，也至少每隔这么多秒全量对账一次
+        self.worker_id = worker_id
+
+        self.app = None
+        self._ring = HashRing()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._last_renewed = None # 最近一次成功续租的时间 (time.monotonic())
+        self._targets_version = None # 调度内容已同步到的 targets_version；None 表示尚未全量对账
+        self._settled_at = None # 最近一次全量对账并领到全部目标的时间；None 表示下一次心跳需要全量对账
+
+        self.heartbeats = 0 # 成功的心跳次数
+        self.leased = 0 # 当前持有租约的目标数
+
+    def init_app(self, app, dispatcher):
+        """
+        绑定Flask应用和检查调度器，并从配置中读取心跳与租约参数。
+        """
+        self.app = app
+        self.dispatcher = dispatcher
+        self.heartbeat_interval = app.config.get('WORKER_HEARTBEAT_SECONDS', self.heartbeat_interval)
+        self.lease_seconds = app.config.get('WORKER_LEASE_SECONDS', self.lease_seconds)
+        self.poll_interval = app.config.get('WORKER_POLL_SECONDS', self.poll_interval)
+        self.dead_after = app.config.get('WORKER_DEAD_AFTER_SECONDS', self.dead_after)
+        self.full_reconcile_interval = app.config.get('WORKER_FULL_RECONCILE_SECONDS', self.full_reconcile_interval)
+        self.worker_id = self.worker_id or app.config.get('WORKER_ID') or \
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def is_leader(self):
+        """
+        当前 worker 是否负责执行维护任务 (整个集群中只有一个)。
+        """
+        return self._ring.owner(_MAINTENANCE_KEY) == self.worker_id
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._targets_version = self._settled_at = None
+        self._thread = threading.Thread(target=self._run, name='check-worker', daemon=True)
+        self._thread.start()
+        logger.info(f"探测 worker {self.worker_id} 已启动: 心跳间隔 {self.heartbeat_interval} 秒, 租约 {self.lease_seconds} 秒。")
+
+    def stop(self, timeout=10):
+        """
+        停止心跳，释放持有的全部租约并注销 worker，使其他 worker 可以立即接手。
+        """
+        if not self.running:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self.dispatcher.clear()
+        with self.app.app_context():
+            try:
+                table = MonitoredTarget.__table__
+                released = db.session.execute(
+                    table.update().where(table.c.lease_owner == self.worker_id)
+                    .values(lease_owner=None, lease_expires_at=None)).rowcount
+                db.session.execute(delete(ProbeWorker).where(ProbeWorker.id == self.worker_id))
+                db.session.commit()
+                logger.info(f"探测 worker {self.worker_id} 已停止，释放了 {released} 个目标的租约。")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"探测 worker {self.worker_id} 停止时释放租约失败: {e}", exc_info=True)
+
+    def _run(self):
+        next_heartbeat = 0
+        while not self._stop_event.is_set():
+            with self.app.app_context():
+                if time.monotonic() >= next_heartbeat:
+                    next_heartbeat = time.monotonic() + self.heartbeat_interval
+                    try:
+                        self.heartbeat()
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f"探测 worker {self.worker_id} 心跳失败: {e}", exc_info=True)
+                        self._check_lease_lost()
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    db.session.rollback()
+                    self._settled_at = None # 增量对账失败时，下一次心跳改为全量对账
+                    logger.error(f"探测 worker {self.worker_id} 同步目标变化时发生错误: {e}", exc_info=True)
+                try:
+                    self.poll_requests()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"探测 worker {self.worker_id} 处理立即检查请求时发生错误: {e}", exc_info=True)
+            self._stop_event.wait(self.poll_interval)
+
+    def collect_metrics(self):
+        """
+        返回 worker 租约和心跳的 Prometheus 指标文本行。
+        """
+        return (gauge('webpulse_worker_leased_targets', '当前 worker 持有租约的目标数', self.leased)
+                + counter('webpulse_worker_heartbeats_total', '成功的心跳次数', self.heartbeats))
+
+    def _check_lease_lost(self):
+        # 长时间无法续租时，租约可能已被其他 worker 接手，暂停全部检查以免重复检查
+        if self._last_renewed is not None and time.monotonic() - self._last_renewed > self.lease_seconds \
+                and len(self.dispatcher):
+            self.dispatcher.clear()
+            self._settled_at = None
+            logger.warning(f"探测 worker {self.worker_id} 超过 {self.lease_seconds} 秒未能续租，已暂停全部检查，等待恢复后重新获取租约。")
+
+    def _check_segment_hosts(self, live):
+        # 段文件保存在本机目录，worker 分布在多台主机时原始历史会分散在各主机上，报表只能读到本机的部分
+        from app import segment_store
+        if not segment_store.enabled:
+            return
+        hosts = db.session.scalars(
+            select(ProbeWorker.hostname).where(ProbeWorker.id.in_(live)).distinct()).all()
+        if len(hosts) > 1:
+            logger.error(f"RAW_HISTORY_BACKEND=segments 要求所有探测 worker 运行在同一台主机上，"
+                         f"当前存活的 worker 分布在 {len(hosts)} 台主机: {sorted(hosts)}。"
+                         f"请改用 RAW_HISTORY_BACKEND=check_log，或只在一台主机上运行 worker。")
+
+    def heartbeat(self):
+        """
+        执行一轮心跳 (需要在应用上下文中调用)：更新自己的心跳时间，根据存活的 worker 重建哈希环并续租。
+        成员没有变化时只用一条 UPDATE 续租，目标的增删改由 reconcile 增量同步；
+        首次心跳、成员变化、上一轮有目标未能领到，或距上次全量对账超过 full_reconcile_interval 秒时，
+        重新划分全部目标并全量对账 (见 rebalance)。
+
+        :return: 当前持有租约的目标数。
+        """
+        now = _utcnow()
+        expires = now + timedelta(seconds=self.lease_seconds)
+
+        if not db.session.execute(
+                ProbeWorker.__table__.update().where(ProbeWorker.id == self.worker_id)
+                .values(heartbeat_at=now)).rowcount:
+            db.session.add(ProbeWorker(id=self.worker_id, hostname=socket.gethostname(), pid=os.getpid(),
+                                       started_at=now, heartbeat_at=now))
+            db.session.flush()
+        live = db.session.scalars(
+            select(ProbeWorker.id).where(ProbeWorker.heartbeat_at >= now - timedelta(seconds=self.dead_after))).all()
+        # 清理早已退出的 worker 留下的记录
+        db.session.execute(delete(ProbeWorker).where(
+            ProbeWorker.heartbeat_at < now - timedelta(seconds=self.dead_after * 10)))
+        full = self._settled_at is None or time.monotonic() - self._settled_at >= self.full_reconcile_interval
+        if set(live) != self._ring.members:
+            self._ring = HashRing(live)
+            full = True
+            logger.info(f"探测 worker 成员变化，当前共 {len(live)} 个: {sorted(live)}，重新划分目标。")
+            self._check_segment_hosts(live)
+
+        if not full:
+            table = MonitoredTarget.__table__
+            renewed = db.session.execute(
+                table.update().where(table.c.lease_owner == self.worker_id)
+                .values(lease_expires_at=expires)).rowcount
+            # 续租的目标数与调度中的目标数不一致 (例如数据库被直接修改而没有发出变化通知)，改为全量对账
+            full = renewed != len(self.dispatcher)
+            if full:
+                logger.info(f"探测 worker {self.worker_id} 续租了 {renewed} 个目标，但调度中有 {len(self.dispatcher)} 个，改为全量对账。")
+        if full:
+            return self.rebalance(now, expires)
+
+        load = self.dispatcher.load_stats()
+        db.session.execute(
+            ProbeWorker.__table__.update().where(ProbeWorker.id == self.worker_id)
+            .values(target_count=self.leased, nominal_checks_per_min=load['nominal_checks_per_min'],
+                    effective_checks_per_min=load['effective_checks_per_min']))
+        db.session.commit()
+        self._last_renewed = time.monotonic()
+        self.heartbeats += 1
+        return self.leased
+
+    def rebalance(self, now, expires):
+        """
+        全量对账 (在心跳的事务中调用)：按哈希环获取归自己负责的全部目标的租约，释放划给其他 worker 的目标，
+        再把自己持有的全部目标与调度器比对，只装入新增或配置变化的目标、移除多余的目标。
+        :return: 当前持有租约的目标数。
+        """
+        table = MonitoredTarget.__table__
+        targets_version = current_version(TARGETS_VERSION) # 先于目标读取，之后的变化会在下一次 reconcile 中同步
+
+        if self._ring.members == {self.worker_id}:
+            # 只有一个 worker 时所有激活的目标都归自己，无需逐个计算归属
+            mine_count = db.session.scalar(
+                select(db.func.count()).select_from(table).where(table.c.is_active.is_(True), table.c.agent_id.is_(None)))
+            moved = []
+            db.session.execute(
+                table.update()
+                .where(table.c.is_active.is_(True), table.c.agent_id.is_(None),
+                       or_(table.c.lease_owner.is_(None), table.c.lease_owner == self.worker_id,
+                           table.c.lease_expires_at < now))
+                .values(lease_owner=self.worker_id, lease_expires_at=expires))
+        else:
+            mine, moved = [], []
+            for target_id, owner in db.session.execute(
+                    select(table.c.id, table.c.lease_owner).where(table.c.is_active.is_(True), table.c.agent_id.is_(None))):
+                if self._ring.owner(target_id) == self.worker_id:
+                    mine.append(target_id)
+                elif owner == self.worker_id:
+                    moved.append(target_id)
+            mine_count = len(mine)
+            for chunk in _chunks(mine):
+                db.session.execute(
+                    table.update()
+                    .where(table.c.id.in_(chunk),
+                           or_(table.c.lease_owner.is_(None), table.c.lease_owner == self.worker_id,
+                               table.c.lease_expires_at < now))
+                    .values(lease_owner=self.worker_id, lease_expires_at=expires))
+            for chunk in _chunks(moved):
+                db.session.execute(
+                    table.update().where(table.c.id.in_(chunk), table.c.lease_owner == self.worker_id)
+                    .values(lease_owner=None, lease_expires_at=None))
+        # 已暂停或已指派给远程探测代理的目标同样释放租约
+        db.session.execute(
+            table.update().where(table.c.lease_owner == self.worker_id,
+                                 or_(table.c.is_active.is_(False), table.c.agent_id.is_not(None)))
+            .values(lease_owner=None, lease_expires_at=None))
+
+        owned = query_schedule_rows(table.c.lease_owner == self.worker_id)
+        load = self.dispatcher.load_stats() # 上一轮同步后的调度状态
+        db.session.execute(
+            ProbeWorker.__table__.update().where(ProbeWorker.id == self.worker_id)
+            .values(target_count=len(owned), nominal_checks_per_min=load['nominal_checks_per_min'],
+                    effective_checks_per_min=load['effective_checks_per_min']))
+        db.session.commit()
+        self._last_renewed = time.monotonic()
+        self.heartbeats += 1
+        self._targets_version = targets_version
+        # 有目标仍被其他 worker 持有 (对方会在下一次心跳释放) 时，下一次心跳继续全量对账
+        self._settled_at = time.monotonic() if len(owned) >= mine_count else None
+
+        added, removed = self.dispatcher.sync(owned)
+        if added or removed or len(owned) != self.leased:
+            logger.info(f"探测 worker {self.worker_id} 持有 {len(owned)} 个目标的租约 "
+                        f"(本轮负责 {mine_count} 个，释放 {len(moved)} 个；调度新增/更新 {added} 个，移除 {removed} 个；"
+                        f"检查频率 {load['effective_checks_per_min']}/{load['nominal_checks_per_min']} 次/分钟)。")
+        self.leased = len(owned)
+        return self.leased
+
+    def reconcile(self):
+        """
+        按变化通知增量对账 (需要在应用上下文中调用)。targets_version 与上次对账时相同则直接返回；
+        否则只读取 config_version 更大的目标，领取或释放它们的租约，把新增或修改的目标装入调度器，
+        并把已删除、已暂停或不再归自己负责的目标移出调度。
+        :return: (装入或更新的目标数, 移除的目标数)；没有变化或尚未全量对账时返回 None。
+        """
+        if self._targets_version is None:
+            return None
+        targets_version = current_version(TARGETS_VERSION)
+        if targets_version == self._targets_version:
+            db.session.rollback() # 结束只读事务，下一次能看到其他进程新提交的变化
+            return None
+
+        now = _utcnow()
+        table = MonitoredTarget.__table__
+        changed = db.session.execute(
+            select(table.c.id, table.c.is_active, table.c.lease_owner, table.c.agent_id)
+            .where(table.c.config_version > self._targets_version)).all()
+        acquire = [row.id for row in changed
+                   if row.is_active and row.agent_id is None and self._ring.owner(row.id) == self.worker_id]
+        wanted = set(acquire)
+        release = [row.id for row in changed if row.lease_owner == self.worker_id and row.id not in wanted]
+        for chunk in _chunks(acquire):
+            db.session.execute(
+                table.update()
+                .where(table.c.id.in_(chunk),
+                       or_(table.c.lease_owner.is_(None), table.c.lease_owner == self.worker_id,
+                           table.c.lease_expires_at < now))
+                .values(lease_owner=self.worker_id, lease_expires_at=now + timedelta(seconds=self.lease_seconds)))
+        for chunk in _chunks(release):
+            db.session.execute(
+                table.update().where(table.c.id.in_(chunk), table.c.lease_owner == self.worker_id)
+                .values(lease_owner=None, lease_expires_at=None))
+        rows = []
+        for chunk in _chunks(acquire):
+            rows.extend(query_schedule_rows(table.c.id.in_(chunk), table.c.lease_owner == self.worker_id))
+        owned_filter = (table.c.lease_owner == self.worker_id, table.c.is_active.is_(True))
+        owned_count = db.session.scalar(select(db.func.count()).select_from(table).where(*owned_filter))
+        loaded = {row.id for row in rows}
+        # 已暂停、已指派给远程探测代理、不再归自己负责或未能领到的目标移出调度
+        added, removed = self.dispatcher.apply(rows, [row.id for row in changed if row.id not in loaded])
+        if len(self.dispatcher) > owned_count:
+            # 有目标被删除 (删除的行不会出现在变化列表中)，只读ID找出调度中多余的目标
+            owned = set(db.session.scalars(select(table.c.id).where(*owned_filter)).all())
+            removed += self.dispatcher.apply(
+                (), [target_id for target_id in self.dispatcher.target_ids() if target_id not in owned])[1]
+        db.session.commit()
+        self._targets_version = targets_version
+        if len(rows) < len(acquire) or len(self.dispatcher) != owned_count:
+            self._settled_at = None # 有目标仍被其他 worker 持有或调度与租约不一致，下一次心跳全量对账
+
+        self.leased = owned_count
+        if added or removed:
+            logger.info(f"探测 worker {self.worker_id} 同步目标变化 (版本 {targets_version}): "
+                        f"调度新增/更新 {added} 个，移除 {removed} 个，当前持有 {owned_count} 个目标。")
+        return added, removed
+
+    def poll_requests(self):
+        """
+        执行用户通过页面请求的立即检查 (只处理自己持有租约的目标)，执行后清空请求时间。
+        :return: 触发的检查数。
+        """
+        table = MonitoredTarget.__table__
+        requests = db.session.execute(
+            select(table.c.id, table.c.check_requested_at)
+            .where(table.c.check_requested_at.is_not(None), table.c.lease_owner == self.worker_id)).all()
+        triggered = [row for row in requests if self.dispatcher.run_now(row.id)]
+        if triggered:
+            # 只清空本次读到的请求，处理期间新到的请求留到下一轮
+            db.session.execute(
+                table.update()
+                .where(table.c.id == bindparam('b_id'), table.c.check_requested_at <= bindparam('b_requested'))
+                .values(check_requested_at=None),
+                [{'b_id': row.id, 'b_requested': row.check_requested_at} for row in triggered])
+        db.session.commit()
+        return len(triggered)
+
+    def run_maintenance(self):
+        """
+        由 APScheduler 定期调用：只有哈希环上负责维护任务的 worker 才执行数据保留任务。
+        """
+        if not self.is_leader:
+            return None
+        from app.retention import run_compaction
+        return run_compaction(self.app)
@@ -0,0 +1,132 @@
+"""
+自适应检查频率基准测试：用不访问网络的模拟探测引擎，在缩短的时间尺度上对比固定间隔与自适应模式下的
+检查次数、记录的故障数 (其中由瞬时抖动造成的误报数)，以及真实故障从发生到被记录、从恢复到被记录的延迟。
+
+模拟中一部分目标在随机时刻出现短暂抖动 (短于确认重试的总时长)，另一部分出现持续较长的真实故障。
+
+用法: python benchmarks/bench_adaptive.py --targets 2000 --interval 2 --duration 40
+"""
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from common import percentile
+from app.dispatcher import CheckDispatcher
+from app.probe_engine import ProbeResult
+
+# 与 scheduler_jobs.query_schedule_rows 查询出的行具有相同的列
+TargetRow = collections.namedtuple(
+    'TargetRow', 'id name url check_interval_seconds check_method max_body_bytes body_keyword body_sha256 '
+                 'force_fresh_connection probe_type probe_params', defaults=('http', None))
+
+
+class SimulatedEngine:
+    """
+    按预先生成的故障时间窗同步返回检查结果的探测引擎替身。
+    """
+
+    def __init__(self, windows, begin):
+        self.windows = windows # target_id -> [(开始, 结束, 是否为真实故障)]，时间相对 begin
+        self.begin = begin
+        self.result_handler = None
+        self.submitted = 0
+
+    def submit(self, targets):
+        now = time.monotonic() - self.begin
+        self.submitted += len(targets)
+        for target in targets:
+            down = any(start <= now < end for start, end, _ in self.windows.get(target.id, ()))
+            self.result_handler(ProbeResult(target.id, datetime.now(timezone.utc), None if down else 200,
+                                            'DOWN' if down else 'UP', 1.0, '', 0.0, target.name))
+
+
+def make_windows(targets, duration, blip_ratio, outage_ratio, blip_seconds, outage_seconds, seed):
+    rng = random.Random(seed)
+    windows = {}
+    for target_id in range(targets):
+        roll = rng.random()
+        if roll < blip_ratio:
+            start = rng.uniform(duration * 0.3, duration * 0.8)
+            windows[target_id] = [(start, start + blip_seconds, False)]
+        elif roll < blip_ratio + outage_ratio:
+            start = rng.uniform(duration * 0.3, duration * 0.6)
+            windows[target_id] = [(start, start + outage_seconds, True)]
+    return windows
+
+
+def run(adaptive, args, windows):
+    begin = time.monotonic()
+    engine = SimulatedEngine(windows, begin)
+    recorded = []
+    lock = threading.Lock()
+
+    def on_result(result):
+        with lock:
+            recorded.append((time.monotonic() - begin, result.target_id, result.status_text))
+
+    dispatcher = CheckDispatcher(engine, result_handler=on_result, adaptive=adaptive,
+                                 max_interval=args.interval * args.max_factor, backoff_after=3, backoff_factor=2,
+                                 confirm_retries=2, retry_delay=args.retry_delay, recovery_checks=3,
+                                 recovery_interval=args.retry_delay)
+    engine.result_handler = dispatcher.handle_result
+    dispatcher.load(TargetRow(i, f'sim-{i}', f'http://sim.invalid/{i}', args.interval, 'GET', 65536, None, None, False)
+                    for i in range(args.targets))
+    dispatcher.start()
+    time.sleep(args.duration)
+    stats = dispatcher.load_stats()
+    dispatcher.stop()
+
+    failures = [(ts, target_id) for ts, target_id, status in recorded if status != 'UP']
+    false_alarms = sum(1 for _, target_id in failures if not windows.get(target_id, [(0, 0, True)])[0][2])
+    detect, recover = [], []
+    for target_id, spans in windows.items():
+        start, end, real = spans[0]
+        if not real:
+            continue
+        first_down = min((ts for ts, tid in failures if tid == target_id and ts >= start), default=None)
+        if first_down is not None:
+            detect.append(first_down - start)
+        first_up = min((ts for ts, tid, status in recorded if tid == target_id and status == 'UP' and ts >= end),
+                       default=None)
+        if first_up is not None:
+            recover.append(first_up - end)
+    return {
+        'mode': 'adaptive' if adaptive else 'fixed',
+        'checks': engine.submitted,
+        'checks_per_min': round(engine.submitted / args.duration * 60, 1),
+        'recorded_results': len(recorded),
+        'recorded_failures': len(failures),
+        'false_alarm_failures': false_alarms,
+        'detect_p50_s': round(percentile(detect, 50) or 0, 2),
+        'detect_max_s': round(max(detect, default=0), 2),
+        'recover_p50_s': round(percentile(recover, 50) or 0, 2),
+        'recover_max_s': round(max(recover, default=0), 2),
+        'load': stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--targets', type=int, default=2000)
+    parser.add_argument('--interval', type=int, default=2, help='所有目标配置的检查间隔(秒)')
+    parser.add_argument('--max-factor', type=int, default=8, help='自适应模式的最大间隔为配置间隔的倍数')
+    parser.add_argument('--retry-delay', type=float, default=0.5, help='第一次确认重试的延迟和恢复后复查的间隔(秒)')
+    parser.add_argument('--duration', type=float, default=40)
+    parser.add_argument('--blip-ratio', type=float, default=0.1, help='出现短暂抖动的目标比例')
+    parser.add_argument('--outage-ratio', type=float, default=0.02, help='出现真实故障的目标比例')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    windows = make_windows(args.targets, args.duration, args.blip_ratio, args.outage_ratio,
+                           blip_seconds=args.retry_delay, outage_seconds=args.interval * args.max_factor,
+                           seed=args.seed)
+    for adaptive in (False, True):
+        print(json.dumps(run(adaptive, args, windows), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+远程探测代理的本机多代理测试：启动带代理接口的 Web 应用、模拟目标集群和若干个远程代理 (RemoteProbeAgent)，
+目标平均指派给各代理。运行期间每隔 --drop-every 个上传请求丢弃一次服务器的响应 (服务器已经写入，
+代理收到 503 后以同一批次ID重试)；运行到一半时把一部分目标改派给下一个代理、暂停一部分目标并新增一批目标，
+检验基于 ETag 的增量同步。结束后核对：
+  * 没有重复写入的检查 (同一目标同一时间戳只有一行)，重试的批次都被识别为重复；
+  * 每行 check_log 的 agent_id 与写入时目标指派的代理一致 (改派的目标在改派前后分别核对)；
+  * 暂停的目标在代理同步后不再产生检查，新增的目标由指派的代理检查；
+  * 各代理报告的已写入结果数、probe_agent 表的统计与 check_log 的行数一致；
+  * 代理在本地评估告警 (与 agent.py 相同，调度器 -> 告警引擎 -> 上传)：指向已关闭端口的目标发出了故障通知。
+并输出检查吞吐量、上传批次的压缩率、服务器写入每批的耗时和同步请求中 304 的比例。
+
+用法: python benchmarks/bench_agents.py --agents 3 --targets 300 --seconds 30
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+from werkzeug.serving import make_server
+
+from common import make_bench_app, percentile
+from fake_farm import FakeTargetFarm
+from app import db
+from app.alerts import AlertEngine, DOWN
+from app.dispatcher import CheckDispatcher
+from app.models import MonitoredTarget, CheckLog, ProbeAgent, AgentBatch
+from app.pipeline_state import bump_version, mark_targets_changed, RESULTS_VERSION, TARGETS_VERSION
+from app.probe_engine import ProbeEngine
+from app.remote_agent import RESULTS_PATH, RemoteProbeAgent
+
+TOKEN = 'bench-token'
+
+
+class DropResponses:
+    """
+    WSGI 中间件：记录上传请求在服务器上的处理耗时，并且每 every 个上传请求照常处理 (写入数据库) 后
+    把响应换成 503，模拟响应在网络中丢失。
+    """
+
+    def __init__(self, app, every):
+        self.app = app
+        self.every = every
+        self.requests = 0
+        self.dropped = 0
+        self.ingest_ms = []
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') != RESULTS_PATH:
+            return self.app(environ, start_response)
+        with self._lock:
+            self.requests += 1
+            drop = bool(self.every) and self.requests % self.every == 0
+        started = time.perf_counter()
+        status = []
+        body = self.app(environ, lambda code, headers, exc_info=None: status.append(code))
+        try:
+            content = b''.join(body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        self.ingest_ms.append((time.perf_counter() - started) * 1000)
+        if drop and status and status[0].startswith('200'):
+            self.dropped += 1
+            start_response('503 Service Unavailable', [('Content-Length', '0')])
+            return [b'']
+        start_response(status[0], [('Content-Type', 'application/json'), ('Content-Length', str(len(content)))])
+        return [content]
+
+
+class RecordingSink:
+    """
+    记录收到的告警通知的通知渠道。
+    """
+    name = 'bench'
+
+    def __init__(self):
+        self.events = []
+
+    def send(self, event):
+        self.events.append(event)
+
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sock.getsockname()[1]}/'
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def add_targets(urls, first_id, agent_ids, interval):
+    version = bump_version(TARGETS_VERSION, RESULTS_VERSION)
+    db.session.execute(MonitoredTarget.__table__.insert(), [
+        {'id': first_id + i, 'name': f'bench-{first_id + i}', 'url': url, 'check_interval_seconds': interval,
+         'is_active': True, 'agent_id': agent_ids[i % len(agent_ids)], 'config_version': version}
+        for i, url in enumerate(urls)])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--agents', type=int, default=3)
+    parser.add_argument('--targets', type=int, default=300)
+    parser.add_argument('--interval', type=int, default=2, help='目标的检查间隔 (秒)')
+    parser.add_argument('--seconds', type=float, default=30, help='运行时长 (秒)，一半时改派、暂停和新增目标')
+    parser.add_argument('--hosts', type=int, default=20, help='模拟的主机(端口)数量')
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--batch', type=int, default=200, help='代理每批上传的结果数')
+    parser.add_argument('--drop-every', type=int, default=7, help='每隔多少个上传请求丢弃一次响应 (0 表示不丢弃)')
+    parser.add_argument('--sync-seconds', type=float, default=1.0)
+    parser.add_argument('--database-url', default=None, help='默认使用临时目录中的 SQLite 文件')
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    workdir = tempfile.mkdtemp(prefix='webpulse-agents-')
+    bench_app = make_bench_app(args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}?timeout=30",
+                               with_routes=True)
+    bench_app.config.update(AGENT_API_TOKEN=TOKEN, CHECK_LOG_MODE='debug')
+    wsgi = DropResponses(bench_app.wsgi_app, args.drop_every)
+    bench_app.wsgi_app = wsgi
+    server = make_server('127.0.0.1', 0, bench_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    server_url = f'http://127.0.0.1:{server.server_port}'
+
+    farm = FakeTargetFarm(ports=args.hosts, latency_ms=args.latency_ms, error_rate=args.error_rate).start_in_thread()
+    urls = farm.urls(args.targets + args.targets // 10)
+    agent_ids = [f'bench-agent-{i + 1}' for i in range(args.agents)]
+    dead_id = args.targets + args.targets // 10 + 1 # 指向已关闭端口的目标，每次检查都失败
+    with bench_app.app_context():
+        add_targets(urls[:args.targets], 1, agent_ids, args.interval)
+        add_targets([closed_port_url()], dead_id, agent_ids[-1:], args.interval)
+
+    agents, pipelines = [], []
+    sink = RecordingSink()
+    for index, agent_id in enumerate(agent_ids):
+        engine = ProbeEngine(max_in_flight=200, per_host_limit=20, timeout=5, stats_log_interval=0)
+        dispatcher = CheckDispatcher(engine)
+        agent = RemoteProbeAgent(server_url, TOKEN, agent_id, f'本机-{index + 1}', dispatcher,
+                                 sync_interval=args.sync_seconds, full_sync_interval=3600, batch_size=args.batch,
+                                 flush_interval=0.5, retry_max_seconds=2)
+        alerts = AlertEngine(result_handler=agent.submit, sinks=[sink], rate_limit_per_minute=0)
+        dispatcher.result_handler = alerts.handle_result
+        dispatcher.removal_handler = alerts.forget
+        engine.result_handler = dispatcher.handle_result
+        agent.start()
+        alerts.start()
+        engine.start()
+        dispatcher.start()
+        agents.append(agent)
+        pipelines.append((dispatcher, engine, alerts))
+
+    started = time.perf_counter()
+    time.sleep(args.seconds / 2)
+
+    # 改派 id % 10 == 0 的目标给下一个代理，暂停 id % 10 == 5 的目标，并新增一批目标
+    with bench_app.app_context():
+        moved = {}
+        changed = []
+        for target in db.session.scalars(select(MonitoredTarget).where(MonitoredTarget.id <= args.targets)):
+            if target.id % 10 == 0:
+                new_agent = agent_ids[(agent_ids.index(target.agent_id) + 1) % len(agent_ids)]
+                moved[target.id] = (target.agent_id, new_agent)
+                target.agent_id = new_agent
+                changed.append(target)
+            elif target.id % 10 == 5:
+                target.is_active = False
+                changed.append(target)
+        mark_targets_changed(*changed)
+        db.session.commit()
+        changed_at = utcnow() # 提交之后记录：此前写入的都是原代理的结果，此后原代理的结果会被拒绝
+        add_targets(urls[args.targets:], args.targets + 1, agent_ids[:1], args.interval)
+
+    time.sleep(args.seconds / 2)
+    wsgi.every = 0 # 退出时每个批次只上传一次，不再丢弃响应，否则最后的批次已写入但代理不知道
+    for dispatcher, engine, alerts in pipelines:
+        dispatcher.stop()
+        engine.stop()
+        alerts.stop()
+    for agent in agents:
+        agent.stop()
+    elapsed = time.perf_counter() - started
+    farm.stop_thread()
+    server.shutdown()
+
+    with bench_app.app_context():
+        table = CheckLog.__table__
+        rows = db.session.scalar(select(func.count()).select_from(table))
+        duplicates = db.session.scalar(select(func.count()).select_from(
+            select(table.c.target_id, table.c.timestamp).group_by(table.c.target_id, table.c.timestamp)
+            .having(func.count() > 1).subquery()))
+        assignment = dict(db.session.execute(select(MonitoredTarget.id, MonitoredTarget.agent_id)).all())
+        mistagged = 0
+        grace = timedelta(seconds=args.sync_seconds * 2 + 1)
+        paused_late = 0
+        for target_id, agent_id, timestamp in db.session.execute(
+                select(table.c.target_id, table.c.agent_id, table.c.timestamp)):
+            if target_id in moved:
+                old_agent, new_agent = moved[target_id]
+                expected = old_agent if timestamp < changed_at else new_agent
+            else:
+                expected = assignment[target_id]
+            mistagged += agent_id != expected
+            if target_id <= args.targets and target_id % 10 == 5 and timestamp > changed_at + grace:
+                paused_late += 1
+        new_target_rows = db.session.scalar(select(func.count()).select_from(table).where(
+            table.c.target_id > args.targets, table.c.agent_id == agent_ids[0]))
+        recorded = db.session.execute(select(func.sum(ProbeAgent.results_received),
+                                             func.sum(ProbeAgent.duplicate_batches))).one()
+        batches = db.session.scalar(select(func.count()).select_from(AgentBatch))
+        locations = dict(db.session.execute(select(ProbeAgent.id, ProbeAgent.location)).all())
+
+    sent = sum(agent.results_sent for agent in agents)
+    syncs = sum(agent.syncs + agent.syncs_not_modified for agent in agents)
+    checks = {
+        'no_duplicate_rows': duplicates == 0,
+        # 每个丢弃的响应都会引起一次重试并被服务器识别为重复 (重试的响应也可能被丢弃，所以代理自己的计数可能更少)
+        'retries_deduplicated': recorded[1] == wsgi.dropped,
+        'rows_tagged_with_assigned_agent': mistagged == 0,
+        'paused_targets_stopped': paused_late == 0,
+        'new_targets_checked': new_target_rows > 0,
+        'agent_counts_match_rows': sent == rows == recorded[0],
+        'agents_registered_with_location': locations == {agent.agent_id: agent.location for agent in agents},
+        'agent_target_alerted': any(event.kind == DOWN and event.target_id == dead_id for event in sink.events),
+    }
+    report = {
+        'benchmark': 'agents', 'agents': args.agents, 'targets': args.targets, 'seconds': round(elapsed, 1),
+        'check_log_rows': rows,
+        'checks_per_sec': round(rows / elapsed, 1),
+        'batches': batches,
+        'responses_dropped': wsgi.dropped,
+        'duplicate_batches': recorded[1],
+        'agent_duplicate_batches': sum(agent.duplicate_batches for agent in agents),
+        'upload_retries': sum(agent.upload_retries for agent in agents),
+        'results_rejected': sum(agent.results_rejected for agent in agents),
+        'results_dropped': sum(agent.dropped for agent in agents),
+        'compression_ratio': round(sum(a.bytes_raw for a in agents) / max(sum(a.bytes_sent for a in agents), 1), 1),
+        'bytes_per_result': round(sum(a.bytes_sent for a in agents) / max(sent, 1), 1),
+        'ingest_p50_ms': round(percentile(wsgi.ingest_ms, 50) or 0, 2),
+        'ingest_p95_ms': round(percentile(wsgi.ingest_ms, 95) or 0, 2),
+        'sync_not_modified_ratio': round(sum(a.syncs_not_modified for a in agents) / max(syncs, 1), 3),
+        'mistagged_rows': mistagged,
+        'paused_rows_after_sync': paused_late,
+        'new_target_rows': new_target_rows,
+        'alerts_sent': len(sink.events),
+        'checks': checks,
+        'ok': all(checks.values()),
+    }
+    print(json.dumps(report, ensure_ascii=False))
+    shutil.rmtree(workdir, ignore_errors=True)
+    if not report['ok']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
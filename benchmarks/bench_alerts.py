@@ -0,0 +1,196 @@
+"""
+告警引擎测试：用本机的 Webhook 接收端 (HTTP) 和最小的 SMTP 服务器代替真实的通知渠道，核对：
+  * 故障/恢复通知通过 Webhook (JSON) 和 SMTP (邮件主题) 送达；
+  * 冷却时间内重复的故障通知被去重，冷却结束后仍在故障中的目标补发故障通知，响应变慢通知同理；
+  * 反复切换状态的目标只通知一次“状态反复切换”，安静 flap_window 秒后通知“恢复稳定”；
+  * 超过每分钟上限的通知被合并为一条摘要。
+状态机部分用显式的时间戳驱动 observe()，不需要真的等待冷却时间。最后输出 observe() 处理每条结果的耗时。
+
+用法: python benchmarks/bench_alerts.py
+"""
+import argparse
+import json
+import socketserver
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import percentile
+from app.alerts import (AlertEngine, SmtpSink, WebhookSink, DOWN, FLAPPING, LATENCY_HIGH, LATENCY_NORMAL,
+                        RATE_LIMITED, RECOVERED, STABLE)
+from app.probe_engine import ProbeResult
+
+
+class WebhookReceiver(BaseHTTPRequestHandler):
+    received = [] # 收到的 JSON 通知 (类属性，所有请求共用)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.received.append(json.loads(body))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SmtpReceiver(socketserver.StreamRequestHandler):
+    """
+    只实现发送一封邮件所需命令的 SMTP 服务器，收到的邮件正文存入 messages。
+    """
+    messages = []
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost stand-in')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 end with <CRLF>.<CRLF>')
+                lines = []
+                for data in self.rfile:
+                    if data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data)
+                self.messages.append(b''.join(lines).decode('utf-8', 'replace'))
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok') # MAIL FROM、RCPT TO、RSET、NOOP
+
+
+def result(target_id, status='UP', response_time_ms=50.0):
+    return ProbeResult(target_id, datetime.now(timezone.utc), 200 if status == 'UP' else 503, status,
+                       response_time_ms, '' if status == 'UP' else 'HTTP 错误状态码: 503', target_name=f'target-{target_id}')
+
+
+def drive(engine, target_id, sequence, start=0.0, step=10.0):
+    """
+    以每 step 秒一条的节奏把 sequence 中的状态 ('UP'/'DOWN'，或 ('UP', 响应时间)) 交给 observe()。
+    :return: (产生的通知类型列表, 下一条结果的时间)
+    """
+    kinds = []
+    now = start
+    for item in sequence:
+        status, latency = item if isinstance(item, tuple) else (item, 50.0)
+        kinds += [event.kind for event in engine.observe(result(target_id, status, latency), now=now)]
+        now += step
+    return kinds, now
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--results', type=int, default=200000, help='测量 observe() 耗时使用的结果数')
+    args = parser.parse_args()
+    checks = {}
+
+    # 冷却期内恢复后再次故障：第二次故障通知先被去重，冷却结束后补发
+    engine = AlertEngine(failure_threshold=2, cooldown=300)
+    kinds, now = drive(engine, 1, ['UP', 'DOWN', 'DOWN', 'UP'])
+    checks['down_then_recovered'] = kinds == [DOWN, RECOVERED]
+    kinds, now = drive(engine, 1, ['DOWN'] * 102, start=now)
+    checks['suppressed_down_resent_after_cooldown'] = kinds == [DOWN] and engine.deduplicated == 1
+    kinds, now = drive(engine, 1, ['UP'], start=now)
+    checks['recovered_after_resent_down'] = kinds == [RECOVERED]
+    # 冷却期内的短暂故障在冷却结束前已经恢复：不补发，也不发送恢复通知
+    engine = AlertEngine(failure_threshold=2, cooldown=300)
+    kinds, now = drive(engine, 1, ['UP', 'DOWN', 'DOWN', 'UP', 'DOWN', 'DOWN', 'UP', 'UP'])
+    checks['short_outage_within_cooldown_deduplicated'] = kinds == [DOWN, RECOVERED] and engine.deduplicated == 1
+
+    # 响应变慢：去重后同样在冷却结束后补发，只有发出过变慢通知才发送恢复通知
+    engine = AlertEngine(latency_threshold_ms=500, latency_breaches=3, cooldown=300)
+    slow, fast = ('UP', 900.0), ('UP', 50.0)
+    kinds, now = drive(engine, 2, [slow] * 3 + [fast] * 3)
+    checks['latency_high_then_normal'] = kinds == [LATENCY_HIGH, LATENCY_NORMAL]
+    kinds, now = drive(engine, 2, [slow] * 3 + [fast] * 3, start=now)
+    checks['latency_high_deduplicated_without_normal'] = kinds == [] and engine.deduplicated == 1
+    kinds, now = drive(engine, 2, [slow] * 40, start=now)
+    checks['suppressed_latency_high_resent_after_cooldown'] = kinds == [LATENCY_HIGH]
+
+    # 反复切换：只通知一次，安静 flap_window 秒后通知恢复稳定
+    engine = AlertEngine(failure_threshold=1, flap_window=600, flap_transitions=5, cooldown=0)
+    kinds, now = drive(engine, 3, ['UP', 'DOWN'] * 10)
+    checks['flapping_notified_once'] = kinds.count(FLAPPING) == 1 and kinds.count(DOWN) <= 2
+    kinds, now = drive(engine, 3, ['UP'] * 70, start=now)
+    checks['stable_after_quiet_window'] = kinds == [STABLE]
+
+    # 通知渠道：Webhook 和 SMTP 的本机替身
+    webhook = ThreadingHTTPServer(('127.0.0.1', 0), WebhookReceiver)
+    smtp = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SmtpReceiver)
+    for server in (webhook, smtp):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    engine = AlertEngine(sinks=[WebhookSink(f'http://127.0.0.1:{webhook.server_port}/hook'),
+                                SmtpSink('127.0.0.1', smtp.server_address[1], 'webpulse@localhost', ['ops@localhost'])],
+                         failure_threshold=2, cooldown=300, rate_limit_per_minute=60)
+    engine.start()
+    for status in ('DOWN', 'DOWN', 'UP'):
+        engine.handle_result(result(4, status))
+    delivered = wait_for(lambda: len(WebhookReceiver.received) >= 2 and len(SmtpReceiver.messages) >= 2)
+    checks['webhook_delivered'] = delivered and [item['kind'] for item in WebhookReceiver.received] == [DOWN, RECOVERED]
+    checks['smtp_delivered'] = delivered and all('target-4' in message for message in SmtpReceiver.messages)
+
+    # 限流：令牌桶容量 60，剩余的通知合并为一条摘要 (令牌每秒恢复一个)
+    WebhookReceiver.received.clear()
+    burst = 100
+    for target_id in range(100, 100 + burst):
+        engine.handle_result(result(target_id, 'DOWN'))
+        engine.handle_result(result(target_id, 'DOWN'))
+    summarized = wait_for(lambda: any(item['kind'] == RATE_LIMITED for item in WebhookReceiver.received))
+    engine.stop()
+    webhook.shutdown()
+    smtp.shutdown()
+    downs = sum(item['kind'] == DOWN for item in WebhookReceiver.received)
+    rate_limited = engine.rate_limited
+    checks['rate_limited_into_summary'] = (summarized and downs + rate_limited == burst
+                                           and 55 <= downs <= 60 and engine.sink_errors == 0)
+
+    # observe() 的开销：1000 个目标轮流检查，约 5% 的结果失败
+    engine = AlertEngine(latency_threshold_ms=500)
+    samples = [result(i % 1000, 'DOWN' if i % 97 < 5 else 'UP', 600.0 if i % 13 == 0 else 50.0)
+               for i in range(args.results)]
+    timings = []
+    started = time.perf_counter()
+    for i, sample in enumerate(samples):
+        if i % 1000 == 0:
+            chunk_started = time.perf_counter()
+        engine.observe(sample, now=i / 100)
+        if i % 1000 == 999:
+            timings.append((time.perf_counter() - chunk_started) * 1e6 / 1000)
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'benchmark': 'alerts',
+        'results': args.results,
+        'observe_per_sec': round(args.results / elapsed),
+        'observe_p50_us': round(percentile(timings, 50), 2),
+        'observe_p95_us': round(percentile(timings, 95), 2),
+        'rate_limited': rate_limited,
+        'checks': checks,
+        'ok': all(checks.values()),
+    }
+    print(json.dumps(report, ensure_ascii=False))
+    if not report['ok']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+批量导入基准测试：对比逐个调用添加目标的旧方式 (每个目标一次唯一性查询和一次提交)
+与 bulk_targets.import_targets 的分块校验、集合写入，并测量重复导入 (全部更新) 和流式导出的耗时。
+
+用法: python benchmarks/bench_bulk_import.py --targets 1000 10000
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+from common import make_bench_app, QueryCounter
+from app import db
+from app.bulk_targets import export_targets, import_targets, iter_records
+from app.models import MonitoredTarget
+
+
+def make_csv(targets):
+    lines = ['name,url,check_interval_seconds,is_active\n']
+    lines.extend(f'bench-{i:06d},http://host{i % 200}.bench.example/{i},300,1\n' for i in range(targets))
+    return ''.join(lines).encode('utf-8')
+
+
+def legacy_import(body):
+    # 复现逐个添加目标的方式：每个目标先查询URL是否存在，再单独提交
+    for _, record in iter_records(io.BytesIO(body), 'csv'):
+        if MonitoredTarget.query.filter_by(url=record['url']).first():
+            continue
+        db.session.add(MonitoredTarget(name=record['name'], url=record['url'],
+                                       check_interval_seconds=int(record['check_interval_seconds']),
+                                       is_active=True))
+        db.session.commit()
+
+
+def measure(func):
+    with QueryCounter(db.engine) as counter:
+        started = time.perf_counter()
+        result = func()
+        elapsed = (time.perf_counter() - started) * 1000
+    return result, round(elapsed, 1), counter.count
+
+
+def run(targets, legacy_limit):
+    body = make_csv(targets)
+    report = {'benchmark': 'bulk_import', 'targets': targets}
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_app = make_bench_app('sqlite:///' + os.path.join(tmp, 'import.db'))
+        with bench_app.test_request_context():
+            if targets <= legacy_limit:
+                _, report['legacy_ms'], report['legacy_queries'] = measure(lambda: legacy_import(body))
+                db.session.execute(MonitoredTarget.__table__.delete())
+                db.session.commit()
+            result, report['import_ms'], report['import_queries'] = measure(
+                lambda: import_targets(iter_records(io.BytesIO(body), 'csv')))
+            report['inserted'] = result['inserted']
+            result, report['reimport_ms'], report['reimport_queries'] = measure(
+                lambda: import_targets(iter_records(io.BytesIO(body), 'csv')))
+            report['updated'] = result['updated']
+            exported, report['export_ms'], report['export_queries'] = measure(
+                lambda: sum(len(part) for part in export_targets('csv')))
+            report['export_bytes'] = exported
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--targets', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--legacy-limit', type=int, default=10000, help='目标数超过该值时跳过逐个添加的对照测试')
+    args = parser.parse_args()
+    for targets in args.targets:
+        print(json.dumps(run(targets, args.legacy_limit), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+日志记录方式基准测试：模拟一批每 30 秒检查一次的目标运行若干小时，分别以 full (每次检查一行) 和
+changes (只记录状态变化，状态不变时按心跳间隔汇总) 方式通过 write_results 写库，
+对比每小时写入 check_log 的行数、数据库文件增长的字节数和写库耗时。
+
+用法: python benchmarks/bench_change_log.py --targets 500 --hours 6 --heartbeat 900
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+from common import make_bench_app
+from app import db
+from app.change_log import LOG_MODE_CHANGES, LOG_MODE_FULL
+from app.models import MonitoredTarget, CheckLog
+from app.probe_engine import ProbeResult
+from app.result_writer import write_results
+
+_DETAILS = {'DOWN': 'HTTP 错误状态码: 503 - Service Unavailable', 'ERROR': '请求超时 (超过10秒)。'}
+
+
+def make_results(targets, hours, interval, incident_rate, seed):
+    """
+    生成按时间排序的检查结果：大部分时间 UP (状态码 200，响应时间随机)，
+    每次检查以 incident_rate 的概率进入一次持续 1~10 次检查的故障 (DOWN 503 或超时)。
+    """
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=hours)
+    rounds = int(hours * 3600 / interval)
+    remaining = [0] * targets # 每个目标剩余的故障检查次数
+    failure = [None] * targets
+    results = []
+    for step in range(rounds):
+        ts = start + timedelta(seconds=step * interval)
+        for index in range(targets):
+            if not remaining[index] and rng.random() < incident_rate:
+                remaining[index] = rng.randint(1, 10)
+                failure[index] = rng.choice(('DOWN', 'ERROR'))
+            if remaining[index]:
+                remaining[index] -= 1
+                status = failure[index]
+                results.append(ProbeResult(index + 1, ts, 503 if status == 'DOWN' else None, status,
+                                           rng.uniform(5, 50) if status == 'DOWN' else None, _DETAILS[status]))
+            else:
+                results.append(ProbeResult(index + 1, ts, 200, 'UP', rng.uniform(20, 300), ''))
+    return results
+
+
+def run_mode(workdir, mode, results, args):
+    db_path = os.path.join(workdir, f'{mode}.db')
+    bench_app = make_bench_app(f'sqlite:///{db_path}')
+    with bench_app.app_context():
+        db.session.execute(MonitoredTarget.__table__.insert(), [
+            {'id': i, 'name': f'bench-{i}', 'url': f'http://bench.invalid/{i}', 'check_interval_seconds': args.interval,
+             'is_active': True, 'log_mode': mode} for i in range(1, args.targets + 1)])
+        db.session.commit()
+        size_before = os.path.getsize(db_path)
+        log_rows = 0
+        started = time.perf_counter()
+        for offset in range(0, len(results), args.batch):
+            _, inserted, _ = write_results(results[offset:offset + args.batch], lambda result: None,
+                                           heartbeat_seconds=args.heartbeat)
+            db.session.commit()
+            log_rows += inserted
+        elapsed = time.perf_counter() - started
+        stored_checks = db.session.scalar(select(func.sum(func.coalesce(CheckLog.sample_count, 1))))
+        db.session.remove()
+    return {
+        'check_log_rows': log_rows,
+        'rows_per_hour': round(log_rows / args.hours),
+        'rows_per_target_hour': round(log_rows / args.hours / args.targets, 2),
+        'db_bytes_per_hour': round((os.path.getsize(db_path) - size_before) / args.hours),
+        'write_s': round(elapsed, 2),
+        'checks_represented': stored_checks, # 汇总记录按 sample_count 计，与检查次数之差为尚未写出的汇总
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--targets', type=int, default=500)
+    parser.add_argument('--hours', type=float, default=6)
+    parser.add_argument('--interval', type=int, default=30, help='检查间隔 (秒)')
+    parser.add_argument('--heartbeat', type=int, default=900, help='changes 模式的汇总间隔 (秒)')
+    parser.add_argument('--incident-rate', type=float, default=0.001, help='每次检查开始一次故障的概率')
+    parser.add_argument('--batch', type=int, default=500, help='每批写入的结果数 (与 RESULT_WRITER_BATCH_SIZE 相同)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.getLogger('app').setLevel(logging.WARNING)
+    results = make_results(args.targets, args.hours, args.interval, args.incident_rate, args.seed)
+    report = {'benchmark': 'change_log', 'targets': args.targets, 'hours': args.hours, 'checks': len(results),
+              'checks_per_hour': round(len(results) / args.hours), 'heartbeat_s': args.heartbeat}
+    with tempfile.TemporaryDirectory() as workdir:
+        report['full'] = run_mode(workdir, LOG_MODE_FULL, results, args)
+        report['changes'] = run_mode(workdir, LOG_MODE_CHANGES, results, args)
+    report['rows_saved_ratio'] = round(1 - report['changes']['check_log_rows'] / report['full']['check_log_rows'], 4)
+    print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
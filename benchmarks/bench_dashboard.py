@@ -0,0 +1,106 @@
+"""
+仪表盘基准测试：对比旧的 1+N 次“每个目标查最新日志”查询与基于 target_status 的单次关联查询，
+并分别测量缓存未命中 (结果版本变化后的首次请求)、缓存命中和带 If-None-Match 的 304 请求的耗时。
+
+用法: python benchmarks/bench_dashboard.py --targets 1000 10000 --logs-per-target 50
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from common import make_bench_app, QueryCounter
+from app import db, dashboard_cache
+from app.models import MonitoredTarget, CheckLog, TargetStatus
+
+
+def seed(bench_app, targets, logs_per_target):
+    now = datetime.now(timezone.utc)
+    with bench_app.app_context():
+        db.session.execute(MonitoredTarget.__table__.insert(), [
+            {'id': i, 'name': f'bench-{i:06d}', 'url': f'http://bench.invalid/{i}', 'check_interval_seconds': 30,
+             'is_active': True} for i in range(1, targets + 1)])
+        for offset in range(logs_per_target):
+            ts = now - timedelta(seconds=30 * (logs_per_target - offset))
+            db.session.execute(CheckLog.__table__.insert(), [
+                {'target_id': i, 'timestamp': ts, 'status_code': 200, 'status_text': 'UP',
+                 'response_time_ms': 10.0, 'details': ''} for i in range(1, targets + 1)])
+        db.session.execute(TargetStatus.__table__.insert(), [
+            {'target_id': i, 'status_text': 'UP', 'status_code': 200, 'response_time_ms': 10.0,
+             'checked_at': now, 'consecutive_failures': 0} for i in range(1, targets + 1)])
+        db.session.commit()
+
+
+def legacy_dashboard_data():
+    # 复现旧版 index() 的查询方式
+    targets = MonitoredTarget.query.order_by(MonitoredTarget.name.asc()).all()
+    latest_statuses = {}
+    for target in targets:
+        latest_log = target.check_logs.order_by(CheckLog.timestamp.desc()).first()
+        if latest_log:
+            latest_statuses[target.id] = {
+                "status_text": latest_log.status_text,
+                "timestamp": latest_log.timestamp.strftime('%Y-%m-%d %H:%M:%S UTC'),
+                "response_time_ms": latest_log.response_time_ms,
+                "status_code": latest_log.status_code
+            }
+    return targets, latest_statuses
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 1)
+
+
+def run(targets, logs_per_target, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_app = make_bench_app('sqlite:///' + os.path.join(tmp, 'dashboard.db'), with_routes=True)
+        seed(bench_app, targets, logs_per_target)
+        dashboard_cache.invalidate()
+        client = bench_app.test_client()
+        report = {'benchmark': 'dashboard', 'targets': targets, 'logs': targets * logs_per_target}
+        with bench_app.app_context():
+            engine = db.engine
+            with QueryCounter(engine) as counter:
+                legacy_dashboard_data()
+            report['legacy_queries'] = counter.count
+            report['legacy_data_ms'] = timed(legacy_dashboard_data, repeat)
+            with QueryCounter(engine) as counter:
+                assert client.get('/').status_code == 200
+            report['queries'] = counter.count
+        report['request_ms'] = timed(lambda: client.get('/'), repeat)
+
+        def miss():
+            dashboard_cache.invalidate()
+            client.get('/')
+
+        report['miss_request_ms'] = timed(miss, repeat)
+        report['hit_request_ms'] = timed(lambda: client.get('/'), repeat)
+        etag = client.get('/').headers['ETag']
+        with bench_app.app_context(), QueryCounter(db.engine) as counter:
+            assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+        report['not_modified_queries'] = counter.count
+        report['not_modified_request_ms'] = timed(lambda: client.get('/', headers={'If-None-Match': etag}), repeat)
+        report['cache'] = dashboard_cache.stats()
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--targets', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--logs-per-target', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    for targets in args.targets:
+        print(json.dumps(run(targets, args.logs_per_target, args.repeat), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
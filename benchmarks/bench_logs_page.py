@@ -0,0 +1,74 @@
+"""
+日志页基准测试：对比 OFFSET 分页 (含 COUNT(*)) 与游标分页在不同翻页深度下的查询耗时。
+
+用法: python benchmarks/bench_logs_page.py --logs 200000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from common import make_bench_app
+from app import db
+from app.models import MonitoredTarget, CheckLog
+from app.pagination import keyset_paginate, encode_cursor
+
+
+def seed(bench_app, logs, chunk=50000):
+    start = datetime.now(timezone.utc) - timedelta(seconds=30 * logs)
+    with bench_app.app_context():
+        db.session.execute(MonitoredTarget.__table__.insert(), [
+            {'id': 1, 'name': 'bench', 'url': 'http://bench.invalid/', 'check_interval_seconds': 30, 'is_active': True}])
+        for offset in range(0, logs, chunk):
+            db.session.execute(CheckLog.__table__.insert(), [
+                {'target_id': 1, 'timestamp': start + timedelta(seconds=30 * i), 'status_code': 200,
+                 'status_text': 'UP', 'response_time_ms': 10.0, 'details': ''}
+                for i in range(offset, min(logs, offset + chunk))])
+        db.session.commit()
+
+
+def timed_ms(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--logs', type=int, default=200000)
+    parser.add_argument('--per-page', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_app = make_bench_app('sqlite:///' + os.path.join(tmp, 'logs.db'))
+        seed(bench_app, args.logs)
+        with bench_app.app_context():
+            base = lambda: CheckLog.query.filter_by(target_id=1) # noqa: E731
+            last_page = args.logs // args.per_page
+            for page in (1, last_page // 2, last_page):
+                # 用 OFFSET 取到该页第一条之前的一条记录作为游标，使两种方式读取同一页
+                anchor = None
+                if page > 1:
+                    anchor = base().order_by(CheckLog.timestamp.desc(), CheckLog.id.desc()) \
+                                   .offset((page - 1) * args.per_page - 1).first()
+                cursor = encode_cursor(anchor.timestamp, anchor.id) if anchor else None
+                report = {
+                    'benchmark': 'logs_page',
+                    'logs': args.logs,
+                    'page': page,
+                    'offset_paginate_ms': timed_ms(lambda: base().order_by(CheckLog.timestamp.desc())
+                                                   .paginate(page=page, per_page=args.per_page, error_out=False)),
+                    'keyset_ms': timed_ms(lambda: keyset_paginate(base(), CheckLog.timestamp, CheckLog.id,
+                                                                  per_page=args.per_page, before=cursor)),
+                }
+                print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+指标与检查日志基准测试：测量 handle_result 中指标埋点的单条开销，
+以及 CHECK_LOG_MODE 为 all / sampled / debug 时逐条日志 (写入临时文件) 的单条开销。
+
+用法: python benchmarks/bench_metrics.py --results 200000
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import common # noqa: F401 把项目根目录加入 sys.path
+from app import logger
+from app.dispatcher import CheckDispatcher
+from app.metrics import MetricsRegistry
+from app.probe_engine import ProbeResult
+from app.result_writer import make_result_logger
+
+
+def make_results(count):
+    now = datetime.now(timezone.utc)
+    results = []
+    for i in range(count):
+        if i % 50 == 0:
+            results.append(ProbeResult(i, now, None, 'DOWN', None, '请求超时 (超过10秒)。', 3.2, f'bench-{i}', None, 'timeout'))
+        else:
+            results.append(ProbeResult(i, now, 200, 'UP', 20.0 + i % 300, '', 1.5 + i % 7, f'bench-{i}'))
+    return results
+
+
+def per_result_us(func, results):
+    started = time.perf_counter()
+    for result in results:
+        func(result)
+    return round((time.perf_counter() - started) * 1e6 / len(results), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--results', type=int, default=200000)
+    parser.add_argument('--sample-rate', type=int, default=100)
+    args = parser.parse_args()
+
+    results = make_results(args.results)
+    report = {'benchmark': 'metrics', 'results': args.results}
+
+    # 指标埋点：handle_result (含直方图和计数器) 对比直接调用下游回调
+    sink = [].append
+    report['bare_handler_us'] = per_result_us(sink, results)
+    dispatcher = CheckDispatcher(result_handler=sink)
+    report['instrumented_handler_us'] = per_result_us(dispatcher.handle_result, results)
+    registry = MetricsRegistry()
+    registry.register('dispatcher', dispatcher.collect_metrics)
+    started = time.perf_counter()
+    text = registry.render()
+    report['render_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    report['render_bytes'] = len(text.encode('utf-8'))
+
+    # 逐条日志：INFO 级别写入临时文件，与生产环境的默认日志级别一致
+    with tempfile.TemporaryDirectory() as tmp:
+        handler = logging.FileHandler(os.path.join(tmp, 'checks.log'), encoding='utf-8')
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(module)s:%(lineno)d - %(message)s'))
+        logger.handlers, logger.propagate = [handler], False
+        logger.setLevel(logging.INFO)
+        for mode in ('all', 'sampled', 'debug'):
+            report[f'log_{mode}_us'] = per_result_us(make_result_logger(mode, args.sample_rate), results)
+        handler.close()
+    print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+多进程探测池基准测试：模拟目标集群运行在独立进程中，
+依次用进程内的单个探测引擎和 1..N 个探测子进程检查同一批目标，输出各自的 checks/sec。
+每种配置先预热一轮 (建立 keep-alive 连接、启动子进程)，再取后续各轮的平均吞吐量。
+
+用法: python benchmarks/bench_probe_pool.py --targets 20000 --processes 4
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from common import percentile
+from app.probe_engine import ProbeEngine, ProbeTarget
+from app.probe_pool import ProcessProbePool
+from fake_farm import FarmProcess
+
+
+def run_rounds(engine, urls, rounds):
+    """
+    用 engine 连续检查 rounds 轮，返回 (每轮 checks/sec 列表, 最后一轮的结果)。
+    """
+    results = []
+    done = threading.Event()
+
+    def on_result(result):
+        results.append(result)
+        if len(results) == len(urls):
+            done.set()
+
+    engine.result_handler = on_result
+    engine.start()
+    rates = []
+    for _ in range(rounds):
+        results.clear()
+        done.clear()
+        now = time.monotonic()
+        started = time.perf_counter()
+        engine.submit(ProbeTarget(i, f'bench-{i}', url, now) for i, url in enumerate(urls))
+        done.wait(600)
+        rates.append(round(len(results) / (time.perf_counter() - started), 1))
+    engine.stop()
+    return rates, list(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--targets', type=int, default=20000)
+    parser.add_argument('--hosts', type=int, default=64, help='模拟的主机(端口)数量')
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='测试的最大探测子进程数')
+    parser.add_argument('--max-in-flight', type=int, default=500, help='每个探测引擎的并发上限')
+    parser.add_argument('--per-host', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3, help='每种配置的测量轮数 (不含预热轮)')
+    args = parser.parse_args()
+
+    farm = FarmProcess(ports=args.hosts, latency_ms=args.latency_ms)
+    urls = farm.urls(args.targets)
+    options = dict(max_in_flight=args.max_in_flight, per_host_limit=args.per_host, timeout=10,
+                   pool_max_total=args.max_in_flight, stats_log_interval=0)
+
+    configurations = [('in_process', 0)] + [(f'processes_{n}', n) for n in range(1, args.processes + 1)]
+    report = {'benchmark': 'probe_pool', 'targets': args.targets, 'cpu_count': os.cpu_count(), 'modes': {}}
+    for label, processes in configurations:
+        engine = ProbeEngine(**options) if processes == 0 else ProcessProbePool(processes=processes, **options)
+        rates, results = run_rounds(engine, urls, args.rounds + 1)
+        measured = rates[1:]
+        lags = [r.lag_ms for r in results if r.lag_ms is not None]
+        report['modes'][label] = {
+            'checks_per_sec': round(sum(measured) / len(measured), 1),
+            'round_checks_per_sec': measured,
+            'completed': len(results),
+            'up': sum(1 for r in results if r.status_text == 'UP'),
+            'lag_p99_ms': percentile(lags, 99),
+        }
+    farm.stop()
+
+    baseline = report['modes']['in_process']['checks_per_sec']
+    for mode in report['modes'].values():
+        mode['speedup'] = round(mode['checks_per_sec'] / baseline, 2) if baseline else None
+    print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
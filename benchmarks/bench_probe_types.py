@@ -0,0 +1,199 @@
+"""
+轻量探测类型 (tcp/tls/dns) 测试：在本机启动TCP监听 (可发送欢迎信息) 和使用自签名证书的TLS监听，
+通过 ProbeEngine 检查它们并核对结果：
+  * tcp：连接成功为 UP；banner 匹配为 UP、不匹配为 DOWN (body)；端口未监听为 DOWN (connect)；
+    服务器一直不发送欢迎信息时按超时 (timeout) 处理；
+  * tls：证书剩余天数满足 min_days 为 UP，不足为 DOWN (cert)，两者都记录 cert_expires_at；
+    不受信任的证书为 DOWN (tls)；
+  * dns：localhost 解析成功，expect 不包含解析结果时为 DOWN (body)，无法解析的域名为 DOWN (dns)；
+  * URL 和参数的校验规则 (tcp 必须写端口、min_days 的范围等)。
+最后测量对本机监听连续执行 tcp 和 tls 检查的吞吐量。依赖 openssl 命令行生成证书。
+
+用法: python benchmarks/bench_probe_types.py --checks 2000
+"""
+import argparse
+import json
+import socket
+import socketserver
+import ssl
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from common import percentile
+from fake_farm import self_signed_contexts
+from app.probe_engine import ProbeEngine, ProbeTarget
+from app.probe_types import parse_probe_params, validate_url
+
+
+class BannerHandler(socketserver.BaseRequestHandler):
+    """
+    连接建立后发送服务器的 banner (为 None 时不发送)，然后等待客户端关闭连接。
+    """
+
+    def handle(self):
+        if self.server.banner is not None:
+            self.request.sendall(self.server.banner)
+        self.request.settimeout(5)
+        try:
+            while self.request.recv(1024):
+                pass
+        except OSError:
+            pass
+
+
+class TlsHandler(socketserver.BaseRequestHandler):
+    """
+    完成TLS握手后等待客户端关闭连接；客户端拒绝证书时握手失败，直接关闭。
+    """
+
+    def handle(self):
+        try:
+            with self.server.ssl_context.wrap_socket(self.request, server_side=True) as tls:
+                tls.settimeout(5)
+                while tls.recv(1024):
+                    pass
+        except (OSError, ssl.SSLError):
+            pass
+
+
+def start_listener(handler, **attributes):
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def target(target_id, url, probe_type, params=None):
+    validate_url(probe_type, url)
+    return ProbeTarget(target_id, f'{probe_type}-{target_id}', url, probe_type=probe_type,
+                       params=parse_probe_params(probe_type, json.dumps(params)) if params else None)
+
+
+def run_checks(targets, ssl_context=None, timeout=2):
+    """
+    用一个独立的探测引擎检查 targets，返回 {目标ID: ProbeResult}。
+    """
+    results = {}
+    done = threading.Event()
+
+    def on_result(result):
+        results[result.target_id] = result
+        if len(results) == len(targets):
+            done.set()
+
+    engine = ProbeEngine(result_handler=on_result, timeout=timeout, ssl_context=ssl_context, stats_log_interval=0)
+    engine.start()
+    engine.submit(targets)
+    done.wait(60)
+    engine.stop()
+    return results
+
+
+def outcome(result):
+    return result.status_text, result.error_class
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--checks', type=int, default=2000, help='测量吞吐量时每种类型的检查次数')
+    args = parser.parse_args()
+    checks = {}
+
+    smtp = start_listener(BannerHandler, banner=b'220 stand-in ESMTP ready\r\n')
+    silent = start_listener(BannerHandler, banner=None)
+    smtp_url = f'tcp://127.0.0.1:{smtp.server_address[1]}'
+    results = run_checks([
+        target(1, smtp_url, 'tcp'),
+        target(2, smtp_url, 'tcp', {'banner': '220'}),
+        target(3, smtp_url, 'tcp', {'banner': 'SSH-'}),
+        target(4, f'tcp://127.0.0.1:{closed_port()}', 'tcp'),
+        target(5, f'tcp://127.0.0.1:{silent.server_address[1]}', 'tcp', {'banner': '220'}),
+    ], timeout=1)
+    checks['tcp_connect_up'] = outcome(results[1]) == ('UP', '')
+    checks['tcp_banner_match_up'] = outcome(results[2]) == ('UP', '')
+    checks['tcp_banner_mismatch_down'] = outcome(results[3]) == ('DOWN', 'body')
+    checks['tcp_refused_connect_error'] = outcome(results[4]) == ('DOWN', 'connect')
+    checks['tcp_silent_banner_timeout'] = outcome(results[5]) == ('DOWN', 'timeout')
+
+    # 两张分别在 30 天和 5 天后过期的证书，min_days=14
+    now = datetime.now(timezone.utc)
+    expiry = {}
+    for days in (30, 5):
+        server_context, client_context = self_signed_contexts('127.0.0.1', days=days)
+        listener = start_listener(TlsHandler, ssl_context=server_context)
+        url = f'tls://127.0.0.1:{listener.server_address[1]}'
+        result = run_checks([target(days, url, 'tls', {'min_days': 14})], ssl_context=client_context)[days]
+        expiry[days] = result
+        if days == 30:
+            untrusted = run_checks([target(6, url, 'tls')])[6] # 系统CA不信任自签名证书
+    for days, result in expiry.items():
+        expires_at = result.cert_expires_at
+        checks[f'tls_{days}d_cert_expires_at'] = (
+            expires_at is not None and abs(expires_at - (now + timedelta(days=days))) < timedelta(hours=1))
+    checks['tls_min_days_satisfied_up'] = outcome(expiry[30]) == ('UP', '')
+    checks['tls_min_days_short_down'] = outcome(expiry[5]) == ('DOWN', 'cert')
+    checks['tls_untrusted_cert_error'] = outcome(untrusted) == ('DOWN', 'tls') and untrusted.cert_expires_at is None
+
+    results = run_checks([
+        target(1, 'dns://localhost', 'dns'),
+        target(2, 'dns://localhost', 'dns', {'expect': ['127.0.0.1', '::1']}),
+        target(3, 'dns://localhost', 'dns', {'expect': '192.0.2.1'}),
+        target(4, 'dns://webpulse-bench.invalid', 'dns'),
+    ])
+    checks['dns_resolve_up'] = outcome(results[1]) == ('UP', '') and results[1].timings.dns_ms is not None
+    checks['dns_expect_match_up'] = outcome(results[2]) == ('UP', '')
+    checks['dns_expect_mismatch_down'] = outcome(results[3]) == ('DOWN', 'body')
+    checks['dns_unresolvable_error'] = outcome(results[4]) == ('DOWN', 'dns')
+
+    invalid = [('tcp', 'tcp://127.0.0.1', None), ('tcp', 'http://127.0.0.1:25', None),
+               ('tls', 'tls://127.0.0.1', {'min_days': -1}), ('tcp', 'tcp://127.0.0.1:25', {'banner': ''}),
+               ('dns', 'dns://localhost', {'family': 'ipx'}), ('dns', 'dns://localhost', {'unknown': 1})]
+    rejected = 0
+    for probe_type, url, params in invalid:
+        try:
+            target(0, url, probe_type, params)
+        except ValueError:
+            rejected += 1
+    checks['invalid_urls_and_params_rejected'] = rejected == len(invalid)
+
+    # 吞吐量：对同一个本机监听连续检查 (每次都新建连接)
+    server_context, client_context = self_signed_contexts('127.0.0.1', days=30)
+    tls_listener = start_listener(TlsHandler, ssl_context=server_context)
+    rates = {}
+    latencies = {}
+    for probe_type, url, context in (
+            ('tcp', smtp_url, None),
+            ('tls', f'tls://127.0.0.1:{tls_listener.server_address[1]}', client_context)):
+        started = time.perf_counter()
+        results = run_checks([target(i, url, probe_type) for i in range(args.checks)], ssl_context=context, timeout=10)
+        rates[probe_type] = round(len(results) / (time.perf_counter() - started), 1)
+        latencies[probe_type] = percentile([r.response_time_ms for r in results.values() if r.response_time_ms], 50)
+        checks[f'{probe_type}_bulk_all_up'] = sum(r.status_text == 'UP' for r in results.values()) == args.checks
+
+    for server in (smtp, silent, tls_listener):
+        server.shutdown()
+    report = {
+        'benchmark': 'probe_types',
+        'tcp_checks_per_sec': rates['tcp'],
+        'tls_checks_per_sec': rates['tls'],
+        'tcp_p50_ms': latencies['tcp'],
+        'tls_p50_ms': latencies['tls'],
+        'checks': checks,
+        'ok': all(checks.values()),
+    }
+    print(json.dumps(report, ensure_ascii=False))
+    if not report['ok']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+SLA 报表基准测试：测量 ReportBuilder 向量化聚合的吞吐量和峰值内存 (默认 1 亿条检查记录)，
+以及从 check_log 表和段文件存储读取并生成完整报表的端到端速度。
+
+合成数据按块生成并立即交给 ReportBuilder，不在内存中保留，因此峰值内存反映的是报表本身的占用：
+它应只随单块大小、时间桶数量和目标数量变化，而与总行数无关 (可以用不同的 --rows 对比)。
+
+用法: python benchmarks/bench_reports.py --rows 100000000 --targets 1000 --db-rows 500000
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from common import make_bench_app
+from app import db
+from app.models import MonitoredTarget, CheckLog
+from app.probe_engine import ProbeResult
+from app.reports import CheckChunk, ReportBuilder, build_report
+from app.segment_store import SegmentStore
+
+
+def synthetic_chunks(rows, targets, days, chunk_size, fail_rate, seed):
+    """
+    按 (目标, 时间) 顺序生成检查记录块：每个目标均匀分布在 days 天内，
+    故障以连续失败的形式出现 (每次平均持续约 5 次检查)。
+    """
+    rng = np.random.default_rng(seed)
+    start_ts = time.time() - days * 86400
+    per_target = rows // targets
+    step = days * 86400 / per_target
+    for target_id in range(1, targets + 1):
+        for offset in range(0, per_target, chunk_size):
+            n = min(chunk_size, per_target - offset)
+            ts = start_ts + (offset + np.arange(n)) * step
+            # 故障开始的位置按 fail_rate / 5 抽样，之后连续失败 1~9 次
+            down = np.zeros(n + 10, dtype=bool)
+            for begin, length in zip(np.flatnonzero(rng.random(n) < fail_rate / 5), rng.integers(1, 10, n)):
+                down[begin:begin + length] = True
+            up = ~down[:n]
+            latency = rng.lognormal(4.5, 0.6, n)
+            latency[~up] = np.nan
+            yield CheckChunk(target_id, ts, up, latency)
+
+
+def run_synthetic(args):
+    start = datetime.now(timezone.utc) - timedelta(days=args.days)
+    builder = ReportBuilder(start, datetime.now(timezone.utc) + timedelta(hours=1), bucket_seconds=args.bucket)
+    tracemalloc.start()
+    aggregate = 0.0
+    started = time.perf_counter()
+    for chunk in synthetic_chunks(args.rows, args.targets, args.days, args.chunk_size, args.fail_rate, args.seed):
+        chunk_started = time.perf_counter()
+        builder.add(chunk)
+        aggregate += time.perf_counter() - chunk_started
+        del chunk
+    report = builder.result()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'rows': builder.rows,
+        'total_s': round(elapsed, 2),
+        'aggregate_s': round(aggregate, 2), # 不含生成合成数据的时间
+        'aggregate_rows_per_sec': round(builder.rows / aggregate),
+        'peak_traced_mb': round(peak / 2 ** 20, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'incidents': report['overall']['incidents'],
+        'uptime_pct': report['overall']['uptime_pct'],
+        'buckets': len(report['buckets']),
+    }
+
+
+def run_database(args, workdir):
+    db_path = os.path.join(workdir, 'bench.db')
+    bench_app = make_bench_app(args.database_url or f'sqlite:///{db_path}')
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=args.days)
+    store = SegmentStore(os.path.join(workdir, 'segments'))
+    result = {'db_rows': 0}
+    agent_target = args.db_targets # 最后一个目标由远程代理检查：它的结果只写入 check_log，不写段文件
+    with bench_app.app_context():
+        db.session.execute(MonitoredTarget.__table__.insert(), [
+            {'id': i, 'name': f'bench-{i}', 'url': f'http://bench.invalid/{i}', 'check_interval_seconds': 30,
+             'is_active': True, 'agent_id': 'bench-agent' if i == agent_target else None}
+            for i in range(1, args.db_targets + 1)])
+        for chunk in synthetic_chunks(args.db_rows, args.db_targets, args.days, 5000, args.fail_rate, args.seed):
+            timestamps = [start + timedelta(seconds=float(ts) - chunk.ts[0]) for ts in chunk.ts]
+            latencies = [None if np.isnan(ms) else float(ms) for ms in chunk.latency]
+            statuses = ['UP' if up else 'DOWN' for up in chunk.up]
+            db.session.execute(CheckLog.__table__.insert(), [
+                {'target_id': chunk.target_id, 'timestamp': ts.replace(tzinfo=None), 'status_text': status,
+                 'status_code': 200 if status == 'UP' else 503, 'response_time_ms': ms, 'details': ''}
+                for ts, status, ms in zip(timestamps, statuses, latencies)])
+            if chunk.target_id != agent_target:
+                store.append([ProbeResult(chunk.target_id, ts, 200 if status == 'UP' else 503, status, ms, '')
+                              for ts, status, ms in zip(timestamps, statuses, latencies)])
+            result['db_rows'] += len(timestamps)
+        db.session.commit()
+        end = datetime.now(timezone.utc)
+        for name, store_arg in (('check_log', None), ('segments', store)):
+            tracemalloc.start()
+            started = time.perf_counter()
+            report = build_report(start, end, bucket_seconds=args.bucket, store=store_arg)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result[name] = {'elapsed_s': round(elapsed, 3), 'rows_per_sec': round(report['rows'] / elapsed),
+                            'peak_traced_mb': round(peak / 2 ** 20, 1), 'incidents': report['overall']['incidents'],
+                            'rows': report['rows'], 'targets': len(report['targets'])}
+        # 启用段存储时代理目标仍从 check_log 读取，两种存储生成的报表应包含相同的目标和检查次数
+        result['segments_match_check_log'] = all(
+            result['segments'][key] == result['check_log'][key] for key in ('rows', 'incidents', 'targets')) and (
+            result['segments']['targets'] == args.db_targets)
+        store.close()
+        db.session.remove()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000000, help='合成数据的检查记录条数')
+    parser.add_argument('--targets', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=30, help='检查记录的时间跨度 (天)')
+    parser.add_argument('--bucket', type=int, default=3600, help='时间桶长度 (秒)')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='每块的记录条数 (与 DEFAULT_CHUNK_SIZE 相同)')
+    parser.add_argument('--fail-rate', type=float, default=0.02, help='失败检查的大致比例')
+    parser.add_argument('--db-rows', type=int, default=200000, help='写入数据库和段存储的记录条数，0 表示跳过端到端测试')
+    parser.add_argument('--db-targets', type=int, default=50)
+    parser.add_argument('--database-url', default=None, help='默认使用临时目录中的 SQLite 文件')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    report = {'benchmark': 'reports', 'targets': args.targets, 'days': args.days, 'chunk_size': args.chunk_size}
+    report['synthetic'] = run_synthetic(args)
+    if args.db_rows:
+        workdir = tempfile.mkdtemp(prefix='webpulse-reports-')
+        try:
+            report['database'] = run_database(args, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
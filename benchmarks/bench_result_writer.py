@@ -0,0 +1,88 @@
+"""
+检查结果写入基准测试：对比逐条提交 (每次检查一个事务) 与 ResultWriter 批量写入的 rows/sec。
+
+用法: python benchmarks/bench_result_writer.py --rows 20000 --targets 1000
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from common import make_bench_app
+from app import db
+from app.models import MonitoredTarget, CheckLog
+from app.probe_engine import ProbeResult
+from app.result_writer import ResultWriter
+
+
+def seed_targets(bench_app, count):
+    with bench_app.app_context():
+        db.session.execute(MonitoredTarget.__table__.insert(), [
+            {'name': f'bench-{i}', 'url': f'http://bench.invalid/{i}', 'check_interval_seconds': 30,
+             'is_active': True} for i in range(1, count + 1)])
+        db.session.commit()
+
+
+def make_results(rows, targets):
+    now = datetime.now(timezone.utc)
+    return [ProbeResult(i % targets + 1, now, 200, 'UP', 12.5, '', None, f'bench-{i % targets + 1}')
+            for i in range(rows)]
+
+
+def bench_per_check_commit(bench_app, results):
+    # 复现原先 perform_check 的写入方式：每条结果都 get 目标、add 日志并单独提交
+    started = time.perf_counter()
+    with bench_app.app_context():
+        for result in results:
+            target = db.session.get(MonitoredTarget, result.target_id)
+            target.last_checked_on = result.timestamp
+            db.session.add(CheckLog(target_id=result.target_id, timestamp=result.timestamp,
+                                    status_code=result.status_code, status_text=result.status_text,
+                                    response_time_ms=result.response_time_ms, details=result.details))
+            db.session.commit()
+    return time.perf_counter() - started
+
+
+def bench_result_writer(bench_app, results, batch_size):
+    writer = ResultWriter(batch_size=batch_size, flush_interval=0.5)
+    writer.init_app(bench_app)
+    writer.start()
+    started = time.perf_counter()
+    for result in results:
+        writer.submit(result)
+    writer.stop()
+    return time.perf_counter() - started, writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--targets', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.getLogger('app').setLevel(logging.WARNING) # 避免逐条日志输出影响计时
+
+    results = make_results(args.rows, args.targets)
+    report = {'benchmark': 'result_writer', 'rows': args.rows, 'batch_size': args.batch_size}
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline_app = make_bench_app('sqlite:///' + os.path.join(tmp, 'baseline.db'))
+        seed_targets(baseline_app, args.targets)
+        elapsed = bench_per_check_commit(baseline_app, results)
+        report['per_check_commit_rows_per_sec'] = round(args.rows / elapsed, 1)
+
+        batched_app = make_bench_app('sqlite:///' + os.path.join(tmp, 'batched.db'))
+        seed_targets(batched_app, args.targets)
+        elapsed, writer = bench_result_writer(batched_app, results, args.batch_size)
+        report['batched_rows_per_sec'] = round(writer.rows_written / elapsed, 1)
+        report['batches'] = writer.batches_written
+        report['dropped'] = writer.dropped
+    report['speedup'] = round(report['batched_rows_per_sec'] / report['per_check_commit_rows_per_sec'], 1)
+    print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+原始检查历史存储基准测试：对比 check_log 表与段文件存储 (SegmentStore) 的
+写入速度、每条检查占用的字节数，以及按目标和时间范围扫描 (计算可用率和平均响应时间) 的耗时。
+
+用法: python benchmarks/bench_segments.py --rows 500000 --targets 200 --database-url sqlite:////tmp/bench.db
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from common import make_bench_app, percentile
+from app import db
+from app.models import MonitoredTarget, CheckLog
+from app.probe_engine import ProbeResult
+from app.segment_store import SegmentStore
+
+_DETAILS = ('请求超时 (超过10秒)。', 'HTTP 错误状态码: 503 - Service Unavailable',
+            '连接错误 (无法解析主机或连接到服务器): ConnectionRefusedError')
+
+
+def make_results(rows, targets, days, seed):
+    # 所有目标按相同间隔检查，时间跨度为 days 天，约 2% 的检查失败
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=days)
+    step = timedelta(days=days) / (rows // targets)
+    results = []
+    for i in range(rows):
+        ts = start + step * (i // targets)
+        if rng.random() < 0.02:
+            results.append(ProbeResult(i % targets + 1, ts, None, 'DOWN', None, rng.choice(_DETAILS), error_class='timeout'))
+        else:
+            results.append(ProbeResult(i % targets + 1, ts, 200, 'UP', rng.uniform(5, 300), ''))
+    return results, start
+
+
+def sql_rows(batch):
+    return [{'target_id': r.target_id, 'timestamp': r.timestamp, 'status_code': r.status_code,
+             'status_text': r.status_text, 'response_time_ms': r.response_time_ms, 'details': r.details}
+            for r in batch]
+
+
+def scan_sql(target_id, start, end):
+    # 与 SegmentStore.summary 相同的统计：只选需要的列，不构造ORM对象
+    rows = db.session.execute(
+        select(CheckLog.status_text, CheckLog.response_time_ms)
+        .where(CheckLog.target_id == target_id, CheckLog.timestamp >= start, CheckLog.timestamp < end)).all()
+    latencies = [ms for _, ms in rows if ms is not None]
+    return len(rows), sum(1 for status, _ in rows if status == 'UP'), (sum(latencies) / len(latencies)) if latencies else None
+
+
+def scan_orm(target_id, start, end):
+    # 旧的读取方式：为每条日志构造 CheckLog 对象
+    logs = CheckLog.query.filter(CheckLog.target_id == target_id, CheckLog.timestamp >= start,
+                                 CheckLog.timestamp < end).all()
+    return len(logs)
+
+
+def timed_queries(func, queries):
+    timings = []
+    for target_id, start, end in queries:
+        started = time.perf_counter()
+        func(target_id, start, end)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'p50_ms': round(percentile(timings, 50), 3), 'p95_ms': round(percentile(timings, 95), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--targets', type=int, default=200)
+    parser.add_argument('--days', type=int, default=3, help='检查结果的时间跨度 (天)')
+    parser.add_argument('--batch', type=int, default=500, help='每批写入的条数 (与 RESULT_WRITER_BATCH_SIZE 相同)')
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--window-hours', type=float, default=24, help='每次范围扫描的时间窗口 (小时)')
+    parser.add_argument('--database-url', default=None, help='默认使用临时目录中的 SQLite 文件')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='webpulse-segments-')
+    db_path = os.path.join(workdir, 'bench.db')
+    bench_app = make_bench_app(args.database_url or f'sqlite:///{db_path}')
+    results, start = make_results(args.rows, args.targets, args.days, args.seed)
+    batches = [results[i:i + args.batch] for i in range(0, len(results), args.batch)]
+    report = {'benchmark': 'segments', 'rows': args.rows, 'targets': args.targets, 'days': args.days}
+
+    with bench_app.app_context():
+        db.session.execute(MonitoredTarget.__table__.insert(), [
+            {'id': i, 'name': f'bench-{i}', 'url': f'http://bench.invalid/{i}', 'check_interval_seconds': 30,
+             'is_active': True} for i in range(1, args.targets + 1)])
+        db.session.commit()
+        size_before = os.path.getsize(db_path) if not args.database_url else None
+
+        # 写入：每批一条 executemany INSERT 并提交，与 write_results 写 check_log 的方式相同
+        started = time.perf_counter()
+        for batch in batches:
+            db.session.execute(CheckLog.__table__.insert(), sql_rows(batch))
+            db.session.commit()
+        elapsed = time.perf_counter() - started
+        report['sql_rows_per_sec'] = round(args.rows / elapsed)
+        if size_before is not None:
+            report['sql_bytes_per_check'] = round((os.path.getsize(db_path) - size_before) / args.rows, 1)
+
+        store = SegmentStore(os.path.join(workdir, 'segments'))
+        started = time.perf_counter()
+        for batch in batches:
+            store.append(batch)
+        elapsed = time.perf_counter() - started
+        store.close()
+        report['segment_rows_per_sec'] = round(args.rows / elapsed)
+        segment_bytes = sum(os.path.getsize(os.path.join(root, name))
+                            for root, _, names in os.walk(store.directory) for name in names)
+        report['segment_bytes_per_check'] = round(segment_bytes / args.rows, 1)
+        report['segment_files'] = sum(len(names) for _, _, names in os.walk(store.directory))
+
+        # 范围扫描：随机目标、随机起点的固定时间窗口
+        rng = random.Random(args.seed)
+        window = timedelta(hours=args.window_hours)
+        span = timedelta(days=args.days) - window
+        queries = []
+        for _ in range(args.queries):
+            query_start = start + span * rng.random()
+            queries.append((rng.randint(1, args.targets), query_start, query_start + window))
+        naive_queries = [(target_id, s.replace(tzinfo=None), e.replace(tzinfo=None)) for target_id, s, e in queries]
+        report['rows_per_scan'] = store.summary(*queries[0])['checks']
+        report['scan_sql'] = timed_queries(scan_sql, naive_queries)
+        report['scan_orm'] = timed_queries(scan_orm, naive_queries)
+        report['scan_segments'] = timed_queries(store.summary, queries)
+        first_sql = scan_sql(*naive_queries[0])
+        first_segment = store.summary(*queries[0])
+        report['results_match'] = first_sql[:2] == (first_segment['checks'], first_segment['up'])
+        db.session.remove()
+
+    print(json.dumps(report, ensure_ascii=False))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
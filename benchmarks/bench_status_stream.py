@@ -0,0 +1,61 @@
+"""
+状态推送基准测试：把一批检查结果的状态变化发布给大量 SSE 订阅者，
+验证发布过程不执行任何SQL，每个订阅者都收到全部消息，并测量发布耗时；
+同时演示消费过慢的订阅者会被移除而不会阻塞发布方。
+
+用法: python benchmarks/bench_status_stream.py --subscribers 100 1000 10000 --changes 100
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from common import make_bench_app, QueryCounter
+from app import db
+from app.status_stream import StatusChange, StatusHub
+
+
+def run(bench_app, subscribers, changes, buffer_size):
+    hub = StatusHub(buffer_size=buffer_size, poll_interval=0) # 不启动轮询线程，只测直接发布
+    with bench_app.app_context():
+        clients = [hub.subscribe() for _ in range(subscribers)]
+        now = datetime.now(timezone.utc)
+        batch = [StatusChange(i, 'UP', 200, 12.5, now, 0, 1) for i in range(changes)]
+        with QueryCounter(db.engine) as counter:
+            started = time.perf_counter()
+            hub.publish(batch)
+            elapsed = time.perf_counter() - started
+    received = [client.take(0) for client in clients]
+    # 一个不读取消息的订阅者在积压超过上限后被移除，发布方不受影响
+    slow = hub.subscribe()
+    for version in range(2, buffer_size + 3):
+        hub.publish([StatusChange(0, 'DOWN', 500, 1.0, now, version, version)])
+    return {
+        'benchmark': 'status_stream',
+        'subscribers': subscribers,
+        'changes': changes,
+        'queries': counter.count,
+        'all_delivered': all(frames is not None and len(frames) == changes for frames in received),
+        'publish_ms': round(elapsed * 1000, 2),
+        'us_per_delivery': round(elapsed * 1e6 / (subscribers * changes), 3),
+        'slow_subscriber_dropped': slow.dropped,
+        'stats': hub.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--changes', type=int, default=100, help='一批结果中的状态变化条数')
+    parser.add_argument('--buffer', type=int, default=256, help='每个订阅者的缓冲上限')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_app = make_bench_app('sqlite:///' + os.path.join(tmp, 'stream.db'))
+        for subscribers in args.subscribers:
+            print(json.dumps(run(bench_app, subscribers, args.changes, args.buffer), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+探测 worker 启动与调度对账基准测试：在大量目标下测量 worker 第一次心跳 (领取全部租约并装入调度器) 的耗时，
+之后没有任何变化时一次心跳的耗时，以及修改、删除一个目标后把变化同步到调度器的耗时和SQL语句数。
+
+用法: python benchmarks/bench_worker_startup.py --targets 10000 50000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from common import make_bench_app, QueryCounter
+from app import db
+from app.dispatcher import CheckDispatcher
+from app.models import MonitoredTarget
+from app.pipeline_state import mark_targets_changed
+from app.retention import delete_target_history
+from app.worker import CheckWorker
+
+
+def seed(bench_app, targets):
+    with bench_app.app_context():
+        db.session.execute(MonitoredTarget.__table__.insert(), [
+            {'id': i, 'name': f'bench-{i:06d}', 'url': f'http://bench.invalid/{i}', 'check_interval_seconds': 300,
+             'is_active': True} for i in range(1, targets + 1)])
+        db.session.commit()
+
+
+def measure(func):
+    with QueryCounter(db.engine) as counter:
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+    return round(elapsed, 1), counter.count
+
+
+def run(targets):
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_app = make_bench_app('sqlite:///' + os.path.join(tmp, 'worker.db'))
+        seed(bench_app, targets)
+        dispatcher = CheckDispatcher()
+        worker = CheckWorker()
+        worker.init_app(bench_app, dispatcher)
+        report = {'benchmark': 'worker_startup', 'targets': targets}
+        with bench_app.app_context():
+            report['startup_ms'], report['startup_queries'] = measure(worker.heartbeat)
+            report['scheduled'] = len(dispatcher)
+            report['idle_heartbeat_ms'], report['idle_heartbeat_queries'] = measure(worker.heartbeat)
+
+            target = db.session.get(MonitoredTarget, targets // 2)
+            target.check_interval_seconds = 600
+            mark_targets_changed(target)
+            db.session.commit()
+            report['edit_reconcile_ms'], report['edit_reconcile_queries'] = measure(worker.reconcile)
+            report['edit_applied'] = dispatcher.load_stats()['nominal_checks_per_min'] < targets * 60 / 300
+
+            delete_target_history(targets // 3)
+            db.session.commit()
+            report['delete_reconcile_ms'], report['delete_reconcile_queries'] = measure(worker.reconcile)
+            report['delete_applied'] = targets // 3 not in dispatcher
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--targets', type=int, nargs='+', default=[10000, 50000])
+    args = parser.parse_args()
+    for targets in args.targets:
+        print(json.dumps(run(targets), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
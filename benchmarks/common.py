@@ -0,0 +1,63 @@
+"""
+基准测试脚本共用的工具函数。
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, pct):
+    """
+    返回 values 的第 pct 百分位数 (最近秩法)，values 为空时返回 None。
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def make_bench_app(database_uri, with_routes=False):
+    """
+    创建一个只初始化数据库的Flask应用 (不启动检查流水线)，并建好所有数据表。
+    :param with_routes: 为 True 时同时注册页面蓝本，以便用测试客户端请求页面。
+    """
+    from flask import Flask
+    from app import db
+    import app.models # noqa: F401 确保模型已注册
+
+    bench_app = Flask('app')
+    bench_app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    bench_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    bench_app.config['SECRET_KEY'] = 'bench'
+    db.init_app(bench_app)
+    if with_routes:
+        from app import routes
+        bench_app.register_blueprint(routes.bp)
+    with bench_app.app_context():
+        db.drop_all()
+        db.create_all()
+    return bench_app
+
+
+class QueryCounter:
+    """
+    统计上下文期间执行的SQL语句条数。
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
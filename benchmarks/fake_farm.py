@@ -0,0 +1,176 @@
+"""
+本地模拟目标服务器集群 (基准测试用)。
+
+在若干个本地端口上启动极简的 asyncio HTTP 服务器，每个端口模拟一个“主机”，
+可以配置响应延迟、错误率、超时比例和响应体大小；传入 ssl_context 时以 HTTPS 提供服务。
+"""
+import asyncio
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+import threading
+
+
+def self_signed_contexts(host='127.0.0.1', days=1):
+    """
+    用 openssl 命令行生成一张自签名证书，返回 (服务端 SSLContext, 信任该证书的客户端 SSLContext)。
+    :param days: 证书的有效天数。
+    """
+    workdir = tempfile.mkdtemp(prefix='webpulse-tls-')
+    cert = os.path.join(workdir, 'cert.pem')
+    key = os.path.join(workdir, 'key.pem')
+    san = f"IP:{host}" if host.replace('.', '').isdigit() else f"DNS:{host}"
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', str(days),
+                    '-keyout', key, '-out', cert, '-subj', f'/CN={host}', '-addext', f'subjectAltName={san}'],
+                   check=True, capture_output=True)
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert, key)
+    client_context = ssl.create_default_context(cafile=cert)
+    return server_context, client_context
+
+
+class FakeTargetFarm:
+    """
+    模拟目标集群。可以在当前事件循环中使用 (start/close)，
+    也可以通过 start_in_thread() 在独立线程中运行，供同步代码调用。
+    """
+
+    def __init__(self, ports=20, host='127.0.0.1', latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, timeout_rate=0.0, body_bytes=0, seed=42, ssl_context=None):
+        self.port_count = ports
+        self.ssl_context = ssl_context # 服务端 SSLContext，为 None 时使用明文 HTTP
+        self.host = host
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate # 命中时服务器只接收请求而不响应，用于模拟超时
+        self.body = b'x' * body_bytes
+        self.requests_served = 0
+        self._random = random.Random(seed)
+        self._servers = []
+        self._loop = None
+        self._thread = None
+        self.ports = []
+
+    async def start(self):
+        for _ in range(self.port_count):
+            server = await asyncio.start_server(self._handle, self.host, 0, ssl=self.ssl_context)
+            self._servers.append(server)
+            self.ports.append(server.sockets[0].getsockname()[1])
+        return self
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+        self._servers = []
+        # 取消仍在处理中的连接 (例如模拟超时的连接)
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def urls(self, count, scheme=None):
+        """
+        生成 count 个目标URL，均匀分布在各个端口上。
+        """
+        scheme = scheme or ('https' if self.ssl_context else 'http')
+        return [f"{scheme}://{self.host}:{self.ports[i % len(self.ports)]}/t/{i}" for i in range(count)]
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                keep_alive = b'connection: close' not in head.lower()
+                roll = self._random.random()
+                if roll < self.timeout_rate:
+                    await asyncio.sleep(3600)
+                    return
+                delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+                if delay:
+                    await asyncio.sleep(delay / 1000)
+                status = b'500 Internal Server Error' if roll < self.timeout_rate + self.error_rate else b'200 OK'
+                body = b'' if head.startswith(b'HEAD ') else self.body
+                writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Length: ' + str(len(self.body)).encode()
+                             + b'\r\nContent-Type: text/plain\r\n'
+                             + (b'' if keep_alive else b'Connection: close\r\n') + b'\r\n' + body)
+                await writer.drain()
+                self.requests_served += 1
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def start_in_thread(self):
+        """
+        在独立线程的事件循环中启动集群，返回时所有端口已开始监听。
+        """
+        ready = threading.Event()
+
+        def _run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name='fake-farm', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.close(), self._loop).result(10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+
+
+def _serve_forever(conn, options):
+    farm = FakeTargetFarm(**options)
+
+    async def _main():
+        await farm.start()
+        conn.send(farm.ports)
+        # 父进程关闭管道或发送任意消息时退出
+        await asyncio.get_running_loop().run_in_executor(None, _wait_closed, conn)
+        await farm.close()
+
+    asyncio.run(_main())
+
+
+def _wait_closed(conn):
+    try:
+        conn.recv()
+    except EOFError:
+        pass
+
+
+class FarmProcess:
+    """
+    在独立进程中运行的模拟目标集群，避免模拟服务器与被测的探测代码争用同一个 GIL。
+    不支持 ssl_context (SSLContext 无法跨进程传递)。
+    """
+
+    def __init__(self, host='127.0.0.1', **options):
+        import multiprocessing
+        self.host = host
+        context = multiprocessing.get_context('spawn')
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(target=_serve_forever, args=(child_conn, dict(options, host=host)),
+                                        name='fake-farm', daemon=True)
+        self._process.start()
+        child_conn.close()
+        self.ports = self._conn.recv()
+
+    def urls(self, count):
+        return [f"http://{self.host}:{self.ports[i % len(self.ports)]}/t/{i}" for i in range(count)]
+
+    def stop(self):
+        self._conn.close()
+        self._process.join(10)
+        if self._process.is_alive():
+            self._process.terminate()
@@ -0,0 +1,398 @@
+"""
+基准测试套件：用固定的随机种子和参数依次运行各项测量，输出机器可读的结果，便于对比不同版本。
+
+场景 (--only 可以只运行其中几项)：
+  seed       向测试数据库写入目标、check_log 历史 (完整配置下为数百万行)、target_status 和聚合数据，并记录写入速率
+  probe      探测引擎对模拟目标集群检查一轮：吞吐量、响应时间与调度延迟分位数、按类别统计的失败数
+  schedule   调度器 + 探测引擎持续运行一段时间：调度延迟 (计划时间 -> 开始检查) 的分布和每秒分发量
+  db_write   结果写入器批量写库的速率和每批耗时
+  dashboard  仪表盘请求耗时 (缓存未命中 / 命中 / 304)
+  logs_page  日志页请求耗时 (最新一页 / 深层游标页 / 带总数统计)
+
+模拟目标集群运行在独立进程中，可以配置延迟、抖动、错误率、超时比例和响应体大小。
+数据库默认为临时目录中的 SQLite；--database-url 可以指定 PostgreSQL 等其他数据库
+(注意：会删除并重建其中的全部数据表)。
+
+结果以 JSON Lines 输出到标准输出 (每个场景一行)，--output 额外写入包含运行环境信息的完整 JSON 文件；
+--compare 读取之前保存的结果文件，输出每个指标的变化百分比。
+
+用法: python benchmarks/run_suite.py --profile quick --output before.json
+      python benchmarks/run_suite.py --profile quick --output after.json --compare before.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from bench_dispatcher import TargetRow
+from common import make_bench_app, percentile, QueryCounter
+from app import db, dashboard_cache
+from app.dispatcher import CheckDispatcher
+from app.models import MonitoredTarget, CheckLog, TargetStatus
+from app.pagination import encode_cursor
+from app.probe_engine import ProbeEngine, ProbeTarget, ProbeResult
+from app.result_writer import ResultWriter
+from app.rollups import backfill_rollups
+from fake_farm import FarmProcess
+
+SCENARIOS = ('seed', 'probe', 'schedule', 'db_write', 'dashboard', 'logs_page')
+
+# 预设的规模；命令行中显式给出的参数会覆盖这些值
+PROFILES = {
+    'quick': {'targets': 1000, 'logs': 100000, 'checks': 2000, 'schedule_seconds': 10, 'writes': 20000},
+    'default': {'targets': 10000, 'logs': 1000000, 'checks': 10000, 'schedule_seconds': 30, 'writes': 100000},
+    'full': {'targets': 50000, 'logs': 5000000, 'checks': 50000, 'schedule_seconds': 60, 'writes': 500000},
+}
+
+_SEED_CHUNK = 50000
+
+
+def timed_ms(func, repeat):
+    """
+    执行 repeat 次，返回每次耗时 (毫秒) 的列表。
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def summarize(prefix, samples, unit='ms', pcts=(50, 95, 99)):
+    """
+    把一组样本汇总为 {prefix_p50_ms: ..., prefix_max_ms: ...} 形式的指标。
+    """
+    report = {f'{prefix}_p{pct}_{unit}': _round(percentile(samples, pct)) for pct in pcts}
+    report[f'{prefix}_max_{unit}'] = _round(max(samples)) if samples else None
+    return report
+
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+def seed_database(bench_app, args):
+    """
+    写入 args.targets 个目标和 args.logs 条检查日志 (分布在最近 args.history_days 天内)。
+    约五分之一的日志属于 1 号目标，用于测量日志深层翻页；其余日志平均分给全部目标。
+    """
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    span = args.history_days * 86400
+    heavy_logs = args.logs // 5
+    per_target = max((args.logs - heavy_logs) // args.targets, 1)
+    report = {'targets': args.targets, 'logs': 0}
+    started = time.perf_counter()
+    with bench_app.app_context():
+        db.session.execute(MonitoredTarget.__table__.insert(), [
+            {'id': i, 'name': f'bench-{i:06d}', 'url': f'http://bench.invalid/{i}', 'check_interval_seconds': 30,
+             'is_active': True} for i in range(1, args.targets + 1)])
+
+        def entries():
+            for offset in range(heavy_logs):
+                yield 1, now - timedelta(seconds=span * (heavy_logs - offset) / heavy_logs)
+            for offset in range(per_target):
+                ts = now - timedelta(seconds=span * (per_target - offset) / per_target)
+                for target_id in range(1, args.targets + 1):
+                    yield target_id, ts
+
+        chunk = []
+        for target_id, ts in entries():
+            down = rng.random() < args.error_rate
+            chunk.append({'target_id': target_id, 'timestamp': ts, 'status_code': 500 if down else 200,
+                          'status_text': 'DOWN' if down else 'UP', 'response_time_ms': round(rng.uniform(5, 300), 2),
+                          'details': 'HTTP 错误状态码: 500 - Internal Server Error' if down else ''})
+            if len(chunk) >= _SEED_CHUNK:
+                db.session.execute(CheckLog.__table__.insert(), chunk)
+                report['logs'] += len(chunk)
+                chunk = []
+        if chunk:
+            db.session.execute(CheckLog.__table__.insert(), chunk)
+            report['logs'] += len(chunk)
+        db.session.execute(TargetStatus.__table__.insert(), [
+            {'target_id': i, 'status_text': 'UP', 'status_code': 200, 'response_time_ms': 10.0,
+             'checked_at': now, 'consecutive_failures': 0, 'version': 0} for i in range(1, args.targets + 1)])
+        db.session.commit()
+        logs_elapsed = time.perf_counter() - started
+        report['log_rows_per_sec'] = round(report['logs'] / logs_elapsed, 1)
+        rollup_started = time.perf_counter()
+        _, written = backfill_rollups()
+        report['rollup_backfill_s'] = round(time.perf_counter() - rollup_started, 2)
+        report['rollup_rows'] = written
+    report['elapsed_s'] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def _farm(args):
+    return FarmProcess(ports=args.hosts, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                       error_rate=args.error_rate, timeout_rate=args.timeout_rate, body_bytes=args.body_bytes,
+                       seed=args.seed)
+
+
+def run_probe(args, farm):
+    results = []
+    done = threading.Event()
+
+    def on_result(result):
+        results.append(result)
+        if len(results) == args.checks:
+            done.set()
+
+    engine = ProbeEngine(result_handler=on_result, max_in_flight=args.max_in_flight, per_host_limit=args.per_host,
+                         timeout=args.probe_timeout, stats_log_interval=0)
+    engine.start()
+    urls = farm.urls(args.checks)
+    # 响应体校验需要读取响应体，以便 body_bytes 参数真正影响传输量
+    keyword = 'x' if args.body_bytes else None
+    now = time.monotonic()
+    started = time.perf_counter()
+    engine.submit(ProbeTarget(i, f'bench-{i}', url, now, body_keyword=keyword) for i, url in enumerate(urls))
+    done.wait(args.probe_timeout * 2 + 600)
+    elapsed = time.perf_counter() - started
+    engine.stop()
+
+    report = {'checks': args.checks, 'completed': len(results), 'elapsed_s': round(elapsed, 3),
+              'checks_per_sec': round(len(results) / elapsed, 1)}
+    report.update(summarize('latency', [r.response_time_ms for r in results if r.response_time_ms is not None]))
+    report.update(summarize('lag', [r.lag_ms for r in results if r.lag_ms is not None]))
+    errors = {}
+    for result in results:
+        if result.error_class:
+            errors[result.error_class] = errors.get(result.error_class, 0) + 1
+    report['errors'] = dict(sorted(errors.items()))
+    return report
+
+
+def run_schedule(args, farm):
+    # 目标间隔按 schedule_interval 设置，使持续时间内每个目标被检查若干次
+    lags = []
+    finished = []
+
+    def on_result(result):
+        # 探测引擎的结果回调在单个线程中执行
+        finished.append(time.monotonic())
+        if result.lag_ms is not None:
+            lags.append(result.lag_ms)
+
+    engine = ProbeEngine(result_handler=on_result, max_in_flight=args.max_in_flight, per_host_limit=args.per_host,
+                         timeout=args.probe_timeout, stats_log_interval=0)
+    engine.start()
+    dispatcher = CheckDispatcher(engine)
+    started = time.perf_counter()
+    dispatcher.load(TargetRow(i, f'bench-{i}', url, args.schedule_interval, 'GET', 65536, None, None, False)
+                    for i, url in enumerate(farm.urls(args.targets)))
+    load_ms = (time.perf_counter() - started) * 1000
+    begin = time.monotonic()
+    dispatcher.start()
+    time.sleep(args.schedule_seconds)
+    dispatcher.stop()
+    engine.stop()
+
+    per_second = [0] * int(args.schedule_seconds)
+    for ts in finished:
+        second = int(ts - begin)
+        if 0 <= second < len(per_second):
+            per_second[second] += 1
+    report = {'targets': args.targets, 'interval_s': args.schedule_interval, 'load_ms': round(load_ms, 1),
+              'checks': len(finished), 'checks_per_sec': round(len(finished) / args.schedule_seconds, 1),
+              'per_second_min': min(per_second), 'per_second_max': max(per_second)}
+    report.update(summarize('lag', lags, pcts=(50, 90, 99)))
+    return report
+
+
+def run_db_write(bench_app, args):
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    results = []
+    for i in range(args.writes):
+        target_id = rng.randint(1, args.targets)
+        down = rng.random() < args.error_rate
+        results.append(ProbeResult(target_id, now + timedelta(microseconds=i), 500 if down else 200,
+                                   'DOWN' if down else 'UP', round(rng.uniform(5, 300), 2),
+                                   'HTTP 错误状态码: 500 - Internal Server Error' if down else '', None,
+                                   f'bench-{target_id}'))
+    writer = ResultWriter(batch_size=args.batch_size, flush_interval=0.5, check_log_mode='debug')
+    writer.init_app(bench_app)
+    writer.start()
+    started = time.perf_counter()
+    for result in results:
+        writer.submit(result)
+    writer.stop()
+    elapsed = time.perf_counter() - started
+    return {'results': args.writes, 'batch_size': args.batch_size, 'rows_written': writer.rows_written,
+            'rows_per_sec': round(writer.rows_written / elapsed, 1), 'batches': writer.batches_written,
+            'avg_flush_ms': round(writer.flush_seconds * 1000 / writer.batches_written, 2) if writer.batches_written else None,
+            'dropped': writer.dropped}
+
+
+def run_dashboard(bench_app, args):
+    client = bench_app.test_client()
+    dashboard_cache.invalidate()
+
+    def miss():
+        dashboard_cache.invalidate()
+        assert client.get('/').status_code == 200
+
+    report = {'targets': args.targets}
+    with bench_app.app_context(), QueryCounter(db.engine) as counter:
+        miss()
+    report['miss_queries'] = counter.count
+    report.update(summarize('miss', timed_ms(miss, args.repeat), pcts=(50, 95)))
+    report.update(summarize('hit', timed_ms(lambda: client.get('/'), args.repeat * 5), pcts=(50, 95)))
+    etag = client.get('/').headers['ETag']
+    report.update(summarize('not_modified', timed_ms(lambda: client.get('/', headers={'If-None-Match': etag}),
+                                                     args.repeat * 5), pcts=(50, 95)))
+    return report
+
+
+def run_logs_page(bench_app, args):
+    client = bench_app.test_client()
+    with bench_app.app_context():
+        heavy_logs = db.session.scalar(db.select(db.func.count()).select_from(CheckLog).where(CheckLog.target_id == 1))
+        # 用 OFFSET 取到中间位置的一条日志作为游标，模拟翻到很深的一页
+        anchor = db.session.execute(
+            db.select(CheckLog.timestamp, CheckLog.id).where(CheckLog.target_id == 1)
+            .order_by(CheckLog.timestamp.desc(), CheckLog.id.desc()).offset(heavy_logs // 2).limit(1)).first()
+    cursor = encode_cursor(anchor.timestamp, anchor.id) if anchor else None
+
+    def get(query=''):
+        assert client.get(f'/target/1/logs{query}').status_code == 200
+
+    report = {'target_logs': heavy_logs}
+    report.update(summarize('first_page', timed_ms(get, args.repeat), pcts=(50, 95)))
+    if cursor:
+        report.update(summarize('deep_page', timed_ms(lambda: get(f'?before={cursor}'), args.repeat), pcts=(50, 95)))
+    report.update(summarize('with_count', timed_ms(lambda: get('?count=1'), args.repeat), pcts=(50, 95)))
+    return report
+
+
+def environment(args, database_uri):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': database_uri.split(':', 1)[0],
+        'params': {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'compare', 'database_url')},
+    }
+
+
+def compare(current, baseline_path):
+    """
+    对比两次运行的结果，输出每个数值指标的变化。
+    :return: 对比行 (字典) 的列表。
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    rows = []
+    for scenario, metrics in current['results'].items():
+        before = baseline.get('results', {}).get(scenario, {})
+        for key, value in metrics.items():
+            old = before.get(key)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = round((value - old) / old * 100, 1) if old else None
+            rows.append({'scenario': scenario, 'metric': key, 'baseline': old, 'current': value, 'change_pct': change})
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, help='只运行指定的场景 (seed 会在需要数据库时自动运行)')
+    parser.add_argument('--database-url', help='测试数据库 (默认使用临时目录中的 SQLite)')
+    parser.add_argument('--output', help='把完整结果写入该 JSON 文件')
+    parser.add_argument('--compare', help='与之前保存的结果文件对比')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子，保证两次运行的数据和故障注入相同')
+    scale = parser.add_argument_group('规模 (默认取 --profile 的预设值)')
+    scale.add_argument('--targets', type=int)
+    scale.add_argument('--logs', type=int, help='写入的 check_log 行数')
+    scale.add_argument('--checks', type=int, help='probe 场景检查的目标数')
+    scale.add_argument('--schedule-seconds', type=float)
+    scale.add_argument('--writes', type=int, help='db_write 场景写入的结果数')
+    farm = parser.add_argument_group('模拟目标集群')
+    farm.add_argument('--hosts', type=int, default=50, help='模拟的主机(端口)数量')
+    farm.add_argument('--latency-ms', type=float, default=20)
+    farm.add_argument('--jitter-ms', type=float, default=10)
+    farm.add_argument('--error-rate', type=float, default=0.01, help='返回 500 的比例 (同时用于生成历史日志)')
+    farm.add_argument('--timeout-rate', type=float, default=0.0, help='不响应 (检查超时) 的比例')
+    farm.add_argument('--body-bytes', type=int, default=0, help='响应体大小；大于 0 时检查会读取并校验响应体')
+    tuning = parser.add_argument_group('被测组件参数')
+    tuning.add_argument('--max-in-flight', type=int, default=500)
+    tuning.add_argument('--per-host', type=int, default=20)
+    tuning.add_argument('--probe-timeout', type=int, default=2)
+    tuning.add_argument('--schedule-interval', type=int, default=5, help='schedule 场景中每个目标的检查间隔(秒)')
+    tuning.add_argument('--batch-size', type=int, default=500)
+    tuning.add_argument('--history-days', type=int, default=7)
+    tuning.add_argument('--repeat', type=int, default=5, help='页面请求的重复次数')
+    args = parser.parse_args(argv)
+    for key, value in PROFILES[args.profile].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger('app').setLevel(logging.WARNING) # 避免逐条日志输出影响计时
+    scenarios = [name for name in SCENARIOS if not args.only or name in args.only]
+    if not args.only or set(args.only) & {'db_write', 'dashboard', 'logs_page'}:
+        scenarios = ['seed'] + [name for name in scenarios if name != 'seed']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_uri = args.database_url or 'sqlite:///' + os.path.join(tmp, 'suite.db')
+        document = {'suite': 'webpulse', 'environment': environment(args, database_uri), 'results': {}}
+        bench_app = None
+        farm = None
+        try:
+            for name in scenarios:
+                print(f"运行场景 {name} ...", file=sys.stderr)
+                started = time.perf_counter()
+                if name in ('probe', 'schedule'):
+                    farm = farm or _farm(args)
+                    report = run_probe(args, farm) if name == 'probe' else run_schedule(args, farm)
+                else:
+                    if bench_app is None:
+                        bench_app = make_bench_app(database_uri, with_routes=True)
+                    if name == 'seed':
+                        report = seed_database(bench_app, args)
+                    elif name == 'db_write':
+                        report = run_db_write(bench_app, args)
+                    elif name == 'dashboard':
+                        report = run_dashboard(bench_app, args)
+                    else:
+                        report = run_logs_page(bench_app, args)
+                report['scenario_s'] = round(time.perf_counter() - started, 2)
+                document['results'][name] = report
+                print(json.dumps({'benchmark': name, **report}, ensure_ascii=False), flush=True)
+        finally:
+            if farm is not None:
+                farm.stop()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        for row in compare(document, args.compare):
+            print(json.dumps({'benchmark': 'compare', **row}, ensure_ascii=False))
+    return document
+
+
+if __name__ == '__main__':
+    main()
@@ -32,6 +32,147 @@ class Config:
     # 如果需要通过Flask API与调度器交互，可以启用此项
     SCHEDULER_API_ENABLED = os.environ.get('SCHEDULER_API_ENABLED', 'True').lower() in ['true', '1', 't']
 
+    # 探测 worker 配置
+    # Web 进程默认不运行检查调度，检查由 python worker.py 启动的独立 worker 进程执行；
+    # 设置 RUN_EMBEDDED_WORKER=1 时在 Web 进程内同时运行一个 worker (单进程部署或开发环境)
+    RUN_EMBEDDED_WORKER = os.environ.get('RUN_EMBEDDED_WORKER', 'False').lower() in ['true', '1', 't']
+    WORKER_ID = os.environ.get('WORKER_ID') # 可选的固定 worker ID，默认为 主机名-进程号-随机后缀
+    # 心跳与重新划分目标的间隔、目标租约的有效期、多久没有心跳视为 worker 已退出，以及处理目标变化通知和“立即检查”请求的间隔(秒)
+    WORKER_HEARTBEAT_SECONDS = int(os.environ.get('WORKER_HEARTBEAT_SECONDS', 10))
+    WORKER_LEASE_SECONDS = int(os.environ.get('WORKER_LEASE_SECONDS', 30))
+    WORKER_DEAD_AFTER_SECONDS = int(os.environ.get('WORKER_DEAD_AFTER_SECONDS', 30))
+    WORKER_POLL_SECONDS = float(os.environ.get('WORKER_POLL_SECONDS', 2))
+    # 目标的增删改通过变化通知增量同步到调度器；此外至少每隔这么多秒全量对账一次，
+    # 用于纠正绕过应用直接修改数据库等没有发出通知的变化
+    WORKER_FULL_RECONCILE_SECONDS = int(os.environ.get('WORKER_FULL_RECONCILE_SECONDS', 300))
+
+    # 探测引擎配置
+    # 全局同时进行中的检查数上限、对同一主机的并发上限，以及单次检查的超时时间(秒)
+    PROBE_MAX_IN_FLIGHT = int(os.environ.get('PROBE_MAX_IN_FLIGHT', 500))
+    PROBE_PER_HOST_LIMIT = int(os.environ.get('PROBE_PER_HOST_LIMIT', 6))
+    PROBE_TIMEOUT_SECONDS = int(os.environ.get('PROBE_TIMEOUT_SECONDS', 10))
+    # DNS缓存有效期(秒)：标准库解析不返回记录的TTL，统一按此值缓存
+    PROBE_DNS_CACHE_TTL = int(os.environ.get('PROBE_DNS_CACHE_TTL', 300))
+    # keep-alive 连接池：每个主机保留的空闲连接数 (默认与单主机并发上限相同)、合计上限，以及空闲连接的保留时间(秒)
+    PROBE_POOL_MAX_PER_HOST = int(os.environ.get('PROBE_POOL_MAX_PER_HOST', PROBE_PER_HOST_LIMIT))
+    PROBE_POOL_MAX_TOTAL = int(os.environ.get('PROBE_POOL_MAX_TOTAL', 1000))
+    PROBE_POOL_IDLE_SECONDS = int(os.environ.get('PROBE_POOL_IDLE_SECONDS', 60))
+    # 定期在日志中输出DNS缓存命中率和连接池统计的间隔(秒)，0 表示不输出 (过期的DNS缓存和空闲连接总是每隔 PROBE_POOL_IDLE_SECONDS 秒清理)
+    PROBE_STATS_LOG_INTERVAL = int(os.environ.get('PROBE_STATS_LOG_INTERVAL', 300))
+    # 探测子进程数：0 表示在 worker 进程内的单个事件循环中执行全部检查；
+    # 大于 0 时按主机把检查分给多个探测子进程，以利用多个 CPU 核心 (上面的并发与连接池上限按每个子进程计算)
+    PROBE_PROCESSES = int(os.environ.get('PROBE_PROCESSES', 0))
+    # 检查调度器每次交给探测引擎的最大目标数
+    DISPATCHER_MAX_BATCH = int(os.environ.get('DISPATCHER_MAX_BATCH', 1000))
+
+    # 自适应检查频率 (默认关闭，所有目标严格按配置的间隔检查)
+    # 开启后：连续正常 ADAPTIVE_BACKOFF_AFTER 次的目标把间隔乘以 ADAPTIVE_BACKOFF_FACTOR，最多放宽到 ADAPTIVE_MAX_INTERVAL_SECONDS；
+    # 正常的目标检查失败时，先间隔 ADAPTIVE_RETRY_DELAY_SECONDS 秒 (之后每次加倍) 重试 ADAPTIVE_CONFIRM_RETRIES 次，仍失败才记录故障；
+    # 故障恢复后以 ADAPTIVE_RECOVERY_INTERVAL_SECONDS 秒的间隔复查 ADAPTIVE_RECOVERY_CHECKS 次
+    ADAPTIVE_CHECKS = os.environ.get('ADAPTIVE_CHECKS', 'False').lower() in ['true', '1', 't']
+    ADAPTIVE_MAX_INTERVAL_SECONDS = int(os.environ.get('ADAPTIVE_MAX_INTERVAL_SECONDS', 3600))
+    ADAPTIVE_BACKOFF_AFTER = int(os.environ.get('ADAPTIVE_BACKOFF_AFTER', 3))
+    ADAPTIVE_BACKOFF_FACTOR = float(os.environ.get('ADAPTIVE_BACKOFF_FACTOR', 2.0))
+    ADAPTIVE_CONFIRM_RETRIES = int(os.environ.get('ADAPTIVE_CONFIRM_RETRIES', 2))
+    ADAPTIVE_RETRY_DELAY_SECONDS = float(os.environ.get('ADAPTIVE_RETRY_DELAY_SECONDS', 5))
+    ADAPTIVE_RECOVERY_CHECKS = int(os.environ.get('ADAPTIVE_RECOVERY_CHECKS', 3))
+    ADAPTIVE_RECOVERY_INTERVAL_SECONDS = int(os.environ.get('ADAPTIVE_RECOVERY_INTERVAL_SECONDS', 30))
+
+    # 仪表盘实时推送 (Server-Sent Events) 配置
+    # 每个客户端最多积压的消息数 (超过则断开，客户端会重新加载页面)，以及供重连补发而保留的最近消息数
+    STATUS_STREAM_BUFFER = int(os.environ.get('STATUS_STREAM_BUFFER', 256))
+    STATUS_STREAM_REPLAY = int(os.environ.get('STATUS_STREAM_REPLAY', 1000))
+    # Web 进程读取数据库版本号以发现其他进程写入的新结果的间隔(秒)，以及空闲时发送心跳的间隔(秒)
+    STATUS_STREAM_POLL_SECONDS = float(os.environ.get('STATUS_STREAM_POLL_SECONDS', 2))
+    STATUS_STREAM_KEEPALIVE_SECONDS = int(os.environ.get('STATUS_STREAM_KEEPALIVE_SECONDS', 15))
+
+    # 告警通知
+    # ALERT_SINKS 为逗号分隔的通知渠道：stdout、webhook (POST JSON 到 ALERT_WEBHOOK_URL)、smtp；为空时不启用告警
+    ALERT_SINKS = os.environ.get('ALERT_SINKS', '')
+    ALERT_WEBHOOK_URL = os.environ.get('ALERT_WEBHOOK_URL')
+    ALERT_SMTP_HOST = os.environ.get('ALERT_SMTP_HOST')
+    ALERT_SMTP_PORT = int(os.environ.get('ALERT_SMTP_PORT', 25))
+    ALERT_SMTP_SENDER = os.environ.get('ALERT_SMTP_SENDER')
+    ALERT_SMTP_RECIPIENTS = os.environ.get('ALERT_SMTP_RECIPIENTS', '') # 逗号分隔的收件人
+    ALERT_SMTP_USERNAME = os.environ.get('ALERT_SMTP_USERNAME')
+    ALERT_SMTP_PASSWORD = os.environ.get('ALERT_SMTP_PASSWORD')
+    ALERT_SMTP_STARTTLS = os.environ.get('ALERT_SMTP_STARTTLS', 'False').lower() in ['true', '1', 't']
+    ALERT_SINK_TIMEOUT_SECONDS = int(os.environ.get('ALERT_SINK_TIMEOUT_SECONDS', 10))
+    # 连续失败多少次发出故障通知；响应时间阈值(毫秒，0 表示不检查) 及连续超过多少次才通知
+    ALERT_FAILURE_THRESHOLD = int(os.environ.get('ALERT_FAILURE_THRESHOLD', 2))
+    ALERT_LATENCY_MS = float(os.environ.get('ALERT_LATENCY_MS', 0))
+    ALERT_LATENCY_BREACHES = int(os.environ.get('ALERT_LATENCY_BREACHES', 3))
+    # ALERT_FLAP_WINDOW_SECONDS 秒内状态切换 ALERT_FLAP_TRANSITIONS 次视为反复切换，期间只通知一次
+    ALERT_FLAP_WINDOW_SECONDS = int(os.environ.get('ALERT_FLAP_WINDOW_SECONDS', 600))
+    ALERT_FLAP_TRANSITIONS = int(os.environ.get('ALERT_FLAP_TRANSITIONS', 5))
+    # 同一目标同类通知的最短间隔(秒)、每分钟最多发送的通知数 (超出的合并为一条摘要)，以及发送队列上限
+    ALERT_COOLDOWN_SECONDS = int(os.environ.get('ALERT_COOLDOWN_SECONDS', 300))
+    ALERT_RATE_LIMIT_PER_MINUTE = int(os.environ.get('ALERT_RATE_LIMIT_PER_MINUTE', 30))
+    ALERT_QUEUE_SIZE = int(os.environ.get('ALERT_QUEUE_SIZE', 1000))
+
+    # 检查结果批量写入配置
+    # 每批最多写入的条数、最长攒批时间(秒)、内存队列上限，以及队列满时提交结果的最长等待时间(秒)
+    RESULT_WRITER_BATCH_SIZE = int(os.environ.get('RESULT_WRITER_BATCH_SIZE', 500))
+    RESULT_WRITER_FLUSH_INTERVAL = float(os.environ.get('RESULT_WRITER_FLUSH_INTERVAL', 1.0))
+    RESULT_WRITER_QUEUE_SIZE = int(os.environ.get('RESULT_WRITER_QUEUE_SIZE', 10000))
+    RESULT_WRITER_PUT_TIMEOUT = float(os.environ.get('RESULT_WRITER_PUT_TIMEOUT', 30))
+
+    # 原始检查历史的存储方式：sql 写入 check_log 表 (默认)；segments 追加到按目标和日期切分的二进制段文件，
+    # 每条 24 字节，读取时通过 mmap 扫描 (聚合表和当前状态仍在数据库中)。段文件目录默认为 instance/segments
+    RAW_HISTORY_BACKEND = os.environ.get('RAW_HISTORY_BACKEND', 'sql').lower()
+    SEGMENT_STORE_DIR = os.environ.get('SEGMENT_STORE_DIR')
+    SEGMENT_MAX_OPEN_FILES = int(os.environ.get('SEGMENT_MAX_OPEN_FILES', 256))
+
+    # 只记录状态变化的目标 (日志记录方式为 changes) 在状态不变时，每隔多少秒写一行汇总记录 (检查次数和平均响应时间)
+    CHANGE_LOG_HEARTBEAT_SECONDS = int(os.environ.get('CHANGE_LOG_HEARTBEAT_SECONDS', 900))
+
+    # 远程探测代理 (python agent.py)：代理与服务器共用 AGENT_API_TOKEN，服务器未设置时代理接口不可用。
+    # 服务器端：解压后的结果批次大小上限 (字节)，批次ID保留多少小时用于识别重复上传，代理多少秒没有请求视为离线
+    AGENT_API_TOKEN = os.environ.get('AGENT_API_TOKEN')
+    AGENT_MAX_BATCH_BYTES = int(os.environ.get('AGENT_MAX_BATCH_BYTES', 16 * 1024 * 1024))
+    AGENT_BATCH_RETENTION_HOURS = int(os.environ.get('AGENT_BATCH_RETENTION_HOURS', 24))
+    AGENT_DEAD_AFTER_SECONDS = int(os.environ.get('AGENT_DEAD_AFTER_SECONDS', 120))
+    # 代理端：服务器地址、代理ID (默认为主机名，目标的 agent_id 填写此值) 和位置，
+    # 同步目标的间隔与全量同步间隔(秒)，上传批大小、批次最长等待时间(秒)，以及服务器不可用时最多积压的结果数
+    AGENT_SERVER_URL = os.environ.get('AGENT_SERVER_URL')
+    AGENT_ID = os.environ.get('AGENT_ID')
+    AGENT_LOCATION = os.environ.get('AGENT_LOCATION')
+    AGENT_SYNC_SECONDS = float(os.environ.get('AGENT_SYNC_SECONDS', 10))
+    AGENT_FULL_SYNC_SECONDS = int(os.environ.get('AGENT_FULL_SYNC_SECONDS', 300))
+    AGENT_BATCH_SIZE = int(os.environ.get('AGENT_BATCH_SIZE', 500))
+    AGENT_FLUSH_SECONDS = float(os.environ.get('AGENT_FLUSH_SECONDS', 2))
+    AGENT_MAX_PENDING_RESULTS = int(os.environ.get('AGENT_MAX_PENDING_RESULTS', 100000))
+    AGENT_TIMEOUT_SECONDS = int(os.environ.get('AGENT_TIMEOUT_SECONDS', 30))
+
+    # 数据保留策略 (天数，0 表示永久保留)
+    # 原始检查日志默认永久保留；设置后更早的数据只保留在聚合表中。
+    # 从没有聚合表的旧版本升级时，开启前先运行 flask backfill-rollups，否则被删除的日子没有聚合数据
+    CHECK_LOG_RETENTION_DAYS = int(os.environ.get('CHECK_LOG_RETENTION_DAYS', 0))
+    ROLLUP_MINUTE_RETENTION_DAYS = int(os.environ.get('ROLLUP_MINUTE_RETENTION_DAYS', 2))
+    ROLLUP_HOUR_RETENTION_DAYS = int(os.environ.get('ROLLUP_HOUR_RETENTION_DAYS', 90))
+    ROLLUP_DAY_RETENTION_DAYS = int(os.environ.get('ROLLUP_DAY_RETENTION_DAYS', 0))
+    # 清理任务的执行间隔(分钟)、每块删除的行数，以及单次运行的最长耗时(秒)
+    COMPACTION_INTERVAL_MINUTES = int(os.environ.get('COMPACTION_INTERVAL_MINUTES', 10))
+    COMPACTION_CHUNK_SIZE = int(os.environ.get('COMPACTION_CHUNK_SIZE', 5000))
+    COMPACTION_MAX_SECONDS = int(os.environ.get('COMPACTION_MAX_SECONDS', 30))
+
+    # 监控指标与检查日志
+    # 独立的探测 worker 进程在此端口提供 Prometheus 格式的 /metrics (0 表示不开启)；Web 进程始终提供 /metrics 路由
+    METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+    METRICS_HOST = os.environ.get('METRICS_HOST', '0.0.0.0')
+    # 每条检查结果的日志方式：all 每条输出一行；sampled 失败照常输出，正常结果每 CHECK_LOG_SAMPLE_RATE 条输出一条；
+    # debug 全部降为 DEBUG 级别。检查量大时逐条日志本身会占用可观的 CPU 和磁盘I/O
+    CHECK_LOG_MODE = os.environ.get('CHECK_LOG_MODE', 'all').lower()
+    CHECK_LOG_SAMPLE_RATE = int(os.environ.get('CHECK_LOG_SAMPLE_RATE', 100))
+
+    # 日志页每页显示的检查记录条数
+    LOGS_PER_PAGE = int(os.environ.get('LOGS_PER_PAGE', 20))
+
+    # 批量导入时每批校验后一起写入数据库的目标数
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))
+    # 脚本调用 /api/targets/import 时在 Authorization: Bearer 请求头中提供的令牌，未设置时该接口不可用
+    IMPORT_API_TOKEN = os.environ.get('IMPORT_API_TOKEN')
+
     # 日志配置 (示例，可以根据需要扩展)
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
 
@@ -0,0 +1,58 @@
+"""初始数据表：monitored_target 和 check_log
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'monitored_target',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('url', sa.String(length=512), nullable=False),
+        sa.Column('check_interval_seconds', sa.Integer(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('added_on', sa.DateTime(), nullable=True),
+        sa.Column('last_checked_on', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_monitored_target_is_active', 'monitored_target', ['is_active'], unique=False)
+    op.create_index('ix_monitored_target_name', 'monitored_target', ['name'], unique=False)
+    op.create_index('ix_monitored_target_url', 'monitored_target', ['url'], unique=True)
+
+    op.create_table(
+        'check_log',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('target_id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('status_text', sa.String(length=50), nullable=False),
+        sa.Column('response_time_ms', sa.Float(), nullable=True),
+        sa.Column('details', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['target_id'], ['monitored_target.id'], name='fk_checklog_target_id'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_check_log_target_id', 'check_log', ['target_id'], unique=False)
+    op.create_index('ix_check_log_timestamp', 'check_log', ['timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_check_log_timestamp', table_name='check_log')
+    op.drop_index('ix_check_log_target_id', table_name='check_log')
+    op.drop_table('check_log')
+    op.drop_index('ix_monitored_target_url', table_name='monitored_target')
+    op.drop_index('ix_monitored_target_name', table_name='monitored_target')
+    op.drop_index('ix_monitored_target_is_active', table_name='monitored_target')
+    op.drop_table('monitored_target')
@@ -0,0 +1,64 @@
+"""target_status 物化状态表，并根据已有的 check_log 回填
+
+Revision ID: 0002_target_status
+Revises: 0001_baseline
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_target_status'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'target_status',
+        sa.Column('target_id', sa.Integer(), nullable=False),
+        sa.Column('status_text', sa.String(length=50), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('response_time_ms', sa.Float(), nullable=True),
+        sa.Column('checked_at', sa.DateTime(), nullable=True),
+        sa.Column('consecutive_failures', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['target_id'], ['monitored_target.id'], name='fk_targetstatus_target_id',
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('target_id'),
+    )
+
+    # 与 flask rebuild-status 相同：每个目标取最新一条日志作为当前状态，
+    # 连续失败次数为最近一次 UP 之后的检查次数。迁移脚本不导入应用的模型 (模型会随之后的版本变化)
+    target = sa.table('monitored_target', sa.column('id'))
+    check_log = sa.table('check_log', sa.column('id'), sa.column('target_id'), sa.column('timestamp', sa.DateTime()),
+                         sa.column('status_code'), sa.column('status_text'), sa.column('response_time_ms'))
+    target_status = sa.table('target_status', sa.column('target_id'), sa.column('status_text'),
+                             sa.column('status_code'), sa.column('response_time_ms'),
+                             sa.column('checked_at', sa.DateTime()), sa.column('consecutive_failures'))
+    connection = op.get_bind()
+    rows = []
+    for target_id in connection.scalars(sa.select(target.c.id)).all():
+        latest = connection.execute(
+            sa.select(check_log.c.status_text, check_log.c.status_code, check_log.c.response_time_ms,
+                      check_log.c.timestamp)
+            .where(check_log.c.target_id == target_id)
+            .order_by(check_log.c.timestamp.desc(), check_log.c.id.desc()).limit(1)).first()
+        if latest is None:
+            continue
+        last_up = connection.scalar(sa.select(sa.func.max(check_log.c.timestamp)).where(
+            check_log.c.target_id == target_id, check_log.c.status_text == 'UP'))
+        failures = sa.select(sa.func.count()).select_from(check_log).where(check_log.c.target_id == target_id)
+        if last_up is not None:
+            failures = failures.where(check_log.c.timestamp > last_up)
+        rows.append({'target_id': target_id, 'status_text': latest.status_text, 'status_code': latest.status_code,
+                     'response_time_ms': latest.response_time_ms, 'checked_at': latest.timestamp,
+                     'consecutive_failures': connection.scalar(failures)})
+    if rows:
+        op.bulk_insert(target_status, rows)
+
+
+def downgrade():
+    op.drop_table('target_status')
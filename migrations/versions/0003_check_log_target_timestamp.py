@@ -0,0 +1,27 @@
+"""check_log 的 (target_id, timestamp) 复合索引，替代单列 target_id 索引
+
+Revision ID: 0003_check_log_target_timestamp
+Revises: 0002_target_status
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_check_log_target_timestamp'
+down_revision = '0002_target_status'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 先建复合索引再删除被它覆盖的单列索引，期间按目标查询日志始终有索引可用
+    op.create_index('ix_check_log_target_id_timestamp', 'check_log', ['target_id', 'timestamp'], unique=False)
+    op.drop_index('ix_check_log_target_id', table_name='check_log')
+
+
+def downgrade():
+    op.create_index('ix_check_log_target_id', 'check_log', ['target_id'], unique=False)
+    op.drop_index('ix_check_log_target_id_timestamp', table_name='check_log')
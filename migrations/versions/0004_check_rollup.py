@@ -0,0 +1,40 @@
+"""check_rollup 分钟/小时/天聚合表
+
+Revision ID: 0004_check_rollup
+Revises: 0003_check_log_target_timestamp
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_check_rollup'
+down_revision = '0003_check_log_target_timestamp'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'check_rollup',
+        sa.Column('target_id', sa.Integer(), nullable=False),
+        sa.Column('resolution', sa.Integer(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('check_count', sa.Integer(), nullable=False),
+        sa.Column('up_count', sa.Integer(), nullable=False),
+        sa.Column('latency_count', sa.Integer(), nullable=False),
+        sa.Column('latency_min_ms', sa.Float(), nullable=True),
+        sa.Column('latency_max_ms', sa.Float(), nullable=True),
+        sa.Column('latency_sum_ms', sa.Float(), nullable=False),
+        sa.Column('latency_sketch', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['target_id'], ['monitored_target.id'], name='fk_checkrollup_target_id',
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('target_id', 'resolution', 'bucket_start'),
+    )
+    # 已有的历史日志由 flask backfill-rollups 回填 (可以按日期分段执行，不在迁移中一次完成)
+
+
+def downgrade():
+    op.drop_table('check_rollup')
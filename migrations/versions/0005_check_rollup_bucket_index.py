@@ -0,0 +1,25 @@
+"""check_rollup 按粒度和时间清理所用的索引
+
+Revision ID: 0005_check_rollup_bucket_index
+Revises: 0004_check_rollup
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_check_rollup_bucket_index'
+down_revision = '0004_check_rollup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_check_rollup_resolution_bucket_start', 'check_rollup', ['resolution', 'bucket_start'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_check_rollup_resolution_bucket_start', table_name='check_rollup')
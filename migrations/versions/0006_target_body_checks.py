@@ -0,0 +1,33 @@
+"""monitored_target 的探测方式和响应体校验列
+
+Revision ID: 0006_target_body_checks
+Revises: 0005_check_rollup_bucket_index
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_target_body_checks'
+down_revision = '0005_check_rollup_bucket_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有目标默认使用 GET、最多读取 64KB 且不校验响应体
+    op.add_column('monitored_target', sa.Column('check_method', sa.String(length=8), server_default='GET',
+                                                nullable=False))
+    op.add_column('monitored_target', sa.Column('max_body_bytes', sa.Integer(), server_default='65536',
+                                                nullable=False))
+    op.add_column('monitored_target', sa.Column('body_keyword', sa.String(length=256), nullable=True))
+    op.add_column('monitored_target', sa.Column('body_sha256', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('monitored_target', 'body_sha256')
+    op.drop_column('monitored_target', 'body_keyword')
+    op.drop_column('monitored_target', 'max_body_bytes')
+    op.drop_column('monitored_target', 'check_method')
@@ -0,0 +1,35 @@
+"""check_log 的分阶段耗时列
+
+Revision ID: 0007_check_log_timings
+Revises: 0006_target_body_checks
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_check_log_timings'
+down_revision = '0006_target_body_checks'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有日志的分阶段耗时为空
+    op.add_column('check_log', sa.Column('dns_ms', sa.Float(), nullable=True))
+    op.add_column('check_log', sa.Column('connect_ms', sa.Float(), nullable=True))
+    op.add_column('check_log', sa.Column('tls_ms', sa.Float(), nullable=True))
+    op.add_column('check_log', sa.Column('ttfb_ms', sa.Float(), nullable=True))
+    op.add_column('check_log', sa.Column('transfer_ms', sa.Float(), nullable=True))
+    op.add_column('check_log', sa.Column('connection_reused', sa.Boolean(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('check_log', 'connection_reused')
+    op.drop_column('check_log', 'transfer_ms')
+    op.drop_column('check_log', 'ttfb_ms')
+    op.drop_column('check_log', 'tls_ms')
+    op.drop_column('check_log', 'connect_ms')
+    op.drop_column('check_log', 'dns_ms')
@@ -0,0 +1,26 @@
+"""monitored_target.force_fresh_connection
+
+Revision ID: 0008_target_fresh_connection
+Revises: 0007_check_log_timings
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_target_fresh_connection'
+down_revision = '0007_check_log_timings'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有目标默认复用 keep-alive 连接
+    op.add_column('monitored_target', sa.Column('force_fresh_connection', sa.Boolean(), server_default='0',
+                                                nullable=False))
+
+
+def downgrade():
+    op.drop_column('monitored_target', 'force_fresh_connection')
@@ -0,0 +1,47 @@
+"""probe_worker 表和 monitored_target 的租约列
+
+Revision ID: 0009_probe_worker_leases
+Revises: 0008_target_fresh_connection
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_probe_worker_leases'
+down_revision = '0008_target_fresh_connection'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'probe_worker',
+        sa.Column('id', sa.String(length=64), nullable=False),
+        sa.Column('hostname', sa.String(length=255), nullable=False),
+        sa.Column('pid', sa.Integer(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=False),
+        sa.Column('target_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_probe_worker_heartbeat_at', 'probe_worker', ['heartbeat_at'], unique=False)
+    # 已有目标没有租约，worker 启动后按哈希环领取
+    op.add_column('monitored_target', sa.Column('lease_owner', sa.String(length=64), nullable=True))
+    op.add_column('monitored_target', sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+    op.add_column('monitored_target', sa.Column('check_requested_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_monitored_target_lease_owner', 'monitored_target', ['lease_owner'], unique=False)
+    op.create_index('ix_monitored_target_check_requested_at', 'monitored_target', ['check_requested_at'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_monitored_target_check_requested_at', table_name='monitored_target')
+    op.drop_index('ix_monitored_target_lease_owner', table_name='monitored_target')
+    op.drop_column('monitored_target', 'check_requested_at')
+    op.drop_column('monitored_target', 'lease_expires_at')
+    op.drop_column('monitored_target', 'lease_owner')
+    op.drop_index('ix_probe_worker_heartbeat_at', table_name='probe_worker')
+    op.drop_table('probe_worker')
@@ -0,0 +1,30 @@
+"""pipeline_state 版本计数器表
+
+Revision ID: 0010_pipeline_state
+Revises: 0009_probe_worker_leases
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_pipeline_state'
+down_revision = '0009_probe_worker_leases'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 计数器在第一次递增时创建，不存在时按 0 读取
+    op.create_table(
+        'pipeline_state',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+
+
+def downgrade():
+    op.drop_table('pipeline_state')
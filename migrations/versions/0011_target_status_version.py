@@ -0,0 +1,27 @@
+"""target_status.version，供状态推送增量读取
+
+Revision ID: 0011_target_status_version
+Revises: 0010_pipeline_state
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011_target_status_version'
+down_revision = '0010_pipeline_state'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有状态行的 version 为空，推送只读取之后更新的行；页面加载时总是读取完整状态
+    op.add_column('target_status', sa.Column('version', sa.BigInteger(), nullable=True))
+    op.create_index('ix_target_status_version', 'target_status', ['version'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_target_status_version', table_name='target_status')
+    op.drop_column('target_status', 'version')
@@ -0,0 +1,26 @@
+"""probe_worker 的名义与实际检查频率
+
+Revision ID: 0012_probe_worker_check_rates
+Revises: 0011_target_status_version
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012_probe_worker_check_rates'
+down_revision = '0011_target_status_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('probe_worker', sa.Column('nominal_checks_per_min', sa.Float(), nullable=True))
+    op.add_column('probe_worker', sa.Column('effective_checks_per_min', sa.Float(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('probe_worker', 'effective_checks_per_min')
+    op.drop_column('probe_worker', 'nominal_checks_per_min')
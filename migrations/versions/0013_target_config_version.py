@@ -0,0 +1,35 @@
+"""monitored_target.config_version，并为已有目标回填
+
+Revision ID: 0013_target_config_version
+Revises: 0012_probe_worker_check_rates
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013_target_config_version'
+down_revision = '0012_probe_worker_check_rates'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('monitored_target', sa.Column('config_version', sa.BigInteger(), nullable=True))
+    op.create_index('ix_monitored_target_config_version', 'monitored_target', ['config_version'], unique=False)
+
+    # 已有目标记为当前的 targets_version (计数器尚未创建时为 0)：表示它们在此之后没有变化，
+    # worker 启动时的全量对账会装入它们，之后的增量同步只读取真正变化的目标，不会漏掉 config_version 为空的行
+    pipeline_state = sa.table('pipeline_state', sa.column('key'), sa.column('value'))
+    target = sa.table('monitored_target', sa.column('config_version'))
+    connection = op.get_bind()
+    version = connection.scalar(
+        sa.select(pipeline_state.c.value).where(pipeline_state.c.key == 'targets_version')) or 0
+    connection.execute(target.update().where(target.c.config_version.is_(None)).values(config_version=version))
+
+
+def downgrade():
+    op.drop_index('ix_monitored_target_config_version', table_name='monitored_target')
+    op.drop_column('monitored_target', 'config_version')
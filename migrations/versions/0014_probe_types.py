@@ -0,0 +1,30 @@
+"""探测类型列和 target_status.cert_expires_at
+
+Revision ID: 0014_probe_types
+Revises: 0013_target_config_version
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0014_probe_types'
+down_revision = '0013_target_config_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有目标保持 HTTP 检查
+    op.add_column('monitored_target', sa.Column('probe_type', sa.String(length=16), server_default='http',
+                                                nullable=False))
+    op.add_column('monitored_target', sa.Column('probe_params', sa.Text(), nullable=True))
+    op.add_column('target_status', sa.Column('cert_expires_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('target_status', 'cert_expires_at')
+    op.drop_column('monitored_target', 'probe_params')
+    op.drop_column('monitored_target', 'probe_type')
@@ -0,0 +1,38 @@
+"""只记录状态变化的日志方式：log_mode、sample_count 和 target_status 的日志状态列
+
+Revision ID: 0015_change_log_mode
+Revises: 0014_probe_types
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0015_change_log_mode'
+down_revision = '0014_probe_types'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已有目标仍记录每次检查；已有日志每行代表一次检查 (sample_count 为空)
+    op.add_column('monitored_target', sa.Column('log_mode', sa.String(length=16), server_default='full',
+                                                nullable=False))
+    op.add_column('check_log', sa.Column('sample_count', sa.Integer(), nullable=True))
+    op.add_column('target_status', sa.Column('log_written_at', sa.DateTime(), nullable=True))
+    op.add_column('target_status', sa.Column('log_pending_checks', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('target_status', sa.Column('log_pending_latency_sum', sa.Float(), server_default='0',
+                                             nullable=False))
+    op.add_column('target_status', sa.Column('log_pending_latency_count', sa.Integer(), server_default='0',
+                                             nullable=False))
+
+
+def downgrade():
+    op.drop_column('target_status', 'log_pending_latency_count')
+    op.drop_column('target_status', 'log_pending_latency_sum')
+    op.drop_column('target_status', 'log_pending_checks')
+    op.drop_column('target_status', 'log_written_at')
+    op.drop_column('check_log', 'sample_count')
+    op.drop_column('monitored_target', 'log_mode')
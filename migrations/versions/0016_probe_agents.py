@@ -0,0 +1,57 @@
+"""远程探测代理：agent_id 列、probe_agent 和 agent_batch 表
+
+Revision ID: 0016_probe_agents
+Revises: 0015_change_log_mode
+Create Date: 2026-10-18 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0016_probe_agents'
+down_revision = '0015_change_log_mode'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'probe_agent',
+        sa.Column('id', sa.String(length=64), nullable=False),
+        sa.Column('location', sa.String(length=64), nullable=True),
+        sa.Column('address', sa.String(length=64), nullable=True),
+        sa.Column('first_seen_at', sa.DateTime(), nullable=False),
+        sa.Column('last_seen_at', sa.DateTime(), nullable=False),
+        sa.Column('synced_version', sa.BigInteger(), nullable=True),
+        sa.Column('target_count', sa.Integer(), nullable=False),
+        sa.Column('batches_received', sa.BigInteger(), nullable=False),
+        sa.Column('duplicate_batches', sa.BigInteger(), nullable=False),
+        sa.Column('results_received', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_probe_agent_last_seen_at', 'probe_agent', ['last_seen_at'], unique=False)
+    op.create_table(
+        'agent_batch',
+        sa.Column('agent_id', sa.String(length=64), nullable=False),
+        sa.Column('batch_id', sa.String(length=64), nullable=False),
+        sa.Column('received_at', sa.DateTime(), nullable=False),
+        sa.Column('result_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('agent_id', 'batch_id'),
+    )
+    op.create_index('ix_agent_batch_received_at', 'agent_batch', ['received_at'], unique=False)
+    # 已有目标仍由探测 worker 检查，已有日志都来自 worker
+    op.add_column('monitored_target', sa.Column('agent_id', sa.String(length=64), nullable=True))
+    op.create_index('ix_monitored_target_agent_id', 'monitored_target', ['agent_id'], unique=False)
+    op.add_column('check_log', sa.Column('agent_id', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('check_log', 'agent_id')
+    op.drop_index('ix_monitored_target_agent_id', table_name='monitored_target')
+    op.drop_column('monitored_target', 'agent_id')
+    op.drop_index('ix_agent_batch_received_at', table_name='agent_batch')
+    op.drop_table('agent_batch')
+    op.drop_index('ix_probe_agent_last_seen_at', table_name='probe_agent')
+    op.drop_table('probe_agent')
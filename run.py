@@ -1,4 +1,4 @@
-from app import create_app, db # 从 app 包中导入 create_app 工厂函数和 db 实例
+from app import create_app, db, start_worker # 从 app 包中导入 create_app 工厂函数和 db 实例
 from app.models import MonitoredTarget, CheckLog # 导入模型，确保 Flask-Migrate 能检测到它们
 from flask_migrate import Migrate
 
@@ -34,6 +34,10 @@ if __name__ == '__main__':
     # 除非你在 app.run() 中显式传递它们。
     # 推荐使用 `flask run` 命令来启动开发服务器。
     
+    # 设置了 RUN_EMBEDDED_WORKER=1 时在开发服务器启动前运行内嵌的探测 worker
+    # (flask run 和 Gunicorn 则在处理第一个请求前启动，见 create_app)
+    if app.config.get('RUN_EMBEDDED_WORKER'):
+        start_worker(app)
     app.run() # 这里的 host 和 port 可以不指定，Flask 会使用默认值 (127.0.0.1:5000)
               # 如果 .flaskenv 中没有设置 FLASK_DEBUG=1, 默认 debug=False
               # 但因为 FLASK_ENV=development, debug 通常会是 True
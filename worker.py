@@ -0,0 +1,40 @@
+"""
+独立的探测 worker 进程入口 (与 run.py 的 Web 应用分开运行)。
+
+可以在一台或多台机器上启动任意多个 worker，它们共享同一个数据库：
+各 worker 通过心跳组成一致性哈希环，按目标ID划分目标，并在数据库中为目标加租约，
+保证每个目标只被一个 worker 检查。worker 加入或退出时会自动重新划分。
+
+用法: python worker.py
+"""
+import signal
+import threading
+
+from app import create_app, start_worker, stop_worker, worker, metrics, logger
+
+
+def main():
+    app = create_app()
+    stop = threading.Event()
+
+    def _handle_signal(signum, frame):
+        logger.info(f"探测 worker 收到信号 {signum}，正在退出...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
+
+    start_worker(app)
+    metrics_server = None
+    if app.config.get('METRICS_PORT'):
+        metrics_server = metrics.serve(app.config['METRICS_PORT'], app.config.get('METRICS_HOST', '0.0.0.0'))
+    logger.info(f"探测 worker {worker.worker_id} 正在运行，按 Ctrl+C 退出。")
+    stop.wait()
+    # 在解释器开始关闭线程池之前主动停止，确保释放租约并写完已完成的检查结果
+    stop_worker()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()